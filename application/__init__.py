@@ -1,10 +1,25 @@
+import os
+import threading
 from flask import Flask, Blueprint
 from .namespaces import main_ns, notification_ns
-from application.config import configure_namespaces
-from application.config.db import get_db_connection
+from application.config import configure_metrics, configure_namespaces, obtain_config
+from application.config.db import get_db_connection, prepare_db_connection
+from application.namespaces.notifications.models import ensure_notification_indexes
+from application.namespaces.notifications.commands import (
+    backfill_inbox_command,
+    deliver_notifications_command,
+    expire_notifications_command,
+    promote_notifications_command,
+    reconcile_counts_command,
+)
+from application.namespaces.notifications.idempotency import ensure_idempotency_indexes
+from application.namespaces.notifications.retention import configure_retention
 
 API_VERSION="v1"
 
+_prepared_pid = None
+_prepare_lock = threading.Lock()
+
 def create_base_app() -> Flask:
     """
     Creates and returns a base flask application without a db connection.
@@ -13,22 +28,55 @@ def create_base_app() -> Flask:
         app(Flask): Our main flask app with our api and blueprints linked
     """
     app = Flask(__name__, instance_relative_config=False)
+    # A 404 for a missing notification should not suggest other routes of the namespace.
+    app.config["ERROR_404_HELP"] = False
     blueprint = Blueprint("Home", __name__)
 
     configure_namespaces(blueprint, main_ns, notification_ns)
+    configure_metrics(app)
 
     app.register_blueprint(blueprint, url_prefix=f"/api/{API_VERSION}")
+    app.cli.add_command(backfill_inbox_command)
+    app.cli.add_command(reconcile_counts_command)
+    app.cli.add_command(expire_notifications_command)
+    app.cli.add_command(deliver_notifications_command)
+    app.cli.add_command(promote_notifications_command)
 
     return app
 
 
+def prepare_worker():
+    """
+    Prepares the process that serves requests, by creating our indexes and filling its db
+    connection pool. It runs once per process, from the post_worker_init hook of gunicorn,
+    or otherwise before the first request of the process.
+    """
+    global _prepared_pid
+    if _prepared_pid == os.getpid():
+        return
+    with _prepare_lock:
+        if _prepared_pid == os.getpid():
+            return
+        config = obtain_config()
+        ensure_notification_indexes()
+        ensure_idempotency_indexes(
+            config["notification_config"].getint("idempotency_ttl_seconds")
+        )
+        configure_retention(config)
+        prepare_db_connection()
+        _prepared_pid = os.getpid()
+
+
 def create_app() -> Flask:
     """
-    Creates and returns a flask application that has a live db connection.
+    Creates and returns a flask application that has a db connection. The connection is
+    only opened once the process that serves requests is prepared, so that a process
+    gunicorn forks its workers from never opens one.
 
     Returns:
         app(Flask): Our main flask app that has been connected to our database.
     """
     app = create_base_app()
     get_db_connection()
+    app.before_request(prepare_worker)
     return app
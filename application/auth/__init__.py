@@ -0,0 +1,13 @@
+from .exceptions import TokenVerificationError, JWKSUnavailableError
+from .token_verification import (
+    AuthModes,
+    JWKSCache,
+    LocalTokenVerifier,
+    create_token_verifier,
+)
+from .keycloak_client import (
+    PooledKeycloakClient,
+    get_keycloak_client,
+    reset_keycloak_client,
+)
+from .token_cache import TokenCache, create_token_cache
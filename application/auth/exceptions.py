@@ -0,0 +1,23 @@
+"""Module that contains custom exceptions for verifying keycloak tokens."""
+
+
+class TokenVerificationError(Exception):
+    """
+    Exception for when a JWT token could not be verified locally. This could be because of
+    a bad signature, an expired token, or a token issued for a different audience or issuer.
+    """
+
+    def __init__(self, message: str = "Token could not be verified"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class JWKSUnavailableError(Exception):
+    """
+    Exception for when the public keys of our keycloak realm could not be obtained
+    and there are no cached keys that can be used in their place.
+    """
+
+    def __init__(self, message: str = "Unable to obtain keycloak realm public keys"):
+        self.message = message
+        super().__init__(self.message)
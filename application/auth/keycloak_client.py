@@ -0,0 +1,261 @@
+"""
+Module which contains the process wide keycloak client shared by every request, rather than
+a new client, http session and tls handshake per request.
+"""
+import configparser
+import os
+import threading
+import time
+import jwt
+import orodha_keycloak
+from keycloak.exceptions import KeycloakError
+from prometheus_client import Counter
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from application.auth.exceptions import TokenVerificationError
+
+KEYCLOAK_HTTP_REQUESTS = Counter(
+    "orodha_keycloak_http_requests",
+    "Number of http requests sent to keycloak by this process.",
+)
+KEYCLOAK_CONNECTIONS_CREATED = Counter(
+    "orodha_keycloak_connections_created",
+    "Number of new http connections opened to keycloak. A value close to"
+    " orodha_keycloak_http_requests means connections are not being reused.",
+)
+KEYCLOAK_CLIENTS_CREATED = Counter(
+    "orodha_keycloak_clients_created",
+    "Number of keycloak clients created by this process.",
+)
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        KEYCLOAK_CONNECTIONS_CREATED.inc()
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        KEYCLOAK_CONNECTIONS_CREATED.inc()
+        return super()._new_conn()
+
+
+class KeepAliveHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter with a bounded pool of keep-alive connections which records every request
+    and every newly opened connection, so that connection reuse can be observed.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+    def send(self, *args, **kwargs):
+        KEYCLOAK_HTTP_REQUESTS.inc()
+        return super().send(*args, **kwargs)
+
+
+class PooledKeycloakClient(orodha_keycloak.OrodhaKeycloakClient):
+    """
+    OrodhaKeycloakClient which is safe to share between the threads of a worker.
+
+    Every underlying python-keycloak connection uses a KeepAliveHTTPAdapter with the
+    configured pool size and timeouts, and the realm public key used by decode_jwt is
+    cached instead of fetched on every call. The key is refetched once it is older than
+    max_age_seconds, and when a token fails signature verification, at most once every
+    min_refresh_seconds, so a rotation of the realm key is picked up without a restart.
+
+    Args:
+        algorithms(list[str]) - Optional: The signing algorithms that decode_jwt accepts.
+        min_refresh_seconds(float) - Optional: The minimum time between two fetches of the
+            public key caused by tokens that failed signature verification.
+        max_age_seconds(float) - Optional: The time after which the public key is refetched.
+        pool_size(int): The maximum number of keep-alive connections kept per host.
+        connect_timeout(float): Seconds to wait when opening a connection to keycloak.
+        read_timeout(float): Seconds to wait for a response from keycloak.
+        max_retries(int): The number of times a failed request is retried.
+        **kwargs: The connection arguments accepted by OrodhaKeycloakClient.
+    """
+
+    def __init__(
+        self,
+        algorithms: list = None,
+        min_refresh_seconds: float = 60,
+        max_age_seconds: float = 3600,
+        pool_size: int = 10,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10,
+        max_retries: int = 1,
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.algorithms = algorithms or ["RS256"]
+        self.min_refresh_seconds = min_refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self._public_key = None
+        self._public_key_fetched_at = None
+        self._public_key_lock = threading.Lock()
+
+        for connection in self._connection_managers():
+            self._configure_connection(connection)
+        KEYCLOAK_CLIENTS_CREATED.inc()
+
+    def _connection_managers(self) -> list:
+        connections = [
+            self.client_connection.connection,
+            self.admin_connection.connection,
+        ]
+        token_client = getattr(self.admin_connection.connection, "keycloak_openid", None)
+        if token_client is not None:
+            connections.append(token_client.connection)
+        return connections
+
+    def _configure_connection(self, connection):
+        adapter = KeepAliveHTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=self.max_retries,
+        )
+        # python-keycloak does not expose its requests session publicly.
+        connection._s.mount("https://", adapter)
+        connection._s.mount("http://", adapter)
+        connection.timeout = self.timeout
+
+    def _is_public_key_expired(self) -> bool:
+        return self._public_key_fetched_at is None or \
+            time.monotonic() - self._public_key_fetched_at >= self.max_age_seconds
+
+    def _can_refresh_public_key(self) -> bool:
+        return self._public_key_fetched_at is None or \
+            time.monotonic() - self._public_key_fetched_at >= self.min_refresh_seconds
+
+    def public_key(self, refresh: bool = False) -> str:
+        """
+        Obtains the public key of our realm, only asking keycloak the first time, once the
+        cached key is older than max_age_seconds, or when a refresh is asked for.
+
+        Args:
+            refresh(bool) - Optional: Refetches the key, unless it was fetched less than
+                min_refresh_seconds ago.
+
+        Returns:
+            public_key(str): The base64 encoded public key of the realm.
+
+        Raises:
+            KeycloakError: If the key could not be obtained and there is no previously
+                cached key.
+        """
+        if self._public_key is not None and not refresh and not self._is_public_key_expired():
+            return self._public_key
+        with self._public_key_lock:
+            if self._public_key is None or self._is_public_key_expired() \
+                    or refresh and self._can_refresh_public_key():
+                try:
+                    self._public_key = self.client_connection.public_key()
+                except KeycloakError:
+                    if self._public_key is None:
+                        raise
+                    # Keep verifying with the key we have, keycloak being down should not
+                    # take us down.
+                self._public_key_fetched_at = time.monotonic()
+        return self._public_key
+
+    def _decode(self, token: str, public_key: str) -> dict:
+        keycloak_public_key = "-----BEGIN PUBLIC KEY-----\n" + \
+            public_key + "\n-----END PUBLIC KEY-----"
+        return jwt.decode(
+            token,
+            key=keycloak_public_key,
+            algorithms=self.algorithms,
+            options={"require": ["exp", "sub"], "verify_aud": False},
+        )
+
+    def decode_jwt(self, token):
+        """
+        Verifies the signature and expiry of a JWT token against our cached realm public key,
+        and decodes it. The token is verified with PyJWT, as LocalTokenVerifier does, rather
+        than by python-keycloak, whose decode_token arguments change between versions. A
+        token whose signature does not match is verified again against a refetched key, in
+        case the realm key was rotated.
+
+        Args:
+            token(str): A JWT token that we get from keycloak.
+
+        Returns:
+            token_info(dict): The decoded information from the token.
+
+        Raises:
+            TokenVerificationError: If the token is malformed, expired or badly signed.
+            KeycloakError: If the realm public key could not be obtained.
+        """
+        public_key = self.public_key()
+        try:
+            try:
+                return self._decode(token, public_key)
+            except jwt.InvalidSignatureError:
+                refreshed_key = self.public_key(refresh=True)
+                if refreshed_key == public_key:
+                    raise
+                return self._decode(token, refreshed_key)
+        except jwt.PyJWTError as err:
+            raise TokenVerificationError(f"Token could not be verified: {err}") from err
+
+
+_keycloak_client = None
+_keycloak_client_lock = threading.Lock()
+
+
+def get_keycloak_client(config: configparser.ConfigParser) -> PooledKeycloakClient:
+    """
+    Function which returns the keycloak client of this process, creating it from our
+    application config the first time that it is needed.
+
+    Args:
+        config(ConfigParser): Our application config, as returned from obtain_config.
+
+    Returns:
+        PooledKeycloakClient: The long lived keycloak client shared by every request.
+    """
+    global _keycloak_client
+    if _keycloak_client is None:
+        with _keycloak_client_lock:
+            if _keycloak_client is None:
+                keycloak_config = config["keycloak_config"]
+                _keycloak_client = PooledKeycloakClient(
+                    server_url=keycloak_config["keycloak_server_url"],
+                    realm_name=keycloak_config["keycloak_realm_name"],
+                    client_id=keycloak_config["keycloak_client_id"],
+                    client_secret_key=keycloak_config["keycloak_client_secret_key"],
+                    algorithms=[
+                        algorithm.strip()
+                        for algorithm in config["auth_config"]["jwt_algorithms"].split(",")
+                    ],
+                    min_refresh_seconds=config["auth_config"].getfloat(
+                        "jwks_min_refresh_seconds"),
+                    max_age_seconds=config["auth_config"].getfloat("jwks_max_age_seconds"),
+                    pool_size=keycloak_config.getint("keycloak_pool_size"),
+                    connect_timeout=keycloak_config.getfloat("keycloak_connect_timeout"),
+                    read_timeout=keycloak_config.getfloat("keycloak_read_timeout"),
+                    max_retries=keycloak_config.getint("keycloak_max_retries"),
+                )
+    return _keycloak_client
+
+
+def reset_keycloak_client():
+    """
+    Function which discards the keycloak client of this process. It is called in a child
+    process after a fork, since sockets and locks can not be shared with the parent.
+    """
+    global _keycloak_client, _keycloak_client_lock
+    _keycloak_client = None
+    _keycloak_client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_keycloak_client)
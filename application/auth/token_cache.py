@@ -0,0 +1,122 @@
+"""
+Module which contains the cache of tokens that have already been resolved to a user, so that
+clients polling with the same bearer token are not validated over and over.
+"""
+import configparser
+import hashlib
+import time
+import jwt
+from prometheus_client import Counter
+from application.utils.cache import LRUCache, SingleFlight
+
+TOKEN_CACHE_HITS = Counter(
+    "orodha_token_cache_hits",
+    "Number of tokens resolved from the token cache.",
+)
+TOKEN_CACHE_MISSES = Counter(
+    "orodha_token_cache_misses",
+    "Number of tokens that had to be validated because they were not cached.",
+)
+TOKEN_CACHE_EVICTIONS = Counter(
+    "orodha_token_cache_evictions",
+    "Number of entries removed from the token cache.",
+    ["reason"],
+)
+TOKEN_CACHE_COALESCED = Counter(
+    "orodha_token_cache_coalesced",
+    "Number of lookups that shared a validation already in flight for the same token.",
+)
+
+
+class TokenCache:
+    """
+    Cache which maps the hash of a token to the user it was resolved to.
+
+    Entries expire at the exp claim of their token or after ttl_seconds, whichever comes
+    first, and the least recently used entry is evicted once maxsize is reached. Concurrent
+    lookups of the same uncached token share a single call to the resolver.
+
+    Args:
+        maxsize(int): The maximum number of tokens held by the cache, zero disables caching.
+        ttl_seconds(float): The maximum number of seconds a token is cached for.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl_seconds: float = 300):
+        self._cache = LRUCache(
+            maxsize,
+            ttl_seconds,
+            on_evict=lambda reason: TOKEN_CACHE_EVICTIONS.labels(reason=reason).inc(),
+        )
+        self._single_flight = SingleFlight()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @staticmethod
+    def _expires_at(token: str, user: dict):
+        expires_at = user.get("exp")
+        if expires_at is None:
+            try:
+                # The resolver has already verified the token, exp only bounds the cache.
+                expires_at = jwt.decode(
+                    token, options={"verify_signature": False}).get("exp")
+            except jwt.PyJWTError:
+                return None
+        return expires_at
+
+    def _resolve(self, key: str, token: str, resolver) -> dict:
+        user = resolver(token)
+        ttl_seconds = self._cache.ttl_seconds
+        expires_at = self._expires_at(token, user)
+        if expires_at is not None:
+            ttl_seconds = min(ttl_seconds, float(expires_at) - time.time())
+        self._cache.set(key, user, ttl_seconds)
+        return user
+
+    def get_user(self, token: str, resolver) -> dict:
+        """
+        Obtains the user a token belongs to from the cache, or from resolver when the
+        token is not cached. Exceptions raised by resolver are not cached.
+
+        Args:
+            token(str): A JWT token obtained through keycloak.
+            resolver(callable): Called with the token to validate it and resolve its user.
+
+        Returns:
+            user(dict): The user associated with the token.
+        """
+        key = self._token_key(token)
+        user = self._cache.get(key)
+        if user is not None:
+            TOKEN_CACHE_HITS.inc()
+            return user
+
+        TOKEN_CACHE_MISSES.inc()
+        user, shared = self._single_flight.do(key, self._resolve, key, token, resolver)
+        if shared:
+            TOKEN_CACHE_COALESCED.inc()
+        return user
+
+    def clear(self):
+        """Removes every token from the cache."""
+        self._cache.clear()
+
+
+def create_token_cache(config: configparser.ConfigParser) -> TokenCache:
+    """
+    Function which creates a TokenCache from our application config.
+
+    Args:
+        config(ConfigParser): Our application config, as returned from obtain_config.
+
+    Returns:
+        TokenCache: A cache of resolved tokens.
+    """
+    return TokenCache(
+        maxsize=config["auth_config"].getint("token_cache_size"),
+        ttl_seconds=config["auth_config"].getfloat("token_cache_ttl_seconds"),
+    )
@@ -0,0 +1,246 @@
+"""
+Module which contains the classes used to verify keycloak JWT tokens locally against
+the public keys of our keycloak realm, rather than asking keycloak about every token.
+"""
+import configparser
+import threading
+import time
+from enum import Enum
+import jwt
+import requests
+from application.auth.exceptions import TokenVerificationError, JWKSUnavailableError
+
+
+class AuthModes(Enum):
+    """
+    Simple class which inherits from Enum and defines the ways a token can be authenticated.
+
+    LOCAL: Tokens are verified against the cached public keys of the realm.
+    KEYCLOAK: Every token is sent to keycloak, which was the original behavior of the service.
+    FALLBACK: Tokens are verified locally, keycloak is only asked when the keys are unavailable.
+    """
+    LOCAL = "local"
+    KEYCLOAK = "keycloak"
+    FALLBACK = "fallback"
+
+
+class JWKSCache:
+    """
+    Thread safe cache of the JSON Web Key Set published by our keycloak realm.
+
+    Keys are fetched once and reused until they are older than max_age_seconds. When a token
+    is signed with a key id that we have not seen we refetch the key set, at most once every
+    min_refresh_seconds, so keycloak key rotation is picked up without a restart.
+
+    Args:
+        jwks_url(str): The url of the realm's certs endpoint.
+        min_refresh_seconds(float): The minimum time between two fetches caused by unknown key ids.
+        max_age_seconds(float): The time after which cached keys are refetched.
+        timeout(float): The timeout of the http request used to fetch the keys.
+        fetcher(callable) - Optional: A callable returning the key set as a dict, used in place
+            of an http request to jwks_url.
+    """
+
+    def __init__(
+        self,
+        jwks_url: str,
+        min_refresh_seconds: float = 60,
+        max_age_seconds: float = 3600,
+        timeout: float = 5,
+        fetcher=None,
+    ):
+        self.jwks_url = jwks_url
+        self.min_refresh_seconds = min_refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.timeout = timeout
+        self._fetcher = fetcher or self._fetch_from_url
+        self._keys = {}
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def _fetch_from_url(self) -> dict:
+        response = requests.get(self.jwks_url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _is_expired(self) -> bool:
+        return self._fetched_at is None or \
+            time.monotonic() - self._fetched_at >= self.max_age_seconds
+
+    def _can_refresh(self) -> bool:
+        return self._fetched_at is None or \
+            time.monotonic() - self._fetched_at >= self.min_refresh_seconds
+
+    def refresh(self):
+        """
+        Fetches the key set and replaces our cached keys with the signing keys it contains.
+
+        Raises:
+            JWKSUnavailableError: If the key set could not be fetched and there are no
+                previously cached keys.
+        """
+        try:
+            jwks = self._fetcher()
+        except (requests.RequestException, ValueError) as err:
+            if self._keys:
+                # Keep serving the keys we have, keycloak being down should not take us down.
+                self._fetched_at = time.monotonic()
+                return
+            raise JWKSUnavailableError(
+                f"Unable to obtain keycloak realm public keys: {err}"
+            ) from err
+
+        keys = {}
+        for jwk in jwks.get("keys", []):
+            if jwk.get("use", "sig") != "sig" or jwk.get("kid") is None:
+                continue
+            try:
+                keys[jwk["kid"]] = jwt.PyJWK(jwk)
+            except jwt.PyJWKError:
+                continue
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+    def get_signing_key(self, kid: str) -> jwt.PyJWK:
+        """
+        Obtains the public key with a given key id, fetching the key set when needed.
+
+        Args:
+            kid(str): The key id taken from the header of a JWT token.
+
+        Returns:
+            signing_key(PyJWK): The public key that the token should have been signed with.
+
+        Raises:
+            TokenVerificationError: If the key set does not contain the key id.
+            JWKSUnavailableError: If the key set could not be fetched.
+        """
+        signing_key = self._keys.get(kid)
+        if signing_key is not None and not self._is_expired():
+            return signing_key
+
+        with self._lock:
+            signing_key = self._keys.get(kid)
+            if signing_key is None and self._can_refresh() or self._is_expired():
+                self.refresh()
+                signing_key = self._keys.get(kid)
+
+        if signing_key is None:
+            raise TokenVerificationError(f"Unknown signing key id: {kid}")
+        return signing_key
+
+
+class LocalTokenVerifier:
+    """
+    Class which verifies keycloak JWT tokens locally and resolves the user they belong to.
+
+    Args:
+        jwks_cache(JWKSCache): The cache which provides the public keys of our realm.
+        issuer(str): The expected iss claim of our tokens.
+        audience(str) - Optional: The expected aud claim of our tokens, the audience
+            is not checked when this is empty.
+        algorithms(list[str]): The signing algorithms that we accept.
+        leeway_seconds(float): Clock skew allowed when checking the exp and nbf claims.
+    """
+
+    def __init__(
+        self,
+        jwks_cache: JWKSCache,
+        issuer: str,
+        audience: str = None,
+        algorithms: list = None,
+        leeway_seconds: float = 30,
+    ):
+        self.jwks_cache = jwks_cache
+        self.issuer = issuer
+        self.audience = audience or None
+        self.algorithms = algorithms or ["RS256"]
+        self.leeway_seconds = leeway_seconds
+
+    def verify(self, token: str) -> dict:
+        """
+        Verifies the signature, expiry, audience and issuer of a JWT token.
+
+        Args:
+            token(str): A JWT token that we get from keycloak.
+
+        Returns:
+            claims(dict): The decoded claims of the token.
+
+        Raises:
+            TokenVerificationError: If the token is malformed or fails any of our checks.
+            JWKSUnavailableError: If the public keys of our realm could not be obtained.
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+            if header.get("alg") not in self.algorithms:
+                raise TokenVerificationError(
+                    f"Unsupported signing algorithm: {header.get('alg')}")
+            signing_key = self.jwks_cache.get_signing_key(header.get("kid"))
+            claims = jwt.decode(
+                token,
+                key=signing_key.key,
+                algorithms=self.algorithms,
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.leeway_seconds,
+                options={
+                    "require": ["exp", "iss", "sub"],
+                    "verify_aud": self.audience is not None,
+                },
+            )
+        except jwt.PyJWTError as err:
+            raise TokenVerificationError(f"Token could not be verified: {err}") from err
+        return claims
+
+    def get_user(self, token: str) -> dict:
+        """
+        Verifies a token and returns the user it belongs to, shaped like the subset of the
+        keycloak user representation that the service relies on.
+
+        Args:
+            token(str): A JWT token that we get from keycloak.
+
+        Returns:
+            user(dict): A dictionary containing the id and username of the user as well as
+                the exp claim of the token.
+        """
+        claims = self.verify(token)
+        return {
+            "id": claims.get("sub"),
+            "username": claims.get("preferred_username"),
+            "exp": claims.get("exp"),
+        }
+
+
+def create_token_verifier(config: configparser.ConfigParser) -> LocalTokenVerifier:
+    """
+    Function which creates a LocalTokenVerifier from our application config. The realm
+    issuer and certs url are derived from the keycloak config unless they are set explicitly.
+
+    Args:
+        config(ConfigParser): Our application config, as returned from obtain_config.
+
+    Returns:
+        LocalTokenVerifier: A verifier for the tokens of our keycloak realm.
+    """
+    keycloak_config = config["keycloak_config"]
+    auth_config = config["auth_config"]
+    realm_url = (
+        f"{keycloak_config['keycloak_server_url'].rstrip('/')}"
+        f"/realms/{keycloak_config['keycloak_realm_name']}"
+    )
+    jwks_cache = JWKSCache(
+        jwks_url=auth_config["jwks_url"] or f"{realm_url}/protocol/openid-connect/certs",
+        min_refresh_seconds=auth_config.getfloat("jwks_min_refresh_seconds"),
+        max_age_seconds=auth_config.getfloat("jwks_max_age_seconds"),
+    )
+    return LocalTokenVerifier(
+        jwks_cache,
+        issuer=auth_config["jwt_issuer"] or realm_url,
+        audience=auth_config["jwt_audience"],
+        algorithms=[
+            algorithm.strip() for algorithm in auth_config["jwt_algorithms"].split(",")
+        ],
+        leeway_seconds=auth_config.getfloat("jwt_leeway_seconds"),
+    )
@@ -1,2 +1,3 @@
 from .config import obtain_config
 from .configure_namespaces import configure_namespaces
+from .configure_metrics import configure_metrics
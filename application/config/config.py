@@ -28,6 +28,25 @@ def _get_environment_variables(*required_variables: str) -> dict:
     return vars_out
 
 
+def _get_optional_environment_variables(**defaults: str) -> dict:
+    """
+    Helper function which looks to the environment for optional named variables,
+    falling back to a default value when a variable is not present.
+
+    Args:
+        defaults(dict[str, str]): Keyword arguments where each key is the target variable
+            that we are looking for and each value is the default used when it is missing.
+
+    Returns:
+        vars_out(dict): This is a dictionary of all of the optional args. The key of each argument
+            is simply the same key passed in the obtain the value from the environment.
+    """
+    vars_out = {}
+    for var, default in defaults.items():
+        vars_out[var] = os.environ.get(var.upper(), default)
+    return vars_out
+
+
 def obtain_config() -> configparser.ConfigParser:
     '''
     Function that creates and returns a configparser object which contains
@@ -49,18 +68,143 @@ def obtain_config() -> configparser.ConfigParser:
         "dbhostname",
         "dbports",
     )
+    keycloak_vars = _get_optional_environment_variables(
+        keycloak_pool_size="10",
+        keycloak_connect_timeout="3.05",
+        keycloak_read_timeout="10",
+        keycloak_max_retries="1",
+    )
+    auth_vars = _get_optional_environment_variables(
+        auth_mode="local",
+        jwt_audience="",
+        jwt_issuer="",
+        jwt_algorithms="RS256",
+        jwt_leeway_seconds="30",
+        jwks_url="",
+        jwks_min_refresh_seconds="60",
+        jwks_max_age_seconds="3600",
+        token_cache_size="10000",
+        token_cache_ttl_seconds="300",
+    )
+    notification_vars = _get_optional_environment_variables(
+        access_tracking_mode="sync",
+        access_flush_interval_seconds="5",
+        access_flush_max_pending="10000",
+        storage_mode="shared",
+        max_page_size="500",
+        max_batch_size="1000",
+        batch_chunk_size="500",
+        stream_broker="auto",
+        stream_heartbeat_seconds="15",
+        stream_replay_limit="100",
+        max_stream_connections="100",
+        response_cache_size="1000",
+        response_cache_ttl_seconds="30",
+        response_cache_max_notifications="1000",
+        idempotency_ttl_seconds="86400",
+        idempotency_lease_seconds="60",
+        coalescing_mode="disabled",
+        coalescing_window_seconds="300",
+    )
 
     config["keycloak_config"] = {
         "keycloak_server_url": environment_vars["keycloak_server_url"],
         "keycloak_realm_name": environment_vars["keycloak_realm_name"],
         "keycloak_client_id": environment_vars["keycloak_client_id"],
-        "keycloak_client_secret_key": environment_vars["keycloak_client_secret_key"]
+        "keycloak_client_secret_key": environment_vars["keycloak_client_secret_key"],
+        "keycloak_pool_size": keycloak_vars["keycloak_pool_size"],
+        "keycloak_connect_timeout": keycloak_vars["keycloak_connect_timeout"],
+        "keycloak_read_timeout": keycloak_vars["keycloak_read_timeout"],
+        "keycloak_max_retries": keycloak_vars["keycloak_max_retries"],
+    }
+    config["auth_config"] = {
+        "auth_mode": auth_vars["auth_mode"],
+        "jwt_audience": auth_vars["jwt_audience"],
+        "jwt_issuer": auth_vars["jwt_issuer"],
+        "jwt_algorithms": auth_vars["jwt_algorithms"],
+        "jwt_leeway_seconds": auth_vars["jwt_leeway_seconds"],
+        "jwks_url": auth_vars["jwks_url"],
+        "jwks_min_refresh_seconds": auth_vars["jwks_min_refresh_seconds"],
+        "jwks_max_age_seconds": auth_vars["jwks_max_age_seconds"],
+        "token_cache_size": auth_vars["token_cache_size"],
+        "token_cache_ttl_seconds": auth_vars["token_cache_ttl_seconds"],
     }
+    config["notification_config"] = {
+        "access_tracking_mode": notification_vars["access_tracking_mode"],
+        "access_flush_interval_seconds": notification_vars["access_flush_interval_seconds"],
+        "access_flush_max_pending": notification_vars["access_flush_max_pending"],
+        "storage_mode": notification_vars["storage_mode"],
+        "max_page_size": notification_vars["max_page_size"],
+        "max_batch_size": notification_vars["max_batch_size"],
+        "batch_chunk_size": notification_vars["batch_chunk_size"],
+        "stream_broker": notification_vars["stream_broker"],
+        "stream_heartbeat_seconds": notification_vars["stream_heartbeat_seconds"],
+        "stream_replay_limit": notification_vars["stream_replay_limit"],
+        "max_stream_connections": notification_vars["max_stream_connections"],
+        "response_cache_size": notification_vars["response_cache_size"],
+        "response_cache_ttl_seconds": notification_vars["response_cache_ttl_seconds"],
+        "response_cache_max_notifications": notification_vars["response_cache_max_notifications"],
+        "idempotency_ttl_seconds": notification_vars["idempotency_ttl_seconds"],
+        "idempotency_lease_seconds": notification_vars["idempotency_lease_seconds"],
+        "coalescing_mode": notification_vars["coalescing_mode"],
+        "coalescing_window_seconds": notification_vars["coalescing_window_seconds"],
+    }
+    # The retention days of each notification type are read by load_retention_policies.
+    config["retention_config"] = _get_optional_environment_variables(
+        retention_mode="disabled",
+        archive_expired="true",
+        archive_batch_size="500",
+        archive_batch_delay_seconds="0.2",
+        retention_pushgateway="",
+    )
+    config["delivery_config"] = _get_optional_environment_variables(
+        delivery_channels="",
+        delivery_batch_size="100",
+        delivery_concurrency="16",
+        delivery_timeout_seconds="10",
+        delivery_max_attempts="8",
+        delivery_backoff_seconds="1",
+        delivery_max_backoff_seconds="300",
+        delivery_lease_seconds="60",
+        delivery_orphan_seconds="60",
+        delivery_poll_seconds="1",
+        delivery_metrics_port="",
+    )
+    config["scheduler_config"] = _get_optional_environment_variables(
+        scheduler_batch_size="500",
+        scheduler_lease_seconds="60",
+        scheduler_poll_seconds="1",
+        scheduler_metrics_port="",
+    )
+    database_vars = _get_optional_environment_variables(
+        slow_command_threshold_ms="100",
+        explain_slow_commands="true",
+        max_pool_size="100",
+        min_pool_size="0",
+        wait_queue_timeout_ms="0",
+        server_selection_timeout_ms="30000",
+        compressors="",
+        read_preference="primary",
+        write_concern_w="",
+        write_concern_journal="",
+        pool_warmup_timeout_seconds="5",
+    )
     config["database_config"] = {
         "dbuser": environment_vars["dbuser"],
         "dbpassword": environment_vars["dbpassword"],
         "dbname": environment_vars["dbname"],
         "dbhostname": environment_vars["dbhostname"],
         "dbports": environment_vars["dbports"],
+        "slow_command_threshold_ms": database_vars["slow_command_threshold_ms"],
+        "explain_slow_commands": database_vars["explain_slow_commands"],
+        "max_pool_size": database_vars["max_pool_size"],
+        "min_pool_size": database_vars["min_pool_size"],
+        "wait_queue_timeout_ms": database_vars["wait_queue_timeout_ms"],
+        "server_selection_timeout_ms": database_vars["server_selection_timeout_ms"],
+        "compressors": database_vars["compressors"],
+        "read_preference": database_vars["read_preference"],
+        "write_concern_w": database_vars["write_concern_w"],
+        "write_concern_journal": database_vars["write_concern_journal"],
+        "pool_warmup_timeout_seconds": database_vars["pool_warmup_timeout_seconds"],
     }
     return config
@@ -0,0 +1,60 @@
+"""Module which contains function that exposes our prometheus metrics on our flask app"""
+import time
+from flask import Flask, Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from application.utils.command_monitoring import request_db_time
+from application.utils.metrics import (
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS_IN_PROGRESS,
+    metrics_registry,
+)
+
+UNMATCHED_ROUTE = "unmatched"
+SERVER_TIMING_HEADER = "Server-Timing"
+
+
+def _route() -> str:
+    # The rule rather than the path, so that ids in paths do not become label values.
+    return request.url_rule.rule if request.url_rule is not None else UNMATCHED_ROUTE
+
+
+def configure_metrics(app: Flask, path: str = "/metrics"):
+    '''Accepts our flask app, times every request it answers and adds our metrics endpoint.
+        Every response carries a Server-Timing header with the time spent on mongo commands
+        and the total time of the request.
+
+        Args:
+            app: Our flask app to be instrumented.
+            path: The path that prometheus scrapes our metrics from.
+    '''
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_route = _route()
+        g.metrics_start = time.perf_counter()
+        HTTP_REQUESTS_IN_PROGRESS.labels(method=request.method, route=g.metrics_route).inc()
+
+    @app.after_request
+    def _observe_request(response):
+        if "metrics_start" in g:
+            total_seconds = time.perf_counter() - g.metrics_start
+            HTTP_REQUEST_DURATION.labels(
+                method=request.method,
+                route=g.metrics_route,
+                status=response.status_code,
+            ).observe(total_seconds)
+            db_seconds, db_commands = request_db_time()
+            response.headers[SERVER_TIMING_HEADER] = (
+                f'db;dur={db_seconds * 1000:.2f};desc="{db_commands} commands", '
+                f"total;dur={total_seconds * 1000:.2f}"
+            )
+        return response
+
+    @app.teardown_request
+    def _finish_request(_error=None):
+        if "metrics_route" in g:
+            HTTP_REQUESTS_IN_PROGRESS.labels(method=request.method, route=g.metrics_route).dec()
+
+    @app.route(path, methods=["GET"])
+    def metrics():
+        return Response(generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST)
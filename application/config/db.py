@@ -1,35 +1,259 @@
-"""Module which configures and obtains our mongo database connection."""
+"""
+Module which configures and obtains our mongo database connection.
+
+pymongo clients are not fork safe, so the connection is registered without connecting and
+is only opened by the first operation, which happens in a gunicorn worker rather than in the
+process it was forked from. prepare_db_connection then fills the pool of each worker before
+it takes traffic.
+"""
+import configparser
+import logging
+import threading
+import time
 from mongoengine import connect
+from mongoengine.connection import DEFAULT_CONNECTION_NAME, get_connection
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+from pymongo.write_concern import WriteConcern
 from application.config.config import obtain_config
+from application.utils.command_monitoring import CommandTimer
+
+LOGGER = logging.getLogger(__name__)
+
+# Fields a driver adds to a command, which can not be part of the command that is explained.
+DRIVER_COMMAND_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern"}
+
+READ_PREFERENCES = {
+    "primary": "primary",
+    "primarypreferred": "primaryPreferred",
+    "secondary": "secondary",
+    "secondarypreferred": "secondaryPreferred",
+    "nearest": "nearest",
+}
+
+
+class ConnectionCounter(monitoring.ConnectionPoolListener):
+    """
+    ConnectionPoolListener which counts the connections of a client that are ready to be
+    used, so that the pool can be waited on until it is filled.
+    """
+
+    def __init__(self):
+        self._ready = 0
+        self._condition = threading.Condition()
+
+    @property
+    def ready(self) -> int:
+        return self._ready
+
+    def wait_for(self, connections: int, timeout_seconds: float) -> bool:
+        """
+        Waits until at least the given number of connections are ready.
+
+        Returns:
+            bool: Whether the connections were ready before the timeout.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._ready >= connections, timeout=timeout_seconds
+            )
+
+    def connection_ready(self, event):
+        with self._condition:
+            self._ready += 1
+            self._condition.notify_all()
+
+    def connection_closed(self, event):
+        with self._condition:
+            self._ready -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+_connection_counters = {}
+
+
+def _explain_command(alias: str):
+    """
+    Helper function which creates the function that a CommandTimer explains slow commands
+    with, on the connection of the given alias.
+    """
+    def explain(database_name: str, command: dict) -> dict:
+        command = {
+            key: value for key, value in command.items()
+            if not key.startswith("$") and key not in DRIVER_COMMAND_FIELDS
+        }
+        return get_connection(alias)[database_name].command(
+            {"explain": command, "verbosity": "queryPlanner"}
+        )
+    return explain
 
-APPCONFIG = obtain_config()
+
+def create_command_timer(
+    config: configparser.ConfigParser,
+    alias: str = DEFAULT_CONNECTION_NAME,
+) -> CommandTimer:
+    """
+    Function that creates the CommandTimer which monitors the commands sent through a
+    connection, from our application config.
+
+    Args:
+        config(ConfigParser): Our application config, as returned from obtain_config.
+        alias(str) - Optional: The alias of the connection being monitored.
+
+    Returns:
+        CommandTimer: A listener timing every command, and logging the slow ones.
+    """
+    database_config = config["database_config"]
+    explain = _explain_command(alias) \
+        if database_config.getboolean("explain_slow_commands") else None
+    return CommandTimer(
+        database_config.getfloat("slow_command_threshold_ms") / 1000,
+        explain=explain,
+    )
 
 
-def get_mongo_settings() -> dict:
+def get_read_preference(config: configparser.ConfigParser):
+    """
+    Function that obtains the read preference that GET requests read notifications with.
+
+    Args:
+        config(ConfigParser): Our application config, as returned from obtain_config.
+
+    Returns:
+        read_preference: A pymongo read preference.
+    """
+    name = config["database_config"]["read_preference"]
+    try:
+        mode = read_pref_mode_from_name(READ_PREFERENCES[name.lower()])
+    except KeyError:
+        raise ValueError(f"read_preference: {name} is not supported.")
+    return make_read_preference(mode, None)
+
+
+def get_write_concern(config: configparser.ConfigParser) -> WriteConcern:
+    """
+    Function that obtains the write concern that notifications are created with.
+
+    Args:
+        config(ConfigParser): Our application config, as returned from obtain_config.
+
+    Returns:
+        WriteConcern: The write concern of created notifications, which is the default
+            write concern of the deployment when neither w nor journal are configured.
+    """
+    database_config = config["database_config"]
+    write_concern = {}
+    w = database_config["write_concern_w"]
+    if w:
+        write_concern["w"] = int(w) if w.isdigit() else w
+    if database_config["write_concern_journal"]:
+        write_concern["j"] = database_config.getboolean("write_concern_journal")
+    return WriteConcern(**write_concern)
+
+
+def get_mongo_settings(config: configparser.ConfigParser = None) -> dict:
     """
     Function that creates a dictionary of settings to be consumed by mongo's connect function.
 
+    Args:
+        config(ConfigParser) - Optional: Our application config, obtained when the settings
+            are created if it is not given.
+
     Returns:
         settings_out(dict): A dictionary of our connection settings for our mongo connection.
     """
+    config = config or obtain_config()
+    database_config = config["database_config"]
 
     settings_out = {
-        "host": APPCONFIG["database_config"]["dbhostname"],
-        "db": APPCONFIG["database_config"]["dbname"],
-        "port": int(APPCONFIG["database_config"]["dbports"]),
-        "username": APPCONFIG["database_config"]["dbuser"],
-        "password": APPCONFIG["database_config"]["dbpassword"],
+        "host": database_config["dbhostname"],
+        "db": database_config["dbname"],
+        "port": int(database_config["dbports"]),
+        "username": database_config["dbuser"],
+        "password": database_config["dbpassword"],
+        # The client is opened by its first operation, after gunicorn forked the worker.
+        "connect": False,
+        "maxPoolSize": database_config.getint("max_pool_size"),
+        "minPoolSize": database_config.getint("min_pool_size"),
+        "serverSelectionTimeoutMS": database_config.getint("server_selection_timeout_ms"),
     }
+    wait_queue_timeout_ms = database_config.getint("wait_queue_timeout_ms")
+    if wait_queue_timeout_ms > 0:
+        settings_out["waitQueueTimeoutMS"] = wait_queue_timeout_ms
+    if database_config["compressors"]:
+        settings_out["compressors"] = database_config["compressors"]
     return settings_out
 
 
 def get_db_connection(alias: str = None):
     """
-    Function which gets the DB connection
+    Function which registers the DB connection, with every command it sends monitored by a
+    CommandTimer. No connection is opened until the first operation.
     """
-
-    settings = get_mongo_settings()
-    if alias is not None:
+    config = obtain_config()
+    settings = get_mongo_settings(config)
+    alias = alias or DEFAULT_CONNECTION_NAME
+    if alias != DEFAULT_CONNECTION_NAME:
         settings["alias"] = alias
+    counter = _connection_counters[alias] = ConnectionCounter()
+    settings["event_listeners"] = [create_command_timer(config, alias), counter]
 
     return connect(**settings)
+
+
+def prepare_db_connection(alias: str = DEFAULT_CONNECTION_NAME) -> bool:
+    """
+    Function which opens the DB connection of a worker and waits until its pool holds
+    min_pool_size connections, so that the first requests of the worker do not wait on
+    new connections.
+
+    Args:
+        alias(str) - Optional: The alias of the connection to prepare.
+
+    Returns:
+        bool: Whether the pool was filled before pool_warmup_timeout_seconds.
+    """
+    database_config = obtain_config()["database_config"]
+    min_pool_size = database_config.getint("min_pool_size")
+    timeout_seconds = database_config.getfloat("pool_warmup_timeout_seconds")
+    start = time.monotonic()
+    try:
+        get_connection(alias).admin.command("ping")
+    except PyMongoError as err:
+        LOGGER.warning("Unable to warm up the mongo connection pool: %s", err)
+        return False
+    counter = _connection_counters.get(alias)
+    filled = counter is None or counter.wait_for(min_pool_size, timeout_seconds)
+    LOGGER.info(
+        "Warmed up the mongo connection pool with %s connections in %.0fms",
+        counter.ready if counter is not None else "unknown",
+        (time.monotonic() - start) * 1000,
+    )
+    return filled
@@ -0,0 +1,260 @@
+"""
+Module which contains the ways that reads of a user's notifications are recorded on the
+lastAccessed field of the notifications.
+"""
+import atexit
+import configparser
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from enum import Enum
+from bson import ObjectId
+from prometheus_client import Counter
+from pymongo import UpdateMany
+from pymongo.errors import PyMongoError
+from application.namespaces.notifications.models import InboxEntry, Notification
+
+LOGGER = logging.getLogger(__name__)
+
+ACCESS_TOUCHES_COALESCED = Counter(
+    "orodha_access_touches_coalesced",
+    "Number of recorded reads of a notification that was already waiting to be flushed.",
+)
+ACCESS_FLUSHES = Counter(
+    "orodha_access_flushes",
+    "Number of flushes of recorded reads to the database.",
+    ["outcome"],
+)
+
+NOTIFICATION_KEY = "notification"
+INBOX_ENTRY_KEY = "inbox_entry"
+
+
+class AccessTrackingModes(Enum):
+    """
+    Simple class which inherits from Enum and defines how notification reads are tracked.
+
+    SYNC: lastAccessed is stamped with a single update_many as the notifications are read.
+    BATCHED: Reads are recorded in memory and flushed to the database in the background.
+    DISABLED: Reads do not write to the database and lastAccessed is left untouched.
+    """
+    SYNC = "sync"
+    BATCHED = "batched"
+    DISABLED = "disabled"
+
+
+def current_access_time() -> datetime:
+    """
+    Function which obtains the time that accessed notifications are stamped with.
+
+    Returns:
+        accessed_at(datetime): The current naive UTC time, truncated to the millisecond
+            precision that mongo stores, so that returned and stored values match.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def touch_user_notifications(target_user: str, first_id: ObjectId, last_id: ObjectId) -> datetime:
+    """
+    Function which stamps the lastAccessed field of the notifications targeting a user,
+    within a range of _id values, in a single update_many.
+
+    Args:
+        target_user(str): The user_id whose notifications have been accessed.
+        first_id(ObjectId): The smallest _id of the notifications that were accessed.
+        last_id(ObjectId): The largest _id of the notifications that were accessed.
+
+    Returns:
+        accessed_at(datetime): The time the notifications were stamped with, truncated to
+            the millisecond precision that mongo stores.
+    """
+    accessed_at = current_access_time()
+    Notification._get_collection().update_many(
+        {"targets": target_user, "_id": {"$gte": first_id, "$lte": last_id}},
+        {"$set": {"lastAccessed": accessed_at}},
+    )
+    return accessed_at
+
+
+def notification_key(notification_id: ObjectId) -> tuple:
+    """Returns the key under which reads of a shared notification document are recorded."""
+    return (NOTIFICATION_KEY, notification_id)
+
+
+def inbox_entry_key(user_id: str, notification_id: ObjectId) -> tuple:
+    """Returns the key under which reads of a user's inbox entry are recorded."""
+    return (INBOX_ENTRY_KEY, user_id, notification_id)
+
+
+def _not_accessed_since(accessed_at: datetime) -> dict:
+    # Also matches a missing or null lastAccessed, so that a stamp never goes back in time.
+    return {"$nor": [{"lastAccessed": {"$gte": accessed_at}}]}
+
+
+class AccessTracker:
+    """
+    Write-behind recorder of notification reads. Reads are kept in memory, where repeated
+    reads of the same document are coalesced into the latest one, and are flushed with one
+    bulk_write per collection every flush_interval_seconds, once max_pending documents are
+    waiting, or when the process exits.
+
+    Args:
+        flush_interval_seconds(float): The longest time a read waits to be flushed.
+        max_pending(int): The number of waiting documents which triggers an early flush.
+    """
+
+    def __init__(self, flush_interval_seconds: float = 5, max_pending: int = 10000):
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, keys: list, accessed_at: datetime) -> set:
+        """
+        Records that documents were read at accessed_at.
+
+        Args:
+            keys(list[tuple]): The keys of the documents that were read, as returned by
+                notification_key or inbox_entry_key.
+            accessed_at(datetime): The time the documents were read.
+
+        Returns:
+            keys(set[tuple]): The keys which were not already waiting to be flushed.
+        """
+        new_keys = set()
+        with self._lock:
+            for key in keys:
+                previous = self._pending.get(key)
+                if previous is None:
+                    new_keys.add(key)
+                else:
+                    ACCESS_TOUCHES_COALESCED.inc()
+                if previous is None or previous < accessed_at:
+                    self._pending[key] = accessed_at
+            pending_count = len(self._pending)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="access-tracker", daemon=True
+                )
+                self._thread.start()
+        if pending_count >= self.max_pending:
+            self._flush_requested.set()
+        return new_keys
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._flush_requested.wait(self.flush_interval_seconds)
+            self._flush_requested.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Writes every waiting read to the database, with one bulk_write per collection.
+        Documents are only stamped when they were not accessed more recently, and
+        documents deleted in the meantime are skipped.
+
+        Returns:
+            flushed(int): The number of documents whose reads were flushed.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        # Reads recorded by the same request share their time, so they are grouped into
+        # one update_many per time rather than one update per document.
+        groups = {}
+        for key, accessed_at in pending.items():
+            group_key = (key[:-1], accessed_at)
+            groups.setdefault(group_key, []).append(key[-1])
+        notification_requests = []
+        inbox_requests = []
+        for (key_prefix, accessed_at), notification_ids in groups.items():
+            update = {"$set": {"lastAccessed": accessed_at}}
+            if key_prefix[0] == NOTIFICATION_KEY:
+                notification_requests.append(UpdateMany(
+                    {"_id": {"$in": notification_ids}, **_not_accessed_since(accessed_at)},
+                    update,
+                ))
+            else:
+                inbox_requests.append(UpdateMany(
+                    {
+                        "userId": key_prefix[1],
+                        "notificationId": {"$in": notification_ids},
+                        **_not_accessed_since(accessed_at),
+                    },
+                    update,
+                ))
+        try:
+            if notification_requests:
+                Notification._get_collection().bulk_write(notification_requests, ordered=False)
+            if inbox_requests:
+                InboxEntry._get_collection().bulk_write(inbox_requests, ordered=False)
+        except PyMongoError:
+            ACCESS_FLUSHES.labels(outcome="error").inc()
+            LOGGER.exception("Unable to flush %s notification reads", len(pending))
+            return 0
+        ACCESS_FLUSHES.labels(outcome="success").inc()
+        return len(pending)
+
+    def close(self):
+        """Stops the background flushes and flushes the reads that are still waiting."""
+        self._closed.set()
+        self._flush_requested.set()
+        self.flush()
+
+
+def create_access_tracker(config: configparser.ConfigParser) -> AccessTracker:
+    """
+    Function which creates an AccessTracker from our application config.
+
+    Args:
+        config(ConfigParser): Our application config, as returned from obtain_config.
+
+    Returns:
+        AccessTracker: A write-behind recorder of notification reads.
+    """
+    return AccessTracker(
+        flush_interval_seconds=config["notification_config"].getfloat(
+            "access_flush_interval_seconds"),
+        max_pending=config["notification_config"].getint("access_flush_max_pending"),
+    )
+
+
+_access_tracker = None
+_access_tracker_lock = threading.Lock()
+
+
+def get_access_tracker(config: configparser.ConfigParser) -> AccessTracker:
+    """
+    Function which returns the access tracker of this process, creating it the first time
+    that it is needed. Its waiting reads are flushed when the process exits.
+    """
+    global _access_tracker
+    if _access_tracker is None:
+        with _access_tracker_lock:
+            if _access_tracker is None:
+                _access_tracker = create_access_tracker(config)
+                atexit.register(_access_tracker.close)
+    return _access_tracker
+
+
+def reset_access_tracker():
+    """
+    Function which discards the access tracker of this process. It is called in a child
+    process after a fork, since the reads waiting in the parent are flushed by the parent.
+    """
+    global _access_tracker, _access_tracker_lock
+    _access_tracker = None
+    _access_tracker_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_access_tracker)
@@ -0,0 +1,101 @@
+"""
+Module which contains the coalescing of repeated notifications. A list can invite the same
+user many times in a short while, and without coalescing every invite is its own document and
+its own row of every GET. With coalescing, a notification whose type declares coalesce_by
+fields is stored once per target, and a new notification that matches an unread one of its
+target, on its type and those fields, bumps the eventCount and lastEventAt of that one instead.
+
+Each target's notification is written with one atomic upsert. Two concurrent first events can
+still both insert, after which later events merge into the newest of them.
+"""
+from datetime import timedelta
+from enum import Enum
+from bson import ObjectId
+from pymongo import DESCENDING, ReturnDocument
+
+
+class CoalescingModes(Enum):
+    """
+    Simple class which inherits from Enum and defines how repeated notifications are merged.
+
+    DISABLED: Every notification is stored as it is created.
+    UNREAD: A notification is merged into the unread notification it matches.
+    DIGEST: A notification is merged into the unread notification it matches, when that one
+        was created less than the coalescing window ago, so that a burst becomes one digest.
+    """
+    DISABLED = "disabled"
+    UNREAD = "unread"
+    DIGEST = "digest"
+
+
+def coalescing_query(notification: dict, target: str, coalesce_by: tuple) -> dict:
+    """
+    Function which creates the query matching the open notification of one target that a
+    notification is merged into. Only notifications written by coalescing have an eventCount,
+    so notifications created otherwise are never merged into.
+
+    Args:
+        notification(dict): The raw document of the new notification.
+        target(str): The target whose notification is matched.
+        coalesce_by(tuple[str]): The attributes, besides the type, notifications must share.
+
+    Returns:
+        query(dict): The query of the notification to merge into.
+    """
+    return {
+        "targets": [target],
+        "notificationType": notification["notificationType"],
+        **{attribute: notification.get(attribute) for attribute in coalesce_by},
+        "lastAccessed": None,
+        "eventCount": {"$gte": 1},
+    }
+
+
+def coalesce_notification(
+    collection,
+    notification: dict,
+    coalesce_by: tuple,
+    window_seconds: float = None,
+) -> list:
+    """
+    Function which writes a new notification by merging it, for each of its targets, into
+    their matching unread notification, or by creating one when there is none.
+
+    Args:
+        collection(Collection): The notification collection, with its write concern.
+        notification(dict): The raw document of the new notification. Its _id, when it has
+            one, is given to the notification created for its first target.
+        coalesce_by(tuple[str]): The attributes, besides the type, notifications must share.
+        window_seconds(float) - Optional: Only notifications created this many seconds ago
+            or less are merged into.
+
+    Returns:
+        coalesced(list[tuple]): For each target, its notification as it was written along
+            with whether it was created rather than merged into.
+    """
+    event_at = notification["createdAt"]
+    coalesced = []
+    for position, target in enumerate(notification["targets"]):
+        query = coalescing_query(notification, target, coalesce_by)
+        # Fields of the query that are matched by value are set on insert by mongo itself.
+        on_insert = {
+            field: value for field, value in notification.items()
+            if field not in query and field not in ("eventCount", "lastEventAt")
+        }
+        on_insert["_id"] = notification["_id"] if position == 0 and "_id" in notification \
+            else ObjectId()
+        if window_seconds:
+            query["createdAt"] = {"$gte": event_at - timedelta(seconds=window_seconds)}
+        written = collection.find_one_and_update(
+            query,
+            {
+                "$inc": {"eventCount": 1},
+                "$set": {"lastEventAt": event_at},
+                "$setOnInsert": on_insert,
+            },
+            sort=[("_id", DESCENDING)],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        coalesced.append((written, written["_id"] == on_insert["_id"]))
+    return coalesced
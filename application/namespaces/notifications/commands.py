@@ -0,0 +1,168 @@
+"""
+Module which contains the command line entry points of the notification service. They are
+registered on the flask cli, and run with a live db connection through:
+
+    flask --app application.wsgi <command>
+"""
+import signal
+import threading
+import click
+from bson import ObjectId
+from prometheus_client import start_http_server
+from application.config import obtain_config
+from application.namespaces.notifications.controllers import promote_notifications
+from application.namespaces.notifications.delivery import create_delivery_worker
+from application.namespaces.notifications.inbox import StorageModes, backfill_inbox
+from application.namespaces.notifications.models import ensure_notification_indexes
+from application.namespaces.notifications.scheduling import create_notification_scheduler
+from application.namespaces.notifications.retention import (
+    expire_notifications,
+    load_retention_policies,
+    push_expiry_metrics,
+)
+from application.namespaces.notifications.user_state import reconcile_user_counts
+
+
+@click.command("backfill-inbox")
+@click.option(
+    "--batch-size", default=1000, show_default=True,
+    help="The number of notifications read and written per batch.")
+@click.option(
+    "--after-id", default=None,
+    help="Resume the backfill after the notification with this id.")
+def backfill_inbox_command(batch_size: int, after_id: str):
+    """Creates the per recipient inbox entries of existing notifications."""
+    counts = backfill_inbox(
+        batch_size=batch_size,
+        after_id=ObjectId(after_id) if after_id is not None else None,
+    )
+    click.echo(
+        f"Backfilled {counts['notifications']} notifications, "
+        f"created {counts['entries_created']} inbox entries, "
+        f"last notification id: {counts['last_id']}"
+    )
+
+
+@click.command("reconcile-counts")
+@click.option(
+    "--user-id", default=None,
+    help="Only reconcile the counters of this user.")
+@click.option(
+    "--batch-size", default=1000, show_default=True,
+    help="The number of counters written per batch.")
+def reconcile_counts_command(user_id: str, batch_size: int):
+    """Recounts the total and unread notifications of users and corrects their counters."""
+    storage_mode = StorageModes(
+        obtain_config()["notification_config"]["storage_mode"].lower()
+    )
+    result = reconcile_user_counts(storage_mode, user_id=user_id, batch_size=batch_size)
+    click.echo(
+        f"Counted the notifications of {result['users']} users, "
+        f"corrected the counters of {result['corrected']} users"
+    )
+
+
+@click.command("expire-notifications")
+@click.option(
+    "--batch-size", default=None, type=int,
+    help="The number of notifications removed per batch, archive_batch_size by default.")
+@click.option(
+    "--batch-delay", default=None, type=float,
+    help="The seconds paused after each batch, archive_batch_delay_seconds by default.")
+@click.option(
+    "--archive/--no-archive", default=None,
+    help="Whether expired notifications are archived, archive_expired by default.")
+@click.option(
+    "--pushgateway", default=None,
+    help="The pushgateway the metrics of the run are pushed to, retention_pushgateway by default.")
+def expire_notifications_command(
+    batch_size: int,
+    batch_delay: float,
+    archive: bool,
+    pushgateway: str,
+):
+    """Removes, and archives, the notifications which expired under their retention."""
+    config = obtain_config()
+    retention_config = config["retention_config"]
+    results = expire_notifications(
+        load_retention_policies(),
+        StorageModes(config["notification_config"]["storage_mode"].lower()),
+        archive=retention_config.getboolean("archive_expired") if archive is None else archive,
+        batch_size=batch_size or retention_config.getint("archive_batch_size"),
+        batch_delay_seconds=(
+            retention_config.getfloat("archive_batch_delay_seconds")
+            if batch_delay is None else batch_delay
+        ),
+    )
+    if not results:
+        click.echo("No notification type has a retention configured")
+    for result in results:
+        click.echo(
+            f"Expired {result['expired']} {result['notification_type']} notifications "
+            f"by {result['reason']} time, archived {result['archived']}"
+        )
+    pushgateway = retention_config["retention_pushgateway"] if pushgateway is None \
+        else pushgateway
+    if pushgateway:
+        try:
+            push_expiry_metrics(pushgateway)
+        except OSError as err:
+            raise click.ClickException(
+                f"The notifications expired, but their metrics could not be pushed: {err}"
+            )
+
+
+def _stop_on_signal() -> threading.Event:
+    """Returns an event which is set once the process is asked to stop."""
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    return stop
+
+
+@click.command("deliver-notifications")
+@click.option(
+    "--once", is_flag=True, default=False,
+    help="Deliver a single batch of due outbox entries and exit.")
+def deliver_notifications_command(once: bool):
+    """Delivers the outbox entries of notifications to their channels, until stopped."""
+    config = obtain_config()
+    delivery_config = config["delivery_config"]
+    ensure_notification_indexes()
+    worker = create_delivery_worker(config)
+    if not worker.channels:
+        click.echo("No delivery channel is configured, entries are left in the outbox")
+    try:
+        if once:
+            counts = worker.run_once()
+            click.echo(
+                "Processed outbox entries: " + (
+                    ", ".join(f"{count} {outcome}" for outcome, count in sorted(counts.items()))
+                    or "none were due"
+                )
+            )
+            return
+        if delivery_config["delivery_metrics_port"]:
+            start_http_server(delivery_config.getint("delivery_metrics_port"))
+        worker.run(delivery_config.getfloat("delivery_poll_seconds"), _stop_on_signal())
+    finally:
+        worker.close()
+
+
+@click.command("promote-notifications")
+@click.option(
+    "--once", is_flag=True, default=False,
+    help="Promote a single batch of due scheduled notifications and exit.")
+def promote_notifications_command(once: bool):
+    """Creates scheduled notifications once they are due, until stopped."""
+    config = obtain_config()
+    scheduler_config = config["scheduler_config"]
+    ensure_notification_indexes()
+    scheduler = create_notification_scheduler(config, promote_notifications)
+    if once:
+        click.echo(f"Promoted {scheduler.run_once()} scheduled notifications")
+        return
+    if scheduler_config["scheduler_metrics_port"]:
+        start_http_server(scheduler_config.getint("scheduler_metrics_port"))
+    scheduler.run(scheduler_config.getfloat("scheduler_poll_seconds"), _stop_on_signal())
+
@@ -1,101 +1,587 @@
 """Module which contains controller functions that create, obtain, and delete notifications."""
+import logging
+import threading
+from http import HTTPStatus
+from datetime import datetime
 from bson import ObjectId
-import orodha_keycloak
+from bson.errors import InvalidId
+from flask_restx.inputs import datetime_from_iso8601
+from keycloak.exceptions import KeycloakConnectionError, KeycloakError
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, PyMongoError
 from mongoengine import (
     InvalidQueryError,
     ValidationError,
-    FieldDoesNotExist,
     OperationError,
-    DoesNotExist,
 )
 from application.config import obtain_config
+from application.config.db import get_read_preference, get_write_concern
+from application.utils.metrics import time_operation
+from application.auth import (
+    AuthModes,
+    LocalTokenVerifier,
+    PooledKeycloakClient,
+    TokenVerificationError,
+    JWKSUnavailableError,
+    create_token_cache,
+    create_token_verifier,
+    get_keycloak_client,
+)
 from application.namespaces.notifications.models import (
+    NOTIFICATION_RESPONSE_PROJECTION,
+    NOTIFICATION_TYPES,
     Notification,
-    notification_factory,
+    NotificationTypes,
+)
+from application.namespaces.notifications.pagination import (
+    decode_cursor,
+    encode_cursor,
+    parse_limit,
+)
+from application.namespaces.notifications.access_tracking import (
+    AccessTracker,
+    AccessTrackingModes,
+    current_access_time,
+    get_access_tracker,
+    inbox_entry_key,
+    notification_key,
+    touch_user_notifications,
+)
+from application.namespaces.notifications.inbox import (
+    DUPLICATE_KEY_ERROR,
+    StorageModes,
+    delete_inbox_entries,
+    fan_out,
+    find_inbox_notifications,
+    inbox_query,
+    touch_inbox_entries,
+)
+from application.namespaces.notifications.user_state import (
+    aggregate_user_counts,
+    count_changes,
+    get_user_counts,
+    get_user_version,
+    removal_changes,
+    update_user_states,
+)
+from application.namespaces.notifications.coalescing import (
+    CoalescingModes,
+    coalesce_notification,
+)
+from application.namespaces.notifications.delivery import (
+    enqueue_deliveries,
+    parse_delivery_channels,
+)
+from application.namespaces.notifications.scheduling import (
+    delete_scheduled_notifications,
+    schedule_notifications,
+)
+from application.namespaces.notifications.idempotency import (
+    claim_idempotency_key,
+    complete_idempotency_key,
+    hash_payload,
+    release_idempotency_key,
+    validate_idempotency_key,
+)
+from application.namespaces.notifications.response_cache import create_notification_page_cache
+from application.namespaces.notifications.streaming import (
+    ConnectionLimiter,
+    InMemoryBroker,
+    NotificationStream,
+    get_broker,
 )
 from application.namespaces.notifications.exceptions import (
+    NotificationTypeError,
     OrodhaForbiddenError,
     OrodhaBadRequestError,
     OrodhaInternalError,
-    OrodhaNotFoundError
+    OrodhaNotFoundError,
+    OrodhaServiceUnavailableError,
+    PayloadValidationError,
 )
 
+LOGGER = logging.getLogger(__name__)
+
 APPCONFIG = obtain_config()
+AUTH_MODE = AuthModes(APPCONFIG["auth_config"]["auth_mode"].lower())
+TOKEN_CACHE = create_token_cache(APPCONFIG)
+RESPONSE_CACHE = create_notification_page_cache(APPCONFIG)
+ACCESS_TRACKING_MODE = AccessTrackingModes(
+    APPCONFIG["notification_config"]["access_tracking_mode"].lower()
+)
+STORAGE_MODE = StorageModes(APPCONFIG["notification_config"]["storage_mode"].lower())
+READ_PREFERENCE = get_read_preference(APPCONFIG)
+WRITE_CONCERN = get_write_concern(APPCONFIG)
+MAX_PAGE_SIZE = APPCONFIG["notification_config"].getint("max_page_size")
+MAX_BATCH_SIZE = APPCONFIG["notification_config"].getint("max_batch_size")
+BATCH_CHUNK_SIZE = APPCONFIG["notification_config"].getint("batch_chunk_size")
+STREAM_HEARTBEAT_SECONDS = APPCONFIG["notification_config"].getfloat("stream_heartbeat_seconds")
+STREAM_REPLAY_LIMIT = APPCONFIG["notification_config"].getint("stream_replay_limit")
+COALESCING_MODE = CoalescingModes(APPCONFIG["notification_config"]["coalescing_mode"].lower())
+COALESCING_WINDOW_SECONDS = APPCONFIG["notification_config"].getfloat(
+    "coalescing_window_seconds"
+)
+DELIVERY_CHANNELS = parse_delivery_channels(APPCONFIG["delivery_config"]["delivery_channels"])
+IDEMPOTENCY_LEASE_SECONDS = APPCONFIG["notification_config"].getfloat(
+    "idempotency_lease_seconds"
+)
+STREAM_LIMITER = ConnectionLimiter(
+    APPCONFIG["notification_config"].getint("max_stream_connections")
+)
 
+_token_verifier = None
+_token_verifier_lock = threading.Lock()
 
-def _create_keycloak_client() -> orodha_keycloak.OrodhaKeycloakClient:
+
+def _get_keycloak_client() -> PooledKeycloakClient:
     """
-    Helper function which creates our keycloak client from config data
-    for use in our main controller functions.
+    Helper function which obtains the keycloak client shared by every request of this
+    process for use in our main controller functions.
 
     Returns:
-        OrodhaKeycloakClient: A facade client used by Orodha in order to make interactions with
+        PooledKeycloakClient: A facade client used by Orodha in order to make interactions with
             keycloak more uniform for the service.
     """
-    return orodha_keycloak.OrodhaKeycloakClient(
-        server_url=APPCONFIG["keycloak_config"]["keycloak_server_url"],
-        realm_name=APPCONFIG["keycloak_config"]["keycloak_realm_name"],
-        client_id=APPCONFIG["keycloak_config"]["keycloak_client_id"],
-        client_secret_key=APPCONFIG["keycloak_config"]["keycloak_client_secret_key"],
-    )
+    return get_keycloak_client(APPCONFIG)
+
+
+def _get_token_verifier() -> LocalTokenVerifier:
+    """
+    Helper function which lazily creates the LocalTokenVerifier shared by every request,
+    so that the public keys of our realm are only fetched once per process.
+
+    Returns:
+        LocalTokenVerifier: A verifier which checks tokens against our cached realm keys.
+    """
+    global _token_verifier
+    if _token_verifier is None:
+        with _token_verifier_lock:
+            if _token_verifier is None:
+                _token_verifier = create_token_verifier(APPCONFIG)
+    return _token_verifier
+
+
+def _get_broker() -> InMemoryBroker:
+    """
+    Helper function which obtains the broker that newly created notifications are
+    published to, and that notification streams subscribe to.
+
+    Returns:
+        InMemoryBroker: The stream broker of this process.
+    """
+    return get_broker(APPCONFIG)
+
+
+def _get_access_tracker() -> AccessTracker:
+    """
+    Helper function which obtains the tracker that reads are recorded on when
+    ACCESS_TRACKING_MODE is batched.
+
+    Returns:
+        AccessTracker: The access tracker of this process.
+    """
+    return get_access_tracker(APPCONFIG)
 
 
-def get_notifications(token: str, target_user: str):
+def _get_keycloak_user(token: str) -> dict:
+    """
+    Helper function which asks keycloak for the user that a JWT token belongs to, mapping
+    the errors of keycloak to ours.
+
+    Args:
+        token(str): A JWT token obtained through keycloak.
+
+    Returns:
+        user(dict): The keycloak representation of the user.
+
+    Raises:
+        OrodhaForbiddenError: If the token is invalid or expired, or its user does not exist.
+        OrodhaServiceUnavailableError: If keycloak could not be reached.
+        OrodhaInternalError: If keycloak answered with any other error.
+    """
+    try:
+        with time_operation("keycloak", "get_user"):
+            return _get_keycloak_client().get_user(token=token)
+    except TokenVerificationError as err:
+        raise OrodhaForbiddenError() from err
+    except KeycloakConnectionError as err:
+        raise OrodhaServiceUnavailableError(
+            f"Unable to reach keycloak: {err.error_message}"
+        ) from err
+    except KeycloakError as err:
+        if err.response_code == HTTPStatus.NOT_FOUND:
+            raise OrodhaForbiddenError() from err
+        raise OrodhaInternalError(
+            message=f"Unable to verify token: {err.error_message}"
+        ) from err
+
+
+def _resolve_user(token: str) -> dict:
+    """
+    Helper function which validates a JWT token and resolves the user that it belongs to.
+
+    Depending on AUTH_MODE the token is verified locally against the public keys of our
+    realm, sent to keycloak, or verified locally with keycloak as a fallback for when
+    the keys can not be obtained.
+
+    Args:
+        token(str): A JWT token obtained through keycloak.
+
+    Returns:
+        user(dict): The user associated with the token, containing at least their id.
+
+    Raises:
+        OrodhaForbiddenError: If the JWT token does not contain a valid user id.
+        OrodhaServiceUnavailableError: If keycloak was asked and could not be reached.
+        OrodhaInternalError: If the public keys of our realm could not be obtained.
+    """
+    if AUTH_MODE == AuthModes.KEYCLOAK:
+        user = _get_keycloak_user(token)
+    else:
+        try:
+            user = _get_token_verifier().get_user(token)
+        except TokenVerificationError as err:
+            raise OrodhaForbiddenError() from err
+        except JWKSUnavailableError as err:
+            if AUTH_MODE != AuthModes.FALLBACK:
+                raise OrodhaInternalError(
+                    message=f"Unable to verify token: {err.message}"
+                ) from err
+            user = _get_keycloak_user(token)
+
+    if user is None or user.get("id") is None:
+        raise OrodhaForbiddenError()
+    return user
+
+
+def _authenticate_user(token: str) -> dict:
+    """
+    Helper function which resolves the user that a JWT token belongs to. This is the
+    auth step shared by all of our main controller functions.
+
+    Tokens that were already resolved are served from TOKEN_CACHE, and concurrent requests
+    carrying the same uncached token share a single call to _resolve_user.
+
+    Args:
+        token(str): A JWT token obtained through keycloak.
+
+    Returns:
+        user(dict): The user associated with the token, containing at least their id.
+
+    Raises:
+        OrodhaForbiddenError: If the JWT token does not contain a valid user id.
+        OrodhaServiceUnavailableError: If keycloak was asked and could not be reached.
+        OrodhaInternalError: If the public keys of our realm could not be obtained.
+    """
+    return TOKEN_CACHE.get_user(token, _resolve_user)
+
+
+def _find_shared_notifications(target_user: str, after_id: ObjectId, limit: int) -> list:
+    """
+    Helper function which reads a user's notifications, in creation order, from the
+    notification documents that they share with the other recipients.
+    """
+    query = {"targets": target_user}
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+    notifications_cursor = Notification._get_collection().with_options(
+        read_preference=READ_PREFERENCE
+    ).find(query, NOTIFICATION_RESPONSE_PROJECTION).sort("_id", ASCENDING)
+    if limit is not None:
+        notifications_cursor = notifications_cursor.limit(limit)
+    return list(notifications_cursor)
+
+
+def _find_user_notifications(target_user: str, after_id: ObjectId, limit: int) -> list:
+    """
+    Helper function which reads a user's notifications, in creation order, from wherever
+    our STORAGE_MODE keeps them.
+    """
+    with time_operation("mongo", "find_notifications"):
+        if STORAGE_MODE == StorageModes.FANOUT:
+            return find_inbox_notifications(
+                target_user, after_id, limit, read_preference=READ_PREFERENCE
+            )
+        return _find_shared_notifications(target_user, after_id, limit)
+
+
+def _notifications_created(notifications: list):
+    """
+    Helper function which runs the work that follows the creation of notifications, once
+    they have been written to the database.
+
+    Args:
+        notifications(list[dict]): The raw documents of the created notifications,
+            including their _id.
+    """
+    if STORAGE_MODE == StorageModes.FANOUT:
+        with time_operation("mongo", "fan_out"):
+            fan_out(notifications)
+    changes = count_changes(notifications, total=1, unread=1)
+    with time_operation("mongo", "update_user_states"):
+        update_user_states(changes)
+    RESPONSE_CACHE.invalidate(changes)
+    _get_broker().publish(notifications)
+
+
+def _enqueue_deliveries(notifications: list):
+    """
+    Helper function which writes the outbox entries of notifications to every channel of
+    DELIVERY_CHANNELS. New notifications are enqueued before they are written, so that no
+    notification that exists is left without its deliveries.
+    """
+    if DELIVERY_CHANNELS:
+        enqueue_deliveries(notifications, DELIVERY_CHANNELS)
+
+
+def _notifications_merged(notifications: list):
+    """
+    Helper function which runs the work that follows merging new notifications into
+    existing ones. Counts are unchanged, but the versions of their targets are bumped and
+    their cached pages dropped, as the notifications they read changed. Merged
+    notifications are not published again, streams only carry new notifications.
+
+    Args:
+        notifications(list[dict]): The raw documents of the notifications, as merged into.
+    """
+    changes = count_changes(notifications, total=0, unread=0)
+    with time_operation("mongo", "update_user_states"):
+        update_user_states(changes)
+    RESPONSE_CACHE.invalidate(changes)
+
+
+def _coalesce_by(notification: dict) -> tuple:
+    """
+    Helper function which obtains the attributes a new notification is coalesced by, which
+    are none when it is stored as it is. Coalescing only applies to the shared storage mode,
+    inbox entries are never merged.
+    """
+    if COALESCING_MODE == CoalescingModes.DISABLED or STORAGE_MODE != StorageModes.SHARED:
+        return ()
+    return NOTIFICATION_TYPES.get(notification["notificationType"]).coalesce_by
+
+
+def _write_coalesced(collection, notification: dict, coalesce_by: tuple) -> tuple:
+    """
+    Helper function which writes a new notification by coalescing it, and runs the work
+    that follows.
+
+    Returns:
+        written(tuple): The id of the notification of its first target, along with whether
+            any of its targets had a notification created rather than merged into.
+    """
+    window_seconds = COALESCING_WINDOW_SECONDS \
+        if COALESCING_MODE == CoalescingModes.DIGEST else None
+    with time_operation("mongo", "coalesce_notification"):
+        coalesced = coalesce_notification(collection, notification, coalesce_by, window_seconds)
+    # The ids of merged notifications are only known once written, so their entries follow.
+    _enqueue_deliveries([written for written, _ in coalesced])
+    created = [written for written, inserted in coalesced if inserted]
+    merged = [written for written, inserted in coalesced if not inserted]
+    if created:
+        _notifications_created(created)
+    if merged:
+        _notifications_merged(merged)
+    return coalesced[0][0]["_id"], bool(created)
+
+
+def _is_scheduled(notification: dict) -> bool:
+    """
+    Helper function which tells whether a new notification is scheduled for later. The
+    deliverAt of a notification that is already due is dropped, and it is created right away.
+    """
+    deliver_at = notification.pop("deliverAt", None)
+    if deliver_at is None or deliver_at <= notification["createdAt"]:
+        return False
+    notification["deliverAt"] = deliver_at
+    return True
+
+
+def _removed_counts(query: dict, target: str = None) -> dict:
+    """
+    Helper function which counts, per user, the notifications matching a query that are
+    about to be removed, as changes to their counts.
+
+    Args:
+        query(dict): A query on notifications.
+        target(str) - Optional: Only the notifications of this user_id are removed.
+    """
+    if STORAGE_MODE == StorageModes.FANOUT:
+        query = inbox_query(query)
+    with time_operation("mongo", "count_removed"):
+        counts = aggregate_user_counts(STORAGE_MODE, query, user_id=target)
+    return removal_changes(counts)
+
+
+def _notifications_deleted(changes: dict):
+    """
+    Helper function which runs the work that follows the deletion of notifications.
+
+    Args:
+        changes(dict): The change to the total and unread counts of each user_id that
+            lost notifications.
+    """
+    with time_operation("mongo", "update_user_states"):
+        update_user_states(changes)
+    RESPONSE_CACHE.invalidate(changes)
+
+
+def _track_access(target_user: str, notifications: list) -> datetime:
+    """
+    Helper function which records that a user read notifications, either by stamping them
+    right away or by recording the read on the access tracker, depending on
+    ACCESS_TRACKING_MODE, and marks them as read in the user's counts.
+
+    Args:
+        target_user(str): The user_id that read the notifications.
+        notifications(list[dict]): The raw notification documents that were read, as they
+            were before the read.
+
+    Returns:
+        accessed_at(datetime): The time the notifications were read at.
+    """
+    if ACCESS_TRACKING_MODE == AccessTrackingModes.SYNC:
+        touch = touch_inbox_entries if STORAGE_MODE == StorageModes.FANOUT \
+            else touch_user_notifications
+        read_changes = count_changes(notifications, total=0, unread=-1)
+        with time_operation("mongo", "touch_notifications"):
+            accessed_at = touch(target_user, notifications[0]["_id"], notifications[-1]["_id"])
+    else:
+        if STORAGE_MODE == StorageModes.FANOUT:
+            keys = [inbox_entry_key(target_user, row["_id"]) for row in notifications]
+        else:
+            keys = [notification_key(row["_id"]) for row in notifications]
+        accessed_at = current_access_time()
+        # Reads still waiting to be flushed were already counted as read.
+        new_keys = _get_access_tracker().record(keys, accessed_at)
+        read_changes = count_changes(
+            [row for row, key in zip(notifications, keys) if key in new_keys],
+            total=0,
+            unread=-1,
+        )
+    with time_operation("mongo", "update_user_states"):
+        update_user_states(read_changes, bump_version=False)
+    return accessed_at
+
+
+def _set_last_accessed(target_user: str, notifications: list):
+    """
+    Helper function which tracks that a user read notifications, unless access tracking
+    is disabled, and sets the lastAccessed of the returned notifications accordingly.
+    """
+    if ACCESS_TRACKING_MODE == AccessTrackingModes.DISABLED:
+        return
+    accessed_at = _track_access(target_user, notifications)
+    for notification in notifications:
+        notification["lastAccessed"] = accessed_at
+
+
+def _read_notification_page(target_user: str, after_id: ObjectId, limit: int) -> tuple:
+    """
+    Helper function which reads a page of a user's notifications and tracks that they
+    were read.
+
+    Returns:
+        tuple(notifications, next_cursor): The notifications of the page, and the cursor
+            of the next page or None if there are no more notifications to obtain.
+    """
+    # One extra notification tells us whether there is a next page.
+    fetch_limit = limit + 1 if limit is not None else None
+    notifications = _find_user_notifications(target_user, after_id, fetch_limit)
+
+    next_cursor = None
+    if limit is not None and len(notifications) > limit:
+        notifications = notifications[:limit]
+        next_cursor = encode_cursor(notifications[-1]["_id"])
+
+    if notifications:
+        _set_last_accessed(target_user, notifications)
+    return notifications, next_cursor
+
+
+def get_notifications(
+    token: str,
+    target_user: str,
+    limit: str = None,
+    cursor: str = None,
+    if_none_match: set = None,
+):
     """
     Function which obtains a list of notifications related to a target user.
 
+    Notifications are returned in the order they were created. When a limit is given only
+    one page of notifications is returned, starting after the notification that cursor
+    points to.
+
+    The etag of the notifications is the version of the user, which only changes when one
+    of their notifications is created or deleted. When it is in if_none_match nothing else
+    is read, and lastAccessed is left as it is. Pages read at the current etag are served
+    from RESPONSE_CACHE.
+
     Args:
         token(str): A JWT token obtained through keycloak that we use to ensure
             that a user is registered with keycloak
         target_user(str): A user_id that is related to the user we want to get
             notifications for.
+        limit(str) - Optional: The maximum number of notifications to return.
+        cursor(str) - Optional: The next_cursor returned alongside the previous page.
+        if_none_match(set[str]) - Optional: The etags the client already holds, "*"
+            matching any etag.
 
     Returns:
-        notifications(list[Notification]): A list of our notification documents that contained the
-            user_id in their targets list.
+        notifications(list[dict]): A list of our raw notification documents, projected to the
+            fields of our response model, that contained the user_id in their targets list.
+            None when the etag was in if_none_match.
+        next_cursor(str): The cursor of the next page, or None if there are no more
+            notifications to obtain.
+        etag(str): The etag of the user's notifications.
 
     Raises:
         OrodhaInternalError: If there was a problem with the mongoengine query
             or updating our lastAccessed field.
         OrodhaForbiddenError: If the JWT token does not contain a valid user id.
-        OrodhaBadRequestError: If the value of target_user is None.
+        OrodhaBadRequestError: If the value of target_user is None, or if the limit or
+            cursor are invalid.
     """
     try:
-        keycloak_client = _create_keycloak_client()
-        if keycloak_client.get_user(token=token).get("id") is None:
-            raise OrodhaForbiddenError()
+        _authenticate_user(token)
         if target_user is None:
             raise OrodhaBadRequestError("target_user must be a value.")
+        limit = parse_limit(limit, MAX_PAGE_SIZE)
 
-        Notification.objects(__raw__={
-            "targets": target_user
-        }).modify(__raw__={"$currentDate": {"lastAccessed": {
-            "$type": "date"
-        }}}
-        )
+        # The version is read first, so a concurrent change can only make the etag stale.
+        with time_operation("mongo", "get_user_version"):
+            etag = str(get_user_version(target_user, read_preference=READ_PREFERENCE))
+        if if_none_match and (etag in if_none_match or "*" in if_none_match):
+            return None, None, etag
 
-        notifications = [
-            x.to_mongo() for x in Notification.objects(
-                __raw__={
-                    "targets": target_user
-                }
-            )
-        ]
+        after_id = decode_cursor(cursor) if cursor is not None else None
+        (notifications, next_cursor), cached = RESPONSE_CACHE.get_or_load(
+            target_user,
+            f"{limit}:{after_id}",
+            etag,
+            lambda: _read_notification_page(target_user, after_id, limit),
+        )
+        # Cached pages were read before, so only the time of this read is recorded.
+        if cached and notifications:
+            _set_last_accessed(target_user, notifications)
 
     except (
         OperationError,
-        InvalidQueryError
+        InvalidQueryError,
+        PyMongoError,
     ) as err:
         raise OrodhaInternalError(
             message=f"There was an internal service error: {err}"
         )
-    return notifications
+    return notifications, next_cursor, etag
 
 
 def delete_notifications(token: str, notification_id: str):
     """
     Function which makes a query to the database with a given notification_id
-    and deletes any returned notification from the database.
+    and deletes any returned notification from the database. A notification that is
+    still scheduled is cancelled.
 
     Args:
         token(str): A JWT token obtained through keycloak that we use to ensure
@@ -106,34 +592,162 @@ def delete_notifications(token: str, notification_id: str):
         OrodhaForbiddenError: If the JWT token does not contain a valid user id.
         OrodhaNotFoundError: If there was not a unique notification found with the specific
             notification_id that was sent in.
-        OrodhaBadRequestError: If the notification_id was set to None.
+        OrodhaBadRequestError: If the notification_id was set to None, or is not a valid id.
         OrodhaInternalError: If there was a problem with the deletion of the notification from
             the database.
     """
     try:
-        keycloak_client = _create_keycloak_client()
-        if keycloak_client.get_user(token=token).get("id") is None:
-            raise OrodhaForbiddenError()
+        _authenticate_user(token)
         if notification_id is None:
             raise OrodhaBadRequestError("notification_id must be a value.")
+        try:
+            document_id = ObjectId(notification_id)
+        except (InvalidId, TypeError) as err:
+            raise OrodhaBadRequestError(f"notification_id is invalid: {err}")
 
-        notification = Notification.objects.get(__raw__={
-            "_id": ObjectId(notification_id)
-        })
-        notification.delete()
-    except DoesNotExist as err:
+        with time_operation("mongo", "delete_notification"):
+            deleted = Notification._get_collection().find_one_and_delete(
+                {"_id": document_id},
+                projection={"targets": True, "lastAccessed": True},
+            )
+            # Scheduled notifications were never counted, so nothing follows their removal.
+            if deleted is None and delete_scheduled_notifications(
+                {"_id": document_id}
+            )["deleted"]:
+                return
+    except PyMongoError as err:
+        raise OrodhaInternalError(
+            f"Unable to delete notification {notification_id}: {err}")
+    if deleted is None:
         raise OrodhaNotFoundError(
             f"Unable to find unique notification_id: {notification_id}"
         )
-    except (ValidationError, OperationError) as err:
+    try:
+        if STORAGE_MODE == StorageModes.FANOUT:
+            changes = _removed_counts({"_id": deleted["_id"]})
+            with time_operation("mongo", "delete_inbox_entries"):
+                delete_inbox_entries({"_id": deleted["_id"]})
+        else:
+            changes = count_changes([deleted], total=-1, unread=-1)
+        _notifications_deleted(changes)
+    except PyMongoError as err:
         raise OrodhaInternalError(
             f"Unable to delete notification {notification_id}: {err}")
 
 
-def post_notifications(token: str, payload: dict):
+def _run_idempotent(user: dict, route: str, idempotency_key: str, payload, create):
+    """
+    Helper function which creates the notifications of a POST request once per idempotency
+    key. A request without a key always creates its notifications.
+
+    Args:
+        user(dict): The user making the request.
+        route(str): The route the request was made to.
+        idempotency_key(str): The Idempotency-Key header of the request, or None.
+        payload(dict|list): The payload of the request.
+        create(callable): Creates the notifications and returns the result of the request.
+
+    Returns:
+        result: The result of create, or the stored result of the first request made
+            with the idempotency key.
+
+    Raises:
+        OrodhaBadRequestError: If the idempotency key is empty or too long.
+        OrodhaConflictError: If the idempotency key was used with another payload, or its
+            first request is still being processed.
+        OrodhaInternalError: If the idempotency key could not be claimed, or the result
+            could not be stored once the notifications were created.
+    """
+    if idempotency_key is None:
+        return create()
+    validate_idempotency_key(idempotency_key)
+    try:
+        with time_operation("mongo", "claim_idempotency_key"):
+            record_id, result = claim_idempotency_key(
+                user["id"], route, idempotency_key, hash_payload(payload),
+                IDEMPOTENCY_LEASE_SECONDS,
+            )
+    except PyMongoError as err:
+        raise OrodhaInternalError(message=f"Unable to claim idempotency key: {err}")
+    if record_id is None:
+        return result
+    try:
+        result = create()
+    except BaseException:
+        try:
+            release_idempotency_key(record_id)
+        except Exception:
+            # The failure of create is the one reported, the key is freed once its lease
+            # runs out.
+            LOGGER.exception("Unable to release idempotency key %s", record_id)
+        raise
+    try:
+        with time_operation("mongo", "complete_idempotency_key"):
+            complete_idempotency_key(record_id, result)
+    except PyMongoError as err:
+        # The key is not released, its retries are refused as in progress until its lease
+        # runs out rather than creating the notifications again right away.
+        raise OrodhaInternalError(
+            message=f"The notifications were created, but their idempotency key could not"
+            f" be completed: {err}"
+        )
+    return result
+
+
+def _create_notification(payload: dict) -> dict:
+    """
+    Helper function which creates, coalesces or schedules the notification of a single POST,
+    and runs the work that follows.
+
+    Args:
+        payload(dict): The payload sent from the POST route.
+
+    Returns:
+        result(dict): Contains the id of the created or scheduled notification, or of the
+            notification of its first target when it was coalesced.
+
+    Raises:
+        PayloadValidationError: If the payload is missing targets, or holds a field of
+            the wrong type.
+        NotificationTypeError: If the notification type is not supported.
+        OrodhaBadRequestError: If the payload is missing data its notification type needs.
+        OrodhaInternalError: If the notification could not be saved.
+    """
+    try:
+        document = NOTIFICATION_TYPES.build(payload)
+        if _is_scheduled(document):
+            document["_id"] = ObjectId()
+            schedule_notifications([document])
+            return {"id": str(document["_id"])}
+        collection = Notification._get_collection().with_options(write_concern=WRITE_CONCERN)
+        coalesce_by = _coalesce_by(document)
+        if coalesce_by:
+            notification_id, _ = _write_coalesced(collection, document, coalesce_by)
+            return {"id": str(notification_id)}
+        document["_id"] = ObjectId()
+        _enqueue_deliveries([document])
+        with time_operation("mongo", "insert_notification"):
+            collection.insert_one(document)
+        _notifications_created([document])
+    except ValidationError as err:
+        raise OrodhaBadRequestError(
+            message=f"There was an issue creating notification: {err}"
+        )
+    except (OperationError, PyMongoError) as err:
+        raise OrodhaInternalError(
+            message=f"Unable to save notification: {err}"
+        )
+    return {"id": str(document["_id"])}
+
+
+def post_notifications(token: str, payload: dict, idempotency_key: str = None) -> dict:
     """
     Function which takes the payload from a POST request, then creates
     the correct Notification Document with the data based on the notification_type.
+    The payload is validated once, by the schema of its type in NOTIFICATION_TYPES,
+    and the resulting raw document is inserted as it is, or coalesced into the unread
+    notifications of its targets when COALESCING_MODE is enabled. A notification with a
+    deliver_at in the future is scheduled instead, and only created once it is promoted.
 
     Args:
         token(str): The JWT token taken from the header of the request.
@@ -141,22 +755,488 @@ def post_notifications(token: str, payload: dict):
             keycloak client.
         payload(dict): The payload sent from the POST route. Contains data
             necessary for determining the type of, as well as creating a Notification.
+        idempotency_key(str) - Optional: The Idempotency-Key header of the request. A retry
+            with the same key and payload is answered with the original result instead
+            of creating the notification again.
+
+    Returns:
+        result(dict): Contains the id of the created or scheduled notification, or of the
+            notification of its first target when it was coalesced.
 
     Raises:
-        OrodhaBadRequestError: If the request is made with extra, or missing data.
+        PayloadValidationError: If the payload is missing targets, or holds a field of
+            the wrong type.
+        OrodhaBadRequestError: If the request is missing data its notification type needs.
+        NotificationTypeError: If the notification type is not supported.
+        OrodhaConflictError: If the idempotency key was used with another payload, or its
+            first request is still being processed.
         OrodhaForbiddenError: If the JWT token sent through did not contain a valid
             keycloak id.
+        OrodhaInternalError: If the public keys of our realm could not be obtained, or
+            the notification could not be saved.
+    """
+    user = _authenticate_user(token)
+    return _run_idempotent(
+        user, "notifications", idempotency_key, payload, lambda: _create_notification(payload)
+    )
+
+
+def _batch_item_result(
+    index: int,
+    notification_id: ObjectId = None,
+    error: str = None,
+    status: str = "created",
+) -> dict:
     """
+    Helper function which creates the result of one payload of a batch POST.
+
+    Args:
+        index(int): The index of the payload in the batch.
+        notification_id(ObjectId) - Optional: The id of the notification the payload wrote.
+        error(str) - Optional: Why the payload could not be written, which makes it failed.
+        status(str) - Optional: The status of a payload that was written, "created" unless
+            it was "scheduled" or "coalesced".
+
+    Returns:
+        result(dict): The index and status of the payload, along with its error when it
+            failed and its notification id otherwise.
+    """
+    if error is not None:
+        return {"index": index, "status": "failed", "error": error}
+    return {"index": index, "status": status, "id": str(notification_id)}
+
+
+def post_notifications_batch(token: str, payloads: list, idempotency_key: str = None) -> list:
+    """
+    Function which takes the payloads from a batch POST request and creates a Notification
+    Document for each of them.
+
+    The request is authenticated once and every payload is validated and turned into a raw
+    document by NOTIFICATION_TYPES before anything is written. Valid documents are then
+    written with unordered insert_many calls of at most BATCH_CHUNK_SIZE documents, so one
+    failing document does not stop the others.
+    Documents with a deliver_at in the future are scheduled the same way. When
+    COALESCING_MODE is enabled, documents of types with coalesce_by fields
+    are then written one by one with coalesce_notification.
+
+    Args:
+        token(str): The JWT token taken from the header of the request.
+            Used to ensure the request was made by a user connected to the
+            keycloak client.
+        payloads(list[dict]): The payloads sent from the batch POST route, each containing
+            the same data as the payload of a single POST.
+        idempotency_key(str) - Optional: The Idempotency-Key header of the request. A retry
+            with the same key and payloads is answered with the original results instead
+            of creating the notifications again.
+
+    Returns:
+        results(list[dict]): One result per payload, in the order of the payloads. Each
+            result contains the index of its payload and a status of "created" or
+            "scheduled" along with the new notification id, "coalesced" along with the id of
+            the notification it was merged into, or "failed" along with an error message.
+            Coalesced payloads give the notification of their first target.
+
+    Raises:
+        PayloadValidationError: If any payload is missing targets, or holds a field of
+            the wrong type, in which case nothing is written.
+        OrodhaBadRequestError: If there are no payloads, or more than MAX_BATCH_SIZE.
+        OrodhaConflictError: If the idempotency key was used with other payloads, or its
+            first request is still being processed.
+        OrodhaForbiddenError: If the JWT token sent through did not contain a valid
+            keycloak id.
+        OrodhaInternalError: If the public keys of our realm could not be obtained.
+    """
+    user = _authenticate_user(token)
+    if not payloads:
+        raise OrodhaBadRequestError("The batch must contain at least one notification.")
+    if len(payloads) > MAX_BATCH_SIZE:
+        raise OrodhaBadRequestError(
+            f"The batch can not contain more than {MAX_BATCH_SIZE} notifications."
+        )
+    return _run_idempotent(
+        user, "batch", idempotency_key, payloads, lambda: _create_notifications(payloads)
+    )
+
+
+def _create_notifications(payloads: list) -> list:
+    """
+    Helper function which validates the payloads of a batch POST, then writes them in chunks,
+    schedules those with a deliver_at in the future and coalesces those of types with
+    coalesce_by fields, and runs the work that follows, see post_notifications_batch.
+
+    Args:
+        payloads(list[dict]): The payloads sent from the batch POST route.
+
+    Returns:
+        results(list[dict]): One result per payload, in the order of the payloads, as
+            created by _batch_item_result.
+
+    Raises:
+        PayloadValidationError: If any payload is missing targets, or holds a field of
+            the wrong type, in which case nothing is written.
+    """
+    results = [None] * len(payloads)
+    documents = []
+    scheduled_documents = []
+    coalesced_documents = []
+    for index, payload in enumerate(payloads):
+        try:
+            document = NOTIFICATION_TYPES.build(payload)
+        except PayloadValidationError as err:
+            raise PayloadValidationError(
+                {f"{index}.{key}": error for key, error in err.errors.items()}
+            )
+        except NotificationTypeError as err:
+            results[index] = _batch_item_result(index, error=err.message)
+        except ValidationError as err:
+            results[index] = _batch_item_result(
+                index, error=f"There was an issue creating notification: {err}"
+            )
+        else:
+            if _is_scheduled(document):
+                document["_id"] = ObjectId()
+                scheduled_documents.append((index, document))
+                continue
+            coalesce_by = _coalesce_by(document)
+            if coalesce_by:
+                coalesced_documents.append((index, document, coalesce_by))
+                continue
+            document["_id"] = ObjectId()
+            documents.append((index, document))
+
+    collection = Notification._get_collection().with_options(write_concern=WRITE_CONCERN)
+    for chunk_start in range(0, len(documents), BATCH_CHUNK_SIZE):
+        chunk = documents[chunk_start:chunk_start + BATCH_CHUNK_SIZE]
+        write_errors = {}
+        try:
+            # A chunk whose deliveries could not be enqueued is not written at all.
+            _enqueue_deliveries([document for _, document in chunk])
+        except PyMongoError as err:
+            write_errors = {chunk_index: str(err) for chunk_index in range(len(chunk))}
+        else:
+            try:
+                with time_operation("mongo", "insert_notifications"):
+                    collection.insert_many([document for _, document in chunk], ordered=False)
+            except BulkWriteError as err:
+                for write_error in err.details.get("writeErrors", []):
+                    write_errors[write_error["index"]] = write_error.get("errmsg")
+            except PyMongoError as err:
+                write_errors = {chunk_index: str(err) for chunk_index in range(len(chunk))}
+
+        created = []
+        for chunk_index, (index, document) in enumerate(chunk):
+            if chunk_index in write_errors:
+                results[index] = _batch_item_result(
+                    index, error=f"Unable to save notification: {write_errors[chunk_index]}"
+                )
+            else:
+                results[index] = _batch_item_result(index, document["_id"])
+                created.append(document)
+        if created:
+            _notifications_created(created)
+
+    for chunk_start in range(0, len(scheduled_documents), BATCH_CHUNK_SIZE):
+        chunk = scheduled_documents[chunk_start:chunk_start + BATCH_CHUNK_SIZE]
+        write_errors = {}
+        try:
+            schedule_notifications([document for _, document in chunk])
+        except BulkWriteError as err:
+            for write_error in err.details.get("writeErrors", []):
+                write_errors[write_error["index"]] = write_error.get("errmsg")
+        except PyMongoError as err:
+            write_errors = {chunk_index: str(err) for chunk_index in range(len(chunk))}
+        for chunk_index, (index, document) in enumerate(chunk):
+            results[index] = _batch_item_result(
+                index,
+                document["_id"],
+                error=f"Unable to schedule notification: {write_errors[chunk_index]}"
+                if chunk_index in write_errors else None,
+                status="scheduled",
+            )
+
+    # Coalesced notifications are written one by one, as each may merge into an earlier one.
+    for index, document, coalesce_by in coalesced_documents:
+        try:
+            notification_id, created = _write_coalesced(collection, document, coalesce_by)
+        except PyMongoError as err:
+            results[index] = _batch_item_result(
+                index, error=f"Unable to save notification: {err}"
+            )
+        else:
+            results[index] = _batch_item_result(
+                index, notification_id, status="created" if created else "coalesced"
+            )
+    return results
+
+
+def promote_notifications(notifications: list) -> list:
+    """
+    Function which creates scheduled notifications once they are due, the way new
+    notifications are created, by coalescing them or by writing them to the notification
+    collection, and running the work that follows. It is the promote callable of the
+    NotificationScheduler.
+
+    Args:
+        notifications(list[dict]): The raw documents of the due notifications, including
+            the _id they are promoted with.
+
+    Returns:
+        promoted(list[dict]): The notifications that were created or coalesced.
+
+    Raises:
+        PyMongoError: If the notifications could not be written, in which case they are
+            promoted again once their lease ran out.
+    """
+    collection = Notification._get_collection().with_options(write_concern=WRITE_CONCERN)
+    documents = []
+    promoted = []
+    for notification in notifications:
+        coalesce_by = _coalesce_by(notification)
+        if coalesce_by:
+            _write_coalesced(collection, notification, coalesce_by)
+            promoted.append(notification)
+        else:
+            documents.append(notification)
+    if not documents:
+        return promoted
+    _enqueue_deliveries(documents)
     try:
-        keycloak_client = _create_keycloak_client()
-        if keycloak_client.get_user(token=token).get("id") is None:
-            raise OrodhaForbiddenError()
-        notification = notification_factory(payload)
-        notification.save()
-    except (
-        ValidationError,
-        FieldDoesNotExist
-    ) as err:
+        with time_operation("mongo", "insert_notifications"):
+            collection.insert_many(documents, ordered=False)
+    except BulkWriteError as err:
+        write_errors = err.details.get("writeErrors", [])
+        if any(write_error["code"] != DUPLICATE_KEY_ERROR for write_error in write_errors):
+            raise
+        duplicates = {write_error["index"] for write_error in write_errors}
+        documents = [
+            document for index, document in enumerate(documents) if index not in duplicates
+        ]
+    if documents:
+        _notifications_created(documents)
+    return promoted + documents
+
+
+def _build_delete_filter(
+    notification_ids: list = None,
+    list_id: str = None,
+    notification_type: str = None,
+    older_than: str = None,
+) -> dict:
+    """
+    Helper function which builds the mongo filter of a bulk delete, not including its target.
+
+    Raises:
+        OrodhaBadRequestError: If a notification id, the notification type or older_than
+            are invalid.
+    """
+    query = {}
+    id_filter = {}
+    if notification_ids is not None:
+        try:
+            id_filter["$in"] = [ObjectId(notification_id) for notification_id in notification_ids]
+        except (InvalidId, TypeError) as err:
+            raise OrodhaBadRequestError(f"notification_ids contains an invalid id: {err}")
+    if older_than is not None:
+        try:
+            # An ObjectId starts with its creation time, so older_than is an index range on _id.
+            id_filter["$lt"] = ObjectId.from_datetime(datetime_from_iso8601(older_than))
+        except ValueError as err:
+            raise OrodhaBadRequestError(f"older_than must be an ISO 8601 datetime: {err}")
+    if id_filter:
+        query["_id"] = id_filter
+    if list_id is not None:
+        query["listId"] = list_id
+    if notification_type is not None:
+        try:
+            query["notificationType"] = NotificationTypes(notification_type.lower()).value
+        except ValueError:
+            raise OrodhaBadRequestError(
+                f"notification_type: {notification_type} is not supported."
+            )
+    return query
+
+
+def delete_notifications_batch(token: str, payload: dict) -> dict:
+    """
+    Function which deletes every notification matching a batch of ids and/or a filter
+    with a single delete_many, or removes a single target from those notifications.
+    Scheduled notifications matching the filter are cancelled the same way, and counted
+    alongside the others.
+
+    Args:
+        token(str): A JWT token obtained through keycloak that we use to ensure
+            that a user is registered with keycloak
+        payload(dict): The payload sent from the batch DELETE route. Contains any of:
+            notification_ids(list[str]): The ids of the notifications to delete.
+            list_id(str): Only matches notifications related to this list.
+            target(str): Only matches notifications targeting this user_id.
+            notification_type(str): Only matches notifications of this type.
+            older_than(str): Only matches notifications created before this ISO 8601 datetime.
+            remove_target_only(bool): Instead of deleting the matched notifications, target
+                is removed from their targets. Notifications left without any targets are
+                deleted.
+
+    Returns:
+        result(dict): The number of notifications that were deleted, and the number that
+            had the target removed from them.
+
+    Raises:
+        OrodhaForbiddenError: If the JWT token does not contain a valid user id.
+        OrodhaBadRequestError: If the payload does not contain any filter, or contains
+            an invalid one.
+        OrodhaInternalError: If there was a problem with the deletion of the notifications
+            from the database.
+    """
+    _authenticate_user(token)
+    target = payload.get("target")
+    remove_target_only = payload.get("remove_target_only", False)
+    query = _build_delete_filter(
+        notification_ids=payload.get("notification_ids"),
+        list_id=payload.get("list_id"),
+        notification_type=payload.get("notification_type"),
+        older_than=payload.get("older_than"),
+    )
+    if remove_target_only and target is None:
+        raise OrodhaBadRequestError("target must be a value when remove_target_only is set.")
+    if not query and target is None:
         raise OrodhaBadRequestError(
-            message=f"There was an issue creating notification: {err}"
+            "At least one of notification_ids, list_id, target, notification_type"
+            " or older_than must be a value."
+        )
+
+    collection = Notification._get_collection()
+    try:
+        result = delete_scheduled_notifications(
+            query, target=target, remove_target_only=remove_target_only
+        )
+        if remove_target_only:
+            target_query = {**query, "targets": target}
+            changes = _removed_counts(target_query, target=target)
+            with time_operation("mongo", "remove_target"):
+                result["targets_removed"] += collection.update_many(
+                    target_query, {"$pull": {"targets": target}}
+                ).modified_count
+            with time_operation("mongo", "delete_notifications"):
+                result["deleted"] += collection.delete_many(
+                    {**query, "targets": {"$size": 0}}
+                ).deleted_count
+            inbox_delete_query = target_query
+        else:
+            if target is not None:
+                query["targets"] = target
+                if STORAGE_MODE == StorageModes.FANOUT:
+                    # Every recipient of a deleted notification loses its inbox entry,
+                    # not only target, so the entries are matched by notification id.
+                    with time_operation("mongo", "find_notification_ids"):
+                        query = {"_id": {"$in": collection.distinct("_id", query)}}
+            changes = _removed_counts(query)
+            with time_operation("mongo", "delete_notifications"):
+                result["deleted"] += collection.delete_many(query).deleted_count
+            inbox_delete_query = query
+        if STORAGE_MODE == StorageModes.FANOUT:
+            with time_operation("mongo", "delete_inbox_entries"):
+                delete_inbox_entries(inbox_delete_query)
+        _notifications_deleted(changes)
+    except PyMongoError as err:
+        raise OrodhaInternalError(f"Unable to delete notifications: {err}")
+    return result
+
+
+def stream_notifications(
+    token: str,
+    target_user: str,
+    serializer,
+    last_event_id: str = None,
+) -> NotificationStream:
+    """
+    Function which opens a stream of the notifications created for a target user, to be
+    sent to them as Server-Sent Events.
+
+    When the client is reconnecting with the id of the last event it received, the
+    notifications it missed since then are replayed first, up to STREAM_REPLAY_LIMIT.
+
+    Args:
+        token(str): A JWT token obtained through keycloak that we use to ensure
+            that a user is registered with keycloak
+        target_user(str): A user_id that is related to the user we want to stream
+            notifications to.
+        serializer(callable): Turns a raw notification document into the json event data.
+        last_event_id(str) - Optional: The id of the last event the client received.
+
+    Returns:
+        NotificationStream: An iterable of events, which must be closed once the client
+            is gone.
+
+    Raises:
+        OrodhaForbiddenError: If the JWT token does not contain a valid user id.
+        OrodhaBadRequestError: If the value of target_user is None, or if the
+            last_event_id is invalid.
+        OrodhaServiceUnavailableError: If this worker already holds its maximum
+            number of open streams.
+        OrodhaInternalError: If the missed notifications could not be obtained.
+    """
+    _authenticate_user(token)
+    if target_user is None:
+        raise OrodhaBadRequestError("target_user must be a value.")
+    after_id = None
+    if last_event_id:
+        try:
+            after_id = ObjectId(last_event_id)
+        except (InvalidId, TypeError):
+            raise OrodhaBadRequestError("last_event_id is invalid.")
+
+    if not STREAM_LIMITER.acquire():
+        raise OrodhaServiceUnavailableError(
+            "Too many open notification streams, try again later."
+        )
+    broker = _get_broker()
+    # Subscribing before the replay query means nothing created in between is missed.
+    subscription = broker.subscribe(target_user)
+    try:
+        replay = [] if after_id is None \
+            else _find_user_notifications(target_user, after_id, STREAM_REPLAY_LIMIT)
+    except PyMongoError as err:
+        broker.unsubscribe(subscription)
+        STREAM_LIMITER.release()
+        raise OrodhaInternalError(
+            message=f"There was an internal service error: {err}"
+        )
+    return NotificationStream(
+        broker,
+        subscription,
+        STREAM_LIMITER,
+        replay,
+        serializer,
+        STREAM_HEARTBEAT_SECONDS,
+    )
+
+
+def get_notification_counts(token: str, target_user: str) -> dict:
+    """
+    Function which obtains the number of notifications, and unread notifications, of a
+    target user from their counters, without reading or stamping their notifications.
+
+    Args:
+        token(str): A JWT token obtained through keycloak that we use to ensure
+            that a user is registered with keycloak
+        target_user(str): A user_id that is related to the user we want to count
+            notifications for.
+
+    Returns:
+        counts(dict): The total and unread notifications of the user.
+
+    Raises:
+        OrodhaForbiddenError: If the JWT token does not contain a valid user id.
+        OrodhaBadRequestError: If the value of target_user is None.
+        OrodhaInternalError: If the counts could not be obtained.
+    """
+    _authenticate_user(token)
+    if target_user is None:
+        raise OrodhaBadRequestError("target_user must be a value.")
+    try:
+        with time_operation("mongo", "get_user_counts"):
+            return get_user_counts(STORAGE_MODE, target_user)
+    except PyMongoError as err:
+        raise OrodhaInternalError(
+            message=f"There was an internal service error: {err}"
         )
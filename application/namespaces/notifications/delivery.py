@@ -0,0 +1,370 @@
+"""
+Module which contains the delivery of notifications to external channels, such as webhooks
+and email relays, through an outbox. Creating a notification only writes one OutboxEntry per
+configured channel, so the latency of the channels stays out of the POST routes, and the
+deliver-notifications worker pushes the entries to their channels.
+
+Entries are written before the notification they reference, in the same request, rather than
+in a multi-document transaction, which standalone mongo servers do not support. A notification
+that exists therefore always has its entries, and an entry whose notification never appeared,
+because its write failed or it was deleted since, is dropped once DELIVERY_ORPHAN_SECONDS
+have passed.
+
+Workers claim due entries in batches by moving their nextAttemptAt past a lease, with
+claim_due, so any number of workers on any number of nodes can run at once, and deliver each
+batch concurrently from a bounded thread pool. Failed deliveries are retried with exponential
+backoff, and moved to the dead letter collection once they ran out of attempts or their channel
+rejected them.
+"""
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http import HTTPStatus
+import requests
+from requests.adapters import HTTPAdapter
+from bson import ObjectId
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from application.utils.metrics import time_operation
+from application.namespaces.notifications.access_tracking import current_access_time
+from application.namespaces.notifications.inbox import DUPLICATE_KEY_ERROR
+from application.namespaces.notifications.leases import claim_due, oldest_due_seconds
+from application.namespaces.notifications.models import (
+    NOTIFICATION_RESPONSE_PROJECTION,
+    DeadLetter,
+    Notification,
+    OutboxEntry,
+)
+from application.namespaces.notifications.serializers import serialize_notification
+
+LOGGER = logging.getLogger(__name__)
+
+DELIVERIES = Counter(
+    "orodha_deliveries",
+    "Number of outbox entries processed by delivery workers, by channel and outcome.",
+    ["channel", "outcome"],
+)
+DELIVERY_LAG = Histogram(
+    "orodha_delivery_lag_seconds",
+    "Time from the creation of a notification to its delivery to a channel.",
+    ["channel"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0),
+)
+OUTBOX_LAG = Gauge(
+    "orodha_outbox_lag_seconds",
+    "How long the oldest due outbox entry has been waiting for a delivery worker.",
+    multiprocess_mode="max",
+)
+
+# Outcomes of a delivery attempt.
+DELIVERED = "delivered"
+RETRIED = "retried"
+DEAD_LETTERED = "dead_lettered"
+ORPHANED = "orphaned"
+DEFERRED = "deferred"
+# Client errors a channel may recover from, every other 4xx rejects the delivery for good.
+RETRYABLE_CLIENT_ERRORS = (HTTPStatus.REQUEST_TIMEOUT, HTTPStatus.TOO_MANY_REQUESTS)
+
+
+def parse_delivery_channels(value: str) -> dict:
+    """
+    Function which reads the channels notifications are delivered to.
+
+    Args:
+        value(str): Comma separated name=url pairs, such as
+            "webhook=https://hooks.example.com/notifications,email=https://relay.example.com".
+
+    Returns:
+        channels(dict): The url of each channel name, empty when delivery is disabled.
+
+    Raises:
+        ValueError: If a channel is not a name=url pair, or is named twice.
+    """
+    channels = {}
+    for channel in filter(None, (item.strip() for item in value.split(","))):
+        name, separator, url = (part.strip() for part in channel.partition("="))
+        if not separator or not name or not url:
+            raise ValueError(f"delivery channel: {channel} is not a name=url pair.")
+        if name in channels:
+            raise ValueError(f"delivery channel: {name} is configured more than once.")
+        channels[name] = url
+    return channels
+
+
+def enqueue_deliveries(notifications: list, channels: dict) -> int:
+    """
+    Function which writes the outbox entries of notifications, one per channel, due now.
+
+    Args:
+        notifications(list[dict]): Raw notification documents, including their _id.
+        channels(dict): The url of each channel name.
+
+    Returns:
+        inserted_count(int): The number of outbox entries that were written.
+    """
+    now = current_access_time()
+    entries = [
+        {
+            "notificationId": notification["_id"],
+            "channel": channel,
+            "attempts": 0,
+            "nextAttemptAt": now,
+            "claimedBy": None,
+            "lastError": None,
+            "createdAt": now,
+        }
+        for notification in notifications
+        for channel in channels
+    ]
+    if not entries:
+        return 0
+    with time_operation("mongo", "enqueue_deliveries"):
+        OutboxEntry._get_collection().insert_many(entries, ordered=False)
+    return len(entries)
+
+
+class DeliveryWorker:
+    """
+    Class which delivers due outbox entries to their channels, a batch at a time.
+
+    Args:
+        channels(dict): The url of each channel name.
+        batch_size(int) - Optional: The number of entries claimed at once.
+        concurrency(int) - Optional: The number of deliveries made at the same time.
+        timeout_seconds(float) - Optional: Seconds to wait for a channel to respond.
+        max_attempts(int) - Optional: The number of attempts before an entry is dead lettered.
+        backoff_seconds(float) - Optional: The delay before the first retry, doubled for
+            each further attempt.
+        max_backoff_seconds(float) - Optional: The longest delay between two attempts.
+        lease_seconds(float) - Optional: How long a claimed entry is held by this worker
+            before other workers may claim it.
+        orphan_seconds(float) - Optional: How long an entry waits for its notification to
+            appear before it is dropped.
+    """
+
+    def __init__(
+        self,
+        channels: dict,
+        batch_size: int = 100,
+        concurrency: int = 16,
+        timeout_seconds: float = 10,
+        max_attempts: int = 8,
+        backoff_seconds: float = 1,
+        max_backoff_seconds: float = 300,
+        lease_seconds: float = 60,
+        orphan_seconds: float = 60,
+    ):
+        self.channels = channels
+        self.batch_size = batch_size
+        self.timeout_seconds = timeout_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.orphan_seconds = orphan_seconds
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(len(channels), 1), pool_maxsize=concurrency)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="delivery"
+        )
+
+    def close(self):
+        """Stops the delivery threads and closes the connections to the channels."""
+        self._executor.shutdown()
+        self._session.close()
+
+    def claim(self) -> tuple:
+        """
+        Claims the batch of outbox entries which have been due the longest.
+
+        Returns:
+            claim(tuple): The token of the claim along with the claimed entries. Entries
+                claimed by another worker in the meantime are left out.
+        """
+        return claim_due(
+            OutboxEntry._get_collection(), "nextAttemptAt", self.batch_size, self.lease_seconds
+        )
+
+    def backoff(self, attempts: int) -> float:
+        """Returns the seconds to wait before the next attempt, after attempts failed ones."""
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempts - 1))
+        # Jitter keeps the retries of entries that failed together from arriving together.
+        return delay * random.uniform(0.5, 1.0)
+
+    def deliver(self, entry: dict, notification: dict) -> tuple:
+        """
+        Delivers one outbox entry to its channel.
+
+        Returns:
+            result(tuple): DELIVERED, RETRIED, DEAD_LETTERED or DEFERRED when the notification
+                was not found, along with the error of a failed attempt.
+        """
+        url = self.channels.get(entry["channel"])
+        if url is None:
+            return DEAD_LETTERED, f"channel: {entry['channel']} is not configured."
+        if notification is None:
+            return DEFERRED, None
+        body = {
+            "deliveryId": str(entry["_id"]),
+            "channel": entry["channel"],
+            "attempt": entry["attempts"] + 1,
+            "notification": serialize_notification(notification),
+        }
+        try:
+            with time_operation("delivery", entry["channel"]):
+                response = self._session.post(
+                    url,
+                    json=body,
+                    # Lets channels drop the repeats of an at least once delivery.
+                    headers={"Idempotency-Key": str(entry["_id"])},
+                    timeout=self.timeout_seconds,
+                )
+        except requests.RequestException as err:
+            return RETRIED, str(err)
+        if response.ok:
+            return DELIVERED, None
+        error = f"{entry['channel']} responded with {response.status_code}"
+        if HTTPStatus.BAD_REQUEST <= response.status_code < HTTPStatus.INTERNAL_SERVER_ERROR \
+                and response.status_code not in RETRYABLE_CLIENT_ERRORS:
+            return DEAD_LETTERED, error
+        return RETRIED, error
+
+    def run_once(self) -> dict:
+        """
+        Claims and delivers one batch of outbox entries.
+
+        Returns:
+            counts(dict): The number of entries of each outcome.
+        """
+        token, entries = self.claim()
+        counts = {}
+        if entries:
+            notifications = {
+                notification["_id"]: notification
+                for notification in Notification._get_collection().find(
+                    {"_id": {"$in": list({entry["notificationId"] for entry in entries})}},
+                    NOTIFICATION_RESPONSE_PROJECTION,
+                )
+            }
+            results = list(self._executor.map(
+                lambda entry: self.deliver(entry, notifications.get(entry["notificationId"])),
+                entries,
+            ))
+            outcomes = self._record_results(token, entries, results)
+            for entry, outcome in zip(entries, outcomes):
+                DELIVERIES.labels(channel=entry["channel"], outcome=outcome).inc()
+                counts[outcome] = counts.get(outcome, 0) + 1
+        self._record_lag()
+        return counts
+
+    def _record_results(self, token: ObjectId, entries: list, results: list) -> list:
+        now = current_access_time()
+        outcomes = []
+        requests_ = []
+        dead_letters = []
+        for entry, (outcome, error) in zip(entries, results):
+            claimed = {"_id": entry["_id"], "claimedBy": token}
+            attempts = entry["attempts"] + 1
+            if outcome == DEFERRED and entry["createdAt"] <= now - timedelta(
+                    seconds=self.orphan_seconds):
+                outcome = ORPHANED
+            elif outcome == RETRIED and attempts >= self.max_attempts:
+                outcome = DEAD_LETTERED
+
+            if outcome in (DELIVERED, ORPHANED):
+                requests_.append(DeleteOne(claimed))
+                if outcome == DELIVERED:
+                    DELIVERY_LAG.labels(channel=entry["channel"]).observe(
+                        (now - entry["createdAt"]).total_seconds()
+                    )
+            elif outcome == DEAD_LETTERED:
+                dead_letters.append({
+                    "_id": entry["_id"],
+                    "notificationId": entry["notificationId"],
+                    "channel": entry["channel"],
+                    "attempts": attempts,
+                    "lastError": error,
+                    "createdAt": entry["createdAt"],
+                    "deadAt": now,
+                })
+                requests_.append(DeleteOne(claimed))
+            elif outcome == DEFERRED:
+                # The notification may still be on its way, it is looked for again shortly.
+                requests_.append(UpdateOne(claimed, {"$set": {
+                    "claimedBy": None,
+                    "nextAttemptAt": now + timedelta(seconds=min(1, self.orphan_seconds)),
+                }}))
+            else:
+                requests_.append(UpdateOne(claimed, {"$set": {
+                    "claimedBy": None,
+                    "attempts": attempts,
+                    "lastError": error,
+                    "nextAttemptAt": now + timedelta(seconds=self.backoff(attempts)),
+                }}))
+            outcomes.append(outcome)
+
+        # Dead letters are written first, so that an entry is never lost in between.
+        if dead_letters:
+            try:
+                DeadLetter._get_collection().insert_many(dead_letters, ordered=False)
+            except BulkWriteError as err:
+                # An entry dead lettered by a worker that died before removing it.
+                if any(
+                    write_error["code"] != DUPLICATE_KEY_ERROR
+                    for write_error in err.details.get("writeErrors", [])
+                ):
+                    raise
+        OutboxEntry._get_collection().bulk_write(requests_, ordered=False)
+        return outcomes
+
+    def _record_lag(self):
+        OUTBOX_LAG.set(oldest_due_seconds(OutboxEntry._get_collection(), "nextAttemptAt"))
+
+    def run(self, poll_seconds: float, stop: threading.Event):
+        """
+        Delivers batches until stop is set, waiting poll_seconds whenever fewer than a full
+        batch were due.
+
+        Args:
+            poll_seconds(float): Seconds waited for more entries to become due.
+            stop(threading.Event): Set to stop the worker once its current batch is done.
+        """
+        while not stop.is_set():
+            try:
+                processed = sum(self.run_once().values())
+            except PyMongoError:
+                # The worker outlives a failing database, claimed entries are retried once
+                # their lease ran out.
+                LOGGER.exception("Unable to deliver notifications")
+                processed = 0
+            if processed < self.batch_size:
+                stop.wait(poll_seconds)
+
+
+def create_delivery_worker(config) -> DeliveryWorker:
+    """
+    Function which creates the delivery worker configured in our application config.
+
+    Args:
+        config(ConfigParser): Our application config, as returned from obtain_config.
+
+    Returns:
+        worker(DeliveryWorker): The worker delivering to the configured channels.
+    """
+    delivery_config = config["delivery_config"]
+    return DeliveryWorker(
+        parse_delivery_channels(delivery_config["delivery_channels"]),
+        batch_size=delivery_config.getint("delivery_batch_size"),
+        concurrency=delivery_config.getint("delivery_concurrency"),
+        timeout_seconds=delivery_config.getfloat("delivery_timeout_seconds"),
+        max_attempts=delivery_config.getint("delivery_max_attempts"),
+        backoff_seconds=delivery_config.getfloat("delivery_backoff_seconds"),
+        max_backoff_seconds=delivery_config.getfloat("delivery_max_backoff_seconds"),
+        lease_seconds=delivery_config.getfloat("delivery_lease_seconds"),
+        orphan_seconds=delivery_config.getfloat("delivery_orphan_seconds"),
+    )
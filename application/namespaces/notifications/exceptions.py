@@ -34,6 +34,18 @@ class OrodhaBadRequestError(Exception):
         self.message = message
         super().__init__(self.message)
 
+class PayloadValidationError(OrodhaBadRequestError):
+    """
+    Exception for when the payload of a POST request does not have the shape of our creation
+    model, such as missing targets or a field of the wrong type. Carries the error of every
+    offending field, as flask_restx reports payload validation errors. Returns a 400 BAD
+    REQUEST status code.
+    """
+
+    def __init__(self, errors: dict, message: str = "Input payload validation failed"):
+        self.errors = errors
+        super().__init__(message)
+
 class OrodhaNotFoundError(Exception):
     """
     Exception for when a search for a specific object in either our database or
@@ -45,6 +57,18 @@ class OrodhaNotFoundError(Exception):
         self.message = message
         super().__init__(self.message)
 
+class OrodhaConflictError(Exception):
+    """
+    Exception for when a request conflicts with an earlier one, such as an Idempotency-Key
+    that was sent with a different payload, or whose first request is still being processed.
+    Returns a 409 CONFLICT status code.
+    """
+    status_code = HTTPStatus.CONFLICT
+
+    def __init__(self, message: str = None):
+        self.message = message
+        super().__init__(self.message)
+
 class OrodhaInternalError(Exception):
     """
     Exception for when there is an internal server error.
@@ -54,3 +78,15 @@ class OrodhaInternalError(Exception):
     def __init__(self, message: str = None):
         self.message = message
         super().__init__(self.message)
+
+class OrodhaServiceUnavailableError(Exception):
+    """
+    Exception for when the service can not take on more work at the moment, such as when a
+    worker already holds its maximum number of open streams. Returns a 503 SERVICE UNAVAILABLE
+    status code.
+    """
+    status_code = HTTPStatus.SERVICE_UNAVAILABLE
+
+    def __init__(self, message: str = None):
+        self.message = message
+        super().__init__(self.message)
@@ -0,0 +1,200 @@
+"""
+Module which contains the idempotency keys of POST requests. A producer that retries a POST
+after a timeout sends the same Idempotency-Key header again, and is answered with the result
+of its first request instead of creating the notifications a second time.
+
+A retry costs one lookup of the unique user_route_key index. The first request with a key
+claims it by inserting a pending IdempotencyRecord, which the unique index lets only one of
+several concurrent requests do, and stores its result on the record once it completed. A
+request that fails releases its key, so that it can be retried, and a pending key whose request
+died with its worker can be claimed again once IDEMPOTENCY_LEASE_SECONDS have passed.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from enum import Enum
+from prometheus_client import Counter
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from application.namespaces.notifications.models import IdempotencyRecord
+from application.namespaces.notifications.access_tracking import current_access_time
+from application.namespaces.notifications.exceptions import (
+    OrodhaBadRequestError,
+    OrodhaConflictError,
+)
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+TTL_INDEX_NAME = "created_ttl"
+# The result of a request is only written once its notifications were, so it is retried
+# rather than lost to a transient error.
+COMPLETE_ATTEMPTS = 3
+
+IDEMPOTENCY_KEYS = Counter(
+    "orodha_idempotency_keys",
+    "Number of POST requests sent with an Idempotency-Key, by what became of their key.",
+    ["route", "outcome"],
+)
+
+
+class IdempotencyStatuses(Enum):
+    """
+    Simple class which inherits from Enum and defines the states of an idempotency key.
+
+    PENDING: The first request with the key is creating its notifications.
+    COMPLETED: The first request completed, and its result is stored with the key.
+    """
+    PENDING = "pending"
+    COMPLETED = "completed"
+
+
+def ensure_idempotency_indexes(ttl_seconds: int):
+    """
+    Function which creates the TTL index that expires idempotency keys, replacing it when
+    it was created with another lifetime.
+
+    Args:
+        ttl_seconds(int): The number of seconds an idempotency key is kept for.
+    """
+    collection = IdempotencyRecord._get_collection()
+    existing = collection.index_information().get(TTL_INDEX_NAME)
+    if existing is not None and existing.get("expireAfterSeconds") != ttl_seconds:
+        collection.drop_index(TTL_INDEX_NAME)
+        existing = None
+    if existing is None:
+        collection.create_index(
+            [("createdAt", ASCENDING)], name=TTL_INDEX_NAME, expireAfterSeconds=ttl_seconds
+        )
+
+
+def hash_payload(payload) -> str:
+    """
+    Function which hashes the payload of a request, the same regardless of the order of
+    its keys, to tell a retry from another request reusing its idempotency key.
+    """
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def validate_idempotency_key(key: str):
+    """
+    Raises:
+        OrodhaBadRequestError: If the idempotency key is empty or too long.
+    """
+    if not 0 < len(key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise OrodhaBadRequestError(
+            f"The {IDEMPOTENCY_KEY_HEADER} header must contain between 1 and "
+            f"{MAX_IDEMPOTENCY_KEY_LENGTH} characters."
+        )
+
+
+def _stored_result(record: dict, route: str, payload_hash: str):
+    if record["payloadHash"] != payload_hash:
+        IDEMPOTENCY_KEYS.labels(route=route, outcome="mismatched").inc()
+        raise OrodhaConflictError(
+            f"The {IDEMPOTENCY_KEY_HEADER} was already used with a different payload."
+        )
+    if record["status"] != IdempotencyStatuses.COMPLETED.value:
+        IDEMPOTENCY_KEYS.labels(route=route, outcome="in_progress").inc()
+        raise OrodhaConflictError(
+            f"A request with this {IDEMPOTENCY_KEY_HEADER} is still being processed."
+        )
+    IDEMPOTENCY_KEYS.labels(route=route, outcome="replayed").inc()
+    return record["result"]
+
+
+def claim_idempotency_key(
+    user_id: str,
+    route: str,
+    key: str,
+    payload_hash: str,
+    lease_seconds: float,
+) -> tuple:
+    """
+    Function which claims an idempotency key for a request, or obtains the result of the
+    request that claimed it first.
+
+    Args:
+        user_id(str): The user making the request, keys are only shared by their requests.
+        route(str): The route the request was made to.
+        key(str): The value of the Idempotency-Key header.
+        payload_hash(str): The hash_payload of the request's payload.
+        lease_seconds(float): How long a pending key is held before another request may
+            claim it again.
+
+    Returns:
+        claim(tuple): The id of the claimed record along with None, or None along with the
+            stored result of the first request.
+
+    Raises:
+        OrodhaConflictError: If the key was used with another payload, or its first request
+            is still being processed.
+    """
+    collection = IdempotencyRecord._get_collection()
+    query = {"userId": user_id, "route": route, "key": key}
+    record = collection.find_one(query)
+    if record is None:
+        record = {
+            **query,
+            "payloadHash": payload_hash,
+            "status": IdempotencyStatuses.PENDING.value,
+            "result": None,
+            "createdAt": current_access_time(),
+        }
+        try:
+            collection.insert_one(record)
+        except DuplicateKeyError:
+            # A concurrent request with the same key claimed it first.
+            record = collection.find_one(query)
+            if record is None:
+                raise OrodhaConflictError(
+                    f"A request with this {IDEMPOTENCY_KEY_HEADER} is still being processed."
+                )
+        else:
+            IDEMPOTENCY_KEYS.labels(route=route, outcome="claimed").inc()
+            return record["_id"], None
+
+    now = current_access_time()
+    if record["status"] == IdempotencyStatuses.PENDING.value \
+            and record["payloadHash"] == payload_hash \
+            and record["createdAt"] <= now - timedelta(seconds=lease_seconds):
+        reclaimed = collection.find_one_and_update(
+            {"_id": record["_id"], "status": record["status"], "createdAt": record["createdAt"]},
+            {"$set": {"createdAt": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if reclaimed is not None:
+            IDEMPOTENCY_KEYS.labels(route=route, outcome="reclaimed").inc()
+            return reclaimed["_id"], None
+    return None, _stored_result(record, route, payload_hash)
+
+
+def complete_idempotency_key(record_id, result):
+    """
+    Function which stores the result of the request that claimed an idempotency key,
+    for its retries to be answered with. The write is attempted up to COMPLETE_ATTEMPTS
+    times.
+
+    Raises:
+        PyMongoError: If the result could not be stored by any attempt.
+    """
+    for attempt in range(1, COMPLETE_ATTEMPTS + 1):
+        try:
+            IdempotencyRecord._get_collection().update_one(
+                {"_id": record_id},
+                {"$set": {"status": IdempotencyStatuses.COMPLETED.value, "result": result}},
+            )
+            return
+        except PyMongoError:
+            if attempt == COMPLETE_ATTEMPTS:
+                raise
+
+
+def release_idempotency_key(record_id):
+    """
+    Function which releases the idempotency key of a request that failed, so that a retry
+    claims it again rather than being answered with the failure.
+    """
+    IdempotencyRecord._get_collection().delete_one(
+        {"_id": record_id, "status": IdempotencyStatuses.PENDING.value}
+    )
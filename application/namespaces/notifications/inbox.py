@@ -0,0 +1,227 @@
+"""
+Module which contains the fan-out on write storage mode, where every notification is also
+written as one compact InboxEntry per recipient. A user's notifications are then read from a
+single range of the (userId, notificationId) index, and each recipient has their own
+lastAccessed time.
+"""
+from datetime import datetime
+from enum import Enum
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from application.namespaces.notifications.models import InboxEntry, Notification
+from application.namespaces.notifications.access_tracking import current_access_time
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Maps the fields of a notification query onto the fields of an inbox entry query.
+INBOX_QUERY_FIELDS = {
+    "_id": "notificationId",
+    "targets": "userId",
+    "listId": "listId",
+    "notificationType": "notificationType",
+}
+
+
+class StorageModes(Enum):
+    """
+    Simple class which inherits from Enum and defines how notifications are stored for reads.
+
+    SHARED: Recipients share one notification document and are found through its targets.
+    FANOUT: Notifications are also written as one InboxEntry per recipient, which reads use.
+    """
+    SHARED = "shared"
+    FANOUT = "fanout"
+
+
+def build_inbox_entries(notification: dict) -> list:
+    """
+    Function which creates the raw inbox entries of a raw notification document.
+
+    Args:
+        notification(dict): A notification document as it is stored in mongo.
+
+    Returns:
+        entries(list[dict]): One inbox entry per target of the notification.
+    """
+    return [
+        {
+            "userId": target,
+            "notificationId": notification["_id"],
+            "notificationType": notification.get("notificationType"),
+            "listId": notification.get("listId"),
+            "lastAccessed": notification.get("lastAccessed"),
+            "createdAt": notification.get("createdAt"),
+        }
+        for target in notification.get("targets", [])
+    ]
+
+
+def fan_out(notifications: list) -> int:
+    """
+    Function which writes the inbox entries of newly created notifications. Entries that
+    already exist are left untouched, so fanning out the same notification twice is safe.
+
+    Args:
+        notifications(list[dict]): Raw notification documents, including their _id.
+
+    Returns:
+        inserted_count(int): The number of inbox entries that were written.
+    """
+    entries = [
+        entry for notification in notifications for entry in build_inbox_entries(notification)
+    ]
+    if not entries:
+        return 0
+    try:
+        return len(InboxEntry._get_collection().insert_many(entries, ordered=False).inserted_ids)
+    except BulkWriteError as err:
+        if any(
+            write_error["code"] != DUPLICATE_KEY_ERROR
+            for write_error in err.details.get("writeErrors", [])
+        ):
+            raise
+        return err.details.get("nInserted", 0)
+
+
+def find_inbox_notifications(
+    target_user: str,
+    after_id: ObjectId = None,
+    limit: int = None,
+    read_preference=None,
+) -> list:
+    """
+    Function which reads a user's notifications from their inbox entries, shaped like
+    the projected notification documents of the shared storage mode.
+
+    Args:
+        target_user(str): The user_id to obtain the notifications of.
+        after_id(ObjectId) - Optional: Only notifications created after this one are returned.
+        limit(int) - Optional: The maximum number of notifications to return.
+        read_preference - Optional: The pymongo read preference the entries are read with.
+
+    Returns:
+        notifications(list[dict]): The user's notifications in creation order. Their targets
+            only contain target_user and lastAccessed is the user's own access time.
+    """
+    query = {"userId": target_user}
+    if after_id is not None:
+        query["notificationId"] = {"$gt": after_id}
+    collection = InboxEntry._get_collection()
+    if read_preference is not None:
+        collection = collection.with_options(read_preference=read_preference)
+    cursor = collection.find(
+        query, {"_id": False, "userId": False, "createdAt": False}
+    ).sort("notificationId", ASCENDING)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    return [
+        {
+            "_id": entry["notificationId"],
+            "targets": [target_user],
+            "notificationType": entry.get("notificationType"),
+            "lastAccessed": entry.get("lastAccessed"),
+            "listId": entry.get("listId"),
+        }
+        for entry in cursor
+    ]
+
+
+def touch_inbox_entries(target_user: str, first_id: ObjectId, last_id: ObjectId) -> datetime:
+    """
+    Function which stamps the lastAccessed field of a user's inbox entries, within a range
+    of notification ids, in a single update_many. Other recipients are not affected.
+
+    Args:
+        target_user(str): The user_id whose notifications have been accessed.
+        first_id(ObjectId): The smallest id of the notifications that were accessed.
+        last_id(ObjectId): The largest id of the notifications that were accessed.
+
+    Returns:
+        accessed_at(datetime): The time the inbox entries were stamped with.
+    """
+    accessed_at = current_access_time()
+    InboxEntry._get_collection().update_many(
+        {"userId": target_user, "notificationId": {"$gte": first_id, "$lte": last_id}},
+        {"$set": {"lastAccessed": accessed_at}},
+    )
+    return accessed_at
+
+
+def inbox_query(notification_query: dict) -> dict:
+    """
+    Function which maps a query on notifications onto the matching query on inbox entries.
+
+    Args:
+        notification_query(dict): A query on the _id, targets, listId and notificationType
+            of notifications.
+
+    Returns:
+        query(dict): The query matching the inbox entries of those notifications.
+    """
+    return {
+        INBOX_QUERY_FIELDS[field]: value for field, value in notification_query.items()
+    }
+
+
+def delete_inbox_entries(notification_query: dict) -> int:
+    """
+    Function which deletes the inbox entries matching a query on notifications.
+
+    Args:
+        notification_query(dict): A query on the _id, targets, listId and notificationType
+            of notifications, as used to delete them.
+
+    Returns:
+        deleted_count(int): The number of inbox entries that were deleted.
+    """
+    return InboxEntry._get_collection().delete_many(
+        inbox_query(notification_query)).deleted_count
+
+
+def backfill_inbox(batch_size: int = 1000, after_id: ObjectId = None) -> dict:
+    """
+    Function which creates the inbox entries of existing notifications, of every type,
+    by walking the notification collection in _id order in batches. Existing entries,
+    and the access times recorded on them, are kept, so the backfill can be resumed
+    or run again.
+
+    Args:
+        batch_size(int): The number of notifications read and written per batch.
+        after_id(ObjectId) - Optional: Only notifications created after this one are backfilled.
+
+    Returns:
+        counts(dict): The number of notifications read, the number of inbox entries that
+            were created, and the _id of the last notification that was backfilled.
+    """
+    notifications = Notification._get_collection()
+    inbox = InboxEntry._get_collection()
+    counts = {"notifications": 0, "entries_created": 0, "last_id": after_id}
+    while True:
+        query = {} if after_id is None else {"_id": {"$gt": after_id}}
+        batch = list(notifications.find(
+            query, {
+                "targets": True,
+                "notificationType": True,
+                "listId": True,
+                "lastAccessed": True,
+                "createdAt": True,
+            }
+        ).sort("_id", ASCENDING).limit(batch_size))
+        if not batch:
+            return counts
+
+        operations = [
+            UpdateOne(
+                {"userId": entry["userId"], "notificationId": entry["notificationId"]},
+                {"$setOnInsert": entry},
+                upsert=True,
+            )
+            for notification in batch for entry in build_inbox_entries(notification)
+        ]
+        if operations:
+            counts["entries_created"] += inbox.bulk_write(
+                operations, ordered=False).upserted_count
+        after_id = batch[-1]["_id"]
+        counts["notifications"] += len(batch)
+        counts["last_id"] = after_id
@@ -0,0 +1,63 @@
+"""
+Module which contains the lease based claiming of due documents, shared by the background
+workers of the service. A document is due once the time in its due field has passed, and a
+worker claims it by moving that time past a lease and stamping it with the token of its claim.
+Any number of workers, on any number of nodes, can therefore claim from the same collection,
+and a document held by a worker that stopped is claimed again once its lease ran out.
+
+The due field must be indexed, so that a claim reads its batch straight from the index however
+many documents are waiting.
+"""
+from datetime import timedelta
+from bson import ObjectId
+from pymongo import ASCENDING
+from application.namespaces.notifications.access_tracking import current_access_time
+
+
+def claim_due(collection, due_field: str, batch_size: int, lease_seconds: float) -> tuple:
+    """
+    Function which claims the batch of documents of a collection which have been due the
+    longest.
+
+    Args:
+        collection(Collection): The collection the documents are claimed from.
+        due_field(str): The indexed date field holding when a document is due, which also
+            holds the end of the lease of a claimed document.
+        batch_size(int): The largest number of documents claimed at once.
+        lease_seconds(float): How long the claimed documents are held before other workers
+            may claim them again.
+
+    Returns:
+        claim(tuple): The token of the claim, which the claimed documents hold in claimedBy,
+            along with the claimed documents. Documents claimed by another worker in the
+            meantime are left out.
+    """
+    now = current_access_time()
+    due = {due_field: {"$lte": now}}
+    document_ids = [
+        document["_id"] for document in collection.find(due, {"_id": True})
+        .sort(due_field, ASCENDING)
+        .limit(batch_size)
+    ]
+    if not document_ids:
+        return None, []
+    token = ObjectId()
+    collection.update_many(
+        {"_id": {"$in": document_ids}, **due},
+        {"$set": {"claimedBy": token, due_field: now + timedelta(seconds=lease_seconds)}},
+    )
+    return token, list(collection.find({"_id": {"$in": document_ids}, "claimedBy": token}))
+
+
+def oldest_due_seconds(collection, due_field: str) -> float:
+    """
+    Function which obtains how long the document of a collection which has been due the
+    longest has been waiting to be claimed, or 0 when none is due.
+    """
+    now = current_access_time()
+    oldest = collection.find_one(
+        {due_field: {"$lte": now}},
+        {due_field: True},
+        sort=[(due_field, ASCENDING)],
+    )
+    return (now - oldest[due_field]).total_seconds() if oldest is not None else 0
@@ -2,15 +2,24 @@
 Module which contains the Mongoengine document definitions as well as helper functions
 related to Notifications.
 """
+from datetime import datetime, timezone
 from enum import Enum
 from mongoengine import (
+    BooleanField,
     Document,
     ListField,
     StringField,
     DateTimeField,
-    EnumField
+    DynamicField,
+    EnumField,
+    IntField,
+    ObjectIdField,
+)
+from application.namespaces.notifications.registry import (
+    NotificationTypeRegistry,
+    NotificationTypeSchema,
+    PayloadField,
 )
-from application.namespaces.notifications.exceptions import NotificationTypeError
 
 
 class NotificationTypes(Enum):
@@ -21,6 +30,12 @@ class NotificationTypes(Enum):
     LIST_INVITE = "list_invite"
 
 
+def _utc_now() -> datetime:
+    """Returns the current naive UTC time, at the millisecond precision that mongo stores."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
 class Notification(Document):
     """
     A base document used for defining future notification types with varying behavior.
@@ -29,8 +44,26 @@ class Notification(Document):
         NotificationTypes, default=NotificationTypes.BASE)
     targets = ListField(StringField(), required=True)
     lastAccessed = DateTimeField(default=None)
+    # A date field, unlike the time within _id, can be expired by a TTL index.
+    createdAt = DateTimeField(default=_utc_now)
+    # Only set on coalesced notifications, as the number of events merged into them.
+    eventCount = IntField(default=None)
+    lastEventAt = DateTimeField(default=None)
 
-    meta = {"allow_inheritance": True}
+    meta = {
+        "allow_inheritance": True,
+        # Indexes are created once at startup by ensure_notification_indexes.
+        "auto_create_index": False,
+        "index_cls": False,
+        "indexes": [
+            # Multikey index on targets, _id is included so that a user's
+            # notifications can be read in insertion order straight from the index.
+            {"fields": ["targets", "_id"], "name": "targets_id"},
+            {"fields": ["targets", "notificationType", "_id"], "name": "targets_type_id"},
+            # Counts a user's unread notifications without reading them.
+            {"fields": ["targets", "lastAccessed"], "name": "targets_last_accessed"},
+        ],
+    }
 
 
 class ListInviteNotification(Notification):
@@ -41,11 +74,227 @@ class ListInviteNotification(Notification):
         NotificationTypes, default=NotificationTypes.LIST_INVITE)
     listId = StringField(required=True)
 
+    meta = {
+        "indexes": [
+            {"fields": ["listId", "notificationType"], "name": "list_type"},
+            # Finds the unread invite of a target that a coalesced invite is merged into.
+            {"fields": ["targets", "listId", "lastAccessed"], "name": "targets_list_last_accessed"},
+        ],
+    }
+
+
+class InboxEntry(Document):
+    """
+    A compact, per recipient copy of a notification used when notifications are fanned
+    out on write. Each entry tracks when its own recipient last accessed it.
+    """
+    userId = StringField(required=True)
+    notificationId = ObjectIdField(required=True)
+    notificationType = EnumField(NotificationTypes, default=NotificationTypes.BASE)
+    listId = StringField(default=None)
+    lastAccessed = DateTimeField(default=None)
+    createdAt = DateTimeField(default=None)
+
+    meta = {
+        "collection": "inbox_entry",
+        "auto_create_index": False,
+        "shard_key": ("userId",),
+        "indexes": [
+            # A user's inbox is one narrow range of this index.
+            {
+                "fields": ["userId", "notificationId"],
+                "name": "user_notification",
+                "unique": True,
+            },
+            {"fields": ["notificationId"], "name": "notification"},
+            {"fields": ["userId", "lastAccessed"], "name": "user_last_accessed"},
+        ],
+    }
+
+
+class UserNotificationState(Document):
+    """
+    The state kept for each user alongside their notifications, keyed by their user_id.
+    version is bumped every time one of the user's notifications is created or deleted,
+    which tells whether their notifications changed without reading them. total and unread
+    count the user's notifications, and are only trusted once counted has been set by
+    counting them.
+    """
+    userId = StringField(primary_key=True)
+    version = IntField(default=0)
+    total = IntField(default=0)
+    unread = IntField(default=0)
+    counted = BooleanField(default=False)
+
+    meta = {
+        "collection": "user_notification_state",
+        "auto_create_index": False,
+    }
+
+
+class NotificationArchive(Document):
+    """
+    A compact copy of an expired notification, kept once it is removed from the
+    notification collection. Fields are stored under short names to keep the
+    archive small.
+    """
+    notificationType = StringField(db_field="t")
+    targets = ListField(StringField(), db_field="tg")
+    listId = StringField(db_field="l")
+    createdAt = DateTimeField(db_field="c")
+    lastAccessed = DateTimeField(db_field="a")
+    expiredAt = DateTimeField(db_field="x")
+    reason = StringField(db_field="r")
+
+    meta = {
+        "collection": "notification_archive",
+        "auto_create_index": False,
+    }
+
+
+class IdempotencyRecord(Document):
+    """
+    The Idempotency-Key of a POST request, kept so that a retry of the request is answered
+    with the result of the first one. The unique user_route_key index lets a single request
+    claim a key, and a TTL index on createdAt, created with the configured lifetime by
+    ensure_idempotency_indexes, removes the record once retries are no longer expected.
+    """
+    userId = StringField(required=True)
+    route = StringField(required=True)
+    key = StringField(required=True)
+    payloadHash = StringField(required=True)
+    status = StringField(default="pending")
+    result = DynamicField(default=None)
+    createdAt = DateTimeField(default=_utc_now)
+
+    meta = {
+        "collection": "idempotency_key",
+        "auto_create_index": False,
+        "indexes": [
+            {"fields": ["userId", "route", "key"], "name": "user_route_key", "unique": True},
+        ],
+    }
+
+
+class ScheduledNotification(Document):
+    """
+    A notification scheduled for later, stored as the raw document it is promoted to, with
+    its _cls as notificationCls, along with its deliverAt. Scheduled notifications stay out
+    of the notification collection, and of every read of it, until a scheduler promotes
+    them. dueAt is both when the notification is due and, once a scheduler claimed it, the
+    end of that scheduler's lease. promotedId is the id the notification is being promoted
+    with, given to it by the last scheduler that claimed it.
+    """
+    notificationCls = StringField(required=True)
+    targets = ListField(StringField(), required=True)
+    notificationType = StringField(required=True)
+    listId = StringField(default=None)
+    deliverAt = DateTimeField(required=True)
+    dueAt = DateTimeField(required=True)
+    claimedBy = ObjectIdField(default=None)
+    promotedId = ObjectIdField(default=None)
+
+    meta = {
+        "collection": "scheduled_notification",
+        "auto_create_index": False,
+        # Holds the fields of every notification type.
+        "strict": False,
+        "indexes": [
+            # _id is included so that claims find their batch from the index alone.
+            {"fields": ["dueAt", "_id"], "name": "due"},
+            # Cancels the scheduled notifications of a user or a list.
+            {"fields": ["targets"], "name": "targets"},
+            {"fields": ["listId"], "name": "list", "sparse": True},
+        ],
+    }
+
+
+class OutboxEntry(Document):
+    """
+    A pending delivery of a notification to one external channel, written before the
+    notification itself so that no created notification is left undelivered. nextAttemptAt
+    is both when the entry is due and, once a delivery worker claimed it, the end of that
+    worker's lease, after which another worker may claim it again.
+    """
+    notificationId = ObjectIdField(required=True)
+    channel = StringField(required=True)
+    attempts = IntField(default=0)
+    nextAttemptAt = DateTimeField(required=True)
+    claimedBy = ObjectIdField(default=None)
+    lastError = StringField(default=None)
+    createdAt = DateTimeField(default=_utc_now)
+
+    meta = {
+        "collection": "notification_outbox",
+        "auto_create_index": False,
+        "indexes": [
+            {"fields": ["nextAttemptAt"], "name": "next_attempt"},
+        ],
+    }
+
+
+class DeadLetter(Document):
+    """
+    A delivery which was given up on, either after its last attempt or because its channel
+    rejected it, kept along with its last error for it to be inspected and replayed.
+    """
+    notificationId = ObjectIdField(required=True)
+    channel = StringField(required=True)
+    attempts = IntField(default=0)
+    lastError = StringField(default=None)
+    createdAt = DateTimeField(default=None)
+    deadAt = DateTimeField(default=_utc_now)
+
+    meta = {
+        "collection": "notification_dead_letter",
+        "auto_create_index": False,
+    }
+
+
+# Every notification type is declared here, once, by the fields of its payload. The
+# creation and response models, the response projection and the serializers are all
+# built from these schemas.
+NOTIFICATION_TYPES = NotificationTypeRegistry(created_at=_utc_now)
+NOTIFICATION_TYPES.register(NotificationTypeSchema(NotificationTypes.BASE, Notification))
+NOTIFICATION_TYPES.register(NotificationTypeSchema(
+    NotificationTypes.LIST_INVITE,
+    ListInviteNotification,
+    [PayloadField("list_id", "listId", required=True, description="The id of the list.")],
+    coalesce_by=("listId",),
+))
+
+NOTIFICATION_RESPONSE_PROJECTION = {
+    "targets": True,
+    "notificationType": True,
+    "lastAccessed": True,
+    "eventCount": True,
+    "lastEventAt": True,
+    **{field.attribute: True for field in NOTIFICATION_TYPES.response_attributes()},
+}
+
+
+def ensure_notification_indexes():
+    """
+    Function which creates the indexes declared on our notification documents. Creating
+    an index which already exists is a no-op, so this is safe to call on every startup.
+    """
+    for document in (
+        Notification,
+        ListInviteNotification,
+        InboxEntry,
+        IdempotencyRecord,
+        ScheduledNotification,
+        OutboxEntry,
+    ):
+        document.ensure_indexes()
+
 
 def notification_factory(payload: dict):
     """
     Factory function which takes the payload from the post request
     and creates a notification Document of a type defined in the payload.
+    The Document is not validated, POST requests are turned into raw documents
+    with NOTIFICATION_TYPES.build instead.
 
     Args:
         payload(dict): The payload passed in from the route functions.
@@ -57,24 +306,4 @@ def notification_factory(payload: dict):
     Raises:
         NotificationTypeError: When there is a missing or improper notification type.
     """
-    notification_type = payload.get("notification_type")
-    return_notification = None
-    if notification_type is not None:
-        notification_type = notification_type.lower()
-
-    if notification_type == NotificationTypes.BASE.value:
-        notification_data = {"targets": payload.get("targets")}
-        return_notification = Notification(**notification_data)
-
-    elif notification_type == NotificationTypes.LIST_INVITE.value:
-        notification_data = {
-            "targets": payload.get("targets"),
-            "listId": payload.get("list_id"),
-        }
-        return_notification = ListInviteNotification(**notification_data)
-
-    else:
-        raise NotificationTypeError(
-            message=f"notification_type: {notification_type} is not supported."
-        )
-    return return_notification
+    return NOTIFICATION_TYPES.get(payload.get("notification_type")).create_document(payload)
@@ -0,0 +1,68 @@
+"""
+Module which contains helpers for the keyset pagination of a user's notifications. Pages are
+read in _id order starting after the last _id of the previous page, so that every page is a
+seek on the (targets, _id) index no matter how deep into the results it is.
+"""
+import base64
+import binascii
+from bson import ObjectId
+from bson.errors import InvalidId
+from application.namespaces.notifications.exceptions import OrodhaBadRequestError
+
+
+def encode_cursor(last_id: ObjectId) -> str:
+    """
+    Function which creates the opaque cursor pointing after a notification.
+
+    Args:
+        last_id(ObjectId): The _id of the last notification of a page.
+
+    Returns:
+        cursor(str): A url safe string that can be sent back to obtain the next page.
+    """
+    return base64.urlsafe_b64encode(last_id.binary).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> ObjectId:
+    """
+    Function which obtains the _id that an opaque cursor points after.
+
+    Args:
+        cursor(str): A cursor previously created by encode_cursor.
+
+    Returns:
+        last_id(ObjectId): The _id of the last notification of the previous page.
+
+    Raises:
+        OrodhaBadRequestError: If the cursor was not created by encode_cursor.
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        return ObjectId(base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, InvalidId, TypeError, ValueError) as err:
+        raise OrodhaBadRequestError("cursor is invalid.") from err
+
+
+def parse_limit(limit: str, max_page_size: int) -> int:
+    """
+    Function which validates the limit query parameter of a request.
+
+    Args:
+        limit(str): The raw value of the limit query parameter, or None.
+        max_page_size(int): The largest page that can be requested.
+
+    Returns:
+        limit(int): The page size, or None when the request is not paginated.
+
+    Raises:
+        OrodhaBadRequestError: If limit is not an integer between 1 and max_page_size.
+    """
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError as err:
+        raise OrodhaBadRequestError("limit must be an integer.") from err
+    if not 1 <= limit <= max_page_size:
+        raise OrodhaBadRequestError(f"limit must be between 1 and {max_page_size}.")
+    return limit
@@ -0,0 +1,284 @@
+"""
+Module which contains the registry of notification types. Each type declares its schema once,
+as the fields its payload holds besides targets and notification_type, and the registry
+compiles every schema when the type is registered. The compiled schemas are then used for the
+restx models of the notification routes, to validate a payload and turn it into the document
+that is stored, and for the fields of the response model.
+
+Besides the fields of its type, a payload may hold a deliver_at time which schedules its
+notification for later.
+
+Payloads are validated exactly once, by NotificationTypeRegistry.build, rather than by restx,
+by constructing a mongoengine Document and again by saving it.
+"""
+from datetime import datetime, timezone
+from flask_restx import fields
+from flask_restx.inputs import datetime_from_iso8601
+from mongoengine import ValidationError
+from application.namespaces.notifications.exceptions import (
+    NotificationTypeError,
+    PayloadValidationError,
+)
+
+
+def _is_string(value) -> bool:
+    return value.__class__ is str
+
+
+def _is_string_list(value) -> bool:
+    return value.__class__ is list and all(item.__class__ is str for item in value)
+
+
+# The latest deliver_at accepted, the time within an ObjectId ends in 2106.
+MAX_DELIVER_AT = datetime(2100, 1, 1)
+
+
+def _parse_deliver_at(value) -> datetime:
+    """
+    Parses the deliver_at of a payload, an ISO 8601 datetime that is UTC unless it holds an
+    offset, into the naive UTC time, at millisecond precision, that mongo stores.
+
+    Raises:
+        PayloadValidationError: If deliver_at is not an ISO 8601 datetime, or is too far off.
+    """
+    try:
+        deliver_at = datetime_from_iso8601(value) if _is_string(value) else None
+    except ValueError:
+        deliver_at = None
+    if deliver_at is None:
+        raise PayloadValidationError({"deliver_at": f"{value!r} is not an ISO 8601 datetime"})
+    if deliver_at.tzinfo is not None:
+        deliver_at = deliver_at.astimezone(timezone.utc).replace(tzinfo=None)
+    if deliver_at >= MAX_DELIVER_AT:
+        raise PayloadValidationError(
+            {"deliver_at": f"{value!r} must be before {MAX_DELIVER_AT.isoformat()}"}
+        )
+    return deliver_at.replace(microsecond=deliver_at.microsecond // 1000 * 1000)
+
+
+# The kinds of value a payload field can hold, with their check and their restx field.
+FIELD_KINDS = {
+    "string": (_is_string, "is not of type 'string'", fields.String),
+    "string_list": (_is_string_list, "is not of type 'array' of 'string'", fields.List),
+}
+
+
+class PayloadField:
+    """
+    A field of a notification type, as it is sent in a payload and stored in a document.
+
+    Args:
+        key(str): The name of the field in the payload.
+        attribute(str): The name of the field in the stored document and in responses.
+        kind(str) - Optional: One of FIELD_KINDS.
+        required(bool) - Optional: Whether notifications of the type need the field.
+        description(str) - Optional: The description of the field in the api docs.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        attribute: str,
+        kind: str = "string",
+        required: bool = False,
+        description: str = None,
+    ):
+        if kind not in FIELD_KINDS:
+            raise ValueError(f"kind: {kind} is not one of {', '.join(FIELD_KINDS)}.")
+        self.key = key
+        self.attribute = attribute
+        self.kind = kind
+        self.required = required
+        self.description = description
+
+    def restx_field(self, attribute: str = None):
+        """Creates the restx field of this payload field."""
+        field_class = FIELD_KINDS[self.kind][2]
+        if field_class is fields.List:
+            return fields.List(fields.String, attribute=attribute, description=self.description)
+        return field_class(attribute=attribute, description=self.description)
+
+
+class NotificationTypeSchema:
+    """
+    The schema of a notification type: the Document it is stored as, and the fields its
+    payload holds besides targets and notification_type.
+
+    Args:
+        notification_type(Enum): The NotificationTypes value of the type.
+        document(type): The mongoengine Document class of the type, whose _cls is stored.
+        payload_fields(list[PayloadField]) - Optional: The fields of the type.
+        coalesce_by(tuple[str]) - Optional: The stored attributes which repeated notifications
+            of the type share, when coalescing is enabled a new notification is merged into
+            the unread one of its target with the same values. Types without them are never
+            coalesced.
+    """
+
+    def __init__(
+        self,
+        notification_type,
+        document,
+        payload_fields: list = (),
+        coalesce_by: tuple = (),
+    ):
+        self.notification_type = notification_type
+        self.document = document
+        self.payload_fields = tuple(payload_fields)
+        self.coalesce_by = tuple(coalesce_by)
+        # (key, attribute, required, check, message) of every field, compiled once.
+        self._checks = tuple(
+            (field.key, field.attribute, field.required, *FIELD_KINDS[field.kind][:2])
+            for field in self.payload_fields
+        )
+
+    def build(self, payload: dict, targets: list, created_at) -> dict:
+        """
+        Validates the fields of a payload of this type and creates the document it is
+        stored as.
+
+        Raises:
+            PayloadValidationError: If a field holds a value of the wrong kind.
+            ValidationError: If a required field is missing.
+        """
+        document = {
+            "_cls": self.document._class_name,
+            "targets": targets,
+            "createdAt": created_at,
+            "notificationType": self.notification_type.value,
+        }
+        for key, attribute, required, check, message in self._checks:
+            value = payload.get(key)
+            if value is None:
+                if required:
+                    raise ValidationError(
+                        f"{key} is required for {self.notification_type.value} notifications"
+                    )
+                continue
+            if not check(value):
+                raise PayloadValidationError({key: f"{value!r} {message}"})
+            document[attribute] = value
+        return document
+
+    def create_document(self, payload: dict):
+        """Creates the mongoengine Document of a payload of this type, without validating it."""
+        return self.document(
+            targets=payload.get("targets"),
+            **{field.attribute: payload.get(field.key) for field in self.payload_fields},
+        )
+
+
+class NotificationTypeRegistry:
+    """
+    The notification types the service accepts, found by their NotificationTypes value.
+
+    Args:
+        created_at(callable): Returns the creation time of a new notification.
+    """
+
+    def __init__(self, created_at):
+        self._created_at = created_at
+        self._schemas = {}
+
+    def __iter__(self):
+        return iter(self._schemas.values())
+
+    def register(self, schema: NotificationTypeSchema):
+        """
+        Registers the schema of a notification type, replacing a schema registered for the
+        same type. Types are registered when the models module is imported, before any
+        restx model or serializer is built from the registry.
+        """
+        self._schemas[schema.notification_type.value] = schema
+
+    def get(self, notification_type: str) -> NotificationTypeSchema:
+        """
+        Obtains the schema of a notification type, ignoring its case.
+
+        Raises:
+            NotificationTypeError: If the notification type is not registered.
+        """
+        schema = None
+        if notification_type.__class__ is str:
+            schema = self._schemas.get(notification_type) \
+                or self._schemas.get(notification_type.lower())
+        if schema is None:
+            raise NotificationTypeError(
+                message=f"notification_type: {notification_type} is not supported."
+            )
+        return schema
+
+    def build(self, payload: dict) -> dict:
+        """
+        Validates a payload and creates the raw document of the notification it describes.
+
+        Args:
+            payload(dict): The payload of a POST request.
+
+        Returns:
+            document(dict): The notification as it is stored in mongo, without an _id. The
+                deliver_at of a scheduled notification is returned as its deliverAt.
+
+        Raises:
+            PayloadValidationError: If the payload is not an object, or a field holds a
+                value of the wrong kind.
+            NotificationTypeError: If the notification type is not registered.
+            ValidationError: If the payload is missing a field its type requires.
+        """
+        if payload.__class__ is not dict:
+            raise PayloadValidationError({"payload": f"{payload!r} is not of type 'object'"})
+        targets = payload.get("targets")
+        if targets is None:
+            raise PayloadValidationError({"targets": "'targets' is a required property"})
+        if not _is_string_list(targets):
+            raise PayloadValidationError(
+                {"targets": f"{targets!r} {FIELD_KINDS['string_list'][1]}"}
+            )
+        if not targets:
+            raise ValidationError("targets must contain at least one user_id")
+        schema = self.get(payload.get("notification_type"))
+        document = schema.build(payload, targets, self._created_at())
+        deliver_at = payload.get("deliver_at")
+        if deliver_at is not None:
+            document["deliverAt"] = _parse_deliver_at(deliver_at)
+        return document
+
+    def creation_fields(self) -> dict:
+        """
+        Creates the fields of the restx model of a creation payload, the fields of every
+        type included, for the api docs.
+        """
+        creation_fields = {
+            "targets": fields.List(fields.String, required=True),
+            "notification_type": fields.String(
+                default="base", enum=[schema.notification_type.value for schema in self]
+            ),
+            "deliver_at": fields.DateTime(
+                description="Schedules the notification to be delivered at this time."
+            ),
+        }
+        for schema in self:
+            for field in schema.payload_fields:
+                creation_fields.setdefault(field.key, field.restx_field())
+        return creation_fields
+
+    def response_attributes(self) -> tuple:
+        """Obtains the stored attributes of every type which are returned in responses."""
+        attributes = {}
+        for schema in self:
+            for field in schema.payload_fields:
+                attributes.setdefault(field.attribute, field)
+        return tuple(attributes.values())
+
+    def response_fields(self) -> dict:
+        """Creates the fields of the restx response model of a notification."""
+        response_fields = {
+            "id": fields.String(required=True, attribute="_id"),
+            "targets": fields.List(fields.String, required=True),
+            "notificationType": fields.String(),
+            "lastAccessed": fields.DateTime(required=False),
+            "eventCount": fields.Integer(required=False),
+            "lastEventAt": fields.DateTime(required=False),
+        }
+        for field in self.response_attributes():
+            response_fields[field.attribute] = field.restx_field()
+        return response_fields
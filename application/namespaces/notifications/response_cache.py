@@ -0,0 +1,212 @@
+"""
+Module which contains the read-through cache of the pages returned by GET /notifications, so
+that clients polling for notifications that did not change are answered without reading them.
+
+Every page is cached under its user along with the version of the user it was read at, and is
+only served while that version is still current. Creating or deleting notifications bumps the
+version of every target, so a page is never served after one of its user's notifications
+changed, even when it was cached by another worker. The writes of this worker also invalidate
+the pages of their targets right away, so that they do not linger until they expire.
+"""
+import configparser
+import time
+import bson
+from prometheus_client import Counter
+from application.utils.cache import LRUCache, SharedCacheBackend, SingleFlight
+
+RESPONSE_CACHE_HITS = Counter(
+    "orodha_response_cache_hits",
+    "Number of notification pages served from the response cache.",
+    ["tier"],
+)
+RESPONSE_CACHE_MISSES = Counter(
+    "orodha_response_cache_misses",
+    "Number of notification pages that had to be read because they were not cached.",
+)
+RESPONSE_CACHE_COALESCED = Counter(
+    "orodha_response_cache_coalesced",
+    "Number of misses that shared a read already in flight for the same page.",
+)
+RESPONSE_CACHE_INVALIDATIONS = Counter(
+    "orodha_response_cache_invalidations",
+    "Number of users whose cached pages were invalidated by a write.",
+)
+RESPONSE_CACHE_EVICTIONS = Counter(
+    "orodha_response_cache_evictions",
+    "Number of users whose cached pages were removed by the local cache.",
+    ["reason"],
+)
+
+SHARED_KEY_PREFIX = "orodha:notifications:"
+
+
+def _copy_page(page: tuple) -> tuple:
+    """Copies the notifications of a page, so that callers can change them."""
+    notifications, next_cursor = page
+    return [dict(notification) for notification in notifications], next_cursor
+
+
+class NotificationPageCache:
+    """
+    Cache of the pages of notifications returned to each user.
+
+    Pages are held in an in process LRUCache of users, and optionally in a shared backend
+    that every worker reads from. Every page expires after ttl_seconds, and concurrent misses
+    of the same page share a single read.
+
+    Args:
+        maxsize(int): The maximum number of users whose pages are held in process, zero
+            disables caching.
+        ttl_seconds(float): The maximum number of seconds a page is cached for.
+        max_notifications(int) - Optional: Pages with more notifications are not cached.
+        max_pages_per_user(int) - Optional: The maximum number of pages held per user, the
+            oldest page being dropped first.
+        shared_backend(SharedCacheBackend) - Optional: A cache shared with other workers.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        ttl_seconds: float = 30,
+        max_notifications: int = 1000,
+        max_pages_per_user: int = 16,
+        shared_backend: SharedCacheBackend = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_notifications = max_notifications
+        self.max_pages_per_user = max_pages_per_user
+        self._local = LRUCache(
+            maxsize,
+            ttl_seconds,
+            on_evict=lambda reason: RESPONSE_CACHE_EVICTIONS.labels(reason=reason).inc(),
+        )
+        self._shared = shared_backend
+        self._single_flight = SingleFlight()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and (self._local.maxsize > 0 or self._shared is not None)
+
+    @staticmethod
+    def _shared_key(user_id: str) -> str:
+        return f"{SHARED_KEY_PREFIX}{user_id}"
+
+    def _read_pages(self, user_id: str) -> tuple:
+        """Returns the cached pages of a user, and the tier they were found in."""
+        pages = self._local.get(user_id)
+        if pages is not None:
+            return pages, "local"
+        if self._shared is not None:
+            data = self._shared.get(self._shared_key(user_id))
+            if data is not None:
+                pages = bson.decode(data)
+                self._local.set(user_id, pages)
+                return pages, "shared"
+        return {}, None
+
+    def _current_pages(self, pages: dict, etag: str) -> dict:
+        oldest = time.time() - self.ttl_seconds
+        return {
+            page_key: page for page_key, page in pages.items()
+            if page["etag"] == etag and page["storedAt"] > oldest
+        }
+
+    def _store(self, user_id: str, page_key: str, etag: str, page: tuple):
+        notifications, next_cursor = page
+        if len(notifications) > self.max_notifications:
+            return
+        pages, _ = self._read_pages(user_id)
+        # Pages read at an older version can never be served again.
+        pages = self._current_pages(pages, etag)
+        pages.pop(page_key, None)
+        pages[page_key] = {
+            "etag": etag,
+            "storedAt": time.time(),
+            "notifications": notifications,
+            "nextCursor": next_cursor,
+        }
+        while len(pages) > self.max_pages_per_user:
+            pages.pop(next(iter(pages)))
+        self._local.set(user_id, pages)
+        if self._shared is not None:
+            self._shared.set(self._shared_key(user_id), bson.encode(pages), self.ttl_seconds)
+
+    def _load(self, user_id: str, page_key: str, etag: str, loader) -> tuple:
+        page = loader()
+        self._store(user_id, page_key, etag, page)
+        return page
+
+    def get_or_load(self, user_id: str, page_key: str, etag: str, loader) -> tuple:
+        """
+        Obtains a page of a user's notifications from the cache, or from loader when it is
+        not cached at the user's current version. The result of loader is cached, and any
+        exception it raises is not.
+
+        Args:
+            user_id(str): The user_id the page belongs to.
+            page_key(str): Identifies the page among the pages of the user.
+            etag(str): The current version of the user's notifications.
+            loader(callable): Reads the page, returning its notifications and next cursor.
+
+        Returns:
+            tuple(page, cached): A copy of the page, and whether it was served from the
+                cache rather than read by this call or a concurrent one.
+        """
+        if not self.enabled:
+            return loader(), False
+
+        pages, tier = self._read_pages(user_id)
+        page = self._current_pages(pages, etag).get(page_key)
+        if page is not None:
+            RESPONSE_CACHE_HITS.labels(tier=tier).inc()
+            return _copy_page((page["notifications"], page["nextCursor"])), True
+
+        RESPONSE_CACHE_MISSES.inc()
+        page, shared = self._single_flight.do(
+            (user_id, page_key, etag), self._load, user_id, page_key, etag, loader
+        )
+        if shared:
+            RESPONSE_CACHE_COALESCED.inc()
+        return _copy_page(page), False
+
+    def invalidate(self, user_ids):
+        """
+        Removes the cached pages of users whose notifications changed.
+
+        Args:
+            user_ids(iterable[str]): The user_ids whose pages are removed.
+        """
+        if not self.enabled:
+            return
+        for user_id in user_ids:
+            self._local.delete(user_id)
+            if self._shared is not None:
+                self._shared.delete(self._shared_key(user_id))
+            RESPONSE_CACHE_INVALIDATIONS.inc()
+
+    def clear(self):
+        """Removes every page from the in process cache."""
+        self._local.clear()
+
+
+def create_notification_page_cache(
+    config: configparser.ConfigParser,
+    shared_backend: SharedCacheBackend = None,
+) -> NotificationPageCache:
+    """
+    Function which creates a NotificationPageCache from our application config.
+
+    Args:
+        config(ConfigParser): Our application config, as returned from obtain_config.
+        shared_backend(SharedCacheBackend) - Optional: A cache shared with other workers.
+
+    Returns:
+        NotificationPageCache: A cache of the pages returned by GET /notifications.
+    """
+    notification_config = config["notification_config"]
+    return NotificationPageCache(
+        maxsize=notification_config.getint("response_cache_size"),
+        ttl_seconds=notification_config.getfloat("response_cache_ttl_seconds"),
+        max_notifications=notification_config.getint("response_cache_max_notifications"),
+        shared_backend=shared_backend,
+    )
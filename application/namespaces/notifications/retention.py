@@ -0,0 +1,405 @@
+"""
+Module which contains the retention of notifications, configured per NotificationTypes value
+as a number of days after a notification was created and a number of days after it was last
+accessed.
+
+Expired notifications are removed either by mongo itself, through TTL indexes, or by the
+expire-notifications job, which can move them to the compact notification_archive collection
+first and keeps the per user counts and versions up to date. TTL indexes delete documents
+without the service knowing, so counts drift until reconcile-counts is run, and conditional
+GETs keep answering 304 until the user's notifications change otherwise.
+
+The job runs in a short lived process of its own, so the metrics of each run are kept in
+EXPIRY_REGISTRY and pushed to a Prometheus pushgateway with push_expiry_metrics once it is done.
+"""
+import configparser
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from bson import ObjectId
+from prometheus_client import CollectorRegistry, Gauge, push_to_gateway
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, OperationFailure
+from application.config.config import _get_optional_environment_variables
+from application.namespaces.notifications.models import (
+    InboxEntry,
+    Notification,
+    NotificationArchive,
+    NotificationTypes,
+)
+from application.namespaces.notifications.inbox import DUPLICATE_KEY_ERROR, StorageModes
+from application.namespaces.notifications.user_state import (
+    aggregate_user_counts,
+    removal_changes,
+    update_user_states,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+EXPIRY_REGISTRY = CollectorRegistry()
+NOTIFICATIONS_EXPIRED = Gauge(
+    "orodha_notifications_expired",
+    "Number of documents removed by the last run of the expire-notifications job.",
+    ["notification_type", "reason"],
+    registry=EXPIRY_REGISTRY,
+)
+NOTIFICATIONS_ARCHIVED = Gauge(
+    "orodha_notifications_archived",
+    "Number of expired notifications copied to the notification archive by the last run.",
+    ["notification_type", "reason"],
+    registry=EXPIRY_REGISTRY,
+)
+EXPIRY_LAST_SUCCESS = Gauge(
+    "orodha_expire_notifications_last_success_timestamp_seconds",
+    "When the last run of the expire-notifications job finished.",
+    registry=EXPIRY_REGISTRY,
+)
+EXPIRY_JOB = "expire_notifications"
+
+RETENTION_INDEX_PREFIX = "retention_"
+INDEX_NOT_FOUND_ERROR = 27
+# The field that each retention reason is measured from.
+RETENTION_FIELDS = {"created": "createdAt", "accessed": "lastAccessed"}
+
+
+class RetentionModes(Enum):
+    """
+    Simple class which inherits from Enum and defines how expired notifications are removed.
+
+    DISABLED: Notifications are kept until they are deleted.
+    TTL: Mongo removes expired notifications through TTL indexes.
+    JOB: The expire-notifications job removes, and optionally archives, expired notifications.
+    """
+    DISABLED = "disabled"
+    TTL = "ttl"
+    JOB = "job"
+
+
+class RetentionPolicy:
+    """
+    The retention of one notification type. A number of days of zero keeps notifications
+    regardless of that reason.
+
+    Args:
+        notification_type(NotificationTypes): The type of notification the policy applies to.
+        created_days(float): The number of days notifications are kept after their creation.
+        accessed_days(float): The number of days notifications are kept after they were
+            last accessed.
+    """
+
+    def __init__(
+        self,
+        notification_type: NotificationTypes,
+        created_days: float = 0,
+        accessed_days: float = 0,
+    ):
+        self.notification_type = notification_type
+        self.created_days = created_days
+        self.accessed_days = accessed_days
+
+    def retention_days(self) -> dict:
+        """Returns the number of days of each reason that notifications expire for."""
+        days = {"created": self.created_days, "accessed": self.accessed_days}
+        return {reason: value for reason, value in days.items() if value > 0}
+
+
+def load_retention_policies() -> list:
+    """
+    Function which reads the retention of each notification type. The number of days of each
+    type and reason is read from its RETENTION_{TYPE}_{REASON}_DAYS environment variable,
+    such as RETENTION_LIST_INVITE_CREATED_DAYS, and defaults to 0.
+
+    Returns:
+        policies(list[RetentionPolicy]): The policies of the types whose notifications expire.
+
+    Raises:
+        ValueError: If the number of days of a type is not a number.
+    """
+    days_vars = _get_optional_environment_variables(**{
+        f"retention_{notification_type.value}_{reason}_days": "0"
+        for notification_type in NotificationTypes
+        for reason in RETENTION_FIELDS
+    })
+    days = {}
+    for var, value in days_vars.items():
+        try:
+            days[var] = float(value)
+        except ValueError:
+            raise ValueError(f"{var.upper()} must be a number of days, not {value!r}")
+    policies = [
+        RetentionPolicy(
+            notification_type,
+            created_days=days[f"retention_{notification_type.value}_created_days"],
+            accessed_days=days[f"retention_{notification_type.value}_accessed_days"],
+        )
+        for notification_type in NotificationTypes
+    ]
+    return [policy for policy in policies if policy.retention_days()]
+
+
+def _retention_index_name(notification_type: NotificationTypes, reason: str) -> str:
+    return f"{RETENTION_INDEX_PREFIX}{notification_type.value}_{reason}"
+
+
+def ensure_retention_indexes(policies: list, enabled: bool = True) -> dict:
+    """
+    Function which makes the TTL indexes of the notification and inbox entry collections
+    match the retention policies. Indexes of policies that were removed or changed are
+    dropped, so that mongo stops expiring notifications once TTL retention is disabled.
+
+    Args:
+        policies(list[RetentionPolicy]): The retention policies.
+        enabled(bool) - Optional: Whether mongo should expire notifications, when False
+            every TTL index is dropped.
+
+    Returns:
+        indexes(dict): The names of the TTL indexes that were created and dropped.
+    """
+    desired = {}
+    if enabled:
+        for policy in policies:
+            for reason, days in policy.retention_days().items():
+                desired[_retention_index_name(policy.notification_type, reason)] = {
+                    "field": RETENTION_FIELDS[reason],
+                    "expireAfterSeconds": int(timedelta(days=days).total_seconds()),
+                    "partialFilterExpression": {
+                        "notificationType": policy.notification_type.value
+                    },
+                }
+
+    result = {"created": [], "dropped": []}
+    for collection in (Notification._get_collection(), InboxEntry._get_collection()):
+        existing = collection.index_information()
+        for name, options in existing.items():
+            if not name.startswith(RETENTION_INDEX_PREFIX):
+                continue
+            wanted = desired.get(name)
+            if wanted is None or options.get("expireAfterSeconds") != wanted["expireAfterSeconds"]:
+                try:
+                    collection.drop_index(name)
+                except OperationFailure as err:
+                    # Another worker starting at the same time may have dropped it first.
+                    if err.code != INDEX_NOT_FOUND_ERROR:
+                        raise
+                result["dropped"].append(f"{collection.name}.{name}")
+        existing = collection.index_information()
+        for name, index in desired.items():
+            if name in existing:
+                continue
+            collection.create_index(
+                [(index["field"], ASCENDING)],
+                name=name,
+                expireAfterSeconds=index["expireAfterSeconds"],
+                partialFilterExpression=index["partialFilterExpression"],
+            )
+            result["created"].append(f"{collection.name}.{name}")
+    return result
+
+
+def _archive_document(notification: dict, reason: str, expired_at: datetime) -> dict:
+    archive = {
+        "id": notification["_id"],
+        "notificationType": notification.get("notificationType"),
+        "targets": notification.get("targets", []),
+        "listId": notification.get("listId"),
+        "createdAt": notification.get("createdAt"),
+        "lastAccessed": notification.get("lastAccessed"),
+        "expiredAt": expired_at,
+        "reason": reason,
+    }
+    return NotificationArchive(**archive).to_mongo().to_dict()
+
+
+def _archive(notifications: list, reason: str, expired_at: datetime) -> int:
+    documents = [
+        _archive_document(notification, reason, expired_at) for notification in notifications
+    ]
+    try:
+        return len(NotificationArchive._get_collection().insert_many(
+            documents, ordered=False).inserted_ids)
+    except BulkWriteError as err:
+        # Notifications archived by an earlier, interrupted run are already there.
+        if any(
+            write_error["code"] != DUPLICATE_KEY_ERROR
+            for write_error in err.details.get("writeErrors", [])
+        ):
+            raise
+        return err.details.get("nInserted", 0)
+
+
+def _expire_notification_batches(
+    query: dict,
+    storage_mode: StorageModes,
+    reason: str,
+    archive: bool,
+    batch_size: int,
+    batch_delay_seconds: float,
+    expired_at: datetime,
+) -> dict:
+    """
+    Helper function which removes the notifications matching query in batches of _id order,
+    archiving them first when archive is set.
+    """
+    notifications = Notification._get_collection()
+    counts = {"expired": 0, "archived": 0}
+    last_id = None
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {**batch_query.get("_id", {}), "$gt": last_id}
+        batch = list(notifications.find(batch_query).sort("_id", ASCENDING).limit(batch_size))
+        if not batch:
+            return counts
+        last_id = batch[-1]["_id"]
+        notification_ids = [notification["_id"] for notification in batch]
+
+        if archive:
+            counts["archived"] += _archive(batch, reason, expired_at)
+        if storage_mode == StorageModes.FANOUT:
+            changes = removal_changes(aggregate_user_counts(
+                storage_mode, {"notificationId": {"$in": notification_ids}}))
+        else:
+            changes = removal_changes(aggregate_user_counts(
+                storage_mode, {"_id": {"$in": notification_ids}}))
+        # The query is applied again, so that a notification read since the batch was
+        # read is kept.
+        counts["expired"] += notifications.delete_many(
+            {**query, "_id": {"$in": notification_ids}}).deleted_count
+        if storage_mode == StorageModes.FANOUT:
+            InboxEntry._get_collection().delete_many({"notificationId": {"$in": notification_ids}})
+        update_user_states(changes)
+        time.sleep(batch_delay_seconds)
+
+
+def _expire_inbox_entry_batches(
+    query: dict,
+    batch_size: int,
+    batch_delay_seconds: float,
+) -> int:
+    """
+    Helper function which removes the inbox entries matching query in batches. Inbox
+    entries are copies of notifications, so they are not archived.
+    """
+    entries = InboxEntry._get_collection()
+    expired = 0
+    while True:
+        entry_ids = [
+            entry["_id"] for entry in
+            entries.find(query, {"_id": True}).sort("_id", ASCENDING).limit(batch_size)
+        ]
+        if not entry_ids:
+            return expired
+        id_query = {**query, "_id": {"$in": entry_ids}}
+        changes = removal_changes(aggregate_user_counts(StorageModes.FANOUT, id_query))
+        expired += entries.delete_many(id_query).deleted_count
+        update_user_states(changes)
+        time.sleep(batch_delay_seconds)
+
+
+def expire_notifications(
+    policies: list,
+    storage_mode: StorageModes,
+    archive: bool = True,
+    batch_size: int = 500,
+    batch_delay_seconds: float = 0.2,
+    now: datetime = None,
+) -> list:
+    """
+    Function which removes every notification that expired under the retention policies,
+    in batches with a pause in between so that live traffic is not starved.
+
+    Notifications expire after their creation time, taken from their _id so that
+    notifications created before createdAt existed expire too, or after their lastAccessed
+    time. When notifications are fanned out, reads are tracked on the inbox entries of each
+    recipient, so it is those entries that expire after they were accessed.
+
+    Args:
+        policies(list[RetentionPolicy]): The retention policies.
+        storage_mode(StorageModes): How notifications are stored for reads.
+        archive(bool) - Optional: Whether expired notifications are copied to the
+            notification archive before they are removed.
+        batch_size(int) - Optional: The number of documents removed per batch.
+        batch_delay_seconds(float) - Optional: The pause after each batch.
+        now(datetime) - Optional: The naive UTC time that expiry is measured from.
+
+    Returns:
+        results(list[dict]): For each notification type and reason, the number of
+            documents that expired and were archived.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    results = []
+    for policy in policies:
+        notification_type = policy.notification_type.value
+        for reason, days in policy.retention_days().items():
+            cutoff = now - timedelta(days=days)
+            query = {"notificationType": notification_type}
+            result = {
+                "notification_type": notification_type,
+                "reason": reason,
+                "expired": 0,
+                "archived": 0,
+            }
+            if reason == "accessed" and storage_mode == StorageModes.FANOUT:
+                result["expired"] = _expire_inbox_entry_batches(
+                    {**query, "lastAccessed": {"$lt": cutoff}},
+                    batch_size,
+                    batch_delay_seconds,
+                )
+            else:
+                if reason == "created":
+                    query["_id"] = {"$lt": ObjectId.from_datetime(cutoff)}
+                else:
+                    query["lastAccessed"] = {"$lt": cutoff}
+                result.update(_expire_notification_batches(
+                    query,
+                    storage_mode,
+                    reason,
+                    archive,
+                    batch_size,
+                    batch_delay_seconds,
+                    now,
+                ))
+            NOTIFICATIONS_EXPIRED.labels(
+                notification_type=notification_type, reason=reason).set(result["expired"])
+            NOTIFICATIONS_ARCHIVED.labels(
+                notification_type=notification_type, reason=reason).set(result["archived"])
+            LOGGER.info(
+                "Expired %s %s notifications by %s time, archived %s",
+                result["expired"], notification_type, reason, result["archived"],
+            )
+            results.append(result)
+    EXPIRY_LAST_SUCCESS.set_to_current_time()
+    return results
+
+
+def push_expiry_metrics(gateway: str):
+    """
+    Function which pushes the metrics of the last expire_notifications run to a Prometheus
+    pushgateway, replacing those of the run before it.
+
+    Args:
+        gateway(str): The address of the pushgateway, such as pushgateway:9091.
+
+    Raises:
+        OSError: If the pushgateway could not be reached, or refused the metrics.
+    """
+    push_to_gateway(gateway, job=EXPIRY_JOB, registry=EXPIRY_REGISTRY)
+
+
+def configure_retention(config: configparser.ConfigParser) -> dict:
+    """
+    Function which creates, or drops, the TTL indexes that our application config and the
+    retention policies ask for. Unchanged indexes are left alone, so this is safe to call on
+    every startup.
+
+    Args:
+        config(ConfigParser): Our application config, as returned from obtain_config.
+
+    Returns:
+        indexes(dict): The names of the TTL indexes that were created and dropped.
+    """
+    mode = RetentionModes(config["retention_config"]["retention_mode"].lower())
+    return ensure_retention_indexes(
+        load_retention_policies(), enabled=mode == RetentionModes.TTL
+    )
@@ -2,15 +2,27 @@
 Module which contains route functions for interacting with notifications
 that direct incoming requests to the correct controllers.
 """
+import json
 from http import HTTPStatus
-from flask_restx import Namespace, Resource, fields
-from flask import request
+from flask_restx import Namespace, Resource, fields, marshal
+from flask import Response, request
+from werkzeug.http import quote_etag
+from application.utils.metrics import time_operation
 from application.namespaces.notifications.exceptions import (
     OrodhaBadRequestError,
+    OrodhaConflictError,
     OrodhaForbiddenError,
     NotificationTypeError,
     OrodhaInternalError,
-    OrodhaNotFoundError
+    OrodhaNotFoundError,
+    OrodhaServiceUnavailableError,
+    PayloadValidationError,
+)
+from application.namespaces.notifications.idempotency import IDEMPOTENCY_KEY_HEADER
+from application.namespaces.notifications.models import NOTIFICATION_TYPES
+from application.namespaces.notifications.serializers import (
+    serialize_notification,
+    serialize_notifications,
 )
 import application.namespaces.notifications.controllers
 
@@ -20,29 +32,49 @@ notification_ns = Namespace(
     description='Notification related operations'
 )
 
+# Both models hold the fields of every notification type. Payloads are not validated
+# against the creation model, which only documents them, but by NOTIFICATION_TYPES.
 list_invite_creation_model = notification_ns.model(
     "Notification input, includes optional list_id for ListInviteNotification type",
+    NOTIFICATION_TYPES.creation_fields(),
+)
+
+bulk_delete_model = notification_ns.model(
+    "Bulk notification deletion, matches notifications by ids and/or a filter",
     {
-        "targets": fields.List(
-            fields.String,
-            required=True
-        ),
+        "notification_ids": fields.List(fields.String, required=False),
         "list_id": fields.String(required=False),
-        "notification_type": fields.String(default="base"),
+        "target": fields.String(required=False),
+        "notification_type": fields.String(required=False),
+        "older_than": fields.DateTime(required=False),
+        "remove_target_only": fields.Boolean(default=False),
     },
 )
 
 notification_response_model = notification_ns.model(
     "Notification Response",
+    NOTIFICATION_TYPES.response_fields(),
+)
+
+notification_count_model = notification_ns.model(
+    "Notification Count Response",
     {
-        "id": fields.String(required=True, attribute="_id"),
-        "targets": fields.List(fields.String, required=True),
-        "notificationType": fields.String(),
-        "lastAccessed": fields.DateTime(required=False),
-        "listId": fields.String(required=False),
+        "total": fields.Integer(required=True),
+        "unread": fields.Integer(required=True),
     },
 )
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+LAST_EVENT_ID_HEADER = "Last-Event-ID"
+MASK_HEADER = "X-Fields"
+IDEMPOTENCY_KEY_PARAMS = {
+    IDEMPOTENCY_KEY_HEADER: {
+        "in": "header",
+        "description": "A key unique to the request, a retry sent with the same key is "
+                       "answered with the result of the first request.",
+    },
+}
+
 
 def get_token_from_header(headers: dict) -> str:
     """
@@ -64,7 +96,12 @@ class NotificationsApi(Resource):
     Class that contains routes for GET, POST, and DELETE requests interacting
     with notifications.
     """
-    @notification_ns.marshal_with(notification_response_model, as_list=True)
+    @notification_ns.doc(params={
+        "user_id": "The user to obtain the notifications of.",
+        "limit": "The maximum number of notifications to return.",
+        "cursor": "The X-Next-Cursor header returned with the previous page.",
+    })
+    @notification_ns.response(HTTPStatus.OK, "Success", [notification_response_model])
     def get(self):
         """
         Function which accepts GET requests to the notifications route, expecting a query parameter
@@ -74,9 +111,14 @@ class NotificationsApi(Resource):
         Args(expected as query parameter):
             user_id(str): The user_id that is associated with the user we inted to
                 obtain the notifications for.
+            limit(int) - Optional: The maximum number of notifications to return.
+            cursor(str) - Optional: The value of the X-Next-Cursor header of the previous page.
 
         Returns:
             response(list): A list containing the notifications associated with the user_id.
+                When there are more notifications to obtain the X-Next-Cursor header is set.
+                The ETag header is always set, and a request whose If-None-Match header
+                contains it is answered with an empty 304 NOT MODIFIED.
                 Contains:
                     id(str): The notification id.
                     listId(str): The optional id of the associated list.
@@ -94,19 +136,42 @@ class NotificationsApi(Resource):
         try:
             request_token = get_token_from_header(request.headers)
             target_user = request.args.get("user_id")
-            response = application.namespaces.notifications.controllers.get_notifications(
-                request_token, target_user
-            )
+            if_none_match = request.if_none_match.as_set(include_weak=True)
+            if request.if_none_match.star_tag:
+                if_none_match.add("*")
+            response, next_cursor, etag = \
+                application.namespaces.notifications.controllers.get_notifications(
+                    request_token,
+                    target_user,
+                    limit=request.args.get("limit"),
+                    cursor=request.args.get("cursor"),
+                    if_none_match=if_none_match,
+                )
 
         except (
             OrodhaForbiddenError,
             OrodhaBadRequestError,
+            OrodhaServiceUnavailableError,
             OrodhaInternalError,
         ) as err:
             notification_ns.abort(err.status_code, err.message)
-        return response
 
-    @notification_ns.expect(list_invite_creation_model, validate=True)
+        # The etag is weak since lastAccessed can differ between equivalent responses.
+        headers = {"ETag": quote_etag(etag, weak=True), "Cache-Control": "private, no-cache"}
+        if response is None:
+            return [], HTTPStatus.NOT_MODIFIED, headers
+        if next_cursor is not None:
+            headers[NEXT_CURSOR_HEADER] = next_cursor
+        mask = request.headers.get(MASK_HEADER)
+        with time_operation("serialization", "notifications"):
+            if mask:
+                body = marshal(response, notification_response_model, mask=mask)
+            else:
+                body = serialize_notifications(response)
+        return body, HTTPStatus.OK, headers
+
+    @notification_ns.doc(params=IDEMPOTENCY_KEY_PARAMS)
+    @notification_ns.expect(list_invite_creation_model)
     def post(self):
         """
         Function which accepts POST requests and initiates the creation of
@@ -120,26 +185,43 @@ class NotificationsApi(Resource):
                 the NotificationType enum options.
             list_id(str): An optional list_id which connects the targets to a the list
                 via the ListInviteNotification.
+            deliver_at(datetime): An optional time to deliver the notification at, it
+                stays hidden until then.
+
+        Headers:
+            Idempotency-Key(str) - Optional: A key unique to the request. A retry with the
+                same key and payload does not create the notification again.
 
         Returns:
             status_code(dict): dictionary containing a status code of 200, OK.
 
         Raises:
             OrodhaBadRequestError: If the payload contained incorrect data.
+            OrodhaConflictError: If the Idempotency-Key was sent with a different payload,
+                or the request first sent with it is still being processed.
             OrodhaForbiddenError: If the JWT token from the request header
                 did not contain a valid keycloak user.
             NotificationTypeError: If the notification_type value in the payload
                 was not included in AVAILABLE_NOTIFICATION_TYPES.
+            OrodhaInternalError: If the token could not be verified because of an
+                internal problem.
         """
         try:
             request_token = get_token_from_header(request.headers)
             application.namespaces.notifications.controllers.post_notifications(
-                request_token, notification_ns.payload
+                request_token,
+                notification_ns.payload,
+                idempotency_key=request.headers.get(IDEMPOTENCY_KEY_HEADER),
             )
+        except PayloadValidationError as err:
+            notification_ns.abort(err.status_code, err.message, errors=err.errors)
         except (
             OrodhaBadRequestError,
+            OrodhaConflictError,
             OrodhaForbiddenError,
-            NotificationTypeError
+            NotificationTypeError,
+            OrodhaServiceUnavailableError,
+            OrodhaInternalError
         ) as err:
             notification_ns.abort(err.status_code, err.message)
 
@@ -179,8 +261,240 @@ class NotificationsApi(Resource):
             OrodhaForbiddenError,
             OrodhaNotFoundError,
             OrodhaBadRequestError,
+            OrodhaServiceUnavailableError,
             OrodhaInternalError
         ) as err:
             notification_ns.abort(err.status_code, err.message)
 
         return {"status_code": HTTPStatus.OK}
+
+
+def serialize_notification_event(notification: dict) -> str:
+    """
+    Accepts a raw notification document and serializes it to json with our response model.
+
+    Args:
+        notification(dict): A raw notification document, including its _id.
+
+    Returns:
+        data(str): The notification as a json string.
+    """
+    return json.dumps(serialize_notification(notification))
+
+
+@notification_ns.route("/batch")
+class NotificationsBatchApi(Resource):
+    """
+    Class that contains routes for creating and deleting notifications in bulk.
+    """
+    @notification_ns.doc(params=IDEMPOTENCY_KEY_PARAMS)
+    @notification_ns.expect([list_invite_creation_model])
+    def post(self):
+        """
+        Function which accepts POST requests containing a list of notification payloads
+        and initiates the creation of a Notification for each of them.
+
+        Args(Arguments are expected on the request body):
+            A list of payloads, each with the same fields as the payload of a POST
+            request to the notifications route.
+
+        Headers:
+            Idempotency-Key(str) - Optional: A key unique to the request. A retry with the
+                same key and payloads is answered with the original results.
+
+        Returns:
+            response(dict): dictionary containing a status code of 200, OK, the number of
+                notifications that were created, scheduled, merged into existing ones by
+                coalescing, and that failed, and a list of results. Each result contains the
+                index of its payload and a status of "created", "scheduled" or "coalesced"
+                along with the notification id, or "failed" along with an error message.
+
+        Raises:
+            OrodhaBadRequestError: If the batch was empty or too large.
+            OrodhaConflictError: If the Idempotency-Key was sent with different payloads,
+                or the request first sent with it is still being processed.
+            OrodhaForbiddenError: If the JWT token from the request header
+                did not contain a valid keycloak user.
+            OrodhaInternalError: If the token could not be verified because of an
+                internal problem.
+        """
+        try:
+            request_token = get_token_from_header(request.headers)
+            payloads = notification_ns.payload
+            if not isinstance(payloads, list):
+                payloads = [payloads]
+            results = application.namespaces.notifications.controllers.post_notifications_batch(
+                request_token,
+                payloads,
+                idempotency_key=request.headers.get(IDEMPOTENCY_KEY_HEADER),
+            )
+        except PayloadValidationError as err:
+            notification_ns.abort(err.status_code, err.message, errors=err.errors)
+        except (
+            OrodhaBadRequestError,
+            OrodhaConflictError,
+            OrodhaForbiddenError,
+            OrodhaServiceUnavailableError,
+            OrodhaInternalError
+        ) as err:
+            notification_ns.abort(err.status_code, err.message)
+
+        created = sum(1 for result in results if result["status"] == "created")
+        scheduled = sum(1 for result in results if result["status"] == "scheduled")
+        coalesced = sum(1 for result in results if result["status"] == "coalesced")
+        return {
+            "status_code": HTTPStatus.OK,
+            "created": created,
+            "scheduled": scheduled,
+            "coalesced": coalesced,
+            "failed": len(results) - created - scheduled - coalesced,
+            "results": results,
+        }
+
+    @notification_ns.expect(bulk_delete_model, validate=True)
+    def delete(self):
+        """
+        Function which accepts DELETE requests to the /notifications/batch endpoint and
+        deletes every notification matching the ids and filters of the request body.
+
+        Args(Arguments are expected on the request body, at least one is required):
+            notification_ids(list): The ids of the notifications to delete.
+            list_id(str): Only matches notifications related to this list.
+            target(str): Only matches notifications targeting this user_id.
+            notification_type(str): Only matches notifications of this type.
+            older_than(datetime): Only matches notifications created before this time.
+            remove_target_only(bool): Removes target from the matched notifications
+                instead of deleting them, for the other recipients to keep.
+
+        Returns:
+            response(dict): dictionary containing a status code of 200, OK, the number of
+                deleted notifications, and the number of notifications target was removed from.
+
+        Raises:
+            OrodhaForbiddenError: If the JWT token from the request header
+                did not contain a valid keycloak user.
+            OrodhaBadRequestError: If the request body did not contain a valid filter.
+            OrodhaInternalError: If there was a problem with the deletion of the
+                notifications from the database.
+        """
+        try:
+            request_token = get_token_from_header(request.headers)
+            result = application.namespaces.notifications.controllers.delete_notifications_batch(
+                request_token, notification_ns.payload
+            )
+        except (
+            OrodhaForbiddenError,
+            OrodhaBadRequestError,
+            OrodhaServiceUnavailableError,
+            OrodhaInternalError
+        ) as err:
+            notification_ns.abort(err.status_code, err.message)
+
+        return {"status_code": HTTPStatus.OK, **result}
+
+
+@notification_ns.route("/count")
+class NotificationsCountApi(Resource):
+    """
+    Class that contains the route counting the notifications of a user.
+    """
+    @notification_ns.doc(params={"user_id": "The user to count the notifications of."})
+    @notification_ns.marshal_with(notification_count_model)
+    def get(self):
+        """
+        Function which accepts GET requests to the /notifications/count endpoint and returns
+        the number of notifications, and unread notifications, of a user. Unlike a GET to the
+        notifications route, this does not mark any notification as read.
+
+        Args(expected as query parameter):
+            user_id(str): The user_id that is associated with the user we intend to
+                count the notifications of.
+
+        Returns:
+            response(dict): Contains:
+                total(int): The number of notifications of the user.
+                unread(int): The number of notifications that were never accessed.
+
+        Raises:
+            OrodhaForbiddenError: If the JWT token from the request header
+                did not contain a valid keycloak user.
+            OrodhaBadRequestError: If the expected query parameter was not passed in.
+            OrodhaInternalError: If there was an internal server error while counting.
+        """
+        try:
+            request_token = get_token_from_header(request.headers)
+            response = application.namespaces.notifications.controllers.get_notification_counts(
+                request_token, request.args.get("user_id")
+            )
+        except (
+            OrodhaForbiddenError,
+            OrodhaBadRequestError,
+            OrodhaServiceUnavailableError,
+            OrodhaInternalError,
+        ) as err:
+            notification_ns.abort(err.status_code, err.message)
+
+        return response
+
+
+@notification_ns.route("/stream")
+class NotificationsStreamApi(Resource):
+    """
+    Class that contains the route streaming newly created notifications to a user.
+    """
+    @notification_ns.doc(params={
+        "user_id": "The user to stream the notifications of.",
+        "last_event_id": "The id of the last event received, for clients that can not "
+                         "send the Last-Event-ID header.",
+    })
+    def get(self):
+        """
+        Function which accepts GET requests to the /notifications/stream endpoint and keeps
+        the connection open, sending each notification created for the user as a
+        Server-Sent Event as soon as it is created.
+
+        Args(expected as query parameter):
+            user_id(str): The user_id that is associated with the user we intend to
+                stream the notifications to.
+            last_event_id(str) - Optional: The id of the last event the client received,
+                used when the Last-Event-ID header is not sent.
+
+        Returns:
+            response(Response): A text/event-stream response. Every event has the id of
+                its notification and a json body matching the notifications route, and a
+                heartbeat comment is sent whenever the stream has been quiet for a while.
+
+        Raises:
+            OrodhaForbiddenError: If the JWT token from the request header
+                did not contain a valid keycloak user.
+            OrodhaBadRequestError: If the expected query parameter was not passed in,
+                or the last event id was invalid.
+            OrodhaServiceUnavailableError: If this worker can not open more streams.
+            OrodhaInternalError: If there was an internal server error while obtaining
+                the missed notifications.
+        """
+        try:
+            request_token = get_token_from_header(request.headers)
+            target_user = request.args.get("user_id")
+            last_event_id = request.headers.get(
+                LAST_EVENT_ID_HEADER, request.args.get("last_event_id")
+            )
+            stream = application.namespaces.notifications.controllers.stream_notifications(
+                request_token,
+                target_user,
+                serialize_notification_event,
+                last_event_id=last_event_id,
+            )
+        except (
+            OrodhaForbiddenError,
+            OrodhaBadRequestError,
+            OrodhaServiceUnavailableError,
+            OrodhaInternalError,
+        ) as err:
+            notification_ns.abort(err.status_code, err.message)
+
+        return Response(
+            stream,
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
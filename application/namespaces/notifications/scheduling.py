@@ -0,0 +1,239 @@
+"""
+Module which contains the scheduling of notifications for later, such as reminders. A
+notification created with a deliver_at time in the future is written to the
+scheduled_notification collection rather than the notification collection, so every read of
+notifications leaves it out without filtering, and the promote-notifications scheduler moves
+it over once it is due. Only then is it counted, fanned out, published and enqueued for
+delivery, as if it was created at its deliver_at time.
+
+A notification is promoted with a new id, created when it is promoted, so that it sorts after
+every notification a client has already read or streamed, and coalesces like any other. The id
+returned when it was scheduled only identifies it until then. Schedulers claim due
+notifications in batches with claim_due, from the due index alone, so any number of them can
+run on any number of nodes however many notifications are scheduled.
+"""
+import logging
+import threading
+from bson import ObjectId
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from application.utils.metrics import time_operation
+from application.namespaces.notifications.access_tracking import current_access_time
+from application.namespaces.notifications.leases import claim_due, oldest_due_seconds
+from application.namespaces.notifications.models import Notification, ScheduledNotification
+
+LOGGER = logging.getLogger(__name__)
+
+SCHEDULED_PROMOTIONS = Counter(
+    "orodha_scheduled_notifications_promoted",
+    "Number of scheduled notifications promoted once they were due.",
+)
+PROMOTION_LAG = Histogram(
+    "orodha_scheduled_promotion_lag_seconds",
+    "Time from the deliver_at of a scheduled notification to its promotion.",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0),
+)
+SCHEDULER_LAG = Gauge(
+    "orodha_scheduler_lag_seconds",
+    "How long the oldest due scheduled notification has been waiting for a scheduler.",
+    multiprocess_mode="max",
+)
+
+# The fields a scheduled notification holds besides those of the notification it becomes.
+SCHEDULING_FIELDS = ("deliverAt", "dueAt", "claimedBy", "notificationCls", "promotedId")
+
+
+def schedule_notifications(notifications: list) -> int:
+    """
+    Function which writes notifications to the scheduled_notification collection.
+
+    Args:
+        notifications(list[dict]): Raw notification documents, including their _id and
+            deliverAt.
+
+    Returns:
+        inserted_count(int): The number of notifications that were scheduled.
+
+    Raises:
+        BulkWriteError: If some of the notifications could not be written, the others are.
+    """
+    rows = []
+    for notification in notifications:
+        row = {field: value for field, value in notification.items() if field != "_cls"}
+        # The _cls of the notification would otherwise be taken for that of the row.
+        row["notificationCls"] = notification["_cls"]
+        row["dueAt"] = notification["deliverAt"]
+        row["claimedBy"] = None
+        rows.append(row)
+    with time_operation("mongo", "schedule_notifications"):
+        ScheduledNotification._get_collection().insert_many(rows, ordered=False)
+    return len(rows)
+
+
+def scheduled_to_notification(row: dict) -> dict:
+    """
+    Function which turns a scheduled notification into the raw document it is promoted to,
+    with its promotedId as its _id, created at its deliver_at time.
+    """
+    notification = {"_cls": row["notificationCls"]}
+    notification.update(
+        (field, value) for field, value in row.items() if field not in SCHEDULING_FIELDS
+    )
+    notification["_id"] = row["promotedId"]
+    notification["createdAt"] = row["deliverAt"]
+    return notification
+
+
+def assign_promoted_ids(token: ObjectId, rows: list) -> list:
+    """
+    Function which gives claimed scheduled notifications the new ids they are promoted with.
+    A notification whose promotedId was already created by a scheduler that stopped before
+    removing it is left out, so it is not created twice. The others get a new id, as an id
+    from an earlier attempt could sort before notifications read since.
+
+    Args:
+        token(ObjectId): The token of the claim of the rows.
+        rows(list[dict]): The claimed scheduled notifications.
+
+    Returns:
+        pending(list[dict]): The rows which still have to be promoted, with their promotedId.
+    """
+    promoted_ids = [row["promotedId"] for row in rows if row.get("promotedId")]
+    promoted = set()
+    if promoted_ids:
+        with time_operation("mongo", "find_promoted"):
+            promoted = set(Notification._get_collection().distinct(
+                "_id", {"_id": {"$in": promoted_ids}}
+            ))
+    pending = [row for row in rows if row.get("promotedId") not in promoted]
+    for row in pending:
+        row["promotedId"] = ObjectId()
+    if pending:
+        with time_operation("mongo", "assign_promoted_ids"):
+            ScheduledNotification._get_collection().bulk_write([
+                UpdateOne(
+                    {"_id": row["_id"], "claimedBy": token},
+                    {"$set": {"promotedId": row["promotedId"]}},
+                )
+                for row in pending
+            ])
+    return pending
+
+
+def delete_scheduled_notifications(
+    query: dict,
+    target: str = None,
+    remove_target_only: bool = False,
+) -> dict:
+    """
+    Function which cancels the scheduled notifications matching a bulk delete, or removes a
+    single target from them.
+
+    Args:
+        query(dict): The filter of the bulk delete, not including its target.
+        target(str) - Optional: Only matches notifications targeting this user_id.
+        remove_target_only(bool) - Optional: Instead of deleting the matched notifications,
+            target is removed from their targets. Notifications left without any targets
+            are deleted.
+
+    Returns:
+        result(dict): The number of scheduled notifications that were deleted, and the
+            number that had the target removed from them.
+    """
+    collection = ScheduledNotification._get_collection()
+    result = {"deleted": 0, "targets_removed": 0}
+    if target is not None:
+        query = {**query, "targets": target}
+    with time_operation("mongo", "delete_scheduled_notifications"):
+        if remove_target_only:
+            result["targets_removed"] = collection.update_many(
+                query, {"$pull": {"targets": target}}
+            ).modified_count
+            query = {**query, "targets": {"$size": 0}}
+        result["deleted"] = collection.delete_many(query).deleted_count
+    return result
+
+
+class NotificationScheduler:
+    """
+    Class which promotes due scheduled notifications, a batch at a time.
+
+    Args:
+        promote(callable): Writes a list of raw notification documents to the notification
+            collection and runs the work that follows their creation.
+        batch_size(int) - Optional: The number of scheduled notifications claimed at once.
+        lease_seconds(float) - Optional: How long claimed notifications are held by this
+            scheduler before other schedulers may claim them.
+    """
+
+    def __init__(self, promote, batch_size: int = 500, lease_seconds: float = 60):
+        self.promote = promote
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+
+    def run_once(self) -> int:
+        """
+        Claims and promotes one batch of due scheduled notifications. A scheduled
+        notification is only removed once it was promoted, so one held by a scheduler that
+        stopped is promoted by another once its lease ran out. One that was merged into an
+        unread notification by coalescing before its scheduler stopped is merged again.
+
+        Returns:
+            promoted(int): The number of scheduled notifications that were promoted.
+        """
+        collection = ScheduledNotification._get_collection()
+        with time_operation("mongo", "claim_scheduled_notifications"):
+            token, rows = claim_due(collection, "dueAt", self.batch_size, self.lease_seconds)
+        if rows:
+            pending = assign_promoted_ids(token, rows)
+            if pending:
+                self.promote([scheduled_to_notification(row) for row in pending])
+            with time_operation("mongo", "delete_scheduled_notifications"):
+                collection.delete_many(
+                    {"_id": {"$in": [row["_id"] for row in rows]}, "claimedBy": token}
+                )
+            now = current_access_time()
+            SCHEDULED_PROMOTIONS.inc(len(rows))
+            for row in rows:
+                PROMOTION_LAG.observe((now - row["deliverAt"]).total_seconds())
+        SCHEDULER_LAG.set(oldest_due_seconds(collection, "dueAt"))
+        return len(rows)
+
+    def run(self, poll_seconds: float, stop: threading.Event):
+        """
+        Promotes batches until stop is set, waiting poll_seconds whenever fewer than a full
+        batch were due.
+
+        Args:
+            poll_seconds(float): Seconds waited for more notifications to become due.
+            stop(threading.Event): Set to stop the scheduler once its current batch is done.
+        """
+        while not stop.is_set():
+            try:
+                promoted = self.run_once()
+            except PyMongoError:
+                # Claimed notifications are promoted again once their lease ran out.
+                LOGGER.exception("Unable to promote scheduled notifications")
+                promoted = 0
+            if promoted < self.batch_size:
+                stop.wait(poll_seconds)
+
+
+def create_notification_scheduler(config, promote) -> NotificationScheduler:
+    """
+    Function which creates the scheduler configured in our application config.
+
+    Args:
+        config(ConfigParser): Our application config, as returned from obtain_config.
+        promote(callable): Writes due notifications, see NotificationScheduler.
+
+    Returns:
+        scheduler(NotificationScheduler): The configured scheduler.
+    """
+    scheduler_config = config["scheduler_config"]
+    return NotificationScheduler(
+        promote,
+        batch_size=scheduler_config.getint("scheduler_batch_size"),
+        lease_seconds=scheduler_config.getfloat("scheduler_lease_seconds"),
+    )
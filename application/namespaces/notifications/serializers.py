@@ -0,0 +1,91 @@
+"""
+Module which turns raw notification documents, as read with NOTIFICATION_RESPONSE_PROJECTION,
+into the response shape of notification_response_model in a single pass.
+
+marshal builds every field of every row through the generic field classes of flask_restx.
+The functions here produce the same output, in the same key order, for the handful of types
+that our projected documents can hold. The fields of each notification type are taken from
+NOTIFICATION_TYPES once, when this module is imported.
+"""
+from datetime import datetime
+from flask_restx import fields
+from application.namespaces.notifications.models import NOTIFICATION_TYPES
+
+_DATETIME_FIELD = fields.DateTime()
+_INTEGER_FIELD = fields.Integer()
+
+
+def _format_string(value):
+    if value is None or value.__class__ is str:
+        return value
+    return str(value)
+
+
+def _format_datetime(value):
+    if value is None:
+        return None
+    if value.__class__ is datetime:
+        return value.isoformat()
+    return _DATETIME_FIELD.format(value)
+
+
+def _format_integer(value):
+    if value is None or value.__class__ is int:
+        return value
+    return _INTEGER_FIELD.format(value)
+
+
+def _format_string_list(value):
+    if value is None:
+        return None
+    return [_format_string(item) for item in value]
+
+
+_FORMATTERS = {"string": _format_string, "string_list": _format_string_list}
+# (attribute, formatter) of the fields that notification types add to the response.
+_TYPE_FIELDS = tuple(
+    (field.attribute, _FORMATTERS[field.kind])
+    for field in NOTIFICATION_TYPES.response_attributes()
+)
+
+
+def serialize_notification(notification: dict) -> dict:
+    """
+    Function which serializes one raw notification document to the response shape
+    of notification_response_model.
+
+    Args:
+        notification(dict): A raw notification document, projected to the fields of
+            our response model.
+
+    Returns:
+        response(dict): The notification as it is returned by the notifications route.
+    """
+    notification_id = notification.get("_id")
+    response = {
+        "id": str(notification_id) if notification_id is not None else None,
+        "targets": _format_string_list(notification.get("targets")),
+        # Stored notification types are already the string values of NotificationTypes.
+        "notificationType": _format_string(notification.get("notificationType")),
+        "lastAccessed": _format_datetime(notification.get("lastAccessed")),
+        "eventCount": _format_integer(notification.get("eventCount")),
+        "lastEventAt": _format_datetime(notification.get("lastEventAt")),
+    }
+    for attribute, format_value in _TYPE_FIELDS:
+        response[attribute] = format_value(notification.get(attribute))
+    return response
+
+
+def serialize_notifications(notifications: list) -> list:
+    """
+    Function which serializes raw notification documents to the response shape
+    of notification_response_model.
+
+    Args:
+        notifications(list[dict]): Raw notification documents, projected to the fields
+            of our response model.
+
+    Returns:
+        response(list[dict]): The notifications as they are returned by the notifications route.
+    """
+    return [serialize_notification(notification) for notification in notifications]
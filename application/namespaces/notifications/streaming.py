@@ -0,0 +1,312 @@
+"""
+Module which contains the pub/sub used to push newly created notifications to connected users
+over Server-Sent Events.
+
+Notifications are published by the create path to a broker, which hands them to the
+subscriptions of their targets. The InMemoryBroker only reaches subscribers of the same worker,
+while the ChangeStreamBroker follows a mongo change stream so that every worker sees the
+notifications created by every other worker.
+"""
+import configparser
+import logging
+import os
+import queue
+import threading
+from enum import Enum
+from pymongo.errors import PyMongoError
+from application.namespaces.notifications.models import (
+    NOTIFICATION_RESPONSE_PROJECTION,
+    Notification,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+
+class BrokerTypes(Enum):
+    """
+    Simple class which inherits from Enum and defines the available stream brokers.
+
+    MEMORY: Notifications only reach subscribers connected to the worker that created them.
+    CHANGE_STREAM: Notifications reach subscribers of every worker through a mongo change stream.
+    AUTO: A change stream when the database supports them, otherwise in memory.
+    """
+    MEMORY = "memory"
+    CHANGE_STREAM = "change_stream"
+    AUTO = "auto"
+
+
+class Subscription:
+    """
+    The notifications published to one connected user, waiting to be sent.
+
+    Args:
+        user_id(str): The user_id that notifications are delivered to.
+        max_pending(int): The number of undelivered notifications kept for a slow client,
+            older notifications are dropped past this number.
+    """
+
+    def __init__(self, user_id: str, max_pending: int = 1000):
+        self.user_id = user_id
+        self._pending = queue.Queue(maxsize=max_pending)
+
+    def put(self, notification: dict):
+        try:
+            self._pending.put_nowait(notification)
+        except queue.Full:
+            LOGGER.warning("Dropping notification for slow stream of user %s", self.user_id)
+
+    def get(self, timeout: float) -> dict:
+        """
+        Waits for the next notification of the subscription.
+
+        Returns:
+            notification(dict): The next notification, or None if there was none in time.
+        """
+        try:
+            return self._pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class InMemoryBroker:
+    """
+    Broker which delivers published notifications to the subscriptions of their targets
+    within this process.
+    """
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def dispatch(self, notification: dict):
+        """
+        Hands a notification to the subscriptions of each of its targets in this process.
+
+        Args:
+            notification(dict): A raw notification document, including its _id.
+        """
+        with self._lock:
+            subscriptions = [
+                subscription
+                for target in notification.get("targets", [])
+                for subscription in self._subscriptions.get(target, ())
+            ]
+        for subscription in subscriptions:
+            subscription.put(notification)
+
+    def publish(self, notifications: list):
+        """
+        Publishes newly created notifications to their connected targets.
+
+        Args:
+            notifications(list[dict]): Raw notification documents, including their _id.
+        """
+        for notification in notifications:
+            self.dispatch(notification)
+
+    def close(self):
+        pass
+
+
+class ChangeStreamBroker(InMemoryBroker):
+    """
+    Broker which follows a change stream of notification inserts, so that notifications
+    created by any worker are delivered to the subscriptions of this worker. Publishing is
+    a no-op, since the change stream delivers the notifications created here as well.
+
+    The change stream is only opened once the first user subscribes, and is resumed from
+    its last event when it is interrupted.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._thread = None
+        self._closed = threading.Event()
+        self._resume_token = None
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = super().subscribe(user_id)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._watch, name="notification-change-stream", daemon=True
+                )
+                self._thread.start()
+        return subscription
+
+    def publish(self, notifications: list):
+        pass
+
+    def _watch(self):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        projection = {
+            f"fullDocument.{field}": True
+            for field in ("_id", *NOTIFICATION_RESPONSE_PROJECTION)
+        }
+        pipeline.append({"$project": {"_id": True, **projection}})
+        while not self._closed.is_set():
+            try:
+                with Notification._get_collection().watch(
+                    pipeline, resume_after=self._resume_token, max_await_time_ms=1000
+                ) as stream:
+                    while not self._closed.is_set():
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        self._resume_token = change["_id"]
+                        self.dispatch(change["fullDocument"])
+            except PyMongoError:
+                LOGGER.exception("Notification change stream interrupted, resuming")
+                self._closed.wait(1)
+
+    def close(self):
+        self._closed.set()
+
+
+def supports_change_streams() -> bool:
+    """
+    Function which checks whether our database can open change streams, which requires
+    a replica set or a sharded cluster.
+    """
+    try:
+        hello = Notification._get_db().command("hello")
+    except (PyMongoError, NotImplementedError):
+        return False
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+
+def create_broker(config: configparser.ConfigParser) -> InMemoryBroker:
+    """
+    Function which creates the stream broker chosen in our application config.
+
+    Args:
+        config(ConfigParser): Our application config, as returned from obtain_config.
+
+    Returns:
+        InMemoryBroker: The broker notifications are published to.
+    """
+    broker_type = BrokerTypes(config["notification_config"]["stream_broker"].lower())
+    if broker_type == BrokerTypes.AUTO:
+        broker_type = BrokerTypes.CHANGE_STREAM if supports_change_streams() \
+            else BrokerTypes.MEMORY
+    if broker_type == BrokerTypes.CHANGE_STREAM:
+        return ChangeStreamBroker()
+    return InMemoryBroker()
+
+
+class ConnectionLimiter:
+    """
+    Bounds the number of streams that a worker holds open at once.
+
+    Args:
+        max_connections(int): The maximum number of open streams.
+    """
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self._semaphore = threading.BoundedSemaphore(max_connections)
+
+    def acquire(self) -> bool:
+        return self._semaphore.acquire(blocking=False)
+
+    def release(self):
+        self._semaphore.release()
+
+
+class NotificationStream:
+    """
+    Iterable of the Server-Sent Events sent to one connected user. Notifications missed
+    since the last event the client received are replayed first, then newly published
+    notifications are sent as they arrive, with a heartbeat comment whenever nothing was
+    sent for heartbeat_seconds. Closing the stream unsubscribes it and frees its connection.
+
+    Args:
+        broker(InMemoryBroker): The broker the stream is subscribed to.
+        subscription(Subscription): The subscription of the connected user.
+        limiter(ConnectionLimiter): The limiter the stream's connection was acquired from.
+        replay(list[dict]): The notifications the client missed, in creation order.
+        serializer(callable): Turns a raw notification document into the json event data.
+        heartbeat_seconds(float): The longest time the stream stays silent for.
+    """
+
+    def __init__(self, broker, subscription, limiter, replay, serializer, heartbeat_seconds):
+        self._broker = broker
+        self._subscription = subscription
+        self._limiter = limiter
+        self._replay = replay
+        self._serializer = serializer
+        self.heartbeat_seconds = heartbeat_seconds
+        self._closed = False
+        self._close_lock = threading.Lock()
+
+    def _event(self, notification: dict) -> str:
+        return (
+            f"id: {notification['_id']}\n"
+            "event: notification\n"
+            f"data: {self._serializer(notification)}\n\n"
+        )
+
+    def __iter__(self):
+        # Tells the client how long to wait before reconnecting.
+        yield f"retry: {int(self.heartbeat_seconds * 1000)}\n\n"
+        last_id = None
+        for notification in self._replay:
+            last_id = notification["_id"]
+            yield self._event(notification)
+        while not self._closed:
+            notification = self._subscription.get(timeout=self.heartbeat_seconds)
+            if notification is None:
+                yield ": heartbeat\n\n"
+            elif last_id is None or notification["_id"] > last_id:
+                yield self._event(notification)
+
+    def close(self):
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._broker.unsubscribe(self._subscription)
+        self._limiter.release()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker(config: configparser.ConfigParser) -> InMemoryBroker:
+    """
+    Function which returns the stream broker of this process, creating it the first time
+    that it is needed.
+    """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = create_broker(config)
+    return _broker
+
+
+def reset_broker():
+    """
+    Function which discards the stream broker of this process. It is called in a child
+    process after a fork, since the thread following the change stream is not copied.
+    """
+    global _broker, _broker_lock
+    _broker = None
+    _broker_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_broker)
@@ -0,0 +1,238 @@
+"""
+Module which contains the per user state kept alongside notifications: the version that
+conditional GET requests are answered from, and the counts of a user's total and unread
+notifications, without reading any notification.
+
+A notification is unread until its lastAccessed time is set. The counts are updated by the
+paths which create, delete and read notifications, and counted from scratch by
+reconcile_user_counts to correct any drift.
+"""
+from pymongo import UpdateOne
+from application.namespaces.notifications.models import (
+    InboxEntry,
+    Notification,
+    UserNotificationState,
+)
+from application.namespaces.notifications.inbox import StorageModes
+
+
+def get_user_version(user_id: str, read_preference=None) -> int:
+    """
+    Function which reads the version of a user's notifications, which is zero for users
+    whose notifications have not changed yet.
+
+    Args:
+        user_id(str): The user_id to obtain the version of.
+        read_preference - Optional: The pymongo read preference the version is read with.
+
+    Returns:
+        version(int): The current version of the user's notifications.
+    """
+    states = UserNotificationState._get_collection()
+    if read_preference is not None:
+        states = states.with_options(read_preference=read_preference)
+    state = states.find_one({"_id": user_id}, {"version": True})
+    return state.get("version", 0) if state is not None else 0
+
+
+def count_changes(notifications: list, total: int, unread: int) -> dict:
+    """
+    Function which sums up, per target, how the counts of their users change with a
+    change to the given notifications.
+
+    Args:
+        notifications(list[dict]): Raw notification documents, with their targets
+            and lastAccessed.
+        total(int): The change to the total count for each notification.
+        unread(int): The change to the unread count for each notification that was
+            never accessed.
+
+    Returns:
+        changes(dict): The change to the total and unread counts of each user_id.
+    """
+    changes = {}
+    for notification in notifications:
+        for target in notification.get("targets", []):
+            change = changes.setdefault(target, {"total": 0, "unread": 0})
+            change["total"] += total
+            if notification.get("lastAccessed") is None:
+                change["unread"] += unread
+    return changes
+
+
+def update_user_states(changes: dict, bump_version: bool = True):
+    """
+    Function which applies changes to the counts of users, and bumps their version, with
+    a single bulk write. The state of users that do not have one yet is created.
+
+    Args:
+        changes(dict): The change to the total and unread counts of each user_id.
+        bump_version(bool) - Optional: Whether the notifications of the users changed,
+            as opposed to only being read.
+    """
+    requests = []
+    for user_id in sorted(changes):
+        increments = {field: value for field, value in changes[user_id].items() if value}
+        if bump_version:
+            increments["version"] = 1
+        if increments:
+            requests.append(UpdateOne({"_id": user_id}, {"$inc": increments}, upsert=True))
+    if requests:
+        UserNotificationState._get_collection().bulk_write(requests, ordered=False)
+
+
+def _counted_collection(storage_mode: StorageModes):
+    """Returns the collection that a user's notifications are counted from, and its user field."""
+    if storage_mode == StorageModes.FANOUT:
+        return InboxEntry._get_collection(), "userId"
+    return Notification._get_collection(), "targets"
+
+
+def aggregate_user_counts(
+    storage_mode: StorageModes,
+    query: dict = None,
+    user_id: str = None,
+) -> dict:
+    """
+    Function which counts the total and unread notifications of every user in one
+    aggregation, from wherever storage_mode keeps them.
+
+    Args:
+        storage_mode(StorageModes): How notifications are stored for reads.
+        query(dict) - Optional: Only counts the notifications, or inbox entries when
+            notifications are fanned out, matching this query.
+        user_id(str) - Optional: Only counts the notifications of this user_id.
+
+    Returns:
+        counts(dict): The total and unread counts of each user_id with notifications.
+    """
+    collection, user_field = _counted_collection(storage_mode)
+    user_match = {} if user_id is None else {user_field: user_id}
+    pipeline = [
+        {"$match": {**(query or {}), **user_match}},
+        {"$project": {"user": f"${user_field}", "lastAccessed": True}},
+    ]
+    if user_field == "targets":
+        pipeline.append({"$unwind": "$user"})
+        if user_id is not None:
+            pipeline.append({"$match": {"user": user_id}})
+    pipeline.append({"$group": {
+        "_id": "$user",
+        "total": {"$sum": 1},
+        "unread": {"$sum": {"$cond": [
+            {"$eq": [{"$ifNull": ["$lastAccessed", None]}, None]}, 1, 0
+        ]}},
+    }})
+    return {
+        row["_id"]: {"total": row["total"], "unread": row["unread"]}
+        for row in collection.aggregate(pipeline, allowDiskUse=True)
+    }
+
+
+def removal_changes(counts: dict) -> dict:
+    """
+    Function which turns the counts of notifications that are about to be removed into
+    the changes to the counts of their users.
+
+    Args:
+        counts(dict): The total and unread counts of each user_id, as returned by
+            aggregate_user_counts.
+
+    Returns:
+        changes(dict): The change to the total and unread counts of each user_id.
+    """
+    return {
+        user_id: {"total": -count["total"], "unread": -count["unread"]}
+        for user_id, count in counts.items()
+    }
+
+
+def count_user_notifications(storage_mode: StorageModes, user_id: str) -> dict:
+    """
+    Function which counts the total and unread notifications of a user with two
+    count_documents calls on the indexes of their user field.
+
+    Args:
+        storage_mode(StorageModes): How notifications are stored for reads.
+        user_id(str): The user_id to count the notifications of.
+
+    Returns:
+        counts(dict): The total and unread notifications of the user.
+    """
+    collection, user_field = _counted_collection(storage_mode)
+    return {
+        "total": collection.count_documents({user_field: user_id}),
+        "unread": collection.count_documents({user_field: user_id, "lastAccessed": None}),
+    }
+
+
+def _set_counts_requests(counts: dict) -> list:
+    return [
+        UpdateOne(
+            {"_id": user_id},
+            {"$set": {"total": count["total"], "unread": count["unread"], "counted": True}},
+            upsert=True,
+        )
+        for user_id, count in counts.items()
+    ]
+
+
+def get_user_counts(storage_mode: StorageModes, user_id: str) -> dict:
+    """
+    Function which obtains the total and unread notifications of a user from their
+    counters. Users whose counters were never counted are counted instead, and their
+    counters are set from the result.
+
+    Args:
+        storage_mode(StorageModes): How notifications are stored for reads.
+        user_id(str): The user_id to obtain the counts of.
+
+    Returns:
+        counts(dict): The total and unread notifications of the user.
+    """
+    states = UserNotificationState._get_collection()
+    state = states.find_one({"_id": user_id}, {"total": True, "unread": True, "counted": True})
+    if state is not None and state.get("counted"):
+        # Concurrent reads can both count a notification as read until reconciled.
+        return {
+            "total": max(state.get("total", 0), 0),
+            "unread": max(state.get("unread", 0), 0),
+        }
+    counts = count_user_notifications(storage_mode, user_id)
+    states.bulk_write(_set_counts_requests({user_id: counts}))
+    return counts
+
+
+def reconcile_user_counts(
+    storage_mode: StorageModes,
+    user_id: str = None,
+    batch_size: int = 1000,
+) -> dict:
+    """
+    Function which counts the notifications of every user from scratch and overwrites
+    their counters, correcting any drift. Counters of users without notifications left
+    are set to zero.
+
+    Args:
+        storage_mode(StorageModes): How notifications are stored for reads.
+        user_id(str) - Optional: Only reconciles the counters of this user_id.
+        batch_size(int): The number of counters written per bulk write.
+
+    Returns:
+        result(dict): The number of users that were counted, and the number of users
+            whose counters were corrected.
+    """
+    states = UserNotificationState._get_collection()
+    counts = aggregate_user_counts(storage_mode, user_id=user_id)
+    state_query = {} if user_id is None else {"_id": user_id}
+    for state in states.find({**state_query, "counted": True}, {"_id": True}):
+        counts.setdefault(state["_id"], {"total": 0, "unread": 0})
+
+    requests = _set_counts_requests(counts)
+    result = {"users": len(counts), "corrected": 0}
+    for batch_start in range(0, len(requests), batch_size):
+        write_result = states.bulk_write(
+            requests[batch_start:batch_start + batch_size], ordered=False
+        )
+        result["corrected"] += write_result.modified_count + write_result.upserted_count
+    return result
@@ -0,0 +1,185 @@
+"""
+Module which contains thread safe, in process caching helpers that are shared by the
+different caches of the service.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread safe cache with a bounded size where every entry has its own expiry time.
+    When the cache is full the least recently used entry is evicted.
+
+    Args:
+        maxsize(int): The maximum number of entries held by the cache.
+        ttl_seconds(float): The default number of seconds an entry lives for.
+        on_evict(callable) - Optional: Called with the reason ("size" or "expired")
+            every time an entry is removed by the cache itself.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evicted(self, reason: str):
+        if self._on_evict is not None:
+            self._on_evict(reason)
+
+    def get(self, key, default=None):
+        """
+        Obtains a cached value and marks it as the most recently used entry.
+
+        Args:
+            key: The key the value was cached under.
+            default: The value returned when the key is missing or has expired.
+
+        Returns:
+            value: The cached value, or default.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._evicted("expired")
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_seconds: float = None):
+        """
+        Caches a value, evicting the least recently used entry when the cache is full.
+
+        Args:
+            key: The key to cache the value under.
+            value: The value to be cached.
+            ttl_seconds(float) - Optional: Overrides the default ttl of the cache for
+                this entry. Entries with a ttl of zero or less are not cached.
+        """
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl_seconds <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evicted("size")
+
+    def delete(self, key):
+        """Removes a key from the cache if it is present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key, so that only the first caller does
+    the work while the others wait for, and share, its result or exception.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Calls function with the given arguments unless a call with the same key is
+        already in flight, in which case that call's outcome is returned instead.
+
+        Args:
+            key: The key identifying the work being done.
+            function(callable): The function doing the work.
+
+        Returns:
+            tuple(result, shared): The result of the call, and whether it was shared
+                with a call made by another thread.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function(*args, **kwargs)
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class SharedCacheBackend(ABC):
+    """
+    Interface of a cache shared by every worker of the service, such as redis or memcached.
+    Values are stored as bytes under string keys, and may be evicted at any time.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """Obtains the value cached under key, or None when it is missing or expired."""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl_seconds: float):
+        """Caches value under key for ttl_seconds."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Removes key from the cache if it is present."""
+
+
+class InMemorySharedCache(SharedCacheBackend):
+    """
+    SharedCacheBackend which is kept in the memory of this process. It stands in for a
+    shared cache in tests, and only shares values between the threads of one worker.
+
+    Args:
+        maxsize(int): The maximum number of keys held by the cache.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self._cache = LRUCache(maxsize, ttl_seconds=0)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def get(self, key: str) -> bytes:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: bytes, ttl_seconds: float):
+        self._cache.set(key, bytes(value), ttl_seconds)
+
+    def delete(self, key: str):
+        self._cache.delete(key)
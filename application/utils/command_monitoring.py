@@ -0,0 +1,224 @@
+"""
+Module which contains the pymongo CommandListener that times every command the service sends
+to mongo, so that the time a request spends in the database, and slow commands such as queries
+on fields without an index, can be observed.
+
+Commands that take longer than a threshold are logged with the shape of their filter, which
+keeps the field names and operators but not the values, and with a summary of the plan mongo
+chose for them, obtained through explain on a background thread.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import g, has_app_context
+from prometheus_client import Counter, Histogram
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+from application.utils.cache import LRUCache
+
+LOGGER = logging.getLogger(__name__)
+
+MONGO_COMMAND_DURATION = Histogram(
+    "orodha_mongo_command_duration_seconds",
+    "Time taken by the commands sent to mongo.",
+    ["command", "collection", "outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+MONGO_SLOW_COMMANDS = Counter(
+    "orodha_mongo_slow_commands",
+    "Number of commands sent to mongo which took longer than the slow command threshold.",
+    ["command", "collection"],
+)
+
+# The commands that explain can describe, and where each of them keeps its filter.
+EXPLAINABLE_COMMANDS = {
+    "find": lambda command: command.get("filter"),
+    "aggregate": lambda command: next(
+        (stage["$match"] for stage in command.get("pipeline", []) if "$match" in stage), None
+    ),
+    "count": lambda command: command.get("query"),
+    "distinct": lambda command: command.get("query"),
+    "findAndModify": lambda command: command.get("query"),
+    "delete": lambda command: (command.get("deletes") or [{}])[0].get("q"),
+    "update": lambda command: (command.get("updates") or [{}])[0].get("q"),
+}
+
+
+def filter_shape(value):
+    """
+    Function which replaces every value of a mongo filter with 1, keeping its field names
+    and operators, so that it can be logged and compared without the data it contains.
+
+    Args:
+        value: A mongo filter, or a part of one.
+
+    Returns:
+        shape: The filter with every value replaced.
+    """
+    if isinstance(value, dict):
+        return {key: filter_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) and value and all(isinstance(item, dict) for item in value):
+        return [filter_shape(item) for item in value]
+    return 1
+
+
+def summarize_plan(explain_result: dict) -> str:
+    """
+    Function which summarizes the winning plan of an explain result as its stages, from
+    the stage reading the collection to the last one, along with the index they used.
+
+    Args:
+        explain_result(dict): The result of an explain command in queryPlanner verbosity.
+
+    Returns:
+        summary(str): The stages of the plan, such as "IXSCAN(targets_1) > FETCH".
+    """
+    planner = explain_result.get("queryPlanner")
+    if planner is None:
+        # Aggregations with several stages keep their plan in their first stage.
+        stages = explain_result.get("stages") or [{}]
+        planner = stages[0].get("$cursor", {}).get("queryPlanner", {})
+    stage = planner.get("winningPlan", {})
+    stage = stage.get("queryPlan", stage)
+    names = []
+    while stage:
+        name = stage.get("stage", "UNKNOWN")
+        if stage.get("indexName"):
+            name = f"{name}({stage['indexName']})"
+        names.append(name)
+        inputs = stage.get("inputStages") or [stage.get("inputStage")]
+        stage = inputs[0] if inputs[0] else None
+    return " > ".join(reversed(names)) or "UNKNOWN"
+
+
+def _command_collection(event) -> str:
+    if event.command_name == "getMore":
+        collection = event.command.get("collection")
+    else:
+        collection = event.command.get(event.command_name)
+    return collection if isinstance(collection, str) else ""
+
+
+def request_db_time() -> tuple:
+    """
+    Function which obtains the time the current request spent waiting on mongo commands.
+
+    Returns:
+        tuple(seconds, commands): The total duration of the commands of the request, and
+            the number of commands it sent.
+    """
+    if not has_app_context():
+        return 0.0, 0
+    return g.get("db_seconds", 0.0), g.get("db_commands", 0)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """
+    CommandListener which records the duration of every command in MONGO_COMMAND_DURATION
+    and on the current request, and logs the commands which are slower than a threshold.
+
+    Args:
+        slow_threshold_seconds(float): Commands taking at least this long are logged, a
+            value of zero or less disables the log.
+        explain(callable) - Optional: Called with the database name and a command, returns
+            the explain result of the command. Slow commands are logged without their plan
+            when it is not given.
+        explain_interval_seconds(float) - Optional: The same filter shape of a command on a
+            collection is explained at most once per interval.
+    """
+
+    def __init__(
+        self,
+        slow_threshold_seconds: float,
+        explain=None,
+        explain_interval_seconds: float = 300,
+    ):
+        self.slow_threshold_seconds = slow_threshold_seconds
+        self._explain = explain
+        self._explained = LRUCache(1000, explain_interval_seconds)
+        self._started = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Threads do not survive a fork, so every worker process starts its own.
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="orodha-explain")
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def started(self, event):
+        explainable = self.slow_threshold_seconds > 0 \
+            and event.command_name in EXPLAINABLE_COMMANDS
+        self._started[(event.connection_id, event.request_id)] = (
+            _command_collection(event),
+            event.database_name,
+            # Only kept for commands that can be explained, as commands can be large.
+            event.command if explainable else None,
+        )
+
+    def succeeded(self, event):
+        self._finished(event, "succeeded")
+
+    def failed(self, event):
+        self._finished(event, "failed")
+
+    def _finished(self, event, outcome: str):
+        collection, database_name, command = self._started.pop(
+            (event.connection_id, event.request_id), ("", None, None)
+        )
+        seconds = event.duration_micros / 1e6
+        if has_app_context():
+            g.db_seconds = g.get("db_seconds", 0.0) + seconds
+            g.db_commands = g.get("db_commands", 0) + 1
+        MONGO_COMMAND_DURATION.labels(
+            command=event.command_name, collection=collection, outcome=outcome
+        ).observe(seconds)
+        if command is not None and seconds >= self.slow_threshold_seconds:
+            MONGO_SLOW_COMMANDS.labels(command=event.command_name, collection=collection).inc()
+            self._log_slow_command(database_name, command, event.command_name, collection, seconds)
+
+    def _log_slow_command(
+        self,
+        database_name: str,
+        command: dict,
+        command_name: str,
+        collection: str,
+        seconds: float,
+    ):
+        shape = filter_shape(EXPLAINABLE_COMMANDS[command_name](command) or {})
+        explain_key = (command_name, collection, repr(shape))
+        if self._explain is None or self._explained.get(explain_key) is not None:
+            LOGGER.warning(
+                "Slow mongo command %s on %s took %.1fms, filter shape: %s",
+                command_name, collection, seconds * 1000, shape,
+            )
+            return
+        self._explained.set(explain_key, True)
+        self._get_executor().submit(
+            self._explain_slow_command,
+            database_name, command, command_name, collection, seconds, shape,
+        )
+
+    def _explain_slow_command(
+        self,
+        database_name: str,
+        command: dict,
+        command_name: str,
+        collection: str,
+        seconds: float,
+        shape: dict,
+    ):
+        try:
+            plan = summarize_plan(self._explain(database_name, command))
+        except PyMongoError as err:
+            plan = f"explain failed: {err}"
+        LOGGER.warning(
+            "Slow mongo command %s on %s took %.1fms, filter shape: %s, plan: %s",
+            command_name, collection, seconds * 1000, shape, plan,
+        )
+
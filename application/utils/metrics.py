@@ -0,0 +1,73 @@
+"""
+Module which contains the prometheus metrics shared by every part of the service, and the
+registry they are exposed from.
+
+When the service runs under several gunicorn workers, the PROMETHEUS_MULTIPROC_DIR environment
+variable must point to an empty directory before any worker starts. Every worker then writes
+its metrics to that directory, and each scrape aggregates the metrics of all workers.
+"""
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CollectorRegistry,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    multiprocess,
+)
+
+MULTIPROCESS_DIR_VARIABLE = "PROMETHEUS_MULTIPROC_DIR"
+
+HTTP_REQUEST_DURATION = Histogram(
+    "orodha_http_request_duration_seconds",
+    "Time taken to answer http requests, until the response starts for streamed responses.",
+    ["method", "route", "status"],
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "orodha_http_requests_in_progress",
+    "Number of http requests currently being answered.",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+OPERATION_DURATION = Histogram(
+    "orodha_operation_duration_seconds",
+    "Time taken by the operations a request is made of, such as keycloak calls, mongo"
+    " operations and serialization.",
+    ["component", "operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+
+@contextmanager
+def time_operation(component: str, operation: str):
+    """
+    Context manager which records how long its block took in OPERATION_DURATION, whether
+    it completed or raised.
+
+    Args:
+        component(str): What the operation calls out to, such as keycloak or mongo.
+        operation(str): The name of the operation.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        OPERATION_DURATION.labels(component=component, operation=operation).observe(
+            time.perf_counter() - start
+        )
+
+
+def metrics_registry() -> CollectorRegistry:
+    """
+    Function which obtains the registry that the metrics of a scrape are collected from.
+
+    Returns:
+        CollectorRegistry: A registry aggregating the metrics of every worker when
+            PROMETHEUS_MULTIPROC_DIR is set, otherwise the registry of this process.
+    """
+    if os.environ.get(MULTIPROCESS_DIR_VARIABLE):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
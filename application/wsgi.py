@@ -1,6 +1,7 @@
-from application import create_app
+from application import create_app, prepare_worker
 
 app = create_app()
 
 if __name__ == "__main__":
+    prepare_worker()
     app.run(host='0.0.0.0', debug=True)
@@ -0,0 +1,154 @@
+"""
+Benchmark of every notification controller against generated notifications, for the user
+holding the most notifications and for the median user. Authentication is left out, it is
+measured by the http load test.
+
+Streams are not benchmarked here, as a stream is held open rather than answered.
+
+Usage:
+    python -m benchmarks.bench_controllers [--mongo-uri URI] [--count 20000] [--users 2000]
+"""
+import itertools
+from unittest import mock
+import application.namespaces.notifications.controllers as controllers
+from application.namespaces.notifications.coalescing import CoalescingModes
+from application.namespaces.notifications.inbox import StorageModes
+from benchmarks.generator import seed_database
+from benchmarks.harness import (
+    base_argument_parser,
+    connect_database,
+    count_round_trips,
+    time_function,
+    write_results,
+)
+
+BENCHMARK_TOKEN = "benchmark-token"
+
+
+def _payload(index: int, list_id: str = None) -> dict:
+    # Created notifications target their own users, leaving the generated users as they are.
+    return {
+        "notification_type": "list_invite",
+        "targets": [f"benchmark-target-{index % 50}", f"benchmark-target-{50 + index % 50}"],
+        "list_id": list_id or f"benchmark-list-{index}",
+    }
+
+
+def _create(payloads: list) -> list:
+    """Creates notifications through the batch controller and returns their ids."""
+    ids = []
+    for start in range(0, len(payloads), controllers.MAX_BATCH_SIZE):
+        results = controllers.post_notifications_batch(
+            BENCHMARK_TOKEN, payloads[start:start + controllers.MAX_BATCH_SIZE]
+        )
+        ids.extend(result["id"] for result in results)
+    return ids
+
+
+def _uncached(function):
+    def _function():
+        controllers.RESPONSE_CACHE.clear()
+        return function()
+    return _function
+
+
+def _coalesced(function):
+    def _function():
+        with mock.patch.object(controllers, "COALESCING_MODE", CoalescingModes.UNREAD):
+            return function()
+    return _function
+
+
+def controller_cases(summary: dict, batch_size: int, repeat: int) -> dict:
+    """
+    Function which creates the functions that call each controller, without arguments.
+    Deletes need a notification to delete per call, which are created beforehand.
+    """
+    hottest_user = summary["hottest_user"]
+    median_user = summary["median_user"]
+    calls = repeat + 1
+
+    delete_ids = iter(_create([_payload(index) for index in range(calls)]))
+    delete_lists = iter(range(calls))
+    _create([
+        _payload(index, list_id=f"benchmark-delete-{list_index}")
+        for list_index in range(calls)
+        for index in range(10)
+    ])
+    post_indexes = itertools.count()
+
+    def get_notifications(user):
+        return lambda: controllers.get_notifications(BENCHMARK_TOKEN, user)
+
+    def get_counts(user):
+        return lambda: controllers.get_notification_counts(BENCHMARK_TOKEN, user)
+
+    return {
+        ("get_notifications", "hottest_user_cached"): get_notifications(hottest_user),
+        ("get_notifications", "hottest_user"): _uncached(get_notifications(hottest_user)),
+        ("get_notifications", "median_user_cached"): get_notifications(median_user),
+        ("get_notifications", "median_user"): _uncached(get_notifications(median_user)),
+        ("get_notification_counts", "hottest_user"): get_counts(hottest_user),
+        ("get_notification_counts", "median_user"): get_counts(median_user),
+        ("post_notifications", "list_invite"): lambda: controllers.post_notifications(
+            BENCHMARK_TOKEN, _payload(next(post_indexes))
+        ),
+        # Every call merges into the same unread invites, in the shared storage mode.
+        ("post_notifications", "list_invite_coalesced"): _coalesced(
+            lambda: controllers.post_notifications(
+                BENCHMARK_TOKEN, _payload(0, list_id="benchmark-coalesced")
+            )
+        ),
+        ("post_notifications_batch", f"batch_{batch_size}"):
+            lambda: controllers.post_notifications_batch(
+                BENCHMARK_TOKEN, [_payload(next(post_indexes)) for _ in range(batch_size)]
+            ),
+        ("delete_notifications", "by_id"): lambda: controllers.delete_notifications(
+            BENCHMARK_TOKEN, next(delete_ids)
+        ),
+        ("delete_notifications_batch", "by_list_id"):
+            lambda: controllers.delete_notifications_batch(
+                BENCHMARK_TOKEN, {"list_id": f"benchmark-delete-{next(delete_lists)}"}
+            ),
+    }
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument(
+        "--count", type=int, default=20000, help="Number of notifications to generate.")
+    parser.add_argument(
+        "--users", type=int, default=2000, help="Number of users targeted.")
+    parser.add_argument(
+        "--skew", type=float, default=1.1, help="Exponent of the zipf distribution of targets.")
+    parser.add_argument(
+        "--storage-mode", default=StorageModes.SHARED.value,
+        choices=[mode.value for mode in StorageModes],
+        help="The storage mode the controllers read and write with.")
+    parser.add_argument(
+        "--batch-size", type=int, default=100, help="Notifications per batch POST.")
+    args = parser.parse_args()
+    counter = connect_database(args.mongo_uri)
+    storage_mode = StorageModes(args.storage_mode)
+
+    summary = seed_database(args.count, args.users, skew=args.skew, storage_mode=storage_mode)
+    results = []
+    with mock.patch.object(controllers, "_authenticate_user", return_value={"id": "benchmark"}), \
+            mock.patch.object(controllers, "STORAGE_MODE", storage_mode):
+        cases = controller_cases(summary, args.batch_size, args.repeat)
+        for (controller, case), function in cases.items():
+            with count_round_trips(counter) as round_trips:
+                function()
+            results.append({
+                "controller": controller,
+                "case": case,
+                "notifications": args.count,
+                "users": args.users,
+                "round_trips": round_trips,
+                **time_function(function, args.repeat, warmup=0),
+            })
+    write_results("controllers", args, results)
+
+
+if __name__ == "__main__":
+    main()
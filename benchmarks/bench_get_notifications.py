@@ -0,0 +1,117 @@
+"""
+Benchmark of the read path of GET /notifications, comparing the original findAndModify plus
+hydrated query against the current update_many plus projected query, with and without the
+lastAccessed stamp.
+
+Usage:
+    python -m benchmarks.bench_get_notifications [--mongo-uri URI] [--sizes 10 100 1000 10000]
+"""
+from unittest import mock
+from bson import ObjectId
+import application.namespaces.notifications.controllers as controllers
+from application.namespaces.notifications.access_tracking import AccessTrackingModes
+from application.namespaces.notifications.models import (
+    Notification,
+    NotificationTypes,
+    ensure_notification_indexes,
+)
+from benchmarks.harness import (
+    base_argument_parser,
+    connect_database,
+    count_round_trips,
+    time_function,
+    write_results,
+)
+
+TARGET_USER = "benchmark-user"
+
+
+def seed_notifications(count: int, noise: int = 1000):
+    """
+    Function which replaces the notification collection with count notifications targeting
+    TARGET_USER, alongside noise notifications for other users.
+    """
+    collection = Notification._get_collection()
+    collection.drop()
+    ensure_notification_indexes()
+    documents = [
+        {
+            "_id": ObjectId(),
+            "_cls": "Notification.ListInviteNotification",
+            "notificationType": NotificationTypes.LIST_INVITE.value,
+            "targets": [TARGET_USER, f"other-user-{index % 50}"],
+            "listId": f"list-{index}",
+            "lastAccessed": None,
+        }
+        for index in range(count)
+    ]
+    documents += [
+        {
+            "_id": ObjectId(),
+            "_cls": "Notification",
+            "notificationType": NotificationTypes.BASE.value,
+            "targets": [f"other-user-{index % 50}"],
+            "lastAccessed": None,
+        }
+        for index in range(noise)
+    ]
+    collection.insert_many(documents)
+
+
+def legacy_get_notifications(target_user: str) -> list:
+    """The read path of get_notifications before it was reworked."""
+    Notification.objects(__raw__={
+        "targets": target_user
+    }).modify(__raw__={"$currentDate": {"lastAccessed": {
+        "$type": "date"
+    }}}
+    )
+    return [
+        x.to_mongo() for x in Notification.objects(
+            __raw__={
+                "targets": target_user
+            }
+        )
+    ]
+
+
+def current_get_notifications(access_tracking_mode: AccessTrackingModes):
+    def _get_notifications(target_user: str) -> list:
+        with mock.patch.object(controllers, "ACCESS_TRACKING_MODE", access_tracking_mode):
+            notifications, _, _ = controllers.get_notifications("benchmark-token", target_user)
+            return notifications
+    return _get_notifications
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000],
+        help="Numbers of notifications held by the benchmarked user.")
+    args = parser.parse_args()
+    counter = connect_database(args.mongo_uri)
+
+    variants = {
+        "legacy": legacy_get_notifications,
+        "update_many_projected": current_get_notifications(AccessTrackingModes.SYNC),
+        "no_touch_projected": current_get_notifications(AccessTrackingModes.DISABLED),
+    }
+    results = []
+    with mock.patch.object(controllers, "_authenticate_user", return_value={"id": TARGET_USER}):
+        for size in args.sizes:
+            seed_notifications(size)
+            for variant, get_notifications in variants.items():
+                with count_round_trips(counter) as round_trips:
+                    returned = len(get_notifications(TARGET_USER))
+                results.append({
+                    "variant": variant,
+                    "notifications": size,
+                    "returned": returned,
+                    "round_trips": round_trips,
+                    **time_function(lambda: get_notifications(TARGET_USER), args.repeat),
+                })
+    write_results("get_notifications", args, results)
+
+
+if __name__ == "__main__":
+    main()
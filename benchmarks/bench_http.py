@@ -0,0 +1,167 @@
+"""
+HTTP load test of the notification service. It serves the service with gunicorn, verifying
+tokens against the certs of a stub keycloak, and sends a mix of GET /notifications,
+GET /notifications/count and POST /notifications requests from concurrent clients, for users
+drawn with the same skew as the generated notifications.
+
+The service reads from the mongo server at --mongo-uri, such as a local
+mongodb://localhost:27017/benchmarks which is seeded with benchmarks.generator beforehand.
+Without it every worker seeds its own mongomock.
+
+Usage:
+    python -m benchmarks.bench_http --mongo-uri mongodb://localhost:27017/benchmarks [--count 1000000]
+"""
+import json
+import tempfile
+from itertools import count as counter
+from benchmarks.generator import NotificationGenerator, seed_database
+from benchmarks.harness import base_argument_parser, connect_database, write_results
+from benchmarks.load import (
+    LoadRequest,
+    bearer_headers,
+    free_port,
+    keycloak_environment,
+    run_load,
+    start_gunicorn,
+    stop_gunicorn,
+    stub_keycloak,
+    wait_for_server,
+)
+
+REQUEST_KINDS = ("get_notifications", "get_notification_counts", "post_notifications")
+
+
+def build_requests(stub, users: list, mix: dict, page_size: int) -> list:
+    """
+    Function which creates the requests of the load test, one per drawn user, whose kinds
+    are spread through the list in the proportions of mix.
+
+    Args:
+        stub(StubKeycloak): Signs the token of every user.
+        users(list[str]): The user of every request.
+        mix(dict): The weight of every request kind.
+        page_size(int): The limit of GET /notifications.
+
+    Returns:
+        requests(list[LoadRequest]): The requests to send.
+    """
+    tokens = {}
+    kinds = [kind for kind, weight in mix.items() for _ in range(weight)]
+    list_ids = counter()
+    requests = []
+    for index, user in enumerate(users):
+        if user not in tokens:
+            tokens[user] = stub.issue_token(user)
+        headers = bearer_headers(tokens[user])
+        kind = kinds[index % len(kinds)]
+        if kind == "get_notifications":
+            request = LoadRequest(
+                "GET", f"/api/v1/notifications?user_id={user}&limit={page_size}", headers,
+            )
+        elif kind == "get_notification_counts":
+            request = LoadRequest("GET", f"/api/v1/notifications/count?user_id={user}", headers)
+        else:
+            request = LoadRequest(
+                "POST",
+                "/api/v1/notifications",
+                {**headers, "Content-Type": "application/json"},
+                body=json.dumps({
+                    "notification_type": "list_invite",
+                    "targets": [user, users[(index + 1) % len(users)]],
+                    "list_id": f"load-list-{next(list_ids)}",
+                }).encode(),
+            )
+        requests.append(request._replace(name=kind))
+    return requests
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument(
+        "--profile", default="gthread", help="The WORKER_PROFILE gunicorn is started with.")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of gunicorn workers.")
+    parser.add_argument(
+        "--cpus", type=int, nargs="+", default=[0], help="The cpus gunicorn is pinned to.")
+    parser.add_argument(
+        "--concurrency", type=int, default=32, help="Number of concurrent clients.")
+    parser.add_argument(
+        "--duration", type=float, default=10, help="Seconds measured.")
+    parser.add_argument(
+        "--warmup", type=float, default=2, help="Seconds of load before measuring.")
+    parser.add_argument(
+        "--count", type=int, default=10000, help="Number of notifications to generate.")
+    parser.add_argument(
+        "--users", type=int, default=1000, help="Number of users targeted.")
+    parser.add_argument(
+        "--skew", type=float, default=1.1, help="Exponent of the zipf distribution of users.")
+    parser.add_argument(
+        "--mix", type=int, nargs=3, default=[70, 20, 10],
+        metavar=("GET", "COUNT", "POST"),
+        help="Weights of GET /notifications, GET /notifications/count and POST requests.")
+    parser.add_argument(
+        "--page-size", type=int, default=50, help="The limit of GET /notifications.")
+    parser.add_argument(
+        "--requests", type=int, default=5000,
+        help="Number of distinct requests the clients take turns sending.")
+    args = parser.parse_args()
+
+    summary = None
+    if args.mongo_uri:
+        connect_database(args.mongo_uri)
+        summary = seed_database(args.count, args.users, skew=args.skew)
+
+    with stub_keycloak() as stub, tempfile.TemporaryDirectory() as metrics_dir:
+        environment = {
+            **keycloak_environment(stub),
+            "AUTH_MODE": "local",
+            "DBNAME": "benchmarks",
+            "DBHOSTNAME": "localhost",
+            "DBPORTS": "27017",
+            "DBUSER": "",
+            "DBPASSWORD": "",
+            "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+            "BENCH_DATASET": "generated",
+            "BENCH_NOTIFICATIONS": str(args.count),
+            "BENCH_USERS": str(args.users),
+            "BENCH_SKEW": str(args.skew),
+        }
+        if args.mongo_uri:
+            environment["BENCH_MONGO_URI"] = args.mongo_uri
+        requests = build_requests(
+            stub,
+            NotificationGenerator(args.users, skew=args.skew, seed=1).draw_users(args.requests),
+            dict(zip(REQUEST_KINDS, args.mix)),
+            args.page_size,
+        )
+
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        process = start_gunicorn(args.profile, port, args.workers, set(args.cpus), environment)
+        try:
+            wait_for_server(f"{base_url}/metrics", timeout_seconds=600)
+            load = run_load(
+                base_url,
+                requests,
+                concurrency=args.concurrency,
+                duration_seconds=args.duration,
+                warmup_seconds=args.warmup,
+            )
+        finally:
+            stop_gunicorn(process)
+
+    write_results("http", args, [{
+        "profile": args.profile,
+        "workers": args.workers,
+        "cpus": sorted(args.cpus),
+        "notifications": args.count,
+        "users": args.users,
+        "skew": args.skew,
+        "mix": dict(zip(REQUEST_KINDS, args.mix)),
+        "dataset": summary,
+        **load,
+    }])
+
+
+if __name__ == "__main__":
+    main()
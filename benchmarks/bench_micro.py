@@ -0,0 +1,75 @@
+"""
+Micro benchmarks of the request handling that does not touch the database: turning payloads
+into documents with notification_factory, reading the token with get_token_from_header, and
+marshalling pages of notifications with notification_response_model, next to the single pass
+serializer used by GET /notifications.
+
+Usage:
+    python -m benchmarks.bench_micro [--repeat 10000] [--page-sizes 1 100 500]
+"""
+import json
+from flask_restx import marshal
+from application.namespaces.notifications.models import notification_factory
+from application.namespaces.notifications.routes import (
+    get_token_from_header,
+    notification_response_model,
+)
+from application.namespaces.notifications.serializers import serialize_notifications
+from benchmarks.generator import NotificationGenerator
+from benchmarks.harness import base_argument_parser, time_function, write_results
+
+FACTORY_PAYLOADS = {
+    "base": {"notification_type": "base", "targets": ["user-0", "user-1"]},
+    "list_invite": {
+        "notification_type": "list_invite",
+        "targets": ["user-0", "user-1", "user-2"],
+        "list_id": "list-0",
+    },
+}
+# A token of the size keycloak issues, the header is parsed without decoding it.
+TOKEN_HEADERS = {"Authorization": "Bearer " + "a" * 1200, "Accept": "application/json"}
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument(
+        "--page-sizes", type=int, nargs="+", default=[1, 100, 500],
+        help="Numbers of notifications per marshalled page.")
+    parser.set_defaults(repeat=10000)
+    args = parser.parse_args()
+
+    results = []
+    for payload_name, payload in FACTORY_PAYLOADS.items():
+        results.append({
+            "function": "notification_factory",
+            "case": payload_name,
+            **time_function(lambda: notification_factory(payload), args.repeat),
+        })
+    results.append({
+        "function": "get_token_from_header",
+        "case": "bearer",
+        **time_function(lambda: get_token_from_header(TOKEN_HEADERS), args.repeat),
+    })
+
+    generator = NotificationGenerator(users=100)
+    for page_size in args.page_sizes:
+        page = list(generator.generate(page_size))
+        # Pages are marshalled less often than the other functions are called.
+        repeat = max(10, args.repeat // page_size)
+        results.append({
+            "function": "marshal",
+            "case": f"page_{page_size}",
+            **time_function(
+                lambda: json.dumps(marshal(page, notification_response_model)), repeat
+            ),
+        })
+        results.append({
+            "function": "serialize_notifications",
+            "case": f"page_{page_size}",
+            **time_function(lambda: json.dumps(serialize_notifications(page)), repeat),
+        })
+    write_results("micro", args, results)
+
+
+if __name__ == "__main__":
+    main()
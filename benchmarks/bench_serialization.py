@@ -0,0 +1,91 @@
+"""
+Benchmark of turning a user's notifications into the json body of GET /notifications,
+comparing Document hydration plus marshal, the projected query plus marshal, and the
+projected query plus the single pass serializer. Each variant is checked to produce the
+same json as marshal.
+
+Usage:
+    python -m benchmarks.bench_serialization [--mongo-uri URI] [--sizes 1000 100000]
+"""
+import json
+from datetime import datetime
+from flask_restx import marshal
+import application.namespaces.notifications.controllers as controllers
+from application.namespaces.notifications.models import Notification
+from application.namespaces.notifications.routes import notification_response_model
+from application.namespaces.notifications.serializers import serialize_notifications
+from benchmarks.bench_get_notifications import TARGET_USER, seed_notifications
+from benchmarks.harness import (
+    base_argument_parser,
+    connect_database,
+    time_function,
+    write_results,
+)
+
+
+def hydrated_marshal(target_user: str) -> str:
+    """The read and marshal path of get_notifications before it was reworked."""
+    notifications = [
+        notification.to_mongo() for notification in Notification.objects(
+            __raw__={"targets": target_user}
+        )
+    ]
+    return json.dumps(marshal(notifications, notification_response_model))
+
+
+def projected_marshal(target_user: str) -> str:
+    notifications = controllers._find_shared_notifications(target_user, None, None)
+    return json.dumps(marshal(notifications, notification_response_model))
+
+
+def projected_serializer(target_user: str) -> str:
+    notifications = controllers._find_shared_notifications(target_user, None, None)
+    return json.dumps(serialize_notifications(notifications))
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 100000],
+        help="Numbers of notifications held by the benchmarked user.")
+    args = parser.parse_args()
+    connect_database(args.mongo_uri)
+
+    variants = {
+        "hydrated_marshal": hydrated_marshal,
+        "projected_marshal": projected_marshal,
+        "projected_serializer": projected_serializer,
+    }
+    results = []
+    for size in args.sizes:
+        seed_notifications(size)
+        Notification._get_collection().update_many(
+            {}, {"$set": {"lastAccessed": datetime(2023, 9, 1, 12, 30, 15, 123000)}}
+        )
+        expected = hydrated_marshal(TARGET_USER)
+        for variant, serialize in variants.items():
+            results.append({
+                "variant": variant,
+                "notifications": size,
+                "identical": serialize(TARGET_USER) == expected,
+                **time_function(lambda: serialize(TARGET_USER), args.repeat),
+            })
+
+        # The same conversions on rows that were already read, without the query.
+        rows = controllers._find_shared_notifications(TARGET_USER, None, None)
+        conversions = {
+            "rows_marshal": lambda: json.dumps(marshal(rows, notification_response_model)),
+            "rows_serializer": lambda: json.dumps(serialize_notifications(rows)),
+        }
+        for variant, convert in conversions.items():
+            results.append({
+                "variant": variant,
+                "notifications": size,
+                "identical": convert() == expected,
+                **time_function(convert, args.repeat),
+            })
+    write_results("serialization", args, results)
+
+
+if __name__ == "__main__":
+    main()
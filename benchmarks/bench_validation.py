@@ -0,0 +1,67 @@
+"""
+Benchmark of the validation of POST payloads, from the payload to the raw document that is
+inserted. The legacy path is the one notifications were created with before the type registry:
+flask_restx validating the payload against the creation model, notification_factory building a
+Document, mongoengine validating it and to_mongo turning it into the raw document. The registry
+path validates the payload once with NOTIFICATION_TYPES.build. Nothing is written.
+
+Usage:
+    python -m benchmarks.bench_validation [--repeat 10000] [--batch-size 100]
+"""
+from flask_restx import Model, fields
+from application.namespaces.notifications.models import NOTIFICATION_TYPES, notification_factory
+from benchmarks.bench_micro import FACTORY_PAYLOADS
+from benchmarks.harness import base_argument_parser, time_function, write_results
+
+# The creation model the routes validated payloads against before the type registry.
+LEGACY_CREATION_MODEL = Model("Legacy notification input", {
+    "targets": fields.List(fields.String, required=True),
+    "list_id": fields.String(required=False),
+    "notification_type": fields.String(default="base"),
+})
+
+
+def legacy_validation(payload: dict) -> dict:
+    """Validates a payload as the routes and controllers did before the type registry."""
+    LEGACY_CREATION_MODEL.validate(payload)
+    notification = notification_factory(payload)
+    notification.validate()
+    return notification.to_mongo()
+
+
+def registry_validation(payload: dict) -> dict:
+    """Validates a payload with the schema of its type."""
+    return NOTIFICATION_TYPES.build(payload)
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument(
+        "--batch-size", type=int, default=100, help="Payloads per validated batch.")
+    parser.set_defaults(repeat=10000)
+    args = parser.parse_args()
+
+    results = []
+    for payload_name, payload in FACTORY_PAYLOADS.items():
+        batch = [payload] * args.batch_size
+        for path, validate in (("legacy", legacy_validation), ("registry", registry_validation)):
+            results.append({
+                "path": path,
+                "case": payload_name,
+                "payloads": 1,
+                **time_function(lambda: validate(payload), args.repeat),
+            })
+            results.append({
+                "path": path,
+                "case": payload_name,
+                "payloads": args.batch_size,
+                **time_function(
+                    lambda: [validate(item) for item in batch],
+                    max(10, args.repeat // args.batch_size),
+                ),
+            })
+    write_results("validation", args, results)
+
+
+if __name__ == "__main__":
+    main()
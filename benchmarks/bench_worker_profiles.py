@@ -0,0 +1,117 @@
+"""
+Load test of the gunicorn worker profiles of scripts/server_scripts/gunicorn.conf.py. For each
+profile it starts gunicorn with the same number of workers pinned to the same cpus, and measures
+the throughput and latency of GET /notifications from many concurrent clients, each with its own
+user and token.
+
+Tokens are verified locally against the certs of a stub keycloak. Without --mongo-uri every
+worker reads from its own seeded mongomock, where every round trip waits --mongo-latency-ms to
+stand in for the network between the service and mongo.
+
+Usage:
+    python -m benchmarks.bench_worker_profiles [--profiles sync gthread gevent] [--concurrency 64]
+"""
+import tempfile
+from benchmarks.harness import base_argument_parser, connect_database, write_results
+from benchmarks.load import (
+    LoadRequest,
+    bearer_headers,
+    free_port,
+    keycloak_environment,
+    run_load,
+    start_gunicorn,
+    stop_gunicorn,
+    stub_keycloak,
+    wait_for_server,
+)
+from benchmarks.worker_app import load_user_id, seed_load_users
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument(
+        "--profiles", nargs="+", default=["sync", "gthread", "gevent"],
+        help="The WORKER_PROFILE values to compare.")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of gunicorn workers of every profile.")
+    parser.add_argument(
+        "--cpus", type=int, nargs="+", default=[0], help="The cpus gunicorn is pinned to.")
+    parser.add_argument(
+        "--concurrency", type=int, default=64, help="Number of concurrent clients.")
+    parser.add_argument(
+        "--duration", type=float, default=10, help="Seconds measured per profile.")
+    parser.add_argument(
+        "--warmup", type=float, default=2, help="Seconds of load before measuring.")
+    parser.add_argument(
+        "--users", type=int, default=64, help="Number of users, one token per user.")
+    parser.add_argument(
+        "--notifications-per-user", type=int, default=5,
+        help="Number of notifications seeded per user.")
+    parser.add_argument(
+        "--mongo-latency-ms", type=float, default=5,
+        help="Time every mongomock round trip waits, ignored with --mongo-uri.")
+    parser.add_argument(
+        "--keycloak-latency-ms", type=float, default=20,
+        help="Time every response of the stub keycloak takes, which serves the realm certs.")
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        connect_database(args.mongo_uri)
+        seed_load_users(args.users, args.notifications_per_user)
+
+    results = []
+    with stub_keycloak(args.keycloak_latency_ms / 1000) as stub, \
+            tempfile.TemporaryDirectory() as metrics_dir:
+        environment = {
+            **keycloak_environment(stub),
+            "AUTH_MODE": "local",
+            "DBNAME": "benchmarks",
+            "DBHOSTNAME": "localhost",
+            "DBPORTS": "27017",
+            "DBUSER": "",
+            "DBPASSWORD": "",
+            "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+            "BENCH_USERS": str(args.users),
+            "BENCH_NOTIFICATIONS_PER_USER": str(args.notifications_per_user),
+            "BENCH_MONGO_LATENCY_MS": str(args.mongo_latency_ms),
+        }
+        if args.mongo_uri:
+            environment["BENCH_MONGO_URI"] = args.mongo_uri
+        requests = [
+            LoadRequest(
+                "GET",
+                f"/api/v1/notifications?user_id={load_user_id(user)}",
+                bearer_headers(stub.issue_token(load_user_id(user))),
+                name="get_notifications",
+            )
+            for user in range(args.users)
+        ]
+
+        for profile in args.profiles:
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            process = start_gunicorn(profile, port, args.workers, set(args.cpus), environment)
+            try:
+                wait_for_server(f"{base_url}/metrics")
+                load = run_load(
+                    base_url,
+                    requests,
+                    concurrency=args.concurrency,
+                    duration_seconds=args.duration,
+                    warmup_seconds=args.warmup,
+                )
+            finally:
+                stop_gunicorn(process)
+            results.append({
+                "profile": profile,
+                "workers": args.workers,
+                "cpus": sorted(args.cpus),
+                "mongo_latency_ms": None if args.mongo_uri else args.mongo_latency_ms,
+                **load,
+            })
+
+    write_results("worker_profiles", args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Synthetic data generator of the benchmarks. It seeds the notification collection with
+notifications whose targets follow a zipf distribution, so that a few users hold most of the
+notifications, as the owners of popular lists do, while most users hold a handful.
+
+Usage:
+    python -m benchmarks.generator --count 1000000 --users 100000 [--skew 1.1] [--mongo-uri URI]
+"""
+import itertools
+import random
+import struct
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from application.namespaces.notifications.inbox import StorageModes, backfill_inbox
+from application.namespaces.notifications.models import (
+    InboxEntry,
+    Notification,
+    NotificationTypes,
+    UserNotificationState,
+    ensure_notification_indexes,
+)
+from application.namespaces.notifications.user_state import reconcile_user_counts
+from benchmarks.harness import base_argument_parser, connect_database, write_results
+
+# How often a notification has 1, 2, 3, 4 or 5 targets.
+TARGET_COUNT_WEIGHTS = (70, 20, 5, 3, 2)
+
+
+def generated_user_id(rank: int) -> str:
+    """
+    Function which obtains the id of a generated user, rank 0 being the user who is the
+    target of the most notifications.
+    """
+    return f"user-{rank:07d}"
+
+
+class NotificationGenerator:
+    """
+    Class which generates raw notification documents, ordered by their ids, whose targets
+    are drawn from users with zipf distributed popularity.
+
+    Args:
+        users(int): The number of users notifications can target.
+        skew(float) - Optional: The exponent of the zipf distribution, larger values
+            concentrate the notifications on fewer users.
+        list_invite_ratio(float) - Optional: The share of list invite notifications.
+        read_ratio(float) - Optional: The share of notifications that were accessed.
+        days(int) - Optional: How many days back the notifications were created over.
+        seed(int) - Optional: The seed of the generator, the same seed generates the
+            same notifications.
+    """
+
+    def __init__(
+        self,
+        users: int,
+        skew: float = 1.1,
+        list_invite_ratio: float = 0.5,
+        read_ratio: float = 0.5,
+        days: int = 90,
+        seed: int = 0,
+    ):
+        self.users = users
+        self.list_invite_ratio = list_invite_ratio
+        self.read_ratio = read_ratio
+        self.days = days
+        self._random = random.Random(seed)
+        self._user_ranks = range(users)
+        self._cumulative_weights = list(itertools.accumulate(
+            1 / (rank + 1) ** skew for rank in self._user_ranks
+        ))
+        self.target_counts = Counter()
+
+    def draw_users(self, count: int) -> list:
+        """
+        Draws count user ids, each user as often as they are the target of a notification.
+        """
+        ranks = self._random.choices(
+            self._user_ranks, cum_weights=self._cumulative_weights, k=count
+        )
+        return [generated_user_id(rank) for rank in ranks]
+
+    def _targets(self) -> list:
+        target_count = min(
+            self.users,
+            self._random.choices(range(1, 6), weights=TARGET_COUNT_WEIGHTS)[0],
+        )
+        ranks = set()
+        while len(ranks) < target_count:
+            ranks.update(self._random.choices(
+                self._user_ranks,
+                cum_weights=self._cumulative_weights,
+                k=target_count - len(ranks),
+            ))
+        targets = [generated_user_id(rank) for rank in sorted(ranks)]
+        self.target_counts.update(targets)
+        return targets
+
+    def generate(self, count: int, now: datetime = None):
+        """
+        Generates count raw notification documents.
+
+        Args:
+            count(int): The number of notifications to generate.
+            now(datetime) - Optional: The creation time of the newest notification.
+
+        Yields:
+            notification(dict): A raw notification document.
+        """
+        now = now or datetime.now(timezone.utc)
+        start = now - timedelta(days=self.days)
+        step_seconds = self.days * 86400 / max(count, 1)
+        for index in range(count):
+            created_at = start + timedelta(seconds=index * step_seconds)
+            # An ObjectId starts with its creation time, followed by eight unique bytes.
+            notification_id = ObjectId(
+                struct.pack(">I", int(created_at.timestamp())) + self._random.randbytes(8)
+            )
+            notification = {
+                "_id": notification_id,
+                "_cls": "Notification",
+                "notificationType": NotificationTypes.BASE.value,
+                "targets": self._targets(),
+                "createdAt": created_at,
+                "lastAccessed": None,
+            }
+            if self._random.random() < self.list_invite_ratio:
+                notification["_cls"] = "Notification.ListInviteNotification"
+                notification["notificationType"] = NotificationTypes.LIST_INVITE.value
+                notification["listId"] = f"list-{self._random.randrange(count // 10 + 1)}"
+            if self._random.random() < self.read_ratio:
+                notification["lastAccessed"] = min(
+                    now, created_at + timedelta(hours=self._random.uniform(0, 72))
+                )
+            yield notification
+
+
+def seed_database(
+    count: int,
+    users: int,
+    skew: float = 1.1,
+    storage_mode: StorageModes = StorageModes.SHARED,
+    batch_size: int = 10000,
+    seed: int = 0,
+) -> dict:
+    """
+    Function which replaces the notifications, inbox entries and user counters with
+    generated ones.
+
+    Args:
+        count(int): The number of notifications to generate.
+        users(int): The number of users notifications can target.
+        skew(float) - Optional: The exponent of the zipf distribution of targets.
+        storage_mode(StorageModes) - Optional: Inbox entries are created for FANOUT.
+        batch_size(int) - Optional: The number of notifications inserted per batch.
+        seed(int) - Optional: The seed of the generator.
+
+    Returns:
+        summary(dict): The number of notifications and users, and the hottest and median
+            users along with their number of notifications.
+    """
+    for document in (Notification, InboxEntry, UserNotificationState):
+        document._get_collection().drop()
+    ensure_notification_indexes()
+
+    start = time.perf_counter()
+    generator = NotificationGenerator(users, skew=skew, seed=seed)
+    notifications = generator.generate(count)
+    collection = Notification._get_collection()
+    while True:
+        batch = list(itertools.islice(notifications, batch_size))
+        if not batch:
+            break
+        collection.insert_many(batch, ordered=False)
+    if storage_mode == StorageModes.FANOUT:
+        backfill_inbox(batch_size=batch_size)
+    reconcile_user_counts(storage_mode, batch_size=batch_size)
+
+    ranked = generator.target_counts.most_common()
+    hottest_user, hottest_count = ranked[0] if ranked else (None, 0)
+    median_user, median_count = ranked[len(ranked) // 2] if ranked else (None, 0)
+    return {
+        "notifications": count,
+        "users": users,
+        "users_with_notifications": len(ranked),
+        "skew": skew,
+        "storage_mode": storage_mode.value,
+        "hottest_user": hottest_user,
+        "hottest_user_notifications": hottest_count,
+        "median_user": median_user,
+        "median_user_notifications": median_count,
+        "mean_targets": round(sum(generator.target_counts.values()) / max(count, 1), 3),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument(
+        "--count", type=int, default=1000000, help="Number of notifications to generate.")
+    parser.add_argument(
+        "--users", type=int, default=100000, help="Number of users targeted.")
+    parser.add_argument(
+        "--skew", type=float, default=1.1, help="Exponent of the zipf distribution of targets.")
+    parser.add_argument(
+        "--storage-mode", default=StorageModes.SHARED.value,
+        choices=[mode.value for mode in StorageModes],
+        help="Inbox entries are created as well for fanout.")
+    parser.add_argument(
+        "--batch-size", type=int, default=10000, help="Notifications inserted per batch.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generator.")
+    args = parser.parse_args()
+    connect_database(args.mongo_uri)
+
+    summary = seed_database(
+        args.count,
+        args.users,
+        skew=args.skew,
+        storage_mode=StorageModes(args.storage_mode),
+        batch_size=args.batch_size,
+        seed=args.seed,
+    )
+    write_results("generator", args, [summary])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Module which contains helpers shared by the benchmarks of the notification service: database
+setup, round trip counting, timing and machine readable output.
+"""
+import argparse
+import contextlib
+import copy
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+import mongomock
+from mongoengine import connect, disconnect
+from pymongo import monitoring
+
+# Collection methods that each cost one round trip to the server, used to count
+# round trips when benchmarking against mongomock, which does not emit command events.
+MONGOMOCK_ROUND_TRIP_METHODS = (
+    "aggregate",
+    "bulk_write",
+    "count_documents",
+    "delete_many",
+    "delete_one",
+    "find",
+    "find_one",
+    "find_one_and_update",
+    "insert_many",
+    "insert_one",
+    "update_many",
+    "update_one",
+)
+
+
+class RoundTripCounter(monitoring.CommandListener):
+    """
+    Command listener which counts the commands sent to the server, grouped by command name.
+    """
+
+    def __init__(self):
+        self.commands = {}
+
+    def started(self, event):
+        self.commands[event.command_name] = self.commands.get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    @property
+    def total(self) -> int:
+        return sum(self.commands.values())
+
+    def reset(self):
+        self.commands = {}
+
+
+_mongomock_counter = None
+_mongomock_latency_seconds = 0.0
+_mongomock_depth = threading.local()
+
+
+def _count_mongomock_calls(counter: RoundTripCounter, latency_seconds: float = 0.0):
+    global _mongomock_counter, _mongomock_latency_seconds
+    _mongomock_counter = counter
+    _mongomock_latency_seconds = latency_seconds
+    for method_name in MONGOMOCK_ROUND_TRIP_METHODS:
+        method = getattr(mongomock.collection.Collection, method_name)
+        if getattr(method, "counted", False):
+            continue
+
+        def counted_method(self, *args, _method=method, _name=method_name, **kwargs):
+            # mongomock implements some methods on top of others, only the outermost
+            # call would have been a round trip to a real server.
+            depth = getattr(_mongomock_depth, "value", 0)
+            if depth == 0:
+                commands = _mongomock_counter.commands
+                commands[_name] = commands.get(_name, 0) + 1
+                if _mongomock_latency_seconds:
+                    time.sleep(_mongomock_latency_seconds)
+                # A driver encodes the arguments of a command, mongomock modifies some of
+                # them in place, which breaks arguments shared by concurrent requests.
+                args, kwargs = copy.deepcopy((args, kwargs))
+            _mongomock_depth.value = depth + 1
+            try:
+                return _method(self, *args, **kwargs)
+            finally:
+                _mongomock_depth.value = depth
+
+        counted_method.counted = True
+        setattr(mongomock.collection.Collection, method_name, counted_method)
+
+
+def connect_database(mongo_uri: str = None, latency_seconds: float = 0.0) -> RoundTripCounter:
+    """
+    Function which connects mongoengine to either a real mongo server or to mongomock.
+
+    Args:
+        mongo_uri(str) - Optional: The uri of the mongo server to benchmark against,
+            mongomock is used when this is not set.
+        latency_seconds(float) - Optional: Time that every round trip to mongomock waits
+            for, to stand in for the network between the service and a mongo server.
+
+    Returns:
+        RoundTripCounter: A counter of the round trips made to the database.
+    """
+    disconnect()
+    counter = RoundTripCounter()
+    if mongo_uri:
+        connect(host=mongo_uri, event_listeners=[counter], uuidRepresentation="standard")
+    else:
+        _count_mongomock_calls(counter, latency_seconds)
+        connect(mongo_client_class=mongomock.MongoClient, uuidRepresentation="standard")
+    return counter
+
+
+def time_function(function, repeat: int, warmup: int = 1) -> dict:
+    """
+    Function which calls a function repeatedly and summarises how long the calls took.
+
+    Args:
+        function(callable): The function to be timed, called without arguments.
+        repeat(int): The number of timed calls.
+        warmup(int): The number of untimed calls made beforehand.
+
+    Returns:
+        timings(dict): The mean, median, 95th percentile and minimum call time in milliseconds.
+    """
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "p50_ms": round(samples[len(samples) // 2], 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        "min_ms": round(samples[0], 4),
+        "repeat": repeat,
+    }
+
+
+@contextlib.contextmanager
+def count_round_trips(counter: RoundTripCounter):
+    """
+    Context manager which yields a dictionary that is filled with the round trips made
+    inside of the with block once it exits.
+    """
+    counter.reset()
+    round_trips = {}
+    yield round_trips
+    round_trips.update({"total": counter.total, "commands": dict(counter.commands)})
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def base_argument_parser(description: str) -> argparse.ArgumentParser:
+    """
+    Function which creates the argument parser shared by every benchmark.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--mongo-uri", default=None,
+        help="Mongo server to benchmark against, mongomock is used when omitted.")
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="Number of timed calls per case.")
+    parser.add_argument(
+        "--output", default=None, help="File to write the json results to, stdout by default.")
+    return parser
+
+
+def write_results(benchmark: str, args: argparse.Namespace, results: list):
+    """
+    Function which writes benchmark results as json, along with the information needed
+    to compare them between commits.
+
+    Args:
+        benchmark(str): The name of the benchmark.
+        args(Namespace): The parsed command line arguments of the benchmark.
+        results(list[dict]): One dictionary per benchmarked case.
+    """
+    report = {
+        "benchmark": benchmark,
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "backend": "mongodb" if args.mongo_uri else "mongomock",
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
@@ -0,0 +1,357 @@
+"""
+Module which contains what the http load tests of the notification service need besides
+the service itself: a stub keycloak server answering with a fixed latency, the tokens it
+signs, a closed loop http load driver, and the gunicorn server they are run against.
+"""
+import base64
+import contextlib
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import NamedTuple
+from urllib.parse import urlsplit
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+STUB_REALM = "benchmark"
+STUB_CLIENT_ID = "notification-service"
+STUB_CLIENT_SECRET = "benchmark-secret"
+STUB_KEY_ID = "benchmark-key"
+
+REPOSITORY_ROOT = Path(__file__).resolve().parent.parent
+GUNICORN_CONFIG = REPOSITORY_ROOT / "scripts" / "server_scripts" / "gunicorn.conf.py"
+
+
+class StubKeycloak:
+    """
+    Threaded http server answering the keycloak endpoints used by the service: the realm,
+    its certs, the client credentials token of the admin connection and the users of the
+    realm, after sleeping for a fixed latency to stand in for a keycloak on the network.
+
+    Args:
+        latency_seconds(float) - Optional: The time taken by every response.
+        host(str) - Optional: The interface to listen on, a free port is chosen.
+    """
+
+    def __init__(self, latency_seconds: float = 0.02, host: str = "127.0.0.1"):
+        self.latency_seconds = latency_seconds
+        self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def _public_key(self) -> str:
+        der = self._private_key.public_key().public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        return base64.b64encode(der).decode()
+
+    def _jwks(self) -> dict:
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self._private_key.public_key()))
+        return {"keys": [{**jwk, "kid": STUB_KEY_ID, "use": "sig", "alg": "RS256"}]}
+
+    def issue_token(self, user_id: str, ttl_seconds: int = 3600) -> str:
+        """
+        Signs a token of the realm for a user.
+
+        Args:
+            user_id(str): The sub claim of the token.
+            ttl_seconds(int) - Optional: The number of seconds until the token expires.
+
+        Returns:
+            token(str): An RS256 signed JWT token.
+        """
+        now = int(time.time())
+        return jwt.encode(
+            {
+                "sub": user_id,
+                "preferred_username": user_id,
+                "iss": f"{self.url}realms/{STUB_REALM}",
+                "iat": now,
+                "exp": now + ttl_seconds,
+            },
+            self._private_key,
+            algorithm="RS256",
+            headers={"kid": STUB_KEY_ID},
+        )
+
+    def _response(self, method: str, path: str):
+        realm_path = f"/realms/{STUB_REALM}"
+        if method == "GET" and path == realm_path:
+            return {"realm": STUB_REALM, "public_key": self._public_key()}
+        if method == "GET" and path == f"{realm_path}/protocol/openid-connect/certs":
+            return self._jwks()
+        if method == "POST" and path == f"{realm_path}/protocol/openid-connect/token":
+            return {
+                "access_token": self.issue_token(STUB_CLIENT_ID),
+                "expires_in": 3600,
+                "token_type": "Bearer",
+            }
+        users_path = f"/admin/realms/{STUB_REALM}/users/"
+        if method == "GET" and path.startswith(users_path):
+            user_id = path[len(users_path):]
+            return {"id": user_id, "username": user_id, "enabled": True}
+        return None
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, method: str):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                with stub._lock:
+                    stub.requests += 1
+                time.sleep(stub.latency_seconds)
+                body = stub._response(method, urlsplit(self.path).path)
+                payload = json.dumps(body or {"error": "not found"}).encode()
+                self.send_response(200 if body is not None else 404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@contextlib.contextmanager
+def stub_keycloak(latency_seconds: float = 0.02):
+    """
+    Context manager which runs a StubKeycloak for the duration of the with block.
+    """
+    stub = StubKeycloak(latency_seconds)
+    stub.start()
+    try:
+        yield stub
+    finally:
+        stub.stop()
+
+
+def keycloak_environment(stub: StubKeycloak) -> dict:
+    """
+    Function which creates the environment variables pointing the service at a StubKeycloak.
+    """
+    return {
+        "KEYCLOAK_SERVER_URL": stub.url,
+        "KEYCLOAK_REALM_NAME": STUB_REALM,
+        "KEYCLOAK_CLIENT_ID": STUB_CLIENT_ID,
+        "KEYCLOAK_CLIENT_SECRET_KEY": STUB_CLIENT_SECRET,
+    }
+
+
+def wait_for_server(url: str, timeout_seconds: float = 30):
+    """
+    Function which waits until an http server answers a GET of url.
+
+    Raises:
+        TimeoutError: If the server did not answer before the timeout.
+    """
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=1)
+        try:
+            connection.request("GET", parts.path or "/")
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+        finally:
+            connection.close()
+    raise TimeoutError(f"{url} did not answer within {timeout_seconds} seconds")
+
+
+class LoadRequest(NamedTuple):
+    """
+    A request sent by the load driver, results are reported per name as well as overall.
+    """
+    method: str
+    path: str
+    headers: dict
+    body: bytes = None
+    name: str = "request"
+
+
+def _percentile(samples: list, fraction: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def _summarize(latencies: list, errors: int, duration_seconds: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / duration_seconds, 2),
+        "p50_ms": round(_percentile(latencies, 0.5), 2) if latencies else None,
+        "p95_ms": round(_percentile(latencies, 0.95), 2) if latencies else None,
+        "p99_ms": round(_percentile(latencies, 0.99), 2) if latencies else None,
+    }
+
+
+def run_load(
+    base_url: str,
+    requests: list,
+    concurrency: int,
+    duration_seconds: float,
+    warmup_seconds: float = 1.0,
+) -> dict:
+    """
+    Function which sends requests to a server from concurrency clients, each sending its
+    next request as soon as its previous one was answered, over its own keep-alive
+    connection.
+
+    Args:
+        base_url(str): The url of the server, such as http://127.0.0.1:5000.
+        requests(list[LoadRequest]): The requests to send, which the clients take turns
+            sending.
+        concurrency(int): The number of clients.
+        duration_seconds(float): How long requests are measured for.
+        warmup_seconds(float) - Optional: How long requests are sent before measuring.
+
+    Returns:
+        results(dict): The requests per second, latency percentiles in milliseconds and
+            the number of failed requests, which are responses other than 2xx and errors,
+            overall and in by_request for every request name.
+    """
+    parts = urlsplit(base_url)
+    start = time.monotonic()
+    measure_from = start + warmup_seconds
+    stop_at = measure_from + duration_seconds
+    # (name, milliseconds, failed) of every measured request.
+    samples = []
+
+    def client(index: int):
+        connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+        sent = index
+        while True:
+            request = requests[sent % len(requests)]
+            sent += concurrency
+            request_start = time.monotonic()
+            if request_start >= stop_at:
+                break
+            try:
+                connection.request(
+                    request.method, request.path, body=request.body, headers=request.headers
+                )
+                response = connection.getresponse()
+                response.read()
+                failed = not 200 <= response.status < 300
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+                failed = True
+            request_end = time.monotonic()
+            if request_start >= measure_from and request_end <= stop_at:
+                # list.append is atomic, the clients do not need a lock.
+                samples.append((request.name, (request_end - request_start) * 1000, failed))
+        connection.close()
+
+    clients = [
+        threading.Thread(target=client, args=(index,), daemon=True)
+        for index in range(concurrency)
+    ]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+
+    by_request = {}
+    for name in sorted({name for name, _, _ in samples}):
+        by_request[name] = _summarize(
+            [ms for sample_name, ms, failed in samples if sample_name == name and not failed],
+            sum(1 for sample_name, _, failed in samples if sample_name == name and failed),
+            duration_seconds,
+        )
+    return {
+        "concurrency": concurrency,
+        "duration_seconds": duration_seconds,
+        **_summarize(
+            [ms for _, ms, failed in samples if not failed],
+            sum(1 for _, _, failed in samples if failed),
+            duration_seconds,
+        ),
+        "by_request": by_request,
+    }
+
+
+def bearer_headers(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(profile: str, port: int, workers: int, cpus: set, environment: dict):
+    """
+    Function which starts gunicorn serving benchmarks.worker_app with a worker profile,
+    with every process pinned to the given cpus.
+
+    Returns:
+        Popen: The gunicorn master process.
+    """
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn",
+            "-c", str(GUNICORN_CONFIG),
+            "-b", f"127.0.0.1:{port}",
+            "--workers", str(workers),
+            "--log-level", "warning",
+            "benchmarks.worker_app:create_benchmark_app()",
+        ],
+        cwd=REPOSITORY_ROOT,
+        env={
+            **os.environ,
+            **environment,
+            "WORKER_PROFILE": profile,
+            "PYTHONPATH": str(REPOSITORY_ROOT),
+        },
+        preexec_fn=lambda: os.sched_setaffinity(0, cpus),
+    )
+
+
+def stop_gunicorn(process: subprocess.Popen):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
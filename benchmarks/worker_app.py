@@ -0,0 +1,77 @@
+"""
+Module which contains the app that gunicorn serves in the worker profile benchmark, loaded with:
+
+    gunicorn -c scripts/server_scripts/gunicorn.conf.py "benchmarks.worker_app:create_benchmark_app()"
+
+The app is connected to the mongo server at BENCH_MONGO_URI, or otherwise to mongomock, which
+is seeded by every worker as every worker process holds its own in memory database. Every round
+trip to mongomock then waits for BENCH_MONGO_LATENCY_MS, so that requests wait on the database
+as they would on a mongo server across the network.
+
+BENCH_DATASET chooses what mongomock is seeded with: load_users, BENCH_NOTIFICATIONS_PER_USER
+notifications for each of BENCH_USERS users, or generated, BENCH_NOTIFICATIONS notifications
+from benchmarks.generator targeting BENCH_USERS users with a zipf skew of BENCH_SKEW.
+"""
+import os
+from bson import ObjectId
+from flask import Flask
+from application import create_base_app
+from application.namespaces.notifications.models import (
+    Notification,
+    NotificationTypes,
+    ensure_notification_indexes,
+)
+from benchmarks.generator import seed_database
+from benchmarks.harness import connect_database
+
+
+def load_user_id(index: int) -> str:
+    return f"load-user-{index}"
+
+
+def seed_load_users(users: int, notifications_per_user: int):
+    """
+    Function which replaces the notification collection with notifications_per_user
+    notifications for each of the load test users.
+    """
+    collection = Notification._get_collection()
+    collection.drop()
+    ensure_notification_indexes()
+    collection.insert_many([
+        {
+            "_id": ObjectId(),
+            "_cls": "Notification.ListInviteNotification",
+            "notificationType": NotificationTypes.LIST_INVITE.value,
+            "targets": [load_user_id(user)],
+            "listId": f"list-{user}-{index}",
+            "lastAccessed": None,
+        }
+        for user in range(users)
+        for index in range(notifications_per_user)
+    ])
+
+
+def create_benchmark_app() -> Flask:
+    """
+    Creates the notification service app of a benchmark worker.
+
+    Returns:
+        app(Flask): Our main flask app, connected to the benchmark database.
+    """
+    mongo_uri = os.environ.get("BENCH_MONGO_URI")
+    connect_database(
+        mongo_uri, latency_seconds=float(os.environ.get("BENCH_MONGO_LATENCY_MS", "0")) / 1000
+    )
+    dataset = os.environ.get("BENCH_DATASET", "load_users")
+    if not mongo_uri and dataset == "generated":
+        seed_database(
+            int(os.environ.get("BENCH_NOTIFICATIONS", "10000")),
+            int(os.environ.get("BENCH_USERS", "1000")),
+            skew=float(os.environ.get("BENCH_SKEW", "1.1")),
+        )
+    elif not mongo_uri:
+        seed_load_users(
+            int(os.environ.get("BENCH_USERS", "100")),
+            int(os.environ.get("BENCH_NOTIFICATIONS_PER_USER", "20")),
+        )
+    return create_base_app()
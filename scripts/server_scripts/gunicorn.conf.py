@@ -0,0 +1,77 @@
+"""
+Gunicorn settings of the notification service, loaded with:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every worker writes its prometheus metrics to PROMETHEUS_MULTIPROC_DIR, so that a scrape of
+/metrics served by any worker aggregates the metrics of all of them, and opens its own db
+connection once it has been forked.
+
+The WORKER_PROFILE environment variable selects how many requests a worker serves at once:
+
+    sync: One request per worker, the default.
+    gthread: WORKER_THREADS requests per worker, each on its own thread.
+    gevent: Up to WORKER_CONNECTIONS requests per worker, each on its own greenlet.
+
+Our handlers spend most of their time waiting on keycloak and mongo, so gthread and gevent
+serve far more requests per worker than sync does on the same cpu.
+"""
+import os
+import shutil
+
+WORKER_PROFILE = os.environ.get("WORKER_PROFILE", "sync").lower()
+
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/orodha-notification-metrics")
+
+# Imported after PROMETHEUS_MULTIPROC_DIR is set, which prometheus_client reads on import.
+from prometheus_client import multiprocess  # noqa: E402
+
+WORKER_PROFILES = {
+    "sync": {"worker_class": "sync", "concurrency": 1},
+    "gthread": {
+        "worker_class": "gthread",
+        "concurrency": int(os.environ.get("WORKER_THREADS", "32")),
+    },
+    "gevent": {
+        "worker_class": "gevent",
+        "concurrency": int(os.environ.get("WORKER_CONNECTIONS", "1000")),
+    },
+}
+
+if WORKER_PROFILE not in WORKER_PROFILES:
+    raise ValueError(
+        f"WORKER_PROFILE: {WORKER_PROFILE} is not one of {', '.join(WORKER_PROFILES)}."
+    )
+
+worker_class = WORKER_PROFILES[WORKER_PROFILE]["worker_class"]
+if WORKER_PROFILE == "gthread":
+    threads = WORKER_PROFILES[WORKER_PROFILE]["concurrency"]
+elif WORKER_PROFILE == "gevent":
+    # The gevent worker monkey patches the standard library itself once it has been forked,
+    # before it loads the application, so the application must not be preloaded by the master.
+    worker_connections = WORKER_PROFILES[WORKER_PROFILE]["concurrency"]
+    preload_app = False
+
+# Connections to keycloak beyond the pool size are closed after every request, so the pool
+# holds as many connections as a worker serves requests at once, up to 100.
+os.environ.setdefault(
+    "KEYCLOAK_POOL_SIZE", str(min(WORKER_PROFILES[WORKER_PROFILE]["concurrency"], 100))
+)
+
+
+def on_starting(server):
+    """Empties the metrics directory, so metrics of a previous run are not aggregated."""
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):
+    """Drops the live gauges of a worker that exited, keeping its counters."""
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    """Opens the db connection of a worker and fills its pool before it accepts requests."""
+    from application import prepare_worker
+    prepare_worker()
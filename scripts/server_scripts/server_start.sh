@@ -20,4 +20,4 @@ then
 fi
 
 export PATH=$PATH:/usr/local/bin
-gunicorn -b 0.0.0.0:$PORT -u $SERVER_USER --chdir /orodha-notification-service/application wsgi:app
+gunicorn -c /orodha-notification-service/gunicorn.conf.py -b 0.0.0.0:$PORT -u $SERVER_USER --chdir /orodha-notification-service/application wsgi:app
@@ -1,10 +1,36 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import pytest
 import mongomock
-from mongoengine import connect
+from mongoengine import connect, disconnect
 import application.namespaces.notifications.models as notification_models
+import application.namespaces.notifications.controllers as controllers
 from application import create_base_app
+from application.auth import AuthModes, JWKSCache, LocalTokenVerifier
 from tests.fixtures.notification_data import INVITE_PAYLOAD
 from tests.fixtures.keycloak_response import KEYCLOAK_GET_USER_RESPONSE
+from tests.fixtures.jwt_tokens import (
+    TEST_AUDIENCE,
+    TEST_ISSUER,
+    TEST_KEY_ID,
+    TEST_PRIVATE_KEY,
+    build_jwks,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    """Fixture function which keeps resolved tokens from leaking between tests."""
+    yield
+    controllers.TOKEN_CACHE.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """Fixture function which keeps cached notification pages from leaking between tests."""
+    yield
+    controllers.RESPONSE_CACHE.clear()
 
 
 @pytest.fixture
@@ -12,6 +38,7 @@ def mock_app_client():
     app = create_base_app()
     connect(mongo_client_class=mongomock.MongoClient)
     yield app.test_client()
+    disconnect()
 
 
 @pytest.fixture
@@ -31,9 +58,92 @@ class MockOrodhaKeycloakClient:
 @pytest.fixture
 def mock_create_keycloak_connection(mocker):
     """
-    Fixture function which patches our _create_keycloak_client function to return our mocked client.
+    Fixture function which patches our _get_keycloak_client function to return our mocked client.
     """
     mocker.patch(
-        "application.namespaces.notifications.controllers._create_keycloak_client",
+        "application.namespaces.notifications.controllers.AUTH_MODE",
+        AuthModes.KEYCLOAK,
+    )
+    mocker.patch(
+        "application.namespaces.notifications.controllers._get_keycloak_client",
         return_value=MockOrodhaKeycloakClient(),
     )
+
+
+class MockJWKSFetcher:
+    """Mock JWKS endpoint which serves the public keys of our local key pairs."""
+
+    def __init__(self, *keys):
+        self.keys = list(keys) or [(TEST_KEY_ID, TEST_PRIVATE_KEY)]
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return build_jwks(*self.keys)
+
+
+@pytest.fixture
+def mock_jwks_fetcher():
+    yield MockJWKSFetcher()
+
+
+@pytest.fixture
+def mock_token_verifier(mocker, mock_jwks_fetcher):
+    """
+    Fixture function which patches our _get_token_verifier function to return a verifier
+    that trusts our local key pair instead of a live keycloak realm.
+    """
+    verifier = LocalTokenVerifier(
+        JWKSCache("http://keycloak.test/certs", fetcher=mock_jwks_fetcher),
+        issuer=TEST_ISSUER,
+        audience=TEST_AUDIENCE,
+    )
+    mocker.patch(
+        "application.namespaces.notifications.controllers.AUTH_MODE",
+        AuthModes.LOCAL,
+    )
+    mocker.patch(
+        "application.namespaces.notifications.controllers._get_token_verifier",
+        return_value=verifier,
+    )
+    yield verifier
+
+
+class LocalHTTPStubHandler(BaseHTTPRequestHandler):
+    """Keep-alive http handler which answers every request with a small json body."""
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self):
+        content_length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(content_length) if content_length else b""
+        self.server.received.append((self.command, self.path, body))
+        status_code = self.server.status_codes.get(self.path, 200)
+        response = json.dumps({"path": self.path}).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_http_server():
+    """
+    Fixture function which runs a local http server in a background thread. Requests it
+    receives are recorded on server.received and per path status codes can be set
+    through server.status_codes.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LocalHTTPStubHandler)
+    server.received = []
+    server.status_codes = {}
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,47 @@
+"""Fixture file which contains a local key pair and helpers used to sign test JWT tokens."""
+import json
+import time
+import jwt
+from jwt.algorithms import RSAAlgorithm
+from cryptography.hazmat.primitives.asymmetric import rsa
+from tests.fixtures.keycloak_response import TEST_KEYCLOAK_USER_ID
+
+TEST_ISSUER = "http://keycloak.test/realms/orodha"
+TEST_AUDIENCE = "orodha-notification-service"
+TEST_KEY_ID = "test-key"
+
+
+def generate_private_key() -> rsa.RSAPrivateKey:
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+TEST_PRIVATE_KEY = generate_private_key()
+
+
+def build_jwks(*keys: tuple) -> dict:
+    """Builds a JSON Web Key Set from (kid, private_key) pairs."""
+    jwks = {"keys": []}
+    for kid, private_key in keys:
+        jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+        jwk.update({"kid": kid, "use": "sig", "alg": "RS256"})
+        jwks["keys"].append(jwk)
+    return jwks
+
+
+def make_token(
+        private_key=TEST_PRIVATE_KEY,
+        kid=TEST_KEY_ID,
+        expires_in=300,
+        **claims):
+    """Signs a keycloak-like access token with our local key pair."""
+    now = int(time.time())
+    payload = {
+        "sub": str(TEST_KEYCLOAK_USER_ID),
+        "iss": TEST_ISSUER,
+        "aud": TEST_AUDIENCE,
+        "iat": now,
+        "exp": now + expires_in,
+        "preferred_username": "someuser",
+    }
+    payload.update(claims)
+    return jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": kid})
@@ -0,0 +1,123 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from http import HTTPStatus
+from application.namespaces.notifications.access_tracking import (
+    AccessTracker,
+    AccessTrackingModes,
+    inbox_entry_key,
+    notification_key,
+)
+from application.namespaces.notifications.inbox import StorageModes, fan_out
+from application.namespaces.notifications.models import (
+    InboxEntry,
+    Notification,
+    notification_factory,
+)
+from tests.fixtures.notification_data import MOCK_USER_ID, INVITE_PAYLOAD
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+ACCESSED_AT = datetime(2023, 9, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def access_tracker(mocker):
+    tracker = AccessTracker(flush_interval_seconds=60)
+    mocker.patch(
+        "application.namespaces.notifications.controllers.ACCESS_TRACKING_MODE",
+        AccessTrackingModes.BATCHED,
+    )
+    mocker.patch(
+        "application.namespaces.notifications.controllers._get_access_tracker",
+        return_value=tracker,
+    )
+    yield tracker
+    tracker.close()
+
+
+def test_access_tracker_coalesces_reads(mock_app_client):
+    notification = notification_factory(INVITE_PAYLOAD).save()
+    tracker = AccessTracker(flush_interval_seconds=60)
+    key = notification_key(notification.id)
+
+    assert tracker.record([key], ACCESSED_AT) == {key}
+    assert tracker.record([key], ACCESSED_AT + timedelta(seconds=2)) == set()
+    assert tracker.record([key], ACCESSED_AT + timedelta(seconds=1)) == set()
+    assert len(tracker) == 1
+    assert notification.reload().lastAccessed is None
+
+    assert tracker.flush() == 1
+    assert notification.reload().lastAccessed == ACCESSED_AT + timedelta(seconds=2)
+    assert tracker.flush() == 0
+    tracker.close()
+
+
+def test_access_tracker_does_not_go_back_in_time(mock_app_client):
+    notification = notification_factory(INVITE_PAYLOAD).save()
+    notification.update(set__lastAccessed=ACCESSED_AT)
+    tracker = AccessTracker(flush_interval_seconds=60)
+
+    tracker.record([notification_key(notification.id)], ACCESSED_AT - timedelta(days=1))
+    tracker.close()
+    assert notification.reload().lastAccessed == ACCESSED_AT
+
+
+def test_access_tracker_flushes_inbox_entries(mock_app_client):
+    notification = notification_factory(INVITE_PAYLOAD).save()
+    fan_out([notification.to_mongo()])
+    tracker = AccessTracker(flush_interval_seconds=60)
+
+    tracker.record([inbox_entry_key(MOCK_USER_ID, notification.id)], ACCESSED_AT)
+    tracker.close()
+    assert InboxEntry.objects.get(userId=MOCK_USER_ID).lastAccessed == ACCESSED_AT
+    assert notification.reload().lastAccessed is None
+
+
+def test_access_tracker_flushes_at_max_pending(mock_app_client):
+    notifications = [notification_factory(INVITE_PAYLOAD).save() for _ in range(3)]
+    tracker = AccessTracker(flush_interval_seconds=60, max_pending=3)
+
+    tracker.record([notification_key(n.id) for n in notifications], ACCESSED_AT)
+    deadline = time.monotonic() + 5
+    while Notification.objects(lastAccessed=None).count() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert all(n.reload().lastAccessed == ACCESSED_AT for n in notifications)
+    tracker.close()
+
+
+def test_get_notifications_batched_tracking(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        access_tracker):
+    count_url = f"{BASE_NOTIFICATIONS_URL}/count?user_id={MOCK_USER_ID}"
+    for _ in range(2):
+        mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    assert mock_app_client.get(count_url).json == {"total": 2, "unread": 2}
+
+    for _ in range(3):
+        api_response = mock_app_client.get(f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}")
+        assert api_response.status_code == HTTPStatus.OK
+        assert all(notification["lastAccessed"] for notification in api_response.json)
+
+    # Reads are not written until they are flushed, but are counted as read once.
+    assert Notification.objects(lastAccessed=None).count() == 2
+    assert mock_app_client.get(count_url).json == {"total": 2, "unread": 0}
+
+    assert access_tracker.flush() == 2
+    assert Notification.objects(lastAccessed=None).count() == 0
+
+
+def test_get_notifications_batched_tracking_fanout(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        access_tracker,
+        mocker):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.STORAGE_MODE",
+        StorageModes.FANOUT,
+    )
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    mock_app_client.get(f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}")
+
+    access_tracker.close()
+    assert InboxEntry.objects.get(userId=MOCK_USER_ID).lastAccessed is not None
@@ -0,0 +1,149 @@
+import pytest
+import requests
+from http import HTTPStatus
+from keycloak.exceptions import KeycloakConnectionError, KeycloakGetError
+from application.auth import (
+    AuthModes,
+    JWKSCache,
+    LocalTokenVerifier,
+    TokenVerificationError,
+)
+from tests.conftest import MockJWKSFetcher, MockOrodhaKeycloakClient
+from tests.fixtures.keycloak_response import TEST_KEYCLOAK_USER_ID
+from tests.fixtures.notification_data import MOCK_USER_ID
+from tests.fixtures.jwt_tokens import (
+    TEST_AUDIENCE,
+    TEST_ISSUER,
+    TEST_KEY_ID,
+    TEST_PRIVATE_KEY,
+    generate_private_key,
+    make_token,
+)
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+
+
+def test_verify_token(mock_token_verifier, mock_jwks_fetcher):
+    for _ in range(3):
+        user = mock_token_verifier.get_user(make_token())
+        assert user["id"] == str(TEST_KEYCLOAK_USER_ID)
+    assert mock_jwks_fetcher.calls == 1
+
+
+@pytest.mark.parametrize("token", [
+    make_token(expires_in=-120),
+    make_token(aud="some-other-client"),
+    make_token(iss="http://evil.test/realms/orodha"),
+    make_token(private_key=generate_private_key()),
+    "not-a-token",
+])
+def test_verify_token_rejected(mock_token_verifier, token):
+    with pytest.raises(TokenVerificationError):
+        mock_token_verifier.verify(token)
+
+
+def test_unknown_kid_refreshes_keys():
+    rotated_key = generate_private_key()
+    fetcher = MockJWKSFetcher((TEST_KEY_ID, TEST_PRIVATE_KEY))
+    verifier = LocalTokenVerifier(
+        JWKSCache("http://keycloak.test/certs", min_refresh_seconds=0, fetcher=fetcher),
+        issuer=TEST_ISSUER,
+        audience=TEST_AUDIENCE,
+    )
+    verifier.verify(make_token())
+
+    fetcher.keys.append(("rotated-key", rotated_key))
+    verifier.verify(make_token(private_key=rotated_key, kid="rotated-key"))
+    assert fetcher.calls == 2
+
+
+def test_unknown_kid_refresh_is_rate_limited(mock_token_verifier, mock_jwks_fetcher):
+    mock_token_verifier.verify(make_token())
+    with pytest.raises(TokenVerificationError):
+        mock_token_verifier.verify(make_token(kid="unknown-key"))
+    assert mock_jwks_fetcher.calls == 1
+
+
+def test_cached_keys_survive_fetch_failure(mock_token_verifier, mock_jwks_fetcher):
+    mock_token_verifier.verify(make_token())
+    mock_token_verifier.jwks_cache.max_age_seconds = 0
+
+    def failing_fetch():
+        raise requests.ConnectionError("keycloak is down")
+
+    mock_token_verifier.jwks_cache._fetcher = failing_fetch
+    assert mock_token_verifier.get_user(make_token())["id"] == str(TEST_KEYCLOAK_USER_ID)
+
+
+def test_get_notifications_local_verification(
+        mock_app_client,
+        mock_notification,
+        mock_token_verifier):
+    api_response = mock_app_client.get(
+        f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}",
+        headers={"Authorization": f"Bearer {make_token()}"}
+    )
+    assert api_response.status_code == HTTPStatus.OK
+    assert len(api_response.json) == 1
+
+
+def test_get_notifications_bad_signature(
+        mock_app_client,
+        mock_notification,
+        mock_token_verifier):
+    token = make_token(private_key=generate_private_key())
+    api_response = mock_app_client.get(
+        f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert api_response.status_code == HTTPStatus.FORBIDDEN
+
+
+@pytest.mark.parametrize("auth_mode, status_code", [
+    (AuthModes.LOCAL, HTTPStatus.INTERNAL_SERVER_ERROR),
+    (AuthModes.FALLBACK, HTTPStatus.OK),
+])
+def test_keycloak_fallback(
+        mocker,
+        mock_app_client,
+        mock_notification,
+        mock_token_verifier,
+        auth_mode,
+        status_code):
+    def failing_fetch():
+        raise requests.ConnectionError("keycloak is down")
+
+    mock_token_verifier.jwks_cache._fetcher = failing_fetch
+    mocker.patch(
+        "application.namespaces.notifications.controllers.AUTH_MODE", auth_mode)
+    mocker.patch(
+        "application.namespaces.notifications.controllers._get_keycloak_client",
+        return_value=MockOrodhaKeycloakClient(),
+    )
+    api_response = mock_app_client.get(
+        f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}",
+        headers={"Authorization": f"Bearer {make_token()}"}
+    )
+    assert api_response.status_code == status_code
+
+
+@pytest.mark.parametrize("error, status_code", [
+    (TokenVerificationError(), HTTPStatus.FORBIDDEN),
+    (KeycloakGetError("User not found", response_code=404), HTTPStatus.FORBIDDEN),
+    (KeycloakConnectionError("Can't connect to server"), HTTPStatus.SERVICE_UNAVAILABLE),
+    (KeycloakGetError("Server error", response_code=500), HTTPStatus.INTERNAL_SERVER_ERROR),
+])
+def test_keycloak_errors(
+        mocker,
+        mock_app_client,
+        mock_create_keycloak_connection,
+        error,
+        status_code):
+    mocker.patch(
+        "application.namespaces.notifications.controllers._get_keycloak_client"
+    ).return_value.get_user.side_effect = error
+    api_response = mock_app_client.get(
+        f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}",
+        headers={"Authorization": f"Bearer {make_token()}"}
+    )
+    assert api_response.status_code == status_code
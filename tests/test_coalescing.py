@@ -0,0 +1,128 @@
+from datetime import timedelta
+from http import HTTPStatus
+import pytest
+from application.namespaces.notifications.coalescing import CoalescingModes
+from application.namespaces.notifications.inbox import StorageModes
+from application.namespaces.notifications.models import Notification, notification_factory
+from tests.fixtures.notification_data import MOCK_USER_ID, INVITE_PAYLOAD
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+BATCH_NOTIFICATIONS_URL = "/api/v1/notifications/batch"
+OTHER_USER_ID = "other-user"
+
+
+@pytest.fixture
+def coalescing_mode(mocker):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.COALESCING_MODE",
+        CoalescingModes.UNREAD,
+    )
+
+
+def _get(client, user_id=MOCK_USER_ID):
+    return client.get(f"{BASE_NOTIFICATIONS_URL}?user_id={user_id}").json
+
+
+def test_post_notifications_coalesced(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        coalescing_mode):
+    for _ in range(3):
+        mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    assert Notification.objects.count() == 1
+    assert mock_app_client.get(
+        f"{BASE_NOTIFICATIONS_URL}/count?user_id={MOCK_USER_ID}"
+    ).json == {"total": 1, "unread": 1}
+
+    notification = Notification.objects.get()
+    response = _get(mock_app_client)
+    assert [row["id"] for row in response] == [str(notification.id)]
+    assert response[0]["eventCount"] == 3
+    assert response[0]["lastEventAt"] == notification.lastEventAt.isoformat()
+
+    # Once read, the notification is closed and the next invite opens a new one.
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    assert [row["eventCount"] for row in _get(mock_app_client)] == [3, 1]
+
+
+def test_post_notifications_coalesced_per_target(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        coalescing_mode):
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    mock_app_client.post(
+        BASE_NOTIFICATIONS_URL,
+        json={**INVITE_PAYLOAD, "targets": [MOCK_USER_ID, OTHER_USER_ID]},
+    )
+    assert sorted(
+        (notification.targets, notification.eventCount)
+        for notification in Notification.objects
+    ) == [([MOCK_USER_ID], 2), ([OTHER_USER_ID], 1)]
+
+
+def test_post_notifications_digest_window(
+        mocker,
+        mock_app_client,
+        mock_create_keycloak_connection):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.COALESCING_MODE",
+        CoalescingModes.DIGEST,
+    )
+    mocker.patch(
+        "application.namespaces.notifications.controllers.COALESCING_WINDOW_SECONDS", 60)
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    notification = Notification.objects.get()
+    notification.update(set__createdAt=notification.createdAt - timedelta(seconds=61))
+
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    assert [notification.eventCount for notification in Notification.objects] == [2, 1]
+
+
+@pytest.mark.parametrize("payload, storage_mode", [
+    ({"targets": [MOCK_USER_ID], "notification_type": "base"}, StorageModes.SHARED),
+    (INVITE_PAYLOAD, StorageModes.FANOUT),
+])
+def test_post_notifications_not_coalesced(
+        mocker,
+        mock_app_client,
+        mock_create_keycloak_connection,
+        coalescing_mode,
+        payload,
+        storage_mode):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.STORAGE_MODE", storage_mode)
+    for _ in range(2):
+        mock_app_client.post(BASE_NOTIFICATIONS_URL, json=payload)
+    assert Notification.objects.count() == 2
+    assert all(notification.eventCount is None for notification in Notification.objects)
+
+
+def test_post_notifications_uncoalesced_notifications_kept(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        coalescing_mode):
+    notification_factory(INVITE_PAYLOAD).save()
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    assert [notification.eventCount for notification in Notification.objects] == [None, 1]
+
+
+def test_post_notifications_batch_coalesced(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        coalescing_mode):
+    api_response = mock_app_client.post(
+        BATCH_NOTIFICATIONS_URL,
+        json=[
+            INVITE_PAYLOAD,
+            {"targets": [MOCK_USER_ID], "notification_type": "base"},
+            INVITE_PAYLOAD,
+        ]
+    )
+    response = api_response.json
+    assert (response["created"], response["coalesced"], response["failed"]) == (2, 1, 0)
+    assert [result["status"] for result in response["results"]] == [
+        "created", "created", "coalesced"
+    ]
+    assert response["results"][0]["id"] == response["results"][2]["id"]
+    assert Notification.objects.count() == 2
@@ -0,0 +1,116 @@
+import logging
+import re
+from types import SimpleNamespace
+import pytest
+from application import create_base_app
+from application.config.db import _explain_command
+from application.utils.command_monitoring import (
+    CommandTimer,
+    filter_shape,
+    request_db_time,
+    summarize_plan,
+)
+from tests.fixtures.notification_data import MOCK_USER_ID
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+FIND_COMMAND = {
+    "find": "notification",
+    "filter": {"targets": MOCK_USER_ID, "_id": {"$gt": "abc"}},
+    "sort": {"_id": 1},
+    "lsid": {"id": "session"},
+    "$db": "orodha",
+}
+IXSCAN_PLAN = {"queryPlanner": {"winningPlan": {
+    "stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "targets_1__id_1"},
+}}}
+
+
+def _run_command(timer, command, duration_micros, request_id=1):
+    command_name = next(iter(command))
+    timer.started(SimpleNamespace(
+        command=command, command_name=command_name, database_name="orodha",
+        connection_id=("localhost", 27017), request_id=request_id,
+    ))
+    timer.succeeded(SimpleNamespace(
+        command_name=command_name, connection_id=("localhost", 27017),
+        request_id=request_id, duration_micros=duration_micros,
+    ))
+
+
+@pytest.mark.parametrize("query, shape", [
+    ({"targets": "user", "_id": {"$gt": 5}}, {"targets": 1, "_id": {"$gt": 1}}),
+    ({"$or": [{"a": 1}, {"b": {"$in": [1, 2]}}]}, {"$or": [{"a": 1}, {"b": {"$in": 1}}]}),
+    ({"tags": ["a", "b"]}, {"tags": 1}),
+    ({}, {}),
+])
+def test_filter_shape(query, shape):
+    assert filter_shape(query) == shape
+
+
+@pytest.mark.parametrize("explain_result, summary", [
+    (IXSCAN_PLAN, "IXSCAN(targets_1__id_1) > FETCH"),
+    ({"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}, "COLLSCAN"),
+    ({"stages": [{"$cursor": IXSCAN_PLAN}, {"$group": {}}]}, "IXSCAN(targets_1__id_1) > FETCH"),
+    ({"queryPlanner": {"winningPlan": {"queryPlan": {"stage": "COLLSCAN"}}}}, "COLLSCAN"),
+    ({}, "UNKNOWN"),
+])
+def test_summarize_plan(explain_result, summary):
+    assert summarize_plan(explain_result) == summary
+
+
+def test_command_timer_logs_slow_commands(caplog):
+    explained = []
+
+    def explain(database_name, command):
+        explained.append((database_name, command))
+        return {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
+
+    timer = CommandTimer(slow_threshold_seconds=0.1, explain=explain)
+    with caplog.at_level(logging.WARNING):
+        _run_command(timer, FIND_COMMAND, duration_micros=5000)
+        _run_command(timer, FIND_COMMAND, duration_micros=150000, request_id=2)
+        _run_command(timer, FIND_COMMAND, duration_micros=150000, request_id=3)
+        timer._get_executor().shutdown(wait=True)
+
+    assert explained == [("orodha", FIND_COMMAND)]
+    messages = [record.getMessage() for record in caplog.records]
+    assert len(messages) == 2
+    assert all("Slow mongo command find on notification took 150.0ms" in m for m in messages)
+    assert all("{'targets': 1, '_id': {'$gt': 1}}" in m for m in messages)
+    assert MOCK_USER_ID not in " ".join(messages)
+    # The same shape is only explained once per interval.
+    assert sorted("plan: COLLSCAN" in message for message in messages) == [False, True]
+
+
+def test_command_timer_request_totals():
+    app = create_base_app()
+    timer = CommandTimer(slow_threshold_seconds=0)
+    with app.test_request_context():
+        _run_command(timer, FIND_COMMAND, duration_micros=1500)
+        _run_command(timer, {"insert": "notification"}, duration_micros=500, request_id=2)
+        assert request_db_time() == (0.002, 2)
+    assert request_db_time() == (0.0, 0)
+
+
+def test_explain_command_strips_driver_fields(mocker):
+    get_connection = mocker.patch("application.config.db.get_connection")
+    _explain_command("default")("orodha", FIND_COMMAND)
+
+    get_connection.return_value.__getitem__.assert_called_once_with("orodha")
+    command = get_connection.return_value.__getitem__.return_value.command
+    command.assert_called_once_with({
+        "explain": {
+            "find": "notification",
+            "filter": FIND_COMMAND["filter"],
+            "sort": {"_id": 1},
+        },
+        "verbosity": "queryPlanner",
+    })
+
+
+def test_server_timing_header(mock_app_client, mock_create_keycloak_connection):
+    api_response = mock_app_client.get(f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}")
+    assert re.fullmatch(
+        r'db;dur=\d+\.\d{2};desc="\d+ commands", total;dur=\d+\.\d{2}',
+        api_response.headers["Server-Timing"],
+    )
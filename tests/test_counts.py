@@ -0,0 +1,128 @@
+import pytest
+from http import HTTPStatus
+from application.namespaces.notifications.inbox import StorageModes
+from application.namespaces.notifications.models import (
+    InboxEntry,
+    UserNotificationState,
+    notification_factory,
+)
+from application.namespaces.notifications.commands import reconcile_counts_command
+from application.namespaces.notifications.user_state import reconcile_user_counts
+from tests.fixtures.notification_data import (
+    MOCK_LIST_ID,
+    MOCK_USER_ID,
+    INVITE_PAYLOAD,
+)
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+OTHER_USER_ID = "other-user"
+SHARED_PAYLOAD = {**INVITE_PAYLOAD, "targets": [MOCK_USER_ID, OTHER_USER_ID]}
+
+
+@pytest.fixture(params=[StorageModes.SHARED, StorageModes.FANOUT])
+def storage_mode(request, mocker):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.STORAGE_MODE",
+        request.param,
+    )
+    yield request.param
+
+
+def _counts(client, user_id=MOCK_USER_ID):
+    api_response = client.get(f"{BASE_NOTIFICATIONS_URL}/count?user_id={user_id}")
+    assert api_response.status_code == HTTPStatus.OK
+    return api_response.json
+
+
+def test_counts_follow_create_read_and_delete(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        storage_mode):
+    assert _counts(mock_app_client) == {"total": 0, "unread": 0}
+
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    mock_app_client.post(f"{BASE_NOTIFICATIONS_URL}/batch", json=[INVITE_PAYLOAD] * 2)
+    assert _counts(mock_app_client) == {"total": 3, "unread": 3}
+    # Counting does not mark anything as read.
+    assert _counts(mock_app_client) == {"total": 3, "unread": 3}
+
+    notifications = mock_app_client.get(
+        f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}&limit=2").json
+    assert _counts(mock_app_client) == {"total": 3, "unread": 1}
+
+    mock_app_client.delete(f"{BASE_NOTIFICATIONS_URL}?notification_id={notifications[0]['id']}")
+    assert _counts(mock_app_client) == {"total": 2, "unread": 1}
+
+    mock_app_client.delete(f"{BASE_NOTIFICATIONS_URL}/batch", json={"list_id": MOCK_LIST_ID})
+    assert _counts(mock_app_client) == {"total": 0, "unread": 0}
+
+
+def test_counts_remove_target_only(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        storage_mode):
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=SHARED_PAYLOAD)
+    mock_app_client.delete(
+        f"{BASE_NOTIFICATIONS_URL}/batch",
+        json={"target": MOCK_USER_ID, "remove_target_only": True}
+    )
+    assert _counts(mock_app_client) == {"total": 0, "unread": 0}
+    assert _counts(mock_app_client, OTHER_USER_ID) == {"total": 1, "unread": 1}
+
+
+def test_bulk_delete_by_target_removes_every_inbox_entry(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        mocker):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.STORAGE_MODE",
+        StorageModes.FANOUT,
+    )
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=SHARED_PAYLOAD)
+    mock_app_client.delete(f"{BASE_NOTIFICATIONS_URL}/batch", json={"target": MOCK_USER_ID})
+
+    assert InboxEntry.objects.count() == 0
+    assert _counts(mock_app_client, OTHER_USER_ID) == {"total": 0, "unread": 0}
+
+
+def test_counts_fall_back_to_counting(
+        mock_app_client,
+        mock_create_keycloak_connection):
+    read_notification = notification_factory(INVITE_PAYLOAD).save()
+    notification_factory(INVITE_PAYLOAD).save()
+    read_notification.update(
+        set__lastAccessed=read_notification.id.generation_time.replace(tzinfo=None)
+    )
+
+    assert _counts(mock_app_client) == {"total": 2, "unread": 1}
+    state = UserNotificationState.objects.get(userId=MOCK_USER_ID)
+    assert state.counted and (state.total, state.unread) == (2, 1)
+
+
+def test_reconcile_user_counts(mock_app_client, mock_create_keycloak_connection):
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=SHARED_PAYLOAD)
+    _counts(mock_app_client)
+    UserNotificationState.objects(userId=MOCK_USER_ID).update(set__total=7, set__unread=-2)
+    UserNotificationState(userId="gone-user", total=3, unread=3, counted=True).save()
+
+    result = reconcile_user_counts(StorageModes.SHARED)
+    assert result == {"users": 3, "corrected": 3}
+    assert _counts(mock_app_client) == {"total": 1, "unread": 1}
+    assert _counts(mock_app_client, "gone-user") == {"total": 0, "unread": 0}
+    assert reconcile_user_counts(StorageModes.SHARED)["corrected"] == 0
+
+
+def test_reconcile_counts_command(mock_app_client):
+    notification_factory(SHARED_PAYLOAD).save()
+    runner = mock_app_client.application.test_cli_runner()
+
+    result = runner.invoke(reconcile_counts_command, ["--user-id", MOCK_USER_ID])
+    assert result.exit_code == 0
+    assert "Counted the notifications of 1 users" in result.output
+    state = UserNotificationState.objects.get(userId=MOCK_USER_ID)
+    assert (state.total, state.unread, state.counted) == (1, 1, True)
+
+
+def test_counts_bad_request(mock_app_client, mock_create_keycloak_connection):
+    api_response = mock_app_client.get(f"{BASE_NOTIFICATIONS_URL}/count")
+    assert api_response.status_code == HTTPStatus.BAD_REQUEST
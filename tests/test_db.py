@@ -0,0 +1,108 @@
+import threading
+import mongomock
+import pytest
+from pymongo.read_preferences import ReadPreference
+import application
+import application.config.db as db
+from application.config import obtain_config
+
+
+@pytest.fixture
+def database_environment(monkeypatch):
+    monkeypatch.setenv("DBHOSTNAME", "mongo")
+    monkeypatch.setenv("DBNAME", "orodha")
+    monkeypatch.setenv("DBPORTS", "27017")
+    yield monkeypatch
+
+
+def test_get_mongo_settings(database_environment):
+    database_environment.setenv("MAX_POOL_SIZE", "50")
+    database_environment.setenv("MIN_POOL_SIZE", "10")
+    database_environment.setenv("WAIT_QUEUE_TIMEOUT_MS", "2000")
+    database_environment.setenv("SERVER_SELECTION_TIMEOUT_MS", "5000")
+    database_environment.setenv("COMPRESSORS", "zstd,snappy")
+
+    settings = db.get_mongo_settings()
+    assert settings["host"] == "mongo"
+    assert settings["port"] == 27017
+    assert settings["connect"] is False
+    assert settings["maxPoolSize"] == 50
+    assert settings["minPoolSize"] == 10
+    assert settings["waitQueueTimeoutMS"] == 2000
+    assert settings["serverSelectionTimeoutMS"] == 5000
+    assert settings["compressors"] == "zstd,snappy"
+
+
+def test_get_mongo_settings_defaults(database_environment):
+    settings = db.get_mongo_settings()
+    assert settings["maxPoolSize"] == 100
+    assert settings["minPoolSize"] == 0
+    assert "waitQueueTimeoutMS" not in settings
+    assert "compressors" not in settings
+
+
+def test_get_read_preference(monkeypatch):
+    assert db.get_read_preference(obtain_config()) == ReadPreference.PRIMARY
+    monkeypatch.setenv("READ_PREFERENCE", "secondaryPreferred")
+    assert db.get_read_preference(obtain_config()) == ReadPreference.SECONDARY_PREFERRED
+    monkeypatch.setenv("READ_PREFERENCE", "fastest")
+    with pytest.raises(ValueError):
+        db.get_read_preference(obtain_config())
+
+
+def test_get_write_concern(monkeypatch):
+    assert db.get_write_concern(obtain_config()).document == {}
+    monkeypatch.setenv("WRITE_CONCERN_W", "majority")
+    monkeypatch.setenv("WRITE_CONCERN_JOURNAL", "true")
+    assert db.get_write_concern(obtain_config()).document == {"w": "majority", "j": True}
+    monkeypatch.setenv("WRITE_CONCERN_W", "2")
+    assert db.get_write_concern(obtain_config()).document["w"] == 2
+
+
+def test_get_db_connection_is_lazy(database_environment, mocker):
+    connect = mocker.patch("application.config.db.connect")
+    db.get_db_connection()
+
+    settings = connect.call_args.kwargs
+    assert settings["connect"] is False
+    assert "alias" not in settings
+    assert [type(listener) for listener in settings["event_listeners"]] == [
+        db.CommandTimer, db.ConnectionCounter
+    ]
+
+
+def test_prepare_db_connection_waits_for_pool(monkeypatch, mocker):
+    monkeypatch.setenv("MIN_POOL_SIZE", "2")
+    mocker.patch("application.config.db.get_connection", return_value=mongomock.MongoClient())
+    counter = db.ConnectionCounter()
+    mocker.patch.dict(db._connection_counters, {"warmup": counter})
+
+    def fill_pool():
+        for _ in range(2):
+            counter.connection_ready(None)
+
+    threading.Timer(0.05, fill_pool).start()
+    assert db.prepare_db_connection("warmup") is True
+    assert counter.ready == 2
+
+    monkeypatch.setenv("POOL_WARMUP_TIMEOUT_SECONDS", "0.01")
+    monkeypatch.setenv("MIN_POOL_SIZE", "3")
+    assert db.prepare_db_connection("warmup") is False
+
+
+def test_prepare_worker_runs_once_per_process(mocker):
+    mocker.patch.object(application, "_prepared_pid", None)
+    steps = [
+        mocker.patch("application.ensure_notification_indexes"),
+        mocker.patch("application.ensure_idempotency_indexes"),
+        mocker.patch("application.configure_retention"),
+        mocker.patch("application.prepare_db_connection"),
+    ]
+
+    application.prepare_worker()
+    application.prepare_worker()
+    assert [step.call_count for step in steps] == [1, 1, 1, 1]
+
+    mocker.patch.object(application, "_prepared_pid", -1)
+    application.prepare_worker()
+    assert [step.call_count for step in steps] == [2, 2, 2, 2]
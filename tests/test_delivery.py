@@ -0,0 +1,215 @@
+import json
+from datetime import timedelta
+from http import HTTPStatus
+import pytest
+from click.testing import CliRunner
+from application.namespaces.notifications.access_tracking import current_access_time
+from application.namespaces.notifications.commands import deliver_notifications_command
+from application.namespaces.notifications.delivery import (
+    DELIVERIES,
+    DELIVERED,
+    DEAD_LETTERED,
+    DEFERRED,
+    ORPHANED,
+    RETRIED,
+    DeliveryWorker,
+    parse_delivery_channels,
+)
+from application.namespaces.notifications.models import DeadLetter, Notification, OutboxEntry
+from tests.fixtures.notification_data import MOCK_USER_ID, INVITE_PAYLOAD
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+BATCH_NOTIFICATIONS_URL = "/api/v1/notifications/batch"
+
+
+@pytest.fixture
+def delivery_channels(mocker, local_http_server):
+    channels = {
+        "webhook": f"{local_http_server.url}/webhook",
+        "email": f"{local_http_server.url}/email",
+    }
+    mocker.patch(
+        "application.namespaces.notifications.controllers.DELIVERY_CHANNELS", channels)
+    yield channels
+
+
+@pytest.fixture
+def delivery_worker(delivery_channels):
+    worker = DeliveryWorker(
+        delivery_channels, batch_size=10, concurrency=4, timeout_seconds=5,
+        max_attempts=3, backoff_seconds=10, max_backoff_seconds=60, orphan_seconds=30,
+    )
+    yield worker
+    worker.close()
+
+
+def _post(client, payload=INVITE_PAYLOAD):
+    return client.post(BASE_NOTIFICATIONS_URL, json=payload)
+
+
+def test_parse_delivery_channels():
+    assert parse_delivery_channels("") == {}
+    assert parse_delivery_channels(" webhook = http://hooks/a , email=http://relay ") == {
+        "webhook": "http://hooks/a",
+        "email": "http://relay",
+    }
+
+
+@pytest.mark.parametrize("value", ["webhook", "=http://hooks", "a=http://x,a=http://y"])
+def test_parse_delivery_channels_invalid(value):
+    with pytest.raises(ValueError):
+        parse_delivery_channels(value)
+
+
+def test_post_notifications_enqueues_deliveries(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        delivery_channels):
+    _post(mock_app_client)
+    notification = Notification.objects.get()
+    assert sorted(
+        (entry.notificationId, entry.channel, entry.attempts) for entry in OutboxEntry.objects
+    ) == [(notification.id, "email", 0), (notification.id, "webhook", 0)]
+
+    api_response = mock_app_client.post(
+        BATCH_NOTIFICATIONS_URL, json=[INVITE_PAYLOAD, INVITE_PAYLOAD])
+    assert api_response.json["created"] == 2
+    assert OutboxEntry.objects.count() == 6
+
+
+def test_post_notifications_without_channels(mock_app_client, mock_create_keycloak_connection):
+    _post(mock_app_client)
+    assert Notification.objects.count() == 1
+    assert OutboxEntry.objects.count() == 0
+
+
+def test_run_once_delivers(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        local_http_server,
+        delivery_worker):
+    _post(mock_app_client)
+    delivered = DELIVERIES.labels(channel="webhook", outcome=DELIVERED)._value.get()
+
+    assert delivery_worker.run_once() == {DELIVERED: 2}
+    assert OutboxEntry.objects.count() == 0
+    assert DELIVERIES.labels(channel="webhook", outcome=DELIVERED)._value.get() == delivered + 1
+
+    received = {path: json.loads(body) for _, path, body in local_http_server.received}
+    assert sorted(received) == ["/email", "/webhook"]
+    assert received["/webhook"]["attempt"] == 1
+    assert received["/webhook"]["notification"]["id"] == str(Notification.objects.get().id)
+    assert received["/webhook"]["notification"]["targets"] == [MOCK_USER_ID]
+
+    # Nothing is left to deliver.
+    assert delivery_worker.run_once() == {}
+
+
+def test_run_once_retries_with_backoff(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        local_http_server,
+        delivery_worker):
+    local_http_server.status_codes["/webhook"] = HTTPStatus.SERVICE_UNAVAILABLE
+    _post(mock_app_client)
+    started = current_access_time()
+
+    assert delivery_worker.run_once() == {DELIVERED: 1, RETRIED: 1}
+    entry = OutboxEntry.objects.get()
+    assert (entry.channel, entry.attempts, entry.claimedBy) == ("webhook", 1, None)
+    assert entry.lastError == "webhook responded with 503"
+    # The first retry waits between half and all of backoff_seconds.
+    assert started + timedelta(seconds=5) <= entry.nextAttemptAt
+    assert entry.nextAttemptAt <= current_access_time() + timedelta(seconds=10)
+
+    # The entry is not due again until its backoff ran out.
+    assert delivery_worker.run_once() == {}
+
+
+def test_run_once_dead_letters_after_max_attempts(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        local_http_server,
+        delivery_worker):
+    local_http_server.status_codes["/webhook"] = HTTPStatus.SERVICE_UNAVAILABLE
+    _post(mock_app_client)
+    outcomes = []
+    for _ in range(3):
+        outcomes.append(delivery_worker.run_once())
+        OutboxEntry.objects.update(set__nextAttemptAt=current_access_time())
+    assert outcomes == [{DELIVERED: 1, RETRIED: 1}, {RETRIED: 1}, {DEAD_LETTERED: 1}]
+    assert OutboxEntry.objects.count() == 0
+    dead_letter = DeadLetter.objects.get()
+    assert (dead_letter.channel, dead_letter.attempts) == ("webhook", 3)
+    assert dead_letter.notificationId == Notification.objects.get().id
+
+
+def test_run_once_dead_letters_rejected_delivery(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        local_http_server,
+        delivery_worker):
+    local_http_server.status_codes["/email"] = HTTPStatus.BAD_REQUEST
+    local_http_server.status_codes["/webhook"] = HTTPStatus.TOO_MANY_REQUESTS
+    _post(mock_app_client)
+    assert delivery_worker.run_once() == {DEAD_LETTERED: 1, RETRIED: 1}
+    assert DeadLetter.objects.get().lastError == "email responded with 400"
+    assert OutboxEntry.objects.get().channel == "webhook"
+
+
+def test_run_once_missing_notification(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        local_http_server,
+        delivery_worker):
+    _post(mock_app_client)
+    Notification.objects.delete()
+
+    # The notification may not have been written yet, so the entry waits for it.
+    assert delivery_worker.run_once() == {DEFERRED: 2}
+    assert OutboxEntry.objects.count() == 2
+
+    OutboxEntry.objects.update(
+        set__nextAttemptAt=current_access_time(),
+        set__createdAt=current_access_time() - timedelta(seconds=31),
+    )
+    assert delivery_worker.run_once() == {ORPHANED: 2}
+    assert OutboxEntry.objects.count() == 0
+    assert local_http_server.received == []
+
+
+def test_claim_skips_claimed_entries(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        delivery_channels,
+        delivery_worker):
+    _post(mock_app_client)
+    token, entries = delivery_worker.claim()
+    assert len(entries) == 2
+    assert all(entry["claimedBy"] == token for entry in entries)
+
+    # Claimed entries are leased to their worker until their lease runs out.
+    assert delivery_worker.claim() == (None, [])
+    OutboxEntry.objects.update(set__nextAttemptAt=current_access_time())
+    other_token, entries = delivery_worker.claim()
+    assert other_token != token and len(entries) == 2
+
+    # The first worker can no longer record results for entries it lost.
+    delivery_worker._record_results(token, entries, [(DELIVERED, None)] * 2)
+    assert OutboxEntry.objects.count() == 2
+
+
+def test_deliver_notifications_command(
+        mocker,
+        mock_app_client,
+        mock_create_keycloak_connection,
+        delivery_worker):
+    _post(mock_app_client)
+    mocker.patch(
+        "application.namespaces.notifications.commands.create_delivery_worker",
+        return_value=delivery_worker,
+    )
+    result = CliRunner().invoke(deliver_notifications_command, ["--once"])
+    assert result.exit_code == 0
+    assert "Processed outbox entries: 2 delivered" in result.output
+    assert OutboxEntry.objects.count() == 0
@@ -0,0 +1,36 @@
+import os
+import runpy
+from pathlib import Path
+import pytest
+
+GUNICORN_CONFIG = str(
+    Path(__file__).resolve().parent.parent / "scripts" / "server_scripts" / "gunicorn.conf.py"
+)
+
+
+@pytest.fixture
+def load_config(mocker, tmp_path):
+    def _load_config(**environment):
+        mocker.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": str(tmp_path), **environment})
+        os.environ.pop("KEYCLOAK_POOL_SIZE", None)
+        return runpy.run_path(GUNICORN_CONFIG)
+    return _load_config
+
+
+def test_sync_profile_is_the_default(load_config):
+    settings = load_config()
+    assert settings["worker_class"] == "sync"
+    assert "threads" not in settings
+    assert os.environ["KEYCLOAK_POOL_SIZE"] == "1"
+
+
+def test_gthread_profile(load_config):
+    settings = load_config(WORKER_PROFILE="gthread", WORKER_THREADS="16")
+    assert settings["worker_class"] == "gthread"
+    assert settings["threads"] == 16
+    assert os.environ["KEYCLOAK_POOL_SIZE"] == "16"
+
+
+def test_unknown_profile(load_config):
+    with pytest.raises(ValueError):
+        load_config(WORKER_PROFILE="eventlet")
@@ -0,0 +1,217 @@
+from datetime import timedelta
+from http import HTTPStatus
+import pytest
+from mongomock.collection import Collection
+from pymongo.errors import AutoReconnect
+from application.namespaces.notifications.access_tracking import current_access_time
+from application.namespaces.notifications.exceptions import OrodhaConflictError
+from application.namespaces.notifications.idempotency import (
+    TTL_INDEX_NAME,
+    claim_idempotency_key,
+    ensure_idempotency_indexes,
+    hash_payload,
+)
+from application.namespaces.notifications.models import (
+    IdempotencyRecord,
+    Notification,
+    ensure_notification_indexes,
+)
+from tests.fixtures.notification_data import MOCK_USER_ID, INVITE_PAYLOAD
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+BATCH_NOTIFICATIONS_URL = "/api/v1/notifications/batch"
+IDEMPOTENCY_KEY = "retry-1"
+
+
+@pytest.fixture
+def idempotency_indexes(mock_app_client):
+    ensure_notification_indexes()
+    ensure_idempotency_indexes(3600)
+
+
+def test_post_notifications_retry(mock_app_client, mock_create_keycloak_connection):
+    for _ in range(3):
+        api_response = mock_app_client.post(
+            BASE_NOTIFICATIONS_URL,
+            json=INVITE_PAYLOAD,
+            headers={"Idempotency-Key": IDEMPOTENCY_KEY},
+        )
+        assert api_response.json == {"status_code": HTTPStatus.OK}
+    assert Notification.objects.count() == 1
+    record = IdempotencyRecord.objects.get()
+    assert record.status == "completed"
+    assert record.result == {"id": str(Notification.objects.get().id)}
+
+
+def test_post_notifications_batch_retry(mock_app_client, mock_create_keycloak_connection):
+    responses = [
+        mock_app_client.post(
+            BATCH_NOTIFICATIONS_URL,
+            json=[INVITE_PAYLOAD, INVITE_PAYLOAD],
+            headers={"Idempotency-Key": IDEMPOTENCY_KEY},
+        ).json
+        for _ in range(2)
+    ]
+    assert responses[0] == responses[1]
+    assert responses[0]["created"] == 2
+    assert Notification.objects.count() == 2
+
+
+def test_post_notifications_key_reused(mock_app_client, mock_create_keycloak_connection):
+    headers = {"Idempotency-Key": IDEMPOTENCY_KEY}
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD, headers=headers)
+    api_response = mock_app_client.post(
+        BASE_NOTIFICATIONS_URL,
+        json={**INVITE_PAYLOAD, "list_id": "another-list"},
+        headers=headers,
+    )
+    assert api_response.status_code == HTTPStatus.CONFLICT
+    assert Notification.objects.count() == 1
+
+    # Keys of the single and batch routes do not collide.
+    api_response = mock_app_client.post(
+        BATCH_NOTIFICATIONS_URL, json=[INVITE_PAYLOAD], headers=headers
+    )
+    assert api_response.json["created"] == 1
+
+
+def test_post_notifications_failure_releases_key(
+        mock_app_client,
+        mock_create_keycloak_connection):
+    headers = {"Idempotency-Key": IDEMPOTENCY_KEY}
+    payload = {**INVITE_PAYLOAD, "list_id": None}
+    api_response = mock_app_client.post(BASE_NOTIFICATIONS_URL, json=payload, headers=headers)
+    assert api_response.status_code == HTTPStatus.BAD_REQUEST
+    assert IdempotencyRecord.objects.count() == 0
+
+    api_response = mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD, headers=headers
+    )
+    assert api_response.status_code == HTTPStatus.OK
+    assert Notification.objects.count() == 1
+
+
+def test_post_notifications_failure_release_fails(
+        mocker,
+        caplog,
+        mock_app_client,
+        mock_create_keycloak_connection):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.release_idempotency_key",
+        side_effect=AutoReconnect("connection closed"),
+    )
+    headers = {"Idempotency-Key": IDEMPOTENCY_KEY}
+    payload = {**INVITE_PAYLOAD, "list_id": None}
+    api_response = mock_app_client.post(BASE_NOTIFICATIONS_URL, json=payload, headers=headers)
+    # The failure of the request is reported rather than that of the release.
+    assert api_response.status_code == HTTPStatus.BAD_REQUEST
+    assert "Unable to release idempotency key" in caplog.text
+    assert IdempotencyRecord.objects.get().status == "pending"
+
+
+@pytest.mark.parametrize("key", ["", "k" * 256])
+def test_post_notifications_invalid_key(mock_app_client, mock_create_keycloak_connection, key):
+    api_response = mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD, headers={"Idempotency-Key": key}
+    )
+    assert api_response.status_code == HTTPStatus.BAD_REQUEST
+    assert Notification.objects.count() == 0
+
+
+def test_post_notifications_completion_retried(
+        mocker,
+        mock_app_client,
+        mock_create_keycloak_connection):
+    update_one = Collection.update_one
+    failures = iter([AutoReconnect("primary stepped down")])
+
+    def flaky_update_one(collection, *args, **kwargs):
+        if collection.name == "idempotency_key":
+            failure = next(failures, None)
+            if failure is not None:
+                raise failure
+        return update_one(collection, *args, **kwargs)
+
+    mocker.patch.object(Collection, "update_one", flaky_update_one)
+    api_response = mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD, headers={"Idempotency-Key": IDEMPOTENCY_KEY}
+    )
+    assert api_response.status_code == HTTPStatus.OK
+    assert IdempotencyRecord.objects.get().status == "completed"
+
+
+def test_post_notifications_completion_fails(
+        mocker,
+        mock_app_client,
+        mock_create_keycloak_connection):
+    update_one = Collection.update_one
+
+    def failing_update_one(collection, *args, **kwargs):
+        if collection.name == "idempotency_key":
+            raise AutoReconnect("primary stepped down")
+        return update_one(collection, *args, **kwargs)
+
+    mocker.patch.object(Collection, "update_one", failing_update_one)
+    headers = {"Idempotency-Key": IDEMPOTENCY_KEY}
+    api_response = mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD, headers=headers
+    )
+    assert api_response.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
+    assert IdempotencyRecord.objects.get().status == "pending"
+
+    # The key is kept, so a retry does not create the notification a second time.
+    api_response = mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD, headers=headers
+    )
+    assert api_response.status_code == HTTPStatus.CONFLICT
+    assert Notification.objects.count() == 1
+
+
+def test_claim_idempotency_key_race(mocker, idempotency_indexes):
+    payload_hash = hash_payload(INVITE_PAYLOAD)
+    record_id, result = claim_idempotency_key(
+        MOCK_USER_ID, "notifications", IDEMPOTENCY_KEY, payload_hash, 60
+    )
+    assert result is None
+
+    # The loser looked the key up before the winner inserted it.
+    find_one = Collection.find_one
+    lookups = iter([None])
+    mocker.patch.object(
+        Collection,
+        "find_one",
+        lambda collection, *args, **kwargs:
+            next(lookups, None) or find_one(collection, *args, **kwargs),
+    )
+    with pytest.raises(OrodhaConflictError) as err:
+        claim_idempotency_key(MOCK_USER_ID, "notifications", IDEMPOTENCY_KEY, payload_hash, 60)
+    assert err.value.message == "A request with this Idempotency-Key is still being processed."
+    assert IdempotencyRecord.objects.get().id == record_id
+
+
+def test_claim_idempotency_key_expired_lease(idempotency_indexes):
+    payload_hash = hash_payload(INVITE_PAYLOAD)
+    record_id, _ = claim_idempotency_key(
+        MOCK_USER_ID, "notifications", IDEMPOTENCY_KEY, payload_hash, 60
+    )
+    IdempotencyRecord._get_collection().update_one(
+        {"_id": record_id},
+        {"$set": {"createdAt": current_access_time() - timedelta(seconds=61)}},
+    )
+    assert claim_idempotency_key(
+        MOCK_USER_ID, "notifications", IDEMPOTENCY_KEY, payload_hash, 60
+    ) == (record_id, None)
+
+
+def test_ensure_idempotency_indexes(idempotency_indexes):
+    collection = IdempotencyRecord._get_collection()
+    assert collection.index_information()["user_route_key"]["unique"] is True
+    assert collection.index_information()[TTL_INDEX_NAME]["expireAfterSeconds"] == 3600
+
+    ensure_idempotency_indexes(60)
+    assert collection.index_information()[TTL_INDEX_NAME]["expireAfterSeconds"] == 60
+
+
+def test_hash_payload_ignores_key_order():
+    assert hash_payload({"a": 1, "b": [1, 2]}) == hash_payload({"b": [1, 2], "a": 1})
+    assert hash_payload({"a": 1}) != hash_payload({"a": 2})
@@ -0,0 +1,101 @@
+import pytest
+from http import HTTPStatus
+from application.namespaces.notifications.inbox import StorageModes, backfill_inbox
+from application.namespaces.notifications.models import InboxEntry, notification_factory
+from application.namespaces.notifications.commands import backfill_inbox_command
+from tests.fixtures.notification_data import (
+    MOCK_LIST_ID,
+    MOCK_USER_ID,
+    INVITE_PAYLOAD,
+)
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+OTHER_USER_ID = "other-user"
+SHARED_PAYLOAD = {**INVITE_PAYLOAD, "targets": [MOCK_USER_ID, OTHER_USER_ID]}
+
+
+@pytest.fixture
+def fanout_storage(mocker):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.STORAGE_MODE",
+        StorageModes.FANOUT,
+    )
+
+
+def test_post_notifications_fans_out(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        fanout_storage):
+    api_response = mock_app_client.post(BASE_NOTIFICATIONS_URL, json=SHARED_PAYLOAD)
+    assert api_response.status_code == HTTPStatus.OK
+
+    entries = InboxEntry.objects.order_by("userId")
+    assert [entry.userId for entry in entries] == sorted([MOCK_USER_ID, OTHER_USER_ID])
+    assert all(entry.listId == MOCK_LIST_ID for entry in entries)
+
+
+def test_get_notifications_reads_inbox(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        fanout_storage):
+    mock_app_client.post(f"{BASE_NOTIFICATIONS_URL}/batch", json=[SHARED_PAYLOAD] * 3)
+
+    api_response = mock_app_client.get(f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}")
+    assert api_response.status_code == HTTPStatus.OK
+    assert len(api_response.json) == 3
+    assert all(notification["targets"] == [MOCK_USER_ID] for notification in api_response.json)
+    assert all(notification["lastAccessed"] for notification in api_response.json)
+
+    # Read state is tracked per recipient.
+    assert all(entry.lastAccessed is None for entry in InboxEntry.objects(userId=OTHER_USER_ID))
+
+
+def test_delete_notifications_removes_inbox_entries(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        fanout_storage):
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=SHARED_PAYLOAD)
+    notification_id = InboxEntry.objects.first().notificationId
+
+    api_response = mock_app_client.delete(
+        f"{BASE_NOTIFICATIONS_URL}?notification_id={notification_id}")
+    assert api_response.status_code == HTTPStatus.OK
+    assert InboxEntry.objects.count() == 0
+
+
+def test_delete_notifications_batch_remove_target_only_inbox(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        fanout_storage):
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=SHARED_PAYLOAD)
+
+    mock_app_client.delete(
+        f"{BASE_NOTIFICATIONS_URL}/batch",
+        json={"target": MOCK_USER_ID, "remove_target_only": True}
+    )
+    assert [entry.userId for entry in InboxEntry.objects] == [OTHER_USER_ID]
+
+
+def test_backfill_inbox(mock_app_client):
+    notifications = [notification_factory(SHARED_PAYLOAD).save() for _ in range(5)]
+    notification_factory({"targets": [MOCK_USER_ID], "notification_type": "base"}).save()
+
+    counts = backfill_inbox(batch_size=2)
+    assert counts["notifications"] == 6
+    assert counts["entries_created"] == 11
+
+    InboxEntry.objects(notificationId=notifications[0].id, userId=MOCK_USER_ID).update(
+        set__lastAccessed=notifications[0].id.generation_time.replace(tzinfo=None)
+    )
+    assert backfill_inbox(batch_size=2)["entries_created"] == 0
+    assert InboxEntry.objects(
+        notificationId=notifications[0].id, userId=MOCK_USER_ID).first().lastAccessed
+
+
+def test_backfill_inbox_command(mock_app_client):
+    notification_factory(SHARED_PAYLOAD).save()
+    result = mock_app_client.application.test_cli_runner().invoke(
+        backfill_inbox_command, ["--batch-size", "10"]
+    )
+    assert result.exit_code == 0
+    assert "created 2 inbox entries" in result.output
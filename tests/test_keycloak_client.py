@@ -0,0 +1,124 @@
+import base64
+import pytest
+from cryptography.hazmat.primitives import serialization
+from keycloak.exceptions import KeycloakConnectionError
+from prometheus_client import REGISTRY
+from application.auth import (
+    PooledKeycloakClient,
+    TokenVerificationError,
+    get_keycloak_client,
+    reset_keycloak_client,
+)
+from application.config import obtain_config
+from tests.fixtures.keycloak_response import TEST_KEYCLOAK_USER_ID
+from tests.fixtures.jwt_tokens import TEST_PRIVATE_KEY, generate_private_key, make_token
+
+
+def _sample(name):
+    return REGISTRY.get_sample_value(name) or 0
+
+
+@pytest.fixture
+def pooled_keycloak_client(local_http_server):
+    yield PooledKeycloakClient(
+        server_url=local_http_server.url,
+        realm_name="orodha",
+        client_id="orodha-notification-service",
+        client_secret_key="secret",
+        pool_size=2,
+        connect_timeout=1,
+        read_timeout=2,
+    )
+
+
+def test_pooled_client_reuses_connections(pooled_keycloak_client, local_http_server):
+    requests_before = _sample("orodha_keycloak_http_requests_total")
+    connections_before = _sample("orodha_keycloak_connections_created_total")
+
+    connection = pooled_keycloak_client.client_connection.connection
+    for _ in range(5):
+        assert connection.raw_get("/realms/orodha").status_code == 200
+
+    assert len(local_http_server.received) == 5
+    assert _sample("orodha_keycloak_http_requests_total") - requests_before == 5
+    assert _sample("orodha_keycloak_connections_created_total") - connections_before == 1
+
+
+def test_pooled_client_timeouts(pooled_keycloak_client):
+    for connection in pooled_keycloak_client._connection_managers():
+        assert connection.timeout == (1, 2)
+
+
+def test_get_keycloak_client_is_shared(mocker):
+    mocker.patch(
+        "application.auth.keycloak_client.PooledKeycloakClient",
+        side_effect=lambda **kwargs: object(),
+    )
+    config = obtain_config()
+    reset_keycloak_client()
+
+    client = get_keycloak_client(config)
+    assert get_keycloak_client(config) is client
+
+    reset_keycloak_client()
+    assert get_keycloak_client(config) is not client
+    reset_keycloak_client()
+
+
+def _realm_public_key(private_key) -> str:
+    """Encodes a public key the way the realm endpoint of keycloak returns it."""
+    return base64.b64encode(private_key.public_key().public_bytes(
+        serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+    )).decode()
+
+
+@pytest.fixture
+def realm_public_key(mocker, pooled_keycloak_client):
+    yield mocker.patch.object(
+        pooled_keycloak_client.client_connection,
+        "public_key",
+        return_value=_realm_public_key(TEST_PRIVATE_KEY),
+    )
+
+
+def test_decode_jwt(pooled_keycloak_client, realm_public_key):
+    token_info = pooled_keycloak_client.decode_jwt(make_token())
+    assert token_info["sub"] == str(TEST_KEYCLOAK_USER_ID)
+    pooled_keycloak_client.decode_jwt(make_token())
+    assert realm_public_key.call_count == 1
+
+
+@pytest.mark.parametrize("token", [
+    make_token(expires_in=-120),
+    make_token(private_key=generate_private_key()),
+    "not-a-token",
+])
+def test_decode_jwt_rejected(pooled_keycloak_client, realm_public_key, token):
+    with pytest.raises(TokenVerificationError):
+        pooled_keycloak_client.decode_jwt(token)
+
+
+def test_decode_jwt_rotated_key(pooled_keycloak_client, realm_public_key):
+    pooled_keycloak_client.decode_jwt(make_token())
+    rotated_key = generate_private_key()
+    realm_public_key.return_value = _realm_public_key(rotated_key)
+
+    # Tokens failing verification refetch the key at most once every min_refresh_seconds.
+    with pytest.raises(TokenVerificationError):
+        pooled_keycloak_client.decode_jwt(make_token(private_key=rotated_key))
+    assert realm_public_key.call_count == 1
+
+    pooled_keycloak_client.min_refresh_seconds = 0
+    token_info = pooled_keycloak_client.decode_jwt(make_token(private_key=rotated_key))
+    assert token_info["sub"] == str(TEST_KEYCLOAK_USER_ID)
+    assert realm_public_key.call_count == 2
+
+
+def test_public_key_expires(pooled_keycloak_client, realm_public_key):
+    pooled_keycloak_client.public_key()
+    pooled_keycloak_client.max_age_seconds = 0
+    realm_public_key.side_effect = KeycloakConnectionError("Can't connect to server")
+
+    # The cached key is kept while keycloak can not be reached.
+    assert pooled_keycloak_client.public_key() == _realm_public_key(TEST_PRIVATE_KEY)
+    assert realm_public_key.call_count == 2
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+import textwrap
+from http import HTTPStatus
+from prometheus_client.parser import text_string_to_metric_families
+from tests.fixtures.notification_data import MOCK_USER_ID, INVITE_PAYLOAD
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+
+
+def _samples(metrics_text: str) -> list:
+    return [
+        sample
+        for family in text_string_to_metric_families(metrics_text)
+        for sample in family.samples
+    ]
+
+
+def _sample_value(samples: list, name: str, **labels) -> float:
+    return sum(
+        sample.value for sample in samples
+        if sample.name == name and all(sample.labels.get(k) == v for k, v in labels.items())
+    )
+
+
+def test_metrics_endpoint(mock_app_client, mock_create_keycloak_connection):
+    before = _samples(mock_app_client.get("/metrics").data.decode())
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    mock_app_client.get(f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}")
+
+    api_response = mock_app_client.get("/metrics")
+    assert api_response.status_code == HTTPStatus.OK
+    assert api_response.content_type.startswith("text/plain")
+    after = _samples(api_response.data.decode())
+
+    def increase(name, **labels):
+        return _sample_value(after, name, **labels) - _sample_value(before, name, **labels)
+
+    assert increase(
+        "orodha_http_request_duration_seconds_count",
+        method="GET", route="/api/v1/notifications", status="200",
+    ) == 1
+    # The token is only sent to keycloak once, it is cached for the GET.
+    assert increase(
+        "orodha_operation_duration_seconds_count", component="keycloak", operation="get_user"
+    ) == 1
+    assert increase(
+        "orodha_operation_duration_seconds_count",
+        component="mongo", operation="find_notifications",
+    ) == 1
+    assert increase(
+        "orodha_operation_duration_seconds_count",
+        component="serialization", operation="notifications",
+    ) == 1
+    # The scrape itself is the only request in progress.
+    assert _sample_value(
+        after, "orodha_http_requests_in_progress", method="GET", route="/metrics"
+    ) == 1
+    assert _sample_value(
+        after, "orodha_http_requests_in_progress", method="GET", route="/api/v1/notifications"
+    ) == 0
+
+
+def test_metrics_unmatched_route(mock_app_client):
+    mock_app_client.get("/not-a-route")
+    samples = _samples(mock_app_client.get("/metrics").data.decode())
+    assert _sample_value(
+        samples, "orodha_http_request_duration_seconds_count", route="unmatched", status="404"
+    ) >= 1
+
+
+def test_metrics_aggregate_worker_processes(tmp_path):
+    script = textwrap.dedent("""
+        import os
+        from prometheus_client import generate_latest
+        from application.utils.metrics import metrics_registry, time_operation
+
+        for _ in range(2):
+            if os.fork() == 0:
+                with time_operation("mongo", "find_notifications"):
+                    pass
+                os._exit(0)
+            os.wait()
+        print(generate_latest(metrics_registry()).decode())
+    """)
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert _sample_value(
+        _samples(output),
+        "orodha_operation_duration_seconds_count",
+        component="mongo",
+        operation="find_notifications",
+    ) == 2
@@ -2,8 +2,12 @@ import pytest
 from bson import objectid
 from datetime import datetime
 from http import HTTPStatus
+import application.namespaces.notifications.controllers as controllers
+from application.namespaces.notifications.access_tracking import AccessTrackingModes
+from application.namespaces.notifications.models import notification_factory
 from tests.fixtures.notification_data import (
     MOCK_USER_ID,
+    MOCK_LIST_ID,
     GET_RESPONSE,
     INVITE_PAYLOAD,
     POST_NO_TARGETS,
@@ -65,8 +69,7 @@ def test_delete_notifications_not_found(
     )
     assert api_response.status_code == HTTPStatus.NOT_FOUND
     assert api_response.json == {
-        'message': f'Unable to find unique notification_id: {BAD_ID}. You have' +
-        f' requested this URI [{BASE_NOTIFICATIONS_URL}] but did you mean {BASE_NOTIFICATIONS_URL} ?'
+        'message': f'Unable to find unique notification_id: {BAD_ID}'
     }
 
 
@@ -82,6 +85,18 @@ def test_delete_notifications_bad_request(
     assert api_response.json == {'message': 'notification_id must be a value.'}
 
 
+def test_delete_notifications_invalid_id(
+        mock_app_client,
+        mock_notification,
+        mock_create_keycloak_connection):
+    api_response = mock_app_client.delete(
+        f"{BASE_NOTIFICATIONS_URL}?notification_id=not-an-id",
+        headers={"Content-Type": "application/json"}
+    )
+    assert api_response.status_code == HTTPStatus.BAD_REQUEST
+    assert api_response.json["message"].startswith("notification_id is invalid")
+
+
 def test_post_notifications(
         mock_app_client,
         mock_create_keycloak_connection,
@@ -101,3 +116,118 @@ def test_post_notifications_no_targets(mock_app_client, mock_create_keycloak_con
     assert api_response.json == {'errors': {
         'targets': "'targets' is a required property"}, 'message': 'Input payload validation failed'}
     assert api_response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_get_notifications_stamps_every_notification(
+        mock_app_client,
+        mock_create_keycloak_connection):
+    for _ in range(3):
+        notification_factory(INVITE_PAYLOAD).save()
+
+    api_response = mock_app_client.get(
+        f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}",
+        headers={"Content-Type": "application/json"}
+    )
+    assert api_response.status_code == HTTPStatus.OK
+    assert len(api_response.json) == 3
+    assert all(notification["lastAccessed"] for notification in api_response.json)
+
+
+def test_get_notifications_no_touch(
+        mocker,
+        mock_app_client,
+        mock_notification,
+        mock_create_keycloak_connection):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.ACCESS_TRACKING_MODE",
+        AccessTrackingModes.DISABLED,
+    )
+    api_response = mock_app_client.get(
+        f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}",
+        headers={"Content-Type": "application/json"}
+    )
+    assert api_response.status_code == HTTPStatus.OK
+    assert api_response.json[0]["lastAccessed"] is None
+
+
+def test_get_notifications_pagination(
+        mock_app_client,
+        mock_create_keycloak_connection):
+    notification_ids = [str(notification_factory(INVITE_PAYLOAD).save().id) for _ in range(5)]
+
+    pages = []
+    url = f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}&limit=2"
+    while url is not None:
+        api_response = mock_app_client.get(url, headers={"Content-Type": "application/json"})
+        assert api_response.status_code == HTTPStatus.OK
+        pages.append([notification["id"] for notification in api_response.json])
+        next_cursor = api_response.headers.get("X-Next-Cursor")
+        url = None if next_cursor is None else \
+            f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}&limit=2&cursor={next_cursor}"
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sum(pages, []) == notification_ids
+
+
+@pytest.mark.parametrize("query, message", [
+    ("limit=0", "limit must be between 1 and 500."),
+    ("limit=ten", "limit must be an integer."),
+    ("limit=2&cursor=not-a-cursor", "cursor is invalid."),
+])
+def test_get_notifications_pagination_bad_request(
+        mock_app_client,
+        mock_notification,
+        mock_create_keycloak_connection,
+        query,
+        message):
+    api_response = mock_app_client.get(
+        f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}&{query}",
+        headers={"Content-Type": "application/json"}
+    )
+    assert api_response.status_code == HTTPStatus.BAD_REQUEST
+    assert api_response.json == {"message": message}
+
+
+def test_get_notifications_etag(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        mocker):
+    url = f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}"
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    first_response = mock_app_client.get(url)
+    etag = first_response.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    find_notifications = mocker.spy(controllers, "_find_user_notifications")
+    not_modified = mock_app_client.get(url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == HTTPStatus.NOT_MODIFIED
+    assert not_modified.headers["ETag"] == etag
+    assert not_modified.data == b""
+    find_notifications.assert_not_called()
+
+    # Reading stamps lastAccessed without changing the etag.
+    assert mock_app_client.get(url).headers["ETag"] == etag
+
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    modified = mock_app_client.get(url, headers={"If-None-Match": etag})
+    assert modified.status_code == HTTPStatus.OK
+    assert len(modified.json) == 2
+
+    new_etag = modified.headers["ETag"]
+    mock_app_client.delete(f"{BASE_NOTIFICATIONS_URL}?notification_id={modified.json[0]['id']}")
+    deleted = mock_app_client.get(url, headers={"If-None-Match": new_etag})
+    assert deleted.status_code == HTTPStatus.OK
+    assert deleted.headers["ETag"] not in (etag, new_etag)
+
+
+def test_bulk_delete_changes_etag(
+        mock_app_client,
+        mock_create_keycloak_connection):
+    url = f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}"
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    etag = mock_app_client.get(url).headers["ETag"]
+
+    mock_app_client.delete(f"{BASE_NOTIFICATIONS_URL}/batch", json={"list_id": MOCK_LIST_ID})
+    api_response = mock_app_client.get(url, headers={"If-None-Match": etag})
+    assert api_response.status_code == HTTPStatus.OK
+    assert api_response.json == []
@@ -0,0 +1,160 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from http import HTTPStatus
+from bson import ObjectId
+from mongomock.collection import Collection
+from application.namespaces.notifications.models import Notification, notification_factory
+from tests.fixtures.notification_data import (
+    MOCK_LIST_ID,
+    MOCK_USER_ID,
+    INVITE_PAYLOAD,
+    POST_NO_TARGETS,
+)
+
+BATCH_NOTIFICATIONS_URL = "/api/v1/notifications/batch"
+BASE_PAYLOAD = {"targets": INVITE_PAYLOAD["targets"], "notification_type": "base"}
+UNSUPPORTED_PAYLOAD = {"targets": INVITE_PAYLOAD["targets"], "notification_type": "unsupported"}
+
+
+def test_post_notifications_batch(mock_app_client, mock_create_keycloak_connection):
+    api_response = mock_app_client.post(
+        BATCH_NOTIFICATIONS_URL,
+        json=[INVITE_PAYLOAD, UNSUPPORTED_PAYLOAD, BASE_PAYLOAD]
+    )
+    assert api_response.status_code == HTTPStatus.OK
+    response = api_response.json
+    assert response["created"] == 2
+    assert response["failed"] == 1
+    assert [result["status"] for result in response["results"]] == [
+        "created", "failed", "created"
+    ]
+    assert response["results"][1]["error"] == \
+        "notification_type: unsupported is not supported."
+
+    created_ids = {result["id"] for result in response["results"] if "id" in result}
+    assert {str(notification.id) for notification in Notification.objects} == created_ids
+
+
+def test_post_notifications_batch_chunks(
+        mocker,
+        mock_app_client,
+        mock_create_keycloak_connection):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.BATCH_CHUNK_SIZE", 2)
+    insert_many = mocker.spy(Collection, "insert_many")
+
+    api_response = mock_app_client.post(BATCH_NOTIFICATIONS_URL, json=[INVITE_PAYLOAD] * 5)
+    assert api_response.json["created"] == 5
+    assert insert_many.call_count == 3
+    assert all(call.kwargs["ordered"] is False for call in insert_many.call_args_list)
+    assert Notification.objects.count() == 5
+
+
+def test_post_notifications_batch_validation(mock_app_client, mock_create_keycloak_connection):
+    api_response = mock_app_client.post(
+        BATCH_NOTIFICATIONS_URL,
+        json=[INVITE_PAYLOAD, POST_NO_TARGETS]
+    )
+    assert api_response.status_code == HTTPStatus.BAD_REQUEST
+    assert Notification.objects.count() == 0
+
+
+@pytest.mark.parametrize("payloads, message", [
+    ([], "The batch must contain at least one notification."),
+    ([INVITE_PAYLOAD] * 3, "The batch can not contain more than 2 notifications."),
+])
+def test_post_notifications_batch_size(
+        mocker,
+        mock_app_client,
+        mock_create_keycloak_connection,
+        payloads,
+        message):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.MAX_BATCH_SIZE", 2)
+    api_response = mock_app_client.post(BATCH_NOTIFICATIONS_URL, json=payloads)
+    assert api_response.status_code == HTTPStatus.BAD_REQUEST
+    assert api_response.json == {"message": message}
+
+
+@pytest.fixture
+def mock_notifications():
+    other_list_payload = {**INVITE_PAYLOAD, "list_id": "other-list"}
+    shared_payload = {**INVITE_PAYLOAD, "targets": INVITE_PAYLOAD["targets"] + ["other-user"]}
+    yield [
+        notification_factory(payload).save()
+        for payload in (INVITE_PAYLOAD, other_list_payload, shared_payload, BASE_PAYLOAD)
+    ]
+
+
+def test_delete_notifications_batch_by_ids(
+        mock_app_client,
+        mock_notifications,
+        mock_create_keycloak_connection):
+    api_response = mock_app_client.delete(
+        BATCH_NOTIFICATIONS_URL,
+        json={"notification_ids": [str(mock_notifications[0].id), str(ObjectId())]}
+    )
+    assert api_response.status_code == HTTPStatus.OK
+    assert api_response.json == {
+        "status_code": HTTPStatus.OK, "deleted": 1, "targets_removed": 0
+    }
+    assert Notification.objects.count() == 3
+
+
+def test_delete_notifications_batch_by_filter(
+        mock_app_client,
+        mock_notifications,
+        mock_create_keycloak_connection):
+    api_response = mock_app_client.delete(
+        BATCH_NOTIFICATIONS_URL,
+        json={"list_id": MOCK_LIST_ID, "notification_type": "list_invite"}
+    )
+    assert api_response.json["deleted"] == 2
+    assert {notification.id for notification in Notification.objects} == {
+        mock_notifications[1].id, mock_notifications[3].id
+    }
+
+
+def test_delete_notifications_batch_older_than(
+        mock_app_client,
+        mock_notifications,
+        mock_create_keycloak_connection):
+    older_than = (datetime.now(timezone.utc) + timedelta(minutes=1)).isoformat()
+    api_response = mock_app_client.delete(
+        BATCH_NOTIFICATIONS_URL, json={"older_than": older_than, "target": MOCK_USER_ID}
+    )
+    assert api_response.json["deleted"] == 4
+    assert Notification.objects.count() == 0
+
+
+def test_delete_notifications_batch_remove_target_only(
+        mock_app_client,
+        mock_notifications,
+        mock_create_keycloak_connection):
+    api_response = mock_app_client.delete(
+        BATCH_NOTIFICATIONS_URL,
+        json={"target": MOCK_USER_ID, "list_id": MOCK_LIST_ID, "remove_target_only": True}
+    )
+    assert api_response.json["targets_removed"] == 2
+    assert api_response.json["deleted"] == 1
+
+    shared_notification = Notification.objects.get(id=mock_notifications[2].id)
+    assert shared_notification.targets == ["other-user"]
+    assert Notification.objects.count() == 3
+
+
+@pytest.mark.parametrize("payload", [
+    {},
+    {"notification_ids": ["not-an-id"]},
+    {"older_than": "yesterday"},
+    {"notification_type": "unsupported"},
+    {"list_id": MOCK_LIST_ID, "remove_target_only": True},
+])
+def test_delete_notifications_batch_bad_request(
+        mock_app_client,
+        mock_notifications,
+        mock_create_keycloak_connection,
+        payload):
+    api_response = mock_app_client.delete(BATCH_NOTIFICATIONS_URL, json=payload)
+    assert api_response.status_code == HTTPStatus.BAD_REQUEST
+    assert Notification.objects.count() == 4
@@ -0,0 +1,125 @@
+from datetime import datetime
+from enum import Enum
+from http import HTTPStatus
+import pytest
+from mongoengine import ListField, StringField, ValidationError
+from application.namespaces.notifications.exceptions import (
+    NotificationTypeError,
+    PayloadValidationError,
+)
+from application.namespaces.notifications.models import (
+    NOTIFICATION_TYPES,
+    Notification,
+    notification_factory,
+)
+from application.namespaces.notifications.registry import (
+    NotificationTypeRegistry,
+    NotificationTypeSchema,
+    PayloadField,
+)
+from tests.fixtures.notification_data import MOCK_LIST_ID, MOCK_USER_ID, INVITE_PAYLOAD
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+BATCH_NOTIFICATIONS_URL = "/api/v1/notifications/batch"
+CREATED_AT = datetime(2023, 9, 1, 12, 30)
+
+
+class _MentionTypes(Enum):
+    MENTION = "mention"
+
+
+class _MentionNotification(Notification):
+    mentioned = ListField(StringField())
+
+
+@pytest.mark.parametrize("payload", [
+    INVITE_PAYLOAD,
+    {"targets": [MOCK_USER_ID], "notification_type": "base", "list_id": MOCK_LIST_ID},
+])
+def test_build_matches_document(payload):
+    document = NOTIFICATION_TYPES.build(payload)
+    expected = notification_factory(payload).to_mongo().to_dict()
+    expected["createdAt"] = document["createdAt"]
+    assert document == expected
+
+
+@pytest.mark.parametrize("payload, errors", [
+    ({"notification_type": "base"}, {"targets": "'targets' is a required property"}),
+    ({"targets": MOCK_USER_ID, "notification_type": "base"},
+     {"targets": f"{MOCK_USER_ID!r} is not of type 'array' of 'string'"}),
+    ({"targets": [MOCK_USER_ID], "notification_type": "list_invite", "list_id": 5},
+     {"list_id": "5 is not of type 'string'"}),
+    ([MOCK_USER_ID], {"payload": f"{[MOCK_USER_ID]!r} is not of type 'object'"}),
+])
+def test_build_invalid_payload(payload, errors):
+    with pytest.raises(PayloadValidationError) as err:
+        NOTIFICATION_TYPES.build(payload)
+    assert err.value.errors == errors
+
+
+@pytest.mark.parametrize("payload", [
+    {"targets": [], "notification_type": "base"},
+    {"targets": [MOCK_USER_ID], "notification_type": "list_invite"},
+])
+def test_build_incomplete_payload(payload):
+    with pytest.raises(ValidationError):
+        NOTIFICATION_TYPES.build(payload)
+
+
+@pytest.mark.parametrize("notification_type", [None, 5, "unsupported"])
+def test_build_unsupported_type(notification_type):
+    with pytest.raises(NotificationTypeError) as err:
+        NOTIFICATION_TYPES.build({"targets": [MOCK_USER_ID], "notification_type": notification_type})
+    assert err.value.message == f"notification_type: {notification_type} is not supported."
+
+
+def test_register_type():
+    registry = NotificationTypeRegistry(created_at=lambda: CREATED_AT)
+    registry.register(NotificationTypeSchema(
+        _MentionTypes.MENTION,
+        _MentionNotification,
+        [PayloadField("mentioned", "mentioned", kind="string_list", required=True)],
+    ))
+
+    assert registry.build({
+        "targets": [MOCK_USER_ID], "notification_type": "MENTION", "mentioned": ["a", "b"],
+    }) == {
+        "_cls": "Notification._MentionNotification",
+        "targets": [MOCK_USER_ID],
+        "createdAt": CREATED_AT,
+        "notificationType": "mention",
+        "mentioned": ["a", "b"],
+    }
+    assert "mentioned" in registry.creation_fields()
+    assert "mentioned" in registry.response_fields()
+    with pytest.raises(NotificationTypeError):
+        registry.build({"targets": [MOCK_USER_ID], "notification_type": "base"})
+
+
+def test_payload_field_unknown_kind():
+    with pytest.raises(ValueError):
+        PayloadField("count", "count", kind="integer")
+
+
+def test_post_notifications_missing_type_field(mock_app_client, mock_create_keycloak_connection):
+    api_response = mock_app_client.post(
+        BASE_NOTIFICATIONS_URL,
+        json={"targets": [MOCK_USER_ID], "notification_type": "list_invite"}
+    )
+    assert api_response.status_code == HTTPStatus.BAD_REQUEST
+    assert Notification.objects.count() == 0
+
+
+def test_post_notifications_batch_invalid_payload(
+        mock_app_client,
+        mock_create_keycloak_connection):
+    api_response = mock_app_client.post(
+        BATCH_NOTIFICATIONS_URL,
+        json=[INVITE_PAYLOAD, {**INVITE_PAYLOAD, "list_id": 5}]
+    )
+    assert api_response.status_code == HTTPStatus.BAD_REQUEST
+    assert api_response.json == {
+        "errors": {"1.list_id": "5 is not of type 'string'"},
+        "message": "Input payload validation failed",
+    }
+    assert Notification.objects.count() == 0
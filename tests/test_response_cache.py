@@ -0,0 +1,158 @@
+import threading
+from datetime import datetime
+import pytest
+from bson import ObjectId
+import application.namespaces.notifications.controllers as controllers
+from application.namespaces.notifications.response_cache import (
+    RESPONSE_CACHE_HITS,
+    NotificationPageCache,
+)
+from application.utils.cache import InMemorySharedCache, SharedCacheBackend
+from tests.fixtures.notification_data import MOCK_USER_ID, INVITE_PAYLOAD
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+PAGE = (
+    [{"_id": ObjectId(), "targets": [MOCK_USER_ID], "lastAccessed": datetime(2023, 9, 1)}],
+    None,
+)
+
+
+class CountingLoader:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return PAGE
+
+
+def test_page_cache_serves_current_version():
+    cache = NotificationPageCache()
+    loader = CountingLoader()
+
+    assert cache.get_or_load(MOCK_USER_ID, "None:None", "1", loader) == (PAGE, False)
+    page, cached = cache.get_or_load(MOCK_USER_ID, "None:None", "1", loader)
+    assert (page, cached) == (PAGE, True)
+    assert loader.calls == 1
+
+    # Callers get their own copy of the notifications.
+    page[0][0]["lastAccessed"] = None
+    assert cache.get_or_load(MOCK_USER_ID, "None:None", "1", loader)[0] == PAGE
+
+    assert cache.get_or_load(MOCK_USER_ID, "None:None", "2", loader) == (PAGE, False)
+    assert cache.get_or_load(MOCK_USER_ID, "10:None", "2", loader) == (PAGE, False)
+    assert loader.calls == 3
+
+
+def test_page_cache_invalidate():
+    cache = NotificationPageCache()
+    loader = CountingLoader()
+    cache.get_or_load(MOCK_USER_ID, "None:None", "1", loader)
+
+    cache.invalidate([MOCK_USER_ID])
+    assert cache.get_or_load(MOCK_USER_ID, "None:None", "1", loader) == (PAGE, False)
+    assert loader.calls == 2
+
+
+@pytest.mark.parametrize("cache", [
+    NotificationPageCache(maxsize=0),
+    NotificationPageCache(ttl_seconds=0),
+    NotificationPageCache(max_notifications=0),
+])
+def test_page_cache_does_not_cache(cache):
+    loader = CountingLoader()
+    for _ in range(2):
+        assert cache.get_or_load(MOCK_USER_ID, "None:None", "1", loader) == (PAGE, False)
+    assert loader.calls == 2
+
+
+def test_page_cache_expires_pages(mocker):
+    cache = NotificationPageCache(ttl_seconds=30)
+    loader = CountingLoader()
+    clock = mocker.patch(
+        "application.namespaces.notifications.response_cache.time.time", return_value=1000.0
+    )
+    cache.get_or_load(MOCK_USER_ID, "None:None", "1", loader)
+
+    clock.return_value = 1031.0
+    assert cache.get_or_load(MOCK_USER_ID, "None:None", "1", loader) == (PAGE, False)
+    assert loader.calls == 2
+
+
+def test_page_cache_shared_backend():
+    shared_backend = InMemorySharedCache()
+    first_worker = NotificationPageCache(shared_backend=shared_backend)
+    second_worker = NotificationPageCache(shared_backend=shared_backend)
+    loader = CountingLoader()
+    shared_hits = RESPONSE_CACHE_HITS.labels(tier="shared")
+    before = shared_hits._value.get()
+
+    first_worker.get_or_load(MOCK_USER_ID, "None:None", "1", loader)
+    assert second_worker.get_or_load(MOCK_USER_ID, "None:None", "1", loader) == (PAGE, True)
+    assert loader.calls == 1
+    assert shared_hits._value.get() == before + 1
+
+    second_worker.invalidate([MOCK_USER_ID])
+    assert len(shared_backend) == 0
+
+
+def test_shared_backend_requires_every_method():
+    class GetOnlyCache(SharedCacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnlyCache()
+
+
+def test_page_cache_coalesces_misses():
+    cache = NotificationPageCache()
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return PAGE
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(
+            cache.get_or_load(MOCK_USER_ID, "None:None", "1", loader)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    while not calls:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [(PAGE, False)] * 5
+    assert len(calls) == 1
+
+
+def test_get_notifications_served_from_cache(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        mocker):
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    find = mocker.spy(controllers, "_find_user_notifications")
+    url = f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}"
+
+    first = mock_app_client.get(url)
+    second = mock_app_client.get(url)
+    assert find.call_count == 1
+    assert second.json[0]["id"] == first.json[0]["id"]
+    assert second.json[0]["lastAccessed"] is not None
+    assert mock_app_client.get(f"{BASE_NOTIFICATIONS_URL}/count?user_id={MOCK_USER_ID}").json \
+        == {"total": 1, "unread": 0}
+
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    assert len(mock_app_client.get(url).json) == 2
+    assert find.call_count == 2
+
+    mock_app_client.delete(f"{BASE_NOTIFICATIONS_URL}?notification_id={first.json[0]['id']}")
+    assert len(mock_app_client.get(url).json) == 1
+    assert find.call_count == 3
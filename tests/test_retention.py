@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId
+from application import create_base_app
+from application.namespaces.notifications.inbox import StorageModes, fan_out
+from application.namespaces.notifications.models import (
+    InboxEntry,
+    Notification,
+    NotificationArchive,
+    NotificationTypes,
+)
+from application.namespaces.notifications.retention import (
+    EXPIRY_REGISTRY,
+    RetentionPolicy,
+    ensure_retention_indexes,
+    expire_notifications,
+    load_retention_policies,
+)
+from application.namespaces.notifications.user_state import get_user_counts
+from tests.fixtures.notification_data import MOCK_LIST_ID, MOCK_USER_ID
+
+NOW = datetime(2023, 9, 30, 12, 0, 0)
+INVITE_POLICY = RetentionPolicy(NotificationTypes.LIST_INVITE, created_days=30, accessed_days=7)
+
+
+def _insert_notification(created_at: datetime, last_accessed: datetime = None) -> ObjectId:
+    notification = {
+        "_id": ObjectId.from_datetime(created_at),
+        "_cls": "Notification.ListInviteNotification",
+        "targets": [MOCK_USER_ID],
+        "notificationType": NotificationTypes.LIST_INVITE.value,
+        "listId": MOCK_LIST_ID,
+        "createdAt": created_at,
+        "lastAccessed": last_accessed,
+    }
+    Notification._get_collection().insert_one(notification)
+    return notification["_id"]
+
+
+def test_load_retention_policies(monkeypatch):
+    monkeypatch.setenv("RETENTION_LIST_INVITE_CREATED_DAYS", "30")
+    policies = load_retention_policies()
+
+    assert len(policies) == 1
+    assert policies[0].notification_type == NotificationTypes.LIST_INVITE
+    assert policies[0].retention_days() == {"created": 30.0}
+
+
+def test_load_retention_policies_invalid(monkeypatch):
+    monkeypatch.setenv("RETENTION_LIST_INVITE_ACCESSED_DAYS", "a week")
+    with pytest.raises(ValueError, match="RETENTION_LIST_INVITE_ACCESSED_DAYS"):
+        load_retention_policies()
+
+
+def test_ensure_retention_indexes(mock_app_client):
+    result = ensure_retention_indexes([INVITE_POLICY])
+    assert "notification.retention_list_invite_created" in result["created"]
+    assert "inbox_entry.retention_list_invite_accessed" in result["created"]
+
+    indexes = Notification._get_collection().index_information()
+    created_index = indexes["retention_list_invite_created"]
+    assert created_index["key"] == [("createdAt", 1)]
+    assert created_index["expireAfterSeconds"] == 30 * 24 * 60 * 60
+    assert created_index["partialFilterExpression"] == {"notificationType": "list_invite"}
+
+    assert ensure_retention_indexes([INVITE_POLICY]) == {"created": [], "dropped": []}
+
+    changed = RetentionPolicy(NotificationTypes.LIST_INVITE, created_days=60)
+    result = ensure_retention_indexes([changed])
+    assert "notification.retention_list_invite_created" in result["created"]
+    assert "notification.retention_list_invite_accessed" in result["dropped"]
+
+    ensure_retention_indexes([changed], enabled=False)
+    assert not any(
+        name.startswith("retention_")
+        for name in Notification._get_collection().index_information()
+    )
+
+
+def test_expire_notifications_shared(mock_app_client):
+    expired_created = _insert_notification(NOW - timedelta(days=31))
+    expired_accessed = _insert_notification(
+        NOW - timedelta(days=10), last_accessed=NOW - timedelta(days=8))
+    kept = _insert_notification(NOW - timedelta(days=9), last_accessed=NOW - timedelta(days=1))
+    assert get_user_counts(StorageModes.SHARED, MOCK_USER_ID) == {"total": 3, "unread": 1}
+
+    results = expire_notifications(
+        [INVITE_POLICY], StorageModes.SHARED, batch_size=1, batch_delay_seconds=0, now=NOW)
+
+    assert [(r["reason"], r["expired"], r["archived"]) for r in results] == [
+        ("created", 1, 1), ("accessed", 1, 1)
+    ]
+    assert [n["_id"] for n in Notification._get_collection().find()] == [kept]
+    assert get_user_counts(StorageModes.SHARED, MOCK_USER_ID) == {"total": 1, "unread": 0}
+
+    archived = NotificationArchive.objects.get(id=expired_created)
+    assert archived.reason == "created"
+    assert archived.targets == [MOCK_USER_ID]
+    assert archived.expiredAt == NOW
+    assert NotificationArchive.objects.get(id=expired_accessed).reason == "accessed"
+    assert "x" in NotificationArchive._get_collection().find_one({"_id": expired_accessed})
+
+
+def test_expire_notifications_without_archive(mock_app_client):
+    _insert_notification(NOW - timedelta(days=31))
+    results = expire_notifications(
+        [INVITE_POLICY], StorageModes.SHARED, archive=False, batch_delay_seconds=0, now=NOW)
+
+    assert results[0]["expired"] == 1
+    assert Notification.objects.count() == 0
+    assert NotificationArchive.objects.count() == 0
+
+
+def test_expire_notifications_fanout(mock_app_client):
+    expired_created = _insert_notification(NOW - timedelta(days=31))
+    read = _insert_notification(NOW - timedelta(days=10))
+    fan_out(list(Notification._get_collection().find()))
+    InboxEntry._get_collection().update_one(
+        {"notificationId": read}, {"$set": {"lastAccessed": NOW - timedelta(days=8)}})
+    assert get_user_counts(StorageModes.FANOUT, MOCK_USER_ID) == {"total": 2, "unread": 1}
+
+    results = expire_notifications(
+        [INVITE_POLICY], StorageModes.FANOUT, batch_delay_seconds=0, now=NOW)
+
+    assert [(r["reason"], r["expired"]) for r in results] == [("created", 1), ("accessed", 1)]
+    assert InboxEntry.objects.count() == 0
+    # Expiring the inbox entry of a read notification keeps the notification itself.
+    assert [n["_id"] for n in Notification._get_collection().find()] == [read]
+    assert NotificationArchive.objects.get(id=expired_created).reason == "created"
+    assert get_user_counts(StorageModes.FANOUT, MOCK_USER_ID) == {"total": 0, "unread": 0}
+
+
+@pytest.mark.parametrize("archive_flag, archived", [("--archive", 1), ("--no-archive", 0)])
+def test_expire_notifications_command(mock_app_client, monkeypatch, archive_flag, archived):
+    monkeypatch.setenv("RETENTION_LIST_INVITE_CREATED_DAYS", "30")
+    _insert_notification(datetime.utcnow() - timedelta(days=31))
+    runner = create_base_app().test_cli_runner()
+
+    result = runner.invoke(args=["expire-notifications", "--batch-delay", "0", archive_flag])
+    assert result.exit_code == 0, result.output
+    assert "Expired 1 list_invite notifications by created time" in result.output
+    assert NotificationArchive.objects.count() == archived
+
+
+def test_expire_notifications_command_pushes_metrics(mocker, mock_app_client, monkeypatch):
+    monkeypatch.setenv("RETENTION_LIST_INVITE_CREATED_DAYS", "30")
+    monkeypatch.setenv("RETENTION_PUSHGATEWAY", "pushgateway:9091")
+    push = mocker.patch("application.namespaces.notifications.retention.push_to_gateway")
+    _insert_notification(datetime.utcnow() - timedelta(days=31))
+    runner = create_base_app().test_cli_runner()
+
+    result = runner.invoke(args=["expire-notifications", "--batch-delay", "0"])
+    assert result.exit_code == 0, result.output
+    push.assert_called_once_with(
+        "pushgateway:9091", job="expire_notifications", registry=EXPIRY_REGISTRY)
+    labels = {"notification_type": "list_invite", "reason": "created"}
+    assert EXPIRY_REGISTRY.get_sample_value("orodha_notifications_expired", labels) == 1
+    assert EXPIRY_REGISTRY.get_sample_value("orodha_notifications_archived", labels) == 1
+
+    push.side_effect = OSError("Connection refused")
+    result = runner.invoke(args=["expire-notifications", "--batch-delay", "0"])
+    assert result.exit_code != 0
+    assert "metrics could not be pushed" in result.output
@@ -0,0 +1,257 @@
+from datetime import timedelta
+from http import HTTPStatus
+import pytest
+from click.testing import CliRunner
+from application.namespaces.notifications.access_tracking import current_access_time
+from application.namespaces.notifications.coalescing import CoalescingModes
+from application.namespaces.notifications.commands import promote_notifications_command
+from application.namespaces.notifications.controllers import (
+    _find_user_notifications,
+    promote_notifications,
+)
+from application.namespaces.notifications.models import (
+    Notification,
+    OutboxEntry,
+    ScheduledNotification,
+)
+from application.namespaces.notifications.scheduling import NotificationScheduler
+from tests.fixtures.notification_data import MOCK_LIST_ID, MOCK_USER_ID, INVITE_PAYLOAD
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+BATCH_NOTIFICATIONS_URL = "/api/v1/notifications/batch"
+OTHER_USER_ID = "other-user"
+
+
+@pytest.fixture
+def scheduler():
+    yield NotificationScheduler(promote_notifications, batch_size=10, lease_seconds=60)
+
+
+def _deliver_at(**delta) -> str:
+    return (current_access_time() + timedelta(**delta)).isoformat()
+
+
+def _make_due():
+    ScheduledNotification._get_collection().update_many(
+        {}, {"$set": {"dueAt": current_access_time()}}
+    )
+
+
+def _counts(client, user_id=MOCK_USER_ID):
+    return client.get(f"{BASE_NOTIFICATIONS_URL}/count?user_id={user_id}").json
+
+
+def test_post_notifications_scheduled(mock_app_client, mock_create_keycloak_connection):
+    deliver_at = _deliver_at(hours=1)
+    api_response = mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json={**INVITE_PAYLOAD, "deliver_at": deliver_at}
+    )
+    assert api_response.status_code == HTTPStatus.OK
+    assert Notification.objects.count() == 0
+    assert mock_app_client.get(f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}").json == []
+    assert _counts(mock_app_client) == {"total": 0, "unread": 0}
+
+    scheduled = ScheduledNotification._get_collection().find_one()
+    assert scheduled["deliverAt"].isoformat() == deliver_at
+    assert scheduled["dueAt"] == scheduled["deliverAt"]
+    assert scheduled["listId"] == MOCK_LIST_ID
+
+
+def test_post_notifications_deliver_at_passed(
+        mock_app_client,
+        mock_create_keycloak_connection):
+    mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json={**INVITE_PAYLOAD, "deliver_at": _deliver_at(hours=-1)}
+    )
+    assert Notification.objects.count() == 1
+    assert ScheduledNotification.objects.count() == 0
+
+
+@pytest.mark.parametrize("deliver_at", ["tomorrow", 10, "2200-01-01T00:00:00"])
+def test_post_notifications_invalid_deliver_at(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        deliver_at):
+    api_response = mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json={**INVITE_PAYLOAD, "deliver_at": deliver_at}
+    )
+    assert api_response.status_code == HTTPStatus.BAD_REQUEST
+    assert "deliver_at" in api_response.json["errors"]
+    assert ScheduledNotification.objects.count() == 0
+
+
+def test_run_once_promotes_due_notifications(
+        mocker,
+        mock_app_client,
+        mock_create_keycloak_connection,
+        scheduler):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.DELIVERY_CHANNELS",
+        {"webhook": "http://127.0.0.1/webhook"},
+    )
+    mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json={**INVITE_PAYLOAD, "deliver_at": _deliver_at(hours=1)}
+    )
+    mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json={**INVITE_PAYLOAD, "deliver_at": _deliver_at(hours=2)}
+    )
+    # Nothing is promoted before it is due.
+    assert scheduler.run_once() == 0
+
+    first = ScheduledNotification._get_collection().find_one(sort=[("deliverAt", 1)])
+    ScheduledNotification._get_collection().update_one(
+        {"_id": first["_id"]}, {"$set": {"dueAt": current_access_time()}}
+    )
+    assert scheduler.run_once() == 1
+    assert ScheduledNotification.objects.count() == 1
+
+    notification = Notification._get_collection().find_one()
+    # The notification is promoted with a new id.
+    assert notification["_id"] > first["_id"]
+    assert notification["createdAt"] == first["deliverAt"]
+    assert notification["_cls"] == "Notification.ListInviteNotification"
+    assert not {"deliverAt", "dueAt", "claimedBy", "notificationCls", "promotedId"} \
+        & set(notification)
+    response = mock_app_client.get(f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}").json
+    assert [row["id"] for row in response] == [str(notification["_id"])]
+    assert _counts(mock_app_client) == {"total": 1, "unread": 0}
+    # Delivery hooks fire on promotion.
+    assert OutboxEntry.objects.get().notificationId == notification["_id"]
+
+
+def test_run_once_promotes_after_read_notifications(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        scheduler):
+    mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json={**INVITE_PAYLOAD, "deliver_at": _deliver_at(hours=1)}
+    )
+    # The scheduler only gets to it well after its deliver_at.
+    ScheduledNotification._get_collection().update_many({}, {"$set": {
+        "deliverAt": current_access_time() - timedelta(hours=1),
+        "dueAt": current_access_time() - timedelta(hours=1),
+    }})
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    last_event_id = Notification.objects.get().id
+    assert scheduler.run_once() == 1
+
+    # Streams replaying after the last notification a client saw still send it.
+    promoted = Notification._get_collection().find_one({"_id": {"$ne": last_event_id}})
+    replayed = _find_user_notifications(MOCK_USER_ID, last_event_id, 10)
+    assert [row["_id"] for row in replayed] == [promoted["_id"]]
+
+
+def test_run_once_coalesces(
+        mocker,
+        mock_app_client,
+        mock_create_keycloak_connection,
+        scheduler):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.COALESCING_MODE",
+        CoalescingModes.UNREAD,
+    )
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json={**INVITE_PAYLOAD, "deliver_at": _deliver_at(hours=1)}
+    )
+    _make_due()
+    assert scheduler.run_once() == 1
+
+    # The promoted invite is merged into the unread one rather than repeating it.
+    notification = Notification.objects.get()
+    assert notification.eventCount == 2
+    assert _counts(mock_app_client) == {"total": 1, "unread": 1}
+
+
+def test_run_once_claims_are_leased(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        scheduler):
+    mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json={**INVITE_PAYLOAD, "deliver_at": _deliver_at(hours=1)}
+    )
+    _make_due()
+    def promote_and_stop(notifications):
+        promote_notifications(notifications)
+        raise RuntimeError("stopped")
+
+    # A scheduler which stopped before removing its batch holds it until the lease ran out.
+    stopped = NotificationScheduler(promote_and_stop, batch_size=10, lease_seconds=60)
+    with pytest.raises(RuntimeError):
+        stopped.run_once()
+    assert scheduler.run_once() == 0
+    assert Notification.objects.count() == 1
+
+    # Once it did, another scheduler removes it without creating it twice.
+    _make_due()
+    assert scheduler.run_once() == 1
+    assert ScheduledNotification.objects.count() == 0
+    assert Notification.objects.count() == 1
+    assert _counts(mock_app_client) == {"total": 1, "unread": 1}
+
+
+def test_delete_notifications_cancels_scheduled(
+        mock_app_client,
+        mock_create_keycloak_connection):
+    mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json={**INVITE_PAYLOAD, "deliver_at": _deliver_at(hours=1)}
+    )
+    scheduled_id = ScheduledNotification.objects.get().id
+    delete_url = f"{BASE_NOTIFICATIONS_URL}?notification_id={scheduled_id}"
+    api_response = mock_app_client.delete(delete_url)
+    assert api_response.status_code == HTTPStatus.OK
+    assert ScheduledNotification.objects.count() == 0
+
+    api_response = mock_app_client.delete(delete_url)
+    assert api_response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_delete_notifications_batch_cancels_scheduled(
+        mock_app_client,
+        mock_create_keycloak_connection):
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    mock_app_client.post(
+        BASE_NOTIFICATIONS_URL,
+        json={
+            **INVITE_PAYLOAD,
+            "targets": [MOCK_USER_ID, OTHER_USER_ID],
+            "deliver_at": _deliver_at(hours=1),
+        },
+    )
+    api_response = mock_app_client.delete(
+        BATCH_NOTIFICATIONS_URL,
+        json={"list_id": MOCK_LIST_ID, "target": MOCK_USER_ID, "remove_target_only": True},
+    )
+    # The notification which was only sent to MOCK_USER_ID is deleted.
+    assert api_response.json["targets_removed"] == 2
+    assert api_response.json["deleted"] == 1
+    assert ScheduledNotification.objects.get().targets == [OTHER_USER_ID]
+
+    api_response = mock_app_client.delete(
+        BATCH_NOTIFICATIONS_URL, json={"list_id": MOCK_LIST_ID}
+    )
+    assert api_response.json["deleted"] == 1
+    assert ScheduledNotification.objects.count() == 0
+
+
+def test_post_notifications_batch_scheduled(mock_app_client, mock_create_keycloak_connection):
+    api_response = mock_app_client.post(
+        BATCH_NOTIFICATIONS_URL,
+        json=[INVITE_PAYLOAD, {**INVITE_PAYLOAD, "deliver_at": _deliver_at(minutes=5)}],
+    )
+    response = api_response.json
+    assert (response["created"], response["scheduled"], response["failed"]) == (1, 1, 0)
+    assert response["results"][1]["status"] == "scheduled"
+    assert response["results"][1]["id"] == str(ScheduledNotification.objects.get().id)
+    assert Notification.objects.count() == 1
+
+
+def test_promote_notifications_command(mock_app_client, mock_create_keycloak_connection):
+    mock_app_client.post(
+        BASE_NOTIFICATIONS_URL, json={**INVITE_PAYLOAD, "deliver_at": _deliver_at(hours=1)}
+    )
+    _make_due()
+    result = CliRunner().invoke(promote_notifications_command, ["--once"])
+    assert result.exit_code == 0
+    assert "Promoted 1 scheduled notifications" in result.output
+    assert Notification.objects.count() == 1
@@ -0,0 +1,54 @@
+import json
+from datetime import date, datetime
+import pytest
+from bson import ObjectId
+from flask_restx import marshal
+import application.namespaces.notifications.routes as routes
+from application.namespaces.notifications.serializers import (
+    serialize_notification,
+    serialize_notifications,
+)
+from tests.fixtures.notification_data import MOCK_LIST_ID, MOCK_USER_ID, INVITE_PAYLOAD
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+
+
+@pytest.mark.parametrize("notification", [
+    {
+        "_id": ObjectId(),
+        "targets": [MOCK_USER_ID, "other-user"],
+        "notificationType": "list_invite",
+        "lastAccessed": datetime(2023, 9, 1, 12, 30, 15, 123000),
+        "listId": MOCK_LIST_ID,
+    },
+    {"_id": ObjectId(), "targets": [MOCK_USER_ID], "notificationType": "base"},
+    {"_id": ObjectId(), "targets": [], "lastAccessed": None, "listId": None},
+    {"_id": ObjectId(), "lastAccessed": date(2023, 9, 1)},
+    {},
+])
+def test_serialize_notification_matches_marshal(notification):
+    assert json.dumps(serialize_notification(notification)) == \
+        json.dumps(marshal(notification, routes.notification_response_model))
+
+
+def test_get_notifications_response_matches_marshal(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        mocker):
+    for _ in range(3):
+        mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    serialize = mocker.spy(routes, "serialize_notifications")
+
+    api_response = mock_app_client.get(f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}")
+    rows = serialize.call_args.args[0]
+    assert api_response.data.decode() == \
+        json.dumps(marshal(rows, routes.notification_response_model)) + "\n"
+    assert serialize_notifications(rows) == api_response.json
+
+
+def test_get_notifications_field_mask(mock_app_client, mock_create_keycloak_connection):
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    api_response = mock_app_client.get(
+        f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}", headers={"X-Fields": "id,listId"}
+    )
+    assert list(api_response.json[0]) == ["id", "listId"]
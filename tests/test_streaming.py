@@ -0,0 +1,143 @@
+import json
+import pytest
+from http import HTTPStatus
+from application.namespaces.notifications.streaming import (
+    ConnectionLimiter,
+    InMemoryBroker,
+    NotificationStream,
+)
+from tests.fixtures.notification_data import MOCK_USER_ID, INVITE_PAYLOAD
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+STREAM_URL = f"{BASE_NOTIFICATIONS_URL}/stream?user_id={MOCK_USER_ID}"
+
+
+@pytest.fixture
+def memory_broker(mocker):
+    broker = InMemoryBroker()
+    mocker.patch(
+        "application.namespaces.notifications.controllers._get_broker",
+        return_value=broker,
+    )
+    mocker.patch(
+        "application.namespaces.notifications.controllers.STREAM_HEARTBEAT_SECONDS",
+        0.05,
+    )
+    yield broker
+
+
+def _events(response, count):
+    """Reads count events from a streamed response, skipping the retry hint."""
+    events = []
+    chunks = response.response
+    while len(events) < count:
+        chunk = next(chunks).decode()
+        if not chunk.startswith("retry:"):
+            events.append(chunk)
+    return events
+
+
+def _event_data(event):
+    return json.loads(event.split("data: ", 1)[1])
+
+
+def test_in_memory_broker_delivers_to_targets():
+    broker = InMemoryBroker()
+    subscription = broker.subscribe(MOCK_USER_ID)
+    other_subscription = broker.subscribe("other-user")
+
+    broker.publish([{"_id": 1, "targets": [MOCK_USER_ID]}])
+
+    assert subscription.get(timeout=0.1) == {"_id": 1, "targets": [MOCK_USER_ID]}
+    assert other_subscription.get(timeout=0.01) is None
+    broker.unsubscribe(subscription)
+    broker.publish([{"_id": 2, "targets": [MOCK_USER_ID]}])
+    assert subscription.get(timeout=0.01) is None
+
+
+def test_notification_stream_close_releases_connection():
+    broker = InMemoryBroker()
+    limiter = ConnectionLimiter(1)
+    assert limiter.acquire()
+    stream = NotificationStream(
+        broker, broker.subscribe(MOCK_USER_ID), limiter, [], str, heartbeat_seconds=0.01
+    )
+    stream.close()
+    stream.close()
+
+    assert limiter.acquire()
+    broker.publish([{"_id": 1, "targets": [MOCK_USER_ID]}])
+
+
+def test_stream_receives_posted_notification(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        memory_broker):
+    response = mock_app_client.get(STREAM_URL, buffered=False)
+    assert response.status_code == HTTPStatus.OK
+    assert response.mimetype == "text/event-stream"
+
+    mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    event = next(event for event in _events(response, 3) if not event.startswith(":"))
+    response.close()
+
+    assert "event: notification" in event
+    data = _event_data(event)
+    assert data["targets"] == [MOCK_USER_ID]
+    assert event.startswith(f"id: {data['id']}")
+
+
+def test_stream_sends_heartbeats(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        memory_broker):
+    response = mock_app_client.get(STREAM_URL, buffered=False)
+    assert _events(response, 2) == [": heartbeat\n\n"] * 2
+    response.close()
+
+
+def test_stream_replays_after_last_event_id(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        memory_broker):
+    for _ in range(3):
+        mock_app_client.post(BASE_NOTIFICATIONS_URL, json=INVITE_PAYLOAD)
+    notifications = mock_app_client.get(
+        f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}").json
+
+    response = mock_app_client.get(
+        STREAM_URL, headers={"Last-Event-ID": notifications[0]["id"]}, buffered=False
+    )
+    replayed = [_event_data(event)["id"] for event in _events(response, 2)]
+    response.close()
+
+    assert replayed == [notification["id"] for notification in notifications[1:]]
+
+
+def test_stream_invalid_last_event_id(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        memory_broker):
+    response = mock_app_client.get(f"{STREAM_URL}&last_event_id=not-an-id")
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_stream_connection_limit(
+        mock_app_client,
+        mock_create_keycloak_connection,
+        memory_broker,
+        mocker):
+    mocker.patch(
+        "application.namespaces.notifications.controllers.STREAM_LIMITER",
+        ConnectionLimiter(1),
+    )
+    first_response = mock_app_client.get(STREAM_URL, buffered=False)
+    assert first_response.status_code == HTTPStatus.OK
+
+    second_response = mock_app_client.get(STREAM_URL)
+    assert second_response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+    first_response.close()
+    third_response = mock_app_client.get(STREAM_URL, buffered=False)
+    assert third_response.status_code == HTTPStatus.OK
+    third_response.close()
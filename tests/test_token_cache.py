@@ -0,0 +1,117 @@
+import threading
+import time
+import pytest
+from prometheus_client import REGISTRY
+from application.auth import TokenCache
+from application.namespaces.notifications.exceptions import OrodhaForbiddenError
+from tests.fixtures.notification_data import MOCK_USER_ID
+from tests.fixtures.jwt_tokens import make_token
+
+BASE_NOTIFICATIONS_URL = "/api/v1/notifications"
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class CountingResolver:
+    def __init__(self, delay=0, error=None):
+        self.calls = 0
+        self.delay = delay
+        self.error = error
+
+    def __call__(self, token):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return {"id": token}
+
+
+def test_token_cache_hit_and_miss():
+    cache = TokenCache(maxsize=10, ttl_seconds=60)
+    resolver = CountingResolver()
+    hits_before = _sample("orodha_token_cache_hits_total")
+    misses_before = _sample("orodha_token_cache_misses_total")
+
+    token = make_token()
+    assert cache.get_user(token, resolver) == {"id": token}
+    assert cache.get_user(token, resolver) == {"id": token}
+
+    assert resolver.calls == 1
+    assert _sample("orodha_token_cache_hits_total") - hits_before == 1
+    assert _sample("orodha_token_cache_misses_total") - misses_before == 1
+
+
+def test_token_cache_expires_at_token_exp():
+    cache = TokenCache(maxsize=10, ttl_seconds=60)
+    resolver = CountingResolver()
+    token = make_token(expires_in=1)
+
+    cache.get_user(token, resolver)
+    time.sleep(1.1)
+    cache.get_user(token, resolver)
+    assert resolver.calls == 2
+
+
+def test_token_cache_lru_eviction():
+    cache = TokenCache(maxsize=2, ttl_seconds=60)
+    resolver = CountingResolver()
+    evictions_before = _sample("orodha_token_cache_evictions_total", reason="size")
+
+    cache.get_user("first", resolver)
+    cache.get_user("second", resolver)
+    cache.get_user("first", resolver)
+    cache.get_user("third", resolver)
+
+    assert len(cache) == 2
+    assert _sample("orodha_token_cache_evictions_total", reason="size") - evictions_before == 1
+    cache.get_user("first", resolver)
+    assert resolver.calls == 3
+    cache.get_user("second", resolver)
+    assert resolver.calls == 4
+
+
+def test_token_cache_does_not_cache_errors():
+    cache = TokenCache(maxsize=10, ttl_seconds=60)
+    resolver = CountingResolver(error=OrodhaForbiddenError())
+
+    for _ in range(2):
+        with pytest.raises(OrodhaForbiddenError):
+            cache.get_user("bad-token", resolver)
+    assert resolver.calls == 2
+    assert len(cache) == 0
+
+
+def test_token_cache_coalesces_concurrent_lookups():
+    cache = TokenCache(maxsize=10, ttl_seconds=60)
+    resolver = CountingResolver(delay=0.2)
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_user("token", resolver)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert resolver.calls == 1
+    assert results == [{"id": "token"}] * 8
+
+
+def test_get_notifications_uses_token_cache(
+        mock_app_client,
+        mock_notification,
+        mock_token_verifier,
+        mock_jwks_fetcher,
+        mocker):
+    verify = mocker.spy(mock_token_verifier, "verify")
+    headers = {"Authorization": f"Bearer {make_token()}"}
+    for _ in range(3):
+        api_response = mock_app_client.get(
+            f"{BASE_NOTIFICATIONS_URL}?user_id={MOCK_USER_ID}", headers=headers
+        )
+        assert api_response.status_code == 200
+    assert verify.call_count == 1